@@ -1,119 +1,424 @@
 """
 AI Validation Module - Use ChemBERTa to verify chemical reaction validity
+
+Inference backends (select with INFERENCE_BACKEND or the AI_VALIDATOR_BACKEND
+environment variable):
+    torch       PyTorch fp32 (reference)
+    torch-int8  PyTorch with dynamic int8 quantization of Linear layers
+    onnx        Exported ONNX graph run by onnxruntime (exported on first use)
+
+Run `python ai_validator.py --parity <backend>` to measure embedding drift
+against fp32 before switching backends.
 """
 
+import argparse
+import atexit
+import os
+import re
+from threading import Lock
+
 from transformers import AutoModel, AutoTokenizer
+import numpy as np
 import torch
 
+from server_log import get_logger
+
+log = get_logger('ai_validator')
+
 # Model config - using publicly available ChemBERTa model
 MODEL_NAME = "seyonec/ChemBERTa-zinc-base-v1"
 
+# Inference backend config
+INFERENCE_BACKEND = os.environ.get("AI_VALIDATOR_BACKEND", "torch")
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "onnx")
+
+# Batching config - a forward pass holds at most MAX_BATCH_TOKENS padded tokens
+MAX_LENGTH = 512
+MAX_BATCH_TOKENS = 4096
+
+# Validity thresholds on reactant/product cosine similarity
+MIN_SIMILARITY = 0.3
+MAX_SIMILARITY = 0.95
+
+# Embedding cache config - repeat SMILES skip the forward pass entirely
+EMBEDDING_CACHE_ENABLED = True
+
+# Reference reactions used by the self test and the backend parity check
+REFERENCE_REACTIONS = [
+    # (reactant, product, description)
+    ("CC=C", "CC(Br)CBr", "Propene + Br2 -> 1,2-dibromopropane (valid)"),
+    ("c1ccccc1", "c1ccc(Br)cc1", "Benzene + Br2 -> Bromobenzene (valid)"),
+    ("CC=O", "CCO", "Acetaldehyde + H2 -> Ethanol (valid)"),
+    ("C", "c1ccccc1", "Methane -> Benzene (invalid - too different)"),
+    ("CCO", "CC(=O)O", "Ethanol -> Acetic acid (valid)"),
+    ("C=CC=C.C=C", "C1=CCCCC1", "Diels-Alder: butadiene + ethene -> cyclohexene (valid)"),
+    ("CC(C)(C)Br", "CC(C)(C)O", "SN1 hydrolysis of tert-butyl bromide (valid)"),
+    ("c1ccccc1.CC(=O)Cl", "CC(=O)c1ccccc1", "Friedel-Crafts acylation (valid)"),
+]
+
 # Global variables (lazy loading)
 _tokenizer = None
-_model = N
+_backends = {}
+_load_lock = Lock()
+_embedding_cache = None
+_embedding_cache_failed = False
+
+
+class TorchBackend:
+    """PyTorch fp32 inference (the reference backend)"""
+
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model
+
+    def last_hidden_state(self, inputs):
+        with torch.inference_mode():
+            return self.model(**inputs).last_hidden_state
+
+
+class TorchInt8Backend(TorchBackend):
+    """PyTorch with Linear layers dynamically quantized to int8"""
+
+    name = "torch-int8"
+
+    def __init__(self, model):
+        quantized = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(quantized)
+
+
+class _LastHiddenState(torch.nn.Module):
+    """Wrapper with plain tensor inputs/outputs for ONNX export"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+class OnnxBackend:
+    """Exported ONNX graph executed with onnxruntime on CPU"""
+
+    name = "onnx"
+
+    def __init__(self, model):
+        import onnxruntime as ort
+
+        path = self.export(model)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def export(model):
+        """Export the model once per model name; returns the .onnx path"""
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", MODEL_NAME)
+        path = os.path.join(ONNX_DIR, f"{slug}.onnx")
+        if os.path.exists(path):
+            return path
+
+        log.info(f"Exporting {MODEL_NAME} to ONNX: {path}")
+        os.makedirs(ONNX_DIR, exist_ok=True)
+        dummy = torch.ones((1, 8), dtype=torch.long)
+        tmp_path = path + ".tmp"
+        torch.onnx.export(
+            _LastHiddenState(model),
+            (dummy, dummy),
+            tmp_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    def last_hidden_state(self, inputs):
+        feeds = {
+            name: tensor.numpy().astype(np.int64)
+            for name, tensor in inputs.items()
+            if name in self.input_names
+        }
+        (hidden,) = self.session.run(["last_hidden_state"], feeds)
+        return torch.from_numpy(hidden)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TorchBackend, TorchInt8Backend, OnnxBackend)
+}
+
+
+def _load_model(backend_name=None):
+    """
+    Lazy load tokenizer and inference backend (on first call)
+
+    Args:
+        backend_name: One of BACKENDS; defaults to INFERENCE_BACKEND
+
+    Returns:
+        tuple: (tokenizer, backend)
+    """
+    global _tokenizer
+    backend_name = backend_name or INFERENCE_BACKEND
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend_name}' (choose from {', '.join(BACKENDS)})")
+
+    if backend_name not in _backends:
+        # The startup warm-up thread and request threads may race to load
+        with _load_lock:
+            if backend_name not in _backends:
+                log.info(f"Loading ChemBERTa model ({backend_name} backend)...")
+                if _tokenizer is None:
+                    _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+                model = AutoModel.from_pretrained(MODEL_NAME)
+                model.eval()  # Set to inference mode
+                _backends[backend_name] = BACKENDS[backend_name](model)
+                log.info("ChemBERTa model loaded successfully")
+    return _tokenizer, _backends[backend_name]
+
+
+def warm_up():
+    """Load the model and run one forward pass so the first request is fast"""
+    _load_model()
+    _embed_uncached(["C"])
+
+
+def set_num_threads(num_threads):
+    """Limit PyTorch intra-op threads (call once per server worker process)"""
+    torch.set_num_threads(max(1, num_threads))
+
+
+def _plan_batches(lengths, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Group sequences into batches whose padded size stays under a token budget
+
+    Sequences are sorted by length so each batch pads to a similar length.
+
+    Args:
+        lengths: Token count of each sequence
+        max_batch_tokens: Budget for batch_size * longest sequence in the batch
+
+    Returns:
+        list: Lists of sequence indices, one list per batch
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    for idx in order:
+        # Sorted ascending, so the new sequence is the longest in the batch
+        if current and (len(current) + 1) * lengths[idx] > max_batch_tokens:
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def get_embedding_cache():
+    """Lazy create the persistent embedding cache (None if disabled or unavailable)"""
+    global _embedding_cache, _embedding_cache_failed
+    if _embedding_cache is None and EMBEDDING_CACHE_ENABLED and not _embedding_cache_failed:
+        try:
+            from embedding_cache import EmbeddingCache
+            # Backends drift slightly from fp32, so each gets its own store
+            cache_name = MODEL_NAME if INFERENCE_BACKEND == "torch" else f"{MODEL_NAME}@{INFERENCE_BACKEND}"
+            _embedding_cache = EmbeddingCache(cache_name)
+            atexit.register(_embedding_cache.close)
+        except Exception as e:
+            _embedding_cache_failed = True
+            log.warning(f"Embedding cache unavailable: {e}")
+    return _embedding_cache
+
+
+def get_cache_stats():
+    """Get embedding cache statistics (None if the cache is not in use)"""
+    cache = _embedding_cache
+    return cache.stats() if cache else None
+
+
+def _embed_uncached(unique_smiles, backend_name=None):
+    """Run the model on distinct SMILES; returns a (n, hidden_size) tensor"""
+    tokenizer, backend = _load_model(backend_name)
+
+    encoded = tokenizer(
+        unique_smiles,
+        truncation=True,
+        max_length=MAX_LENGTH
+    )
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+
+    embeddings = [None] * len(unique_smiles)
+    with torch.inference_mode():
+        for batch in _plan_batches(lengths):
+            features = [
+                {key: encoded[key][i] for key in encoded.keys()}
+                for i in batch
+            ]
+            inputs = tokenizer.pad(features, return_tensors="pt")
+            hidden = backend.last_hidden_state(inputs).float()
+
+            # Mean of last hidden state over real (non-padding) tokens
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            summed = (hidden * mask).sum(dim=1)
+            pooled = summed / mask.sum(dim=1).clamp(min=1)
+
+            for row, i in enumerate(batch):
+                embeddings[i] = pooled[row]
+
+    return torch.stack(embeddings)
+
+
+def get_molecule_embeddings(smiles_list):
+    """
+    Convert many SMILES to feature vectors with batched forward passes
+
+    The model embeds the SMILES as given. With the embedding cache
+    enabled, only the cache key is canonicalized: a miss embeds the first
+    spelling seen of the molecule, and every spelling of it then gets
+    that vector from the cache.
 
-def _load_model():
-    """Lazy load model (on first call)"""
-    global _tokenizer, _model
-    if _model is None:
-        print("[INFO] Loading ChemBERTa model...")
-        _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-        _model = AutoModel.from_pretrained(MODEL_NAME)
-        _model.eval()  # Set to inference mode
-        print("[OK] ChemBERTa model loaded successfully")
-    return _tokenizer, _model
+    Args:
+        smiles_list: List of SMILES strings (duplicates are embedded once)
+
+    Returns:
+        torch.Tensor: Feature vectors (len(smiles_list), hidden_size)
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        unique_smiles = list(dict.fromkeys(smiles_list))
+        embeddings = _embed_uncached(unique_smiles)
+        index = {smi: i for i, smi in enumerate(unique_smiles)}
+        return embeddings[[index[smi] for smi in smiles_list]]
+
+    from embedding_cache import canonicalize
+    keys = [canonicalize(smi) for smi in smiles_list]
+    # First spelling of each molecule, embedded on a cache miss
+    spellings = {}
+    for key, smi in zip(keys, smiles_list):
+        spellings.setdefault(key, smi)
+    unique_keys = list(spellings)
+
+    vectors = dict(zip(unique_keys, cache.get_many(unique_keys)))
+    missing = [key for key in unique_keys if vectors[key] is None]
+    if missing:
+        # Stored as float16; use the same rounded values on hits and misses
+        computed = _embed_uncached([spellings[key] for key in missing])
+        computed = computed.float().numpy().astype(np.float16)
+        cache.put_many(missing, computed)
+        vectors.update(zip(missing, computed))
+
+    stacked = np.stack([vectors[key] for key in keys]).astype(np.float32)
+    return torch.from_numpy(stacked)
 
 
 def get_molecule_embedding(smiles):
     """
     Convert SMILES to chemical feature vector
-    
+
     Args:
         smiles: SMILES string of molecule
-        
+
     Returns:
         torch.Tensor: Feature vector (1, hidden_size)
     """
-    tokenizer, model = _load_model()
-    
-    inputs = tokenizer(
-        smiles, 
-        return_tensors="pt", 
-        padding=True, 
-        truncation=True, 
-        max_length=512
-    )
-    
-    with torch.no_grad():
-        outputs = model(**inputs)
-    
-    # Use mean of last hidden state as molecule vector
-    embedding = outputs.last_hidden_state.mean(dim=1)
-    return embedding
+    return get_molecule_embeddings([smiles])
 
 
-def check_reaction_validity(reactant_smiles, product_smiles):
+def _judge_similarity(similarity):
+    """Turn a reactant/product similarity into a validation result"""
+    # Logic:
+    # - Too low (< 0.3): Product differs too much from reactant
+    # - Too high (> 0.95): Possibly no effective reaction occurred
+    # - Reasonable range: 0.3 ~ 0.95
+    is_valid = MIN_SIMILARITY < similarity < MAX_SIMILARITY
+
+    if similarity <= MIN_SIMILARITY:
+        reason = "Product differs too much from reactant - possibly abnormal reaction"
+    elif similarity >= MAX_SIMILARITY:
+        reason = "Product too similar to reactant - possibly no effective reaction"
+    else:
+        reason = "Product-reactant similarity is within reasonable range"
+
+    return {
+        "similarity": round(similarity, 4),
+        "is_valid": is_valid,
+        "reason": reason
+    }
+
+
+def _validate_pairs(pairs):
     """
-    Check if reaction is reasonable (by comparing reactant and product feature vectors)
-    
+    Validate (reactant, product) SMILES pairs with one batched embedding pass
+
     Args:
-        reactant_smiles: Reactant SMILES string (or list)
-        product_smiles: Product SMILES string
-        
+        pairs: List of (reactant_smiles, product_smiles) tuples; reactant may be a list
+
     Returns:
-        dict: Contains similarity, validity flag, and reason
+        list: Validation result dicts, in input order
     """
-    # Handle multiple reactants
-    if isinstance(reactant_smiles, list):
-        reactant_smiles = ".".join(reactant_smiles)
-    
+    reactants = [".".join(r) if isinstance(r, list) else r for r, _ in pairs]
+    products = [p for _, p in pairs]
+
     try:
-        r_emb = get_molecule_embedding(reactant_smiles)
-        p_emb = get_molecule_embedding(product_smiles)
-        
-        # Calculate cosine similarity
-        similarity = torch.nn.functional.cosine_similarity(r_emb, p_emb).item()
-        
-        # Logic:
-        # - Too low (< 0.3): Product differs too much from reactant
-        # - Too high (> 0.95): Possibly no effective reaction occurred
-        # - Reasonable range: 0.3 ~ 0.95
-        is_valid = 0.3 < similarity < 0.95
-        
-        if similarity <= 0.3:
-            reason = "Product differs too much from reactant - possibly abnormal reaction"
-        elif similarity >= 0.95:
-            reason = "Product too similar to reactant - possibly no effective reaction"
-        else:
-            reason = "Product-reactant similarity is within reasonable range"
-        
-        return {
-            "similarity": round(similarity, 4),
-            "is_valid": is_valid,
-            "reason": reason
-        }
-        
+        embeddings = get_molecule_embeddings(reactants + products)
+        r_emb = embeddings[:len(pairs)]
+        p_emb = embeddings[len(pairs):]
+
+        # Calculate cosine similarity row by row
+        similarities = torch.nn.functional.cosine_similarity(r_emb, p_emb, dim=1).tolist()
+        return [_judge_similarity(sim) for sim in similarities]
+
     except Exception as e:
-        return {
+        return [{
             "similarity": 0.0,
             "is_valid": False,
             "reason": f"Validation failed: {str(e)}"
-        }
+        } for _ in pairs]
+
+
+def check_reaction_validity(reactant_smiles, product_smiles):
+    """
+    Check if reaction is reasonable (by comparing reactant and product feature vectors)
+
+    Args:
+        reactant_smiles: Reactant SMILES string (or list)
+        product_smiles: Product SMILES string
+
+    Returns:
+        dict: Contains similarity, validity flag, and reason
+    """
+    return _validate_pairs([(reactant_smiles, product_smiles)])[0]
 
 
 def batch_validate(reactions):
     """
     Batch validate multiple reactions
-    
+
+    All reactant and product SMILES are embedded together, so the whole
+    list costs a few padded forward passes instead of two per reaction.
+
     Args:
         reactions: List of (reactant_smiles, product_smiles) tuples
-        
+
     Returns:
         list: Validation results
     """
+    if not reactions:
+        return []
+
     results = []
-    for reactant, product in reactions:
-        result = check_reaction_validity(reactant, product)
+    for (reactant, product), result in zip(reactions, _validate_pairs(reactions)):
         results.append({
             "reactant": reactant,
             "product": product,
@@ -122,35 +427,106 @@ def batch_validate(reactions):
     return results
 
 
-# Test code
-if __name__ == "__main__":
+def check_backend_parity(backend_name, reactions=None):
+    """
+    Compare a backend against PyTorch fp32 on a reference set (bypasses the cache)
+
+    Args:
+        backend_name: Backend to check (see BACKENDS)
+        reactions: List of (reactant, product, description) tuples;
+                   defaults to REFERENCE_REACTIONS
+
+    Returns:
+        dict: Embedding cosine drift, reactant/product similarity drift and
+              the reactions whose valid/invalid verdict changed
+    """
+    reactions = reactions or REFERENCE_REACTIONS
+    smiles = list(dict.fromkeys(
+        [r for r, _, _ in reactions] + [p for _, p, _ in reactions]
+    ))
+
+    reference = _embed_uncached(smiles, "torch")
+    candidate = _embed_uncached(smiles, backend_name)
+    embedding_cos = torch.nn.functional.cosine_similarity(reference, candidate, dim=1)
+
+    index = {smi: i for i, smi in enumerate(smiles)}
+    flips = []
+    similarity_drift = []
+    for reactant, product, description in reactions:
+        ref_sim = torch.nn.functional.cosine_similarity(
+            reference[index[reactant]], reference[index[product]], dim=0).item()
+        new_sim = torch.nn.functional.cosine_similarity(
+            candidate[index[reactant]], candidate[index[product]], dim=0).item()
+        similarity_drift.append(abs(new_sim - ref_sim))
+        if _judge_similarity(ref_sim)["is_valid"] != _judge_similarity(new_sim)["is_valid"]:
+            flips.append({
+                "description": description,
+                "fp32_similarity": round(ref_sim, 4),
+                "backend_similarity": round(new_sim, 4)
+            })
+
+    return {
+        "backend": backend_name,
+        "molecules": len(smiles),
+        "reactions": len(reactions),
+        "embedding_cosine_min": round(embedding_cos.min().item(), 6),
+        "embedding_cosine_mean": round(embedding_cos.mean().item(), 6),
+        "similarity_drift_max": round(max(similarity_drift), 6),
+        "similarity_drift_mean": round(sum(similarity_drift) / len(similarity_drift), 6),
+        "verdict_flips": flips,
+        "thresholds_hold": not flips
+    }
+
+
+def _run_self_test():
     print("=" * 60)
     print("ChemBERTa Reaction Validation Module Test")
+    print(f"Backend: {INFERENCE_BACKEND}")
     print("=" * 60)
-    
-    # Test cases
-    test_cases = [
-        # (reactant, product, description)
-        ("CC=C", "CC(Br)CBr", "Propene + Br2 -> 1,2-dibromopropane (valid)"),
-        ("c1ccccc1", "c1ccc(Br)cc1", "Benzene + Br2 -> Bromobenzene (valid)"),
-        ("CC=O", "CCO", "Acetaldehyde + H2 -> Ethanol (valid)"),
-        ("C", "c1ccccc1", "Methane -> Benzene (invalid - too different)"),
-    ]
-    
+
     print("\n[TEST] Starting tests...\n")
-    
-    for reactant, product, description in test_cases:
+
+    for reactant, product, description in REFERENCE_REACTIONS:
         print(f"Test: {description}")
         print(f"  Reactant: {reactant}")
         print(f"  Product:  {product}")
-        
+
         result = check_reaction_validity(reactant, product)
-        
+
         print(f"  Similarity: {result['similarity']}")
         print(f"  Valid: {'[YES]' if result['is_valid'] else '[NO]'}")
         print(f"  Reason: {result['reason']}")
         print()
-    
+
     print("=" * 60)
     print("Test completed")
 
+
+def _run_parity_check(backend_name):
+    print("=" * 60)
+    print(f"Backend Parity Check: {backend_name} vs torch (fp32)")
+    print("=" * 60)
+
+    report = check_backend_parity(backend_name)
+
+    print(f"Molecules: {report['molecules']}  Reactions: {report['reactions']}")
+    print(f"Embedding cosine vs fp32: min={report['embedding_cosine_min']}  mean={report['embedding_cosine_mean']}")
+    print(f"Similarity drift: max={report['similarity_drift_max']}  mean={report['similarity_drift_mean']}")
+    for flip in report["verdict_flips"]:
+        print(f"  [X] {flip['description']}: fp32={flip['fp32_similarity']} -> {flip['backend_similarity']}")
+    print(f"Thresholds {MIN_SIMILARITY}/{MAX_SIMILARITY} hold: {'[YES]' if report['thresholds_hold'] else '[NO]'}")
+
+
+# Test code
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ChemBERTa reaction validator")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="Inference backend for the self test")
+    parser.add_argument("--parity", choices=sorted(BACKENDS), help="Compare a backend against fp32 and exit")
+    args = parser.parse_args()
+
+    if args.parity:
+        _run_parity_check(args.parity)
+    else:
+        if args.backend:
+            INFERENCE_BACKEND = args.backend
+        _run_self_test()
@@ -10,18 +10,17 @@ import json
 import os
 import sys
 
+import reaction_logger
+
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-FAILED_FILE = os.path.join(BASE_DIR, 'data', 'failed_reactions.json')
+FAILED_FILE = reaction_logger.FAILED_REACTIONS_FILE
 TRAIN_FILE = os.path.join(BASE_DIR, 'data', 'training_data.jsonl')
 
 def load_failed():
-    if not os.path.exists(FAILED_FILE):
-        return []
     try:
-        with open(FAILED_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
+        return reaction_logger.get_failed_reactions(limit=None)
+    except Exception:
         return []
 
 def save_training_data(entry):
@@ -94,8 +93,7 @@ def main():
             break
 
     # 更新失败记录文件，移除已处理的
-    with open(FAILED_FILE, 'w', encoding='utf-8') as f:
-        json.dump(remaining, f, indent=2, ensure_ascii=False)
+    reaction_logger.replace_failed_reactions(remaining)
 
     print(f"\n标注完成！")
     print(f"本次标注: {processed_count} 条")
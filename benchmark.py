@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark - Reproducible timings of the reaction server hot paths
+基准测试：对反应服务器的热点路径计时，结果保存为 JSON，便于前后两次运行对比
+
+Benchmarks (names are "<group>.<case>", select with --filter):
+    compile.*        SMARTS → initialized ChemicalReaction, and a reaction cache hit
+    run_reactants.*  RDKit RunReactants on precompiled reactions, one case per category
+    postprocess.*    collect_products on fresh RunReactants output
+    embedding.*      ChemBERTa embeddings, one SMILES per forward pass vs batched
+                     (skipped when torch / the model is not available)
+    logger.*         reaction_logger write throughput (into a temporary directory)
+    api.*            End-to-end /api/react and /api/react/batch through Flask's test
+                     client (inline reactions, no AI validation, no data logging)
+
+Jobs are the load_test.py jobs: every template of parsed_reactions.json whose
+reactant slots match one of the sample molecules. Each benchmark runs
+--repeat timed samples after one warm-up; cheap benchmarks loop inside a
+sample until it lasts at least MIN_SAMPLE_SECONDS.
+
+Usage:
+    python benchmark.py run                        # → data/benchmarks/<timestamp>.json
+    python benchmark.py run --filter run_reactants --repeat 10 --output before.json
+    python benchmark.py run --quick                # 20 templates, 3 samples (smoke test)
+    python benchmark.py compare before.json after.json [--threshold 0.1]
+    python benchmark.py list
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from rdkit import Chem, RDLogger
+from rdkit.Chem import AllChem
+
+import reaction_cache
+import reaction_executor
+from load_test import SAMPLE_MOLECULES, build_jobs
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+RESULTS_DIR = os.path.join(BASE_DIR, 'data', 'benchmarks')
+
+RESULT_VERSION = 1
+REPEAT = 7                       # Timed samples per benchmark
+MIN_SAMPLE_SECONDS = 0.05        # Loop cheap benchmarks until one sample takes this long
+REGRESSION_THRESHOLD = 0.10      # compare: flag medians more than 10% slower
+QUICK_TEMPLATES = 20             # --quick: templates / jobs per benchmark
+LOGGER_ENTRIES = 500             # Failed reactions written per logger sample
+EMBEDDING_MOLECULES = 32         # SMILES embedded per embedding sample
+
+
+class Benchmark:
+    """
+    One timed case
+
+    Args:
+        name: "<group>.<case>"
+        run: Callable(state) timed once per iteration
+        setup: Optional callable() → state, run untimed before every sample
+               (used when run() consumes or mutates its input)
+        items: Operations per run() call; reported as per-item time and throughput
+        skip: Reason the benchmark cannot run here (None = runnable)
+    """
+
+    def __init__(self, name, run=None, setup=None, items=1, skip=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.items = max(1, items)
+        self.skip = skip
+
+
+# ---------------------------------------------------------------------------
+# Benchmark definitions
+# ---------------------------------------------------------------------------
+
+def _compiles(smarts):
+    # A few templates do not parse (see reaction_validation.py); they are not timed
+    try:
+        return reaction_cache.get_reaction(smarts) is not None
+    except Exception:
+        return False
+
+
+class _Context:
+    """Inputs shared by the benchmark definitions, built once"""
+
+    def __init__(self, quick=False):
+        with open(PARSED_JSON, 'r', encoding='utf-8') as f:
+            self.reactions = json.load(f)
+        limit = QUICK_TEMPLATES if quick else None
+        self.smarts = [smarts for smarts in dict.fromkeys(
+            rxn['smarts'] for rxn in self.reactions.values() if isinstance(rxn, dict) and rxn.get('smarts'))
+            if _compiles(smarts)]
+        if limit:
+            self.smarts = self.smarts[:limit]
+        self.jobs = [job for job in build_jobs(limit) if _compiles(job['smarts'])]
+
+    def compiled_jobs(self, jobs):
+        """(rxn, reactant mols) per job, padded to the template's reactant count like execute_reaction"""
+        compiled = []
+        for job in jobs:
+            rxn = reaction_cache.get_reaction(job['smarts'])
+            mols = [Chem.MolFromSmiles(smi) for smi in job['reactants']]
+            mols = [mol for mol in mols if mol is not None]
+            if rxn is None or not mols:
+                continue
+            while len(mols) < rxn.GetNumReactantTemplates():
+                mols.append(mols[0])
+            compiled.append((rxn, tuple(mols)))
+        return compiled
+
+    def jobs_by_category(self):
+        groups = OrderedDict()
+        for job in self.jobs:
+            category = self.reactions[job['reaction_name']].get('category') or 'other'
+            groups.setdefault(category, []).append(job)
+        return groups
+
+
+def _run_all(compiled):
+    return [rxn.RunReactants(mols, maxProducts=reaction_executor.MAX_PRODUCTS) for rxn, mols in compiled]
+
+
+def _compile_benchmarks(ctx):
+    def compile_all(_):
+        for smarts in ctx.smarts:
+            rxn = AllChem.ReactionFromSmarts(smarts)
+            rxn.Initialize()
+
+    def cache_hits(_):
+        for smarts in ctx.smarts:
+            reaction_cache.get_reaction(smarts)
+
+    return [
+        Benchmark('compile.smarts', compile_all, items=len(ctx.smarts)),
+        Benchmark('compile.cache_hit', cache_hits, items=len(ctx.smarts)),
+    ]
+
+
+def _reaction_benchmarks(ctx):
+    benchmarks = []
+    for category, jobs in ctx.jobs_by_category().items():
+        compiled = ctx.compiled_jobs(jobs)
+        benchmarks.append(Benchmark(f'run_reactants.{category}', lambda _, c=compiled: _run_all(c),
+                                    items=len(compiled)))
+
+    compiled = ctx.compiled_jobs(ctx.jobs)
+
+    def postprocess(product_tuples):
+        for products_tuple in product_tuples:
+            reaction_executor.collect_products(products_tuple)
+
+    # collect_products sanitizes the product mols in place, so every sample gets fresh ones
+    benchmarks.append(Benchmark('postprocess.collect_products', postprocess,
+                                setup=lambda: _run_all(compiled), items=len(compiled)))
+    return benchmarks
+
+
+def _embedding_benchmarks(ctx):
+    try:
+        import ai_validator
+        ai_validator.warm_up()
+    except Exception as e:
+        reason = f"AI validator unavailable: {e}"
+        return [Benchmark('embedding.single', skip=reason), Benchmark('embedding.batched', skip=reason)]
+
+    molecules = SAMPLE_MOLECULES[:EMBEDDING_MOLECULES]
+
+    # _embed_uncached: measure the model itself, not the embedding cache
+    def single(_):
+        for smiles in molecules:
+            ai_validator._embed_uncached([smiles])
+
+    def batched(_):
+        ai_validator._embed_uncached(molecules)
+
+    return [
+        Benchmark('embedding.single', single, items=len(molecules)),
+        Benchmark('embedding.batched', batched, items=len(molecules)),
+    ]
+
+
+@contextlib.contextmanager
+def _isolated_logger(directory):
+    """Point reaction_logger at an empty directory with fresh in-memory state"""
+    import reaction_logger as rl
+    names = ('DATA_DIR', 'FAILED_REACTIONS_FILE', 'LEGACY_FAILED_REACTIONS_FILE', 'STATS_FILE', '_loaded',
+             '_stats', '_stats_delta', '_stats_reset', '_recent', '_segment_counts', '_pending_counts',
+             '_log_handle')
+    saved = {name: getattr(rl, name) for name in names}
+    rl.DATA_DIR = directory
+    rl.FAILED_REACTIONS_FILE = os.path.join(directory, 'failed_reactions.jsonl')
+    rl.LEGACY_FAILED_REACTIONS_FILE = os.path.join(directory, 'failed_reactions.json')
+    rl.STATS_FILE = os.path.join(directory, 'reaction_stats.json')
+    rl._loaded = False
+    rl._stats, rl._stats_delta, rl._stats_reset = {}, {}, False
+    rl._recent = deque(maxlen=rl.RECENT_ENTRIES)
+    rl._segment_counts = []
+    rl._pending_counts = {'total': 0, 'reasons': {}}
+    rl._log_handle = None
+    try:
+        yield rl
+    finally:
+        rl.flush()
+        if rl._log_handle is not None:
+            rl._log_handle.close()
+        for name, value in saved.items():
+            setattr(rl, name, value)
+
+
+def _logger_benchmarks(ctx):
+    validation = {'similarity': 0.1, 'is_valid': False, 'reason': 'Product differs too much from reactant'}
+    jobs = ctx.jobs or [{'smarts': '[C:1]=[C:2]>>[C:1][C:2]', 'reactants': ['CC=C'], 'reaction_name': 'test'}]
+
+    def write(_):
+        with tempfile.TemporaryDirectory() as directory, _isolated_logger(directory) as rl, \
+                contextlib.redirect_stdout(io.StringIO()):
+            for i in range(LOGGER_ENTRIES):
+                job = jobs[i % len(jobs)]
+                rl.log_failed_reaction(job['reactants'], 'CCC', job['smarts'], validation, job['reaction_name'])
+                rl.update_stats(job['reaction_name'], 2, 1, 1)
+            rl.flush()
+
+    return [Benchmark('logger.write', write, items=LOGGER_ENTRIES)]
+
+
+def _api_benchmarks(ctx):
+    import server
+    import server_log
+
+    server.AI_VALIDATION_ENABLED = False
+    server.DATA_LOGGING_ENABLED = False
+    server.REACTION_POOL_ENABLED = False
+    server.app.config['TESTING'] = True
+    client = server.app.test_client()
+    bodies = [{'smarts': job['smarts'], 'reactants': job['reactants'], 'reaction_name': job['reaction_name']}
+              for job in ctx.jobs]
+
+    def react(_):
+        with _quiet_server(server_log):
+            for body in bodies:
+                client.post('/api/react', json=body)
+
+    def react_batch(_):
+        with _quiet_server(server_log):
+            for start in range(0, len(bodies), server.MAX_BATCH_JOBS):
+                client.post('/api/react/batch', json={'jobs': bodies[start:start + server.MAX_BATCH_JOBS]})
+
+    return [
+        Benchmark('api.react', react, items=len(bodies)),
+        Benchmark('api.react_batch', react_batch, items=len(bodies)),
+    ]
+
+
+@contextlib.contextmanager
+def _quiet_server(server_log):
+    level = server_log.get_level()
+    server_log.set_level('WARNING')
+    try:
+        yield
+    finally:
+        server_log.set_level(level)
+
+
+SUITES = (_compile_benchmarks, _reaction_benchmarks, _embedding_benchmarks, _logger_benchmarks, _api_benchmarks)
+
+# Suites that are expensive to build (model load) and the benchmark names they define
+EXPENSIVE_SUITES = {_embedding_benchmarks: ('embedding.single', 'embedding.batched')}
+
+
+def collect_benchmarks(ctx, name_filter=None):
+    """
+    Build the benchmark cases
+
+    Args:
+        ctx: _Context
+        name_filter: Substring a benchmark name must contain (None = all)
+
+    Returns:
+        list: Benchmark objects in run order
+    """
+    benchmarks = []
+    for suite in SUITES:
+        names = EXPENSIVE_SUITES.get(suite)
+        if name_filter and names and not any(name_filter in name for name in names):
+            continue
+        benchmarks.extend(b for b in suite(ctx) if not name_filter or name_filter in b.name)
+    return benchmarks
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def measure(benchmark, repeat=REPEAT, min_sample_seconds=MIN_SAMPLE_SECONDS):
+    """
+    Time one benchmark
+
+    Returns:
+        dict: Per-run seconds (min/median/mean/stdev), per-item microseconds,
+              items per second and the raw samples
+    """
+    if benchmark.skip:
+        return {'skipped': benchmark.skip}
+
+    def sample(number):
+        state = benchmark.setup() if benchmark.setup else None
+        started = time.perf_counter()
+        for _ in range(number):
+            benchmark.run(state)
+        return (time.perf_counter() - started) / number
+
+    # Warm-up, then calibrate how many calls make a sample long enough to time reliably
+    first = sample(1)
+    number = 1
+    if benchmark.setup is None and 0 < first < min_sample_seconds:
+        number = min(1000, int(min_sample_seconds / first) + 1)
+
+    samples = [sample(number) for _ in range(repeat)]
+    median = statistics.median(samples)
+    return {
+        'items': benchmark.items,
+        'number': number,
+        'repeat': repeat,
+        'min': min(samples),
+        'median': median,
+        'mean': statistics.mean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'per_item_us': round(median / benchmark.items * 1e6, 3),
+        'items_per_second': round(benchmark.items / median, 1) if median else None,
+        'samples': samples,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(name_filter=None, repeat=REPEAT, quick=False, output=None, progress=print):
+    """
+    Run the benchmark suite and write the results
+
+    Args:
+        name_filter: Substring a benchmark name must contain (None = all)
+        repeat: Timed samples per benchmark
+        quick: Limit every benchmark to QUICK_TEMPLATES templates / jobs
+        output: JSON path (None = data/benchmarks/<timestamp>.json, '' = don't write)
+
+    Returns:
+        dict: The result document ('machine', 'settings', 'benchmarks')
+    """
+    RDLogger.DisableLog('rdApp.*')
+    started = time.time()
+    ctx = _Context(quick=quick)
+    results = OrderedDict()
+    for benchmark in collect_benchmarks(ctx, name_filter):
+        result = measure(benchmark, repeat)
+        results[benchmark.name] = result
+        if 'skipped' in result:
+            progress(f"[Bench] {benchmark.name:<32} skipped: {result['skipped']}")
+        else:
+            progress(f"[Bench] {benchmark.name:<32} {result['median'] * 1000:>10.3f} ms/run  "
+                     f"{result['per_item_us']:>10.1f} us/item  ±{result['stdev'] / result['median'] * 100:.1f}%")
+
+    document = {
+        'version': RESULT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(time.time() - started, 2),
+        'machine': {
+            'python': platform.python_version(),
+            'rdkit': Chem.rdBase.rdkitVersion,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'git_commit': _git_commit(),
+        },
+        'settings': {'filter': name_filter, 'repeat': repeat, 'quick': quick,
+                     'templates': len(ctx.smarts), 'jobs': len(ctx.jobs)},
+        'benchmarks': results,
+    }
+    if output is None:
+        output = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        tmp_path = output + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        os.replace(tmp_path, output)
+        progress(f"[Bench] Results written to {output}")
+    return document
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare two result documents by median time per item
+
+    Args:
+        baseline: Earlier result document
+        current: Newer result document
+        threshold: Relative slowdown above which a benchmark counts as a regression
+
+    Returns:
+        list: {'name', 'baseline_us', 'current_us', 'ratio', 'status'} per benchmark,
+              status one of 'regression', 'improvement', 'unchanged', 'added', 'removed', 'skipped'
+    """
+    old, new = baseline['benchmarks'], current['benchmarks']
+    rows = []
+    for name in list(old) + [name for name in new if name not in old]:
+        a, b = old.get(name), new.get(name)
+        row = {'name': name, 'baseline_us': None, 'current_us': None, 'ratio': None}
+        if a is None:
+            row['status'] = 'added'
+        elif b is None:
+            row['status'] = 'removed'
+        elif 'skipped' in a or 'skipped' in b:
+            row['status'] = 'skipped'
+        else:
+            row['baseline_us'], row['current_us'] = a['per_item_us'], b['per_item_us']
+            row['ratio'] = round(b['per_item_us'] / a['per_item_us'], 3) if a['per_item_us'] else None
+            if row['ratio'] is None:
+                row['status'] = 'unchanged'
+            elif row['ratio'] > 1 + threshold:
+                row['status'] = 'regression'
+            elif row['ratio'] < 1 / (1 + threshold):
+                row['status'] = 'improvement'
+            else:
+                row['status'] = 'unchanged'
+        rows.append(row)
+    return rows
+
+
+def _load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reaction server hot paths")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="run benchmarks and write a JSON result file")
+    run_parser.add_argument('--filter', help="only benchmarks whose name contains this")
+    run_parser.add_argument('--repeat', type=int, default=REPEAT, help="timed samples per benchmark")
+    run_parser.add_argument('--quick', action='store_true', help=f"only {QUICK_TEMPLATES} templates")
+    run_parser.add_argument('--output', help="result file (default: data/benchmarks/<timestamp>.json)")
+
+    compare_parser = sub.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                                help="relative slowdown reported as a regression (default 0.1)")
+
+    sub.add_parser('list', help="list benchmark names")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run_benchmarks(args.filter, args.repeat, args.quick, args.output)
+    elif args.command == 'compare':
+        rows = compare(_load(args.baseline), _load(args.current), args.threshold)
+        print(f"{'benchmark':<34} {'baseline us':>12} {'current us':>12} {'ratio':>7}  status")
+        for row in rows:
+            fmt = lambda v: '-' if v is None else f"{v:.1f}"
+            ratio = '-' if row['ratio'] is None else f"{row['ratio']:.2f}x"
+            print(f"{row['name']:<34} {fmt(row['baseline_us']):>12} {fmt(row['current_us']):>12} "
+                  f"{ratio:>7}  {row['status']}")
+        regressions = [row['name'] for row in rows if row['status'] == 'regression']
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        RDLogger.DisableLog('rdApp.*')
+        for benchmark in collect_benchmarks(_Context(quick=True)):
+            print(benchmark.name + (f"  (skipped: {benchmark.skip})" if benchmark.skip else ''))
+
+
+if __name__ == '__main__':
+    main()
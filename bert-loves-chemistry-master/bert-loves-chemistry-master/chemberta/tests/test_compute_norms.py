@@ -0,0 +1,143 @@
+"""Chunked, resumable and mergeable descriptor statistics of compute_norms.py.
+
+Run from the repository root: python -m pytest chemberta/tests
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("absl")
+pytest.importorskip("rdkit")
+
+from chemberta.utils import compute_norms  # noqa: E402
+from chemberta.utils.descriptors import (  # noqa: E402
+    descriptor_calculator,
+    descriptor_rows,
+)
+from chemberta.utils.running_stats import QuantileSketch, RunningStats  # noqa: E402
+
+SMILES_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "pubchem_1k_smiles.txt"
+)
+CHUNK_BYTES = 256
+
+
+@pytest.fixture
+def smiles():
+    with open(SMILES_FILE) as f:
+        lines = [f.readline().strip() for _ in range(60)]
+    return lines
+
+
+def write(path, lines, final_newline=True):
+    path.write_text("\n".join(lines) + ("\n" if final_newline else ""))
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 7, 64, 10_000])
+@pytest.mark.parametrize("final_newline", [True, False])
+def test_chunks_cover_every_line_once(tmp_path, chunk_bytes, final_newline):
+    lines = ["C" * (i % 9 + 1) + str(i) for i in range(50)]
+    path = write(tmp_path / "lines.smi", lines[:25] + [""] + lines[25:], final_newline)
+
+    read = []
+    for start, end in compute_norms.chunk_ranges(path, chunk_bytes):
+        read += list(compute_norms.read_smiles(path, start, end))
+    assert read == lines
+
+
+def assert_same_stats(actual, expected):
+    assert actual.count == expected.count
+    np.testing.assert_allclose(actual.mean, expected.mean, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(actual.std, expected.std, rtol=1e-9, atol=1e-12)
+    np.testing.assert_array_equal(actual.min, expected.min)
+    np.testing.assert_array_equal(actual.max, expected.max)
+
+
+def test_single_run_matches_numpy(tmp_path, smiles):
+    path = write(tmp_path / "mols.smi", smiles)
+    stats, quantiles = compute_norms.compute_norms(
+        path, str(tmp_path / "state.npz"), CHUNK_BYTES, num_workers=2, sketch=True
+    )
+
+    descriptors, calculator = descriptor_calculator()
+    rows = descriptor_rows(smiles, calculator, len(descriptors))
+    assert_same_stats(stats, RunningStats(len(descriptors)).update(rows))
+    counted = quantiles.zero.sum() + quantiles.positive.sum() + quantiles.negative.sum()
+    assert counted == rows.size
+
+
+def test_resumed_run_equals_single_run(tmp_path, smiles):
+    path = write(tmp_path / "mols.smi", smiles)
+    single, single_quantiles = compute_norms.compute_norms(
+        path, str(tmp_path / "single.npz"), CHUNK_BYTES, num_workers=1, sketch=True
+    )
+
+    # State of a run interrupted after its first chunks
+    descriptors, _ = descriptor_calculator()
+    compute_norms._init_worker(path, True)
+    meta = {
+        "smiles_file": os.path.abspath(path),
+        "file_size": os.path.getsize(path),
+        "chunk_bytes": CHUNK_BYTES,
+        "descriptors": descriptors,
+        "sketch": True,
+        "done": [],
+    }
+    stats, quantiles = RunningStats(len(descriptors)), QuantileSketch(len(descriptors))
+    ranges = compute_norms.chunk_ranges(path, CHUNK_BYTES)
+    for index in range(len(ranges) // 2):
+        _, chunk_stats, chunk_quantiles = compute_norms._process_chunk(
+            (index, *ranges[index])
+        )
+        stats.merge(chunk_stats)
+        quantiles.merge(chunk_quantiles)
+        meta["done"].append(index)
+    state_file = str(tmp_path / "resumed.npz")
+    compute_norms.save_state(state_file, meta, stats, quantiles)
+
+    resumed, resumed_quantiles = compute_norms.compute_norms(
+        path, state_file, CHUNK_BYTES, num_workers=2, sketch=True
+    )
+    assert_same_stats(resumed, single)
+    np.testing.assert_array_equal(resumed_quantiles.positive, single_quantiles.positive)
+    np.testing.assert_array_equal(resumed_quantiles.zero, single_quantiles.zero)
+
+    # Resuming a finished state changes nothing
+    again, _ = compute_norms.compute_norms(
+        path, state_file, CHUNK_BYTES, num_workers=1, sketch=True
+    )
+    assert_same_stats(again, single)
+
+
+def test_merged_states_equal_single_run(tmp_path, smiles):
+    whole = write(tmp_path / "all.smi", smiles)
+    single, single_quantiles = compute_norms.compute_norms(
+        whole, str(tmp_path / "all.npz"), CHUNK_BYTES, num_workers=1, sketch=True
+    )
+
+    states = []
+    for i, part in enumerate((smiles[:17], smiles[17:])):
+        path = write(tmp_path / f"part{i}.smi", part)
+        states.append(str(tmp_path / f"part{i}.npz"))
+        compute_norms.compute_norms(path, states[-1], CHUNK_BYTES, 1, sketch=True)
+
+    merged, merged_quantiles = compute_norms.merge_state_files(states[::-1])
+    assert_same_stats(merged, single)
+    np.testing.assert_array_equal(merged_quantiles.negative, single_quantiles.negative)
+
+
+def test_incomplete_states_are_not_merged(tmp_path, smiles):
+    path = write(tmp_path / "mols.smi", smiles)
+    descriptors, _ = descriptor_calculator()
+    meta = {
+        "file_size": os.path.getsize(path),
+        "chunk_bytes": CHUNK_BYTES,
+        "done": [0],
+    }
+    state_file = str(tmp_path / "partial.npz")
+    compute_norms.save_state(state_file, meta, RunningStats(len(descriptors)), None)
+    with pytest.raises(ValueError):
+        compute_norms.merge_state_files([state_file])
@@ -0,0 +1,96 @@
+"""Precomputed descriptor rows line up with the corpus lines.
+
+Run from the repository root: python -m pytest chemberta/tests
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("rdkit")
+
+from chemberta.utils.descriptor_cache import (  # noqa: E402
+    META_FILE,
+    DescriptorCache,
+    precompute_descriptors,
+)
+from chemberta.utils.descriptors import (  # noqa: E402
+    compute_descriptors,
+    descriptor_calculator,
+)
+from chemberta.utils.raw_text_dataset import (  # noqa: E402
+    LazyRegressionDataset,
+    TextLines,
+)
+
+LINES_PER_SHARD = 4
+
+
+class CharTokenizer:
+    def __call__(self, line, add_special_tokens=True, truncation=True, max_length=None):
+        return {"input_ids": [ord(c) for c in line][:max_length]}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / "corpus"
+    directory.mkdir()
+    # A lone "\r" does not end a line; "\r\n" does; the second file has no final
+    # newline
+    (directory / "a.txt").write_bytes(
+        b"CCO\nc1ccccc1\r\nCC\rO\nnot a smiles\n\nCC(=O)O\nCCN\n"
+    )
+    (directory / "b.txt").write_bytes(b"C1CC1\nO=C=O\r\nCCCl\nCC#N")
+    return str(directory)
+
+
+def expected_rows(path):
+    lines = TextLines([os.path.join(path, name) for name in sorted(os.listdir(path))])
+    descriptors, calculator = descriptor_calculator()
+    return [
+        compute_descriptors(lines[i], calculator, len(descriptors)).astype(np.float32)
+        for i in range(len(lines))
+    ]
+
+
+def test_rows_match_compute_descriptors(tmp_path, corpus):
+    output_dir = str(tmp_path / "descriptors")
+    meta = precompute_descriptors(corpus, output_dir, LINES_PER_SHARD, num_workers=2)
+
+    expected = expected_rows(corpus)
+    assert meta["num_lines"] == len(expected) == 11
+    cache = DescriptorCache(output_dir)
+    for i, row in enumerate(expected):
+        np.testing.assert_array_equal(cache.get(i), row)
+
+
+def test_missing_shards_fall_back_to_compute_descriptors(tmp_path, corpus):
+    output_dir = str(tmp_path / "descriptors")
+    precompute_descriptors(corpus, output_dir, LINES_PER_SHARD, num_workers=1)
+    # As if the run had stopped before recording shard 1
+    meta_path = os.path.join(output_dir, META_FILE)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["shards"] = [shard for shard in meta["shards"] if shard["shard"] != 1]
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+
+    dataset = LazyRegressionDataset(
+        CharTokenizer(), corpus, 32, descriptor_path=output_dir
+    )
+    missing = range(LINES_PER_SHARD, 2 * LINES_PER_SHARD)
+    assert all(dataset.descriptor_cache.get(i) is None for i in missing)
+    assert dataset.descriptor_cache.get(0) is not None
+    for i, row in enumerate(expected_rows(corpus)):
+        label = dataset[i]["label"].numpy()
+        np.testing.assert_allclose(label, row, rtol=1e-6)
+
+    # Resuming computes only the missing shard
+    meta = precompute_descriptors(corpus, output_dir, LINES_PER_SHARD, num_workers=1)
+    assert sorted(shard["shard"] for shard in meta["shards"]) == [0, 1, 2]
+    cache = DescriptorCache(output_dir)
+    for i, row in enumerate(expected_rows(corpus)):
+        np.testing.assert_array_equal(cache.get(i), row)
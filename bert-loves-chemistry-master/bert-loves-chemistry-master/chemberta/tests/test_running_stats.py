@@ -0,0 +1,61 @@
+"""Mergeable statistics of chemberta.utils.running_stats against numpy.
+
+Run from the repository root: python -m pytest chemberta/tests
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from chemberta.utils.running_stats import QuantileSketch, RunningStats
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    columns = [
+        rng.normal(100.0, 5.0, 3000),  # Large mean, small spread
+        rng.lognormal(0.0, 2.0, 3000),  # Skewed, many magnitudes
+        -rng.exponential(3.0, 3000),  # Negative
+        np.where(rng.random(3000) < 0.3, 0.0, rng.normal(0.0, 1.0, 3000)),  # Zeros
+    ]
+    return np.stack(columns, axis=1)
+
+
+def test_merged_shards_match_numpy_in_any_order(data):
+    shards = np.array_split(data, [1, 700, 701, 2500])  # Includes a single row
+    for order in itertools.permutations(range(len(shards))):
+        stats = RunningStats(data.shape[1])
+        for i in order:
+            stats.merge(RunningStats(data.shape[1]).update(shards[i]))
+        assert stats.count == len(data)
+        np.testing.assert_allclose(stats.mean, data.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(stats.std, data.std(axis=0), rtol=1e-10)
+        np.testing.assert_array_equal(stats.min, data.min(axis=0))
+        np.testing.assert_array_equal(stats.max, data.max(axis=0))
+
+
+def test_empty_updates_and_round_trip(data):
+    stats = RunningStats(data.shape[1]).update(data[:0]).update(data)
+    stats.merge(RunningStats(data.shape[1]))
+    restored = RunningStats.from_dict(stats.to_dict())
+    np.testing.assert_array_equal(restored.mean, stats.mean)
+    np.testing.assert_array_equal(restored.m2, stats.m2)
+    assert restored.count == len(data)
+    assert np.isnan(RunningStats(2).std).all()
+
+
+@pytest.mark.parametrize("q", [0.0, 0.01, 0.25, 0.5, 0.9, 0.99, 1.0])
+def test_quantile_sketch_stays_within_relative_accuracy(data, q):
+    sketch = QuantileSketch(data.shape[1], relative_accuracy=0.01)
+    for shard in np.array_split(data, 7):
+        sketch.merge(QuantileSketch(data.shape[1]).update(shard))
+
+    expected = np.quantile(data, q, axis=0, method="lower")
+    error = np.abs(sketch.quantile(q) - expected)
+    assert (error <= 0.01 * np.abs(expected) + 1e-12).all(), (q, error)
+
+
+def test_quantile_sketch_of_empty_columns_is_nan():
+    assert np.isnan(QuantileSketch(3).quantile(0.5)).all()
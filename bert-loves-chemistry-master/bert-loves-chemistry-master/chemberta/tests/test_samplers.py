@@ -0,0 +1,91 @@
+"""Length-grouped batches and the padding of multitask_data_collator.
+
+Run from the repository root: python -m pytest chemberta/tests
+"""
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from chemberta.utils.data_collators import multitask_data_collator  # noqa: E402
+from chemberta.utils.samplers import LengthGroupedBatchSampler  # noqa: E402
+
+LENGTHS = np.random.default_rng(0).integers(5, 200, size=1003)
+
+
+def sampler(**kwargs):
+    kwargs = {"batch_size": 16, "bucket_size": 4, "seed": 3, **kwargs}
+    return LengthGroupedBatchSampler(LENGTHS, **kwargs)
+
+
+@pytest.mark.parametrize("epoch", [0, 1, 7])
+def test_every_index_once_per_epoch(epoch):
+    batch_sampler = sampler()
+    batch_sampler.set_epoch(epoch)
+    indices = [i for batch in batch_sampler for i in batch]
+    assert sorted(indices) == list(range(len(LENGTHS)))
+
+
+@pytest.mark.parametrize("drop_last", [False, True])
+@pytest.mark.parametrize("num_replicas", [1, 2, 3, 4])
+def test_len_matches_batches(drop_last, num_replicas):
+    seen = []
+    for rank in range(num_replicas):
+        batch_sampler = sampler(
+            drop_last=drop_last, num_replicas=num_replicas, rank=rank
+        )
+        batches = list(batch_sampler)
+        assert len(batches) == len(batch_sampler)
+        if drop_last:
+            assert all(len(batch) == 16 for batch in batches)
+        seen += [i for batch in batches for i in batch]
+    # Replicas never share an index
+    assert len(seen) == len(set(seen))
+
+
+def test_batches_group_similar_lengths():
+    spread = [np.ptp(LENGTHS[batch]) for batch in sampler()]
+    random_spread = [np.ptp(batch) for batch in np.array_split(LENGTHS, 63)]
+    assert np.mean(spread) < np.mean(random_spread) / 2
+
+
+def test_order_depends_on_seed_and_epoch():
+    first, second = sampler(), sampler()
+    first.set_epoch(2)
+    second.set_epoch(2)
+    assert list(first) == list(second)
+    # Iterating does not advance the epoch
+    assert list(first) == list(second)
+
+    second.set_epoch(3)
+    assert list(first) != list(second)
+    assert list(sampler(seed=4)) != list(sampler())
+
+
+def test_collator_pads_to_multiple_of_8():
+    features = [
+        {
+            "input_ids": torch.arange(2, 2 + n),
+            "attention_mask": torch.ones(n, dtype=torch.long),
+            "label": torch.tensor([float(n)]),
+        }
+        for n in (3, 11, 9)
+    ]
+    batch = multitask_data_collator(features, pad_token_id=1)
+
+    assert batch["input_ids"].shape == (3, 16)
+    assert batch["attention_mask"].shape == (3, 16)
+    assert batch["labels"].tolist() == [[3.0], [11.0], [9.0]]
+    for row, feature in enumerate(features):
+        n = len(feature["input_ids"])
+        assert torch.equal(batch["input_ids"][row, :n], feature["input_ids"])
+        assert (batch["input_ids"][row, n:] == 1).all()
+        assert (batch["attention_mask"][row, :n] == 1).all()
+        assert (batch["attention_mask"][row, n:] == 0).all()
+
+    # Already a multiple of 8: no extra padding
+    batch = multitask_data_collator(
+        [{"input_ids": torch.arange(8)}, {"input_ids": torch.arange(5)}]
+    )
+    assert batch["input_ids"].shape == (2, 8)
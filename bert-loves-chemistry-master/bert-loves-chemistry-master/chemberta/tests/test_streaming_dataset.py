@@ -0,0 +1,83 @@
+"""Exact resume of StreamingTextDataset from a saved cursor.
+
+Run from the repository root: python -m pytest chemberta/tests
+"""
+
+import json
+
+import pytest
+
+torch = pytest.importorskip("torch")
+from torch.utils.data import DataLoader  # noqa: E402
+
+from chemberta.utils.streaming_dataset import (  # noqa: E402
+    CURSOR_HISTORY,
+    StreamingTextDataset,
+)
+
+# More examples in flight per worker ((prefetch_factor + 1) x batch) than
+# CURSOR_HISTORY, which per-example cursors could not cover
+BATCH_SIZE = 2048
+CONSUMED_BATCHES = 4
+
+
+class CharTokenizer:
+    def __call__(self, line, add_special_tokens=True, truncation=True, max_length=None):
+        return {"input_ids": [ord(c) for c in line][:max_length]}
+
+
+def as_lists(batch):
+    return [example.tolist() for example in batch]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    for f in range(2):
+        lines = [f"C{f}" + "O" * (i % 11) + str(i) for i in range(12_000)]
+        (tmp_path / f"part{f}.txt").write_text("\n".join(lines) + "\n")
+    return str(tmp_path)
+
+
+def make_dataset(corpus):
+    return StreamingTextDataset(
+        CharTokenizer(),
+        corpus,
+        block_size=64,
+        shuffle_buffer_size=500,
+        seed=3,
+        cursor_interval=BATCH_SIZE,
+    )
+
+
+def make_loader(dataset, num_workers):
+    return DataLoader(
+        dataset, batch_size=BATCH_SIZE, collate_fn=as_lists, num_workers=num_workers
+    )
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_resume_continues_the_uninterrupted_sequence(corpus, num_workers):
+    assert 3 * BATCH_SIZE > CURSOR_HISTORY
+    uninterrupted = list(make_loader(make_dataset(corpus), num_workers))
+
+    dataset = make_dataset(corpus)
+    batches = iter(make_loader(dataset, num_workers))
+    consumed = [next(batches) for _ in range(CONSUMED_BATCHES)]
+    # Saved while the workers have prefetched further batches
+    state = json.loads(
+        json.dumps(dataset.cursor_state(CONSUMED_BATCHES, BATCH_SIZE, num_workers))
+    )
+    del batches
+
+    resumed_dataset = make_dataset(corpus)
+    resumed_dataset.load_state_dict(state)
+    resumed = list(make_loader(resumed_dataset, num_workers))
+
+    assert consumed == uninterrupted[:CONSUMED_BATCHES]
+    assert resumed == uninterrupted[CONSUMED_BATCHES:]
+
+
+def test_cursor_needs_whole_batches(corpus):
+    dataset = make_dataset(corpus)
+    with pytest.raises(ValueError):
+        dataset.cursor_state(1, BATCH_SIZE // 2, 0)
@@ -87,6 +87,12 @@ def dataset_flags():
         help="Fraction of dataset to use for training. Gets overridden by `eval_path`, if provided.",
         module_name="dataset",
     )
+    flags.DEFINE_string(
+        name="descriptor_path",
+        default=None,
+        help="For `regression_lazy`: output directory of utils/precompute_descriptors.py for `dataset_path`. Labels are read from it (missing rows are computed on the fly) and, without `normalization_path`, so are the normalization values.",
+        module_name="dataset",
+    )
     flags.DEFINE_string(
         name="output_dir",
         default="default_dir",
@@ -99,6 +105,24 @@ def dataset_flags():
         help="Subdirectory for results",
         module_name="dataset",
     )
+    flags.DEFINE_boolean(
+        name="streaming",
+        default=False,
+        help="Stream the dataset files instead of indexing them up front. Requires `eval_path` and `max_steps`; resumes from the read position saved with each checkpoint.",
+        module_name="dataset",
+    )
+    flags.DEFINE_boolean(
+        name="group_by_length",
+        default=True,
+        help="Batch training sequences of similar length together, so dynamically padded batches carry less padding. Ignored with `streaming`.",
+        module_name="dataset",
+    )
+    flags.DEFINE_integer(
+        name="shuffle_buffer_size",
+        default=10_000,
+        help="Number of consecutive lines shuffled together when streaming.",
+        module_name="dataset",
+    )
 
 
 def train_flags():
@@ -132,6 +156,12 @@ def train_flags():
         help="Number of update steps between two logs if logging_strategy='steps'.",
         module_name="training",
     )
+    flags.DEFINE_integer(
+        name="max_steps",
+        default=-1,
+        help="If positive, the total number of training steps to perform, overriding `num_train_epochs`. Required with `streaming`.",
+        module_name="training",
+    )
     flags.DEFINE_float(
         name="num_train_epochs",
         default=100,
@@ -8,6 +8,13 @@ Usage [mlm]:
         --output_dir=<OUTPUT_DIR>
         --run_name=<RUN_NAME>
 
+    <DATASET_PATH> may also be a directory written by utils/tokenize_corpus.py, which
+    skips tokenization during training (pass an eval_path in the same format).
+
+    With --streaming --eval_path=<EVAL_PATH> --max_steps=<STEPS>, the text files are
+    streamed instead of indexed up front, and an interrupted run resumes from the
+    read position saved with its latest checkpoint.
+
 Usage [regression]:
     python train_roberta.py
         --model_type=regression
@@ -15,6 +22,18 @@ Usage [regression]:
         --normalization_path=<PATH_TO_CACHED_NORMS>
         --output_dir=<OUTPUT_DIR>
         --run_name=<RUN_NAME>
+
+Usage [regression_lazy]:
+    python train_roberta.py
+        --model_type=regression_lazy
+        --dataset_path=<SMILES_PATH>
+        --descriptor_path=<PRECOMPUTED_DESCRIPTORS_DIR>
+        --output_dir=<OUTPUT_DIR>
+        --run_name=<RUN_NAME>
+
+    <PRECOMPUTED_DESCRIPTORS_DIR> is written by utils/precompute_descriptors.py and
+    also provides the normalization values. Without it, the RDKit descriptors are
+    computed on the fly and --normalization_path is required.
 >
 """
 
@@ -35,7 +54,12 @@ from chemberta.train.flags import (
     tokenizer_flags,
     train_flags,
 )
-from chemberta.train.utils import AwsS3Callback, DatasetArguments, create_trainer
+from chemberta.train.utils import (
+    AwsS3Callback,
+    DatasetArguments,
+    StreamingCursorCallback,
+    create_trainer,
+)
 
 # Model params
 flags.DEFINE_enum(
@@ -86,6 +110,10 @@ def main(argv):
         FLAGS.tokenizer_path,
         FLAGS.tokenizer_max_length,
         FLAGS.mlm_probability,
+        FLAGS.streaming,
+        FLAGS.shuffle_buffer_size,
+        FLAGS.group_by_length,
+        FLAGS.descriptor_path,
     )
 
     training_args = TrainingArguments(
@@ -99,10 +127,13 @@ def main(argv):
         run_name=FLAGS.run_name,
         overwrite_output_dir=FLAGS.overwrite_output_dir,
         num_train_epochs=FLAGS.num_train_epochs,
+        max_steps=FLAGS.max_steps,
         per_device_train_batch_size=FLAGS.per_device_train_batch_size,
         per_device_eval_batch_size=FLAGS.per_device_train_batch_size,
         save_total_limit=FLAGS.save_total_limit,
         fp16=torch.cuda.is_available(),  # fp16 only works on CUDA devices
+        # The streaming cursor restores the read position; don't replay batches
+        ignore_data_skip=FLAGS.streaming,
     )
 
     callbacks = [
@@ -150,6 +181,9 @@ def main(argv):
         iters.sort()
         latest_checkpoint = os.path.join(run_dir, f"checkpoint-{iters[-1]}")
         print(f"Loading model from latest checkpoint: {latest_checkpoint}")
+        for callback in trainer.callback_handler.callbacks:
+            if isinstance(callback, StreamingCursorCallback):
+                callback.load(latest_checkpoint)
         trainer.train(resume_from_checkpoint=latest_checkpoint)
     else:
         trainer.train()
@@ -1,9 +1,11 @@
 import json
+import os
 import subprocess
 from dataclasses import dataclass
+from functools import partial
 from typing import List
 
-from torch.utils.data import random_split
+from torch.utils.data import DataLoader, random_split
 from transformers import (
     DataCollatorForLanguageModeling,
     RobertaForMaskedLM,
@@ -13,13 +15,21 @@ from transformers import (
     TrainerCallback,
 )
 
-from chemberta.utils.data_collators import multitask_data_collator
+from chemberta.utils.data_collators import PAD_TO_MULTIPLE_OF, multitask_data_collator
+from chemberta.utils.descriptor_cache import NORMALIZATION_FILE
+from chemberta.utils.memmap_dataset import MemmapTokenDataset, is_memmap_dataset
 from chemberta.utils.raw_text_dataset import (
     LazyRegressionDataset,
     RawTextDataset,
     RegressionTextDataset,
 )
 from chemberta.utils.roberta_regression import RobertaForRegression
+from chemberta.utils.samplers import LengthGroupedBatchSampler, dataset_lengths
+from chemberta.utils.streaming_dataset import (
+    SHUFFLE_BUFFER_SIZE,
+    StreamingRegressionDataset,
+    StreamingTextDataset,
+)
 
 
 def create_trainer(
@@ -34,8 +44,19 @@ def create_trainer(
         dataset_args.tokenizer_path,
     )
 
+    if dataset_args.streaming:
+        return create_streaming_trainer(
+            model_type,
+            config,
+            training_args,
+            dataset_args,
+            callbacks,
+            tokenizer,
+            pretrained_model,
+        )
+
     if model_type == "mlm":
-        dataset_class = RawTextDataset
+        dataset_class = mlm_dataset_class(dataset_args.dataset_path)
         dataset = dataset_class(
             tokenizer=tokenizer,
             file_path=dataset_args.dataset_path,
@@ -43,7 +64,10 @@ def create_trainer(
         )
 
         data_collator = DataCollatorForLanguageModeling(
-            tokenizer=tokenizer, mlm=True, mlm_probability=dataset_args.mlm_probability
+            tokenizer=tokenizer,
+            mlm=True,
+            mlm_probability=dataset_args.mlm_probability,
+            pad_to_multiple_of=PAD_TO_MULTIPLE_OF,
         )
         model = RobertaForMaskedLM
 
@@ -63,7 +87,29 @@ def create_trainer(
         config.norm_std = normalization_values["std"]
         model = RobertaForRegression
 
-        data_collator = multitask_data_collator
+        data_collator = partial(
+            multitask_data_collator, pad_token_id=tokenizer.pad_token_id
+        )
+
+    elif model_type == "regression_lazy":
+        dataset_class = LazyRegressionDataset
+        dataset = dataset_class(
+            tokenizer=tokenizer,
+            file_path=dataset_args.dataset_path,
+            block_size=dataset_args.tokenizer_max_length,
+            descriptor_path=dataset_args.descriptor_path,
+        )
+
+        normalization_values = load_normalization_values(dataset_args)
+
+        config.num_labels = dataset.num_labels
+        config.norm_mean = normalization_values["mean"]
+        config.norm_std = normalization_values["std"]
+        model = RobertaForRegression
+
+        data_collator = partial(
+            multitask_data_collator, pad_token_id=tokenizer.pad_token_id
+        )
 
     elif model_type == "classification":
         dataset_class = RegressionTextDataset
@@ -76,7 +122,9 @@ def create_trainer(
         config.num_labels = dataset.num_labels
         model = RobertaForSequenceClassification
 
-        data_collator = multitask_data_collator
+        data_collator = partial(
+            multitask_data_collator, pad_token_id=tokenizer.pad_token_id
+        )
 
     else:
         raise ValueError(model_type)
@@ -92,7 +140,8 @@ def create_trainer(
         dataset, dataset_class, dataset_args, tokenizer
     )
 
-    return Trainer(
+    trainer_class = LengthGroupedTrainer if dataset_args.group_by_length else Trainer
+    return trainer_class(
         model=model,
         args=training_args,
         data_collator=data_collator,
@@ -102,6 +151,91 @@ def create_trainer(
     )
 
 
+def create_streaming_trainer(
+    model_type,
+    config,
+    training_args,
+    dataset_args,
+    callbacks: List,
+    tokenizer,
+    pretrained_model=None,
+):
+    """
+    Trainer reading the train and eval sets with streaming datasets.
+
+    Streams have no length, so training is bounded by `training_args.max_steps`, and
+    the eval set must be given separately (there is nothing to split). The returned
+    trainer carries a StreamingCursorCallback; call its `load` with the checkpoint
+    before resuming, and set `ignore_data_skip` so the Trainer does not replay data.
+    """
+    if not dataset_args.eval_path:
+        raise ValueError("Streaming datasets require an eval_path")
+    if training_args.max_steps <= 0:
+        raise ValueError("Streaming datasets require max_steps > 0")
+
+    if model_type == "mlm":
+        dataset_class = StreamingTextDataset
+        data_collator = DataCollatorForLanguageModeling(
+            tokenizer=tokenizer,
+            mlm=True,
+            mlm_probability=dataset_args.mlm_probability,
+            pad_to_multiple_of=PAD_TO_MULTIPLE_OF,
+        )
+        model = RobertaForMaskedLM
+    elif model_type in ("regression", "classification"):
+        dataset_class = StreamingRegressionDataset
+        data_collator = partial(
+            multitask_data_collator, pad_token_id=tokenizer.pad_token_id
+        )
+        model = (
+            RobertaForRegression
+            if model_type == "regression"
+            else RobertaForSequenceClassification
+        )
+    else:
+        raise ValueError(model_type)
+
+    train_dataset = dataset_class(
+        tokenizer=tokenizer,
+        file_path=dataset_args.dataset_path,
+        block_size=dataset_args.tokenizer_max_length,
+        shuffle_buffer_size=dataset_args.shuffle_buffer_size,
+        seed=training_args.seed,
+        # Examples per step from each worker's stream (see StreamingCursorCallback)
+        cursor_interval=training_args.train_batch_size * training_args.world_size,
+    )
+    eval_dataset = dataset_class(
+        tokenizer=tokenizer,
+        file_path=dataset_args.eval_path,
+        block_size=dataset_args.tokenizer_max_length,
+        shuffle_buffer_size=0,
+    )
+
+    if model_type != "mlm":
+        config.num_labels = train_dataset.num_labels
+    if model_type == "regression":
+        with open(dataset_args.normalization_path) as f:
+            normalization_values = json.load(f)
+        config.norm_mean = normalization_values["mean"]
+        config.norm_std = normalization_values["std"]
+
+    if pretrained_model:
+        model = model.from_pretrained(
+            pretrained_model, config=config, use_auth_token=True
+        )
+    else:
+        model = model(config=config)
+
+    return Trainer(
+        model=model,
+        args=training_args,
+        data_collator=data_collator,
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        callbacks=callbacks + [StreamingCursorCallback(train_dataset)],
+    )
+
+
 def get_hyperopt_trainer(
     model_type, config, training_args, dataset_args, callbacks: List
 ):
@@ -111,13 +245,16 @@ def get_hyperopt_trainer(
     )
 
     if model_type == "mlm":
-        dataset = RawTextDataset(
+        dataset = mlm_dataset_class(dataset_args.dataset_path)(
             tokenizer=tokenizer,
             file_path=dataset_args.dataset_path,
             block_size=dataset_args.tokenizer_max_length,
         )
         data_collator = DataCollatorForLanguageModeling(
-            tokenizer=tokenizer, mlm=True, mlm_probability=dataset_args.mlm_probability
+            tokenizer=tokenizer,
+            mlm=True,
+            mlm_probability=dataset_args.mlm_probability,
+            pad_to_multiple_of=PAD_TO_MULTIPLE_OF,
         )
 
         def model_init_fn():
@@ -146,17 +283,19 @@ def get_hyperopt_trainer(
 
         model_init_callable = model_init_fn
 
-        data_collator = multitask_data_collator
+        data_collator = partial(
+            multitask_data_collator, pad_token_id=tokenizer.pad_token_id
+        )
 
     elif model_type == "regression_lazy":
         dataset = LazyRegressionDataset(
             tokenizer=tokenizer,
             file_path=dataset_args.dataset_path,
             block_size=dataset_args.tokenizer_max_length,
+            descriptor_path=dataset_args.descriptor_path,
         )
 
-        with open(dataset_args.normalization_path) as f:
-            normalization_values = json.load(f)
+        normalization_values = load_normalization_values(dataset_args)
 
         config.num_labels = dataset.num_labels
         config.norm_mean = normalization_values["mean"]
@@ -169,14 +308,17 @@ def get_hyperopt_trainer(
 
         model_init_callable = model_init_fn
 
-        data_collator = multitask_data_collator
+        data_collator = partial(
+            multitask_data_collator, pad_token_id=tokenizer.pad_token_id
+        )
 
     else:
         raise ValueError(model_type)
 
     train_dataset, eval_dataset = get_train_test_split(dataset, dataset_args.frac_train)
 
-    return Trainer(
+    trainer_class = LengthGroupedTrainer if dataset_args.group_by_length else Trainer
+    return trainer_class(
         model_init=model_init_callable,
         args=training_args,
         data_collator=data_collator,
@@ -195,6 +337,26 @@ class DatasetArguments:
     tokenizer_path: str
     tokenizer_max_length: int
     mlm_probability: float
+    streaming: bool = False
+    shuffle_buffer_size: int = SHUFFLE_BUFFER_SIZE
+    group_by_length: bool = True
+    descriptor_path: str = None
+
+
+def load_normalization_values(dataset_args):
+    """Descriptor means/stds from normalization_path, else from the descriptor cache."""
+    path = dataset_args.normalization_path
+    if not path and dataset_args.descriptor_path:
+        path = os.path.join(dataset_args.descriptor_path, NORMALIZATION_FILE)
+    with open(path) as f:
+        return json.load(f)
+
+
+def mlm_dataset_class(dataset_path):
+    """MemmapTokenDataset for tokenize_corpus.py output, RawTextDataset otherwise."""
+    if is_memmap_dataset(dataset_path):
+        return MemmapTokenDataset
+    return RawTextDataset
 
 
 def get_dataset_splits(dataset, dataset_class, dataset_args, tokenizer):
@@ -222,6 +384,51 @@ def create_train_test_split(dataset, frac_train):
     return train_dataset, eval_dataset
 
 
+class LengthGroupedTrainer(Trainer):
+    """
+    Trainer that batches training sequences of similar length together.
+
+    With the dynamic padding of the collators, batches are padded to their own
+    longest sequence instead of a random one. The train dataset needs `lengths()`
+    (see `chemberta.utils.samplers`).
+
+    The Trainer does not set the epoch of a custom batch sampler, so a
+    `SamplerEpochCallback` does; a resumed run then continues with the batch order of
+    the epoch it was interrupted in.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_callback(SamplerEpochCallback())
+
+    def get_train_dataloader(self):
+        batch_sampler = LengthGroupedBatchSampler(
+            dataset_lengths(self.train_dataset),
+            batch_size=self.args.train_batch_size,
+            drop_last=self.args.dataloader_drop_last,
+            seed=self.args.seed,
+            num_replicas=self.args.world_size,
+            rank=self.args.process_index,
+        )
+        return DataLoader(
+            self.train_dataset,
+            batch_sampler=batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+
+
+class SamplerEpochCallback(TrainerCallback):
+    """Sets the epoch of the train batch sampler from the Trainer state."""
+
+    def on_epoch_begin(self, args, state, control, train_dataloader=None, **kwargs):
+        batch_sampler = getattr(train_dataloader, "batch_sampler", None)
+        if hasattr(batch_sampler, "set_epoch"):
+            # Fractional when resuming mid-epoch; the whole part is the epoch
+            batch_sampler.set_epoch(int(state.epoch))
+
+
 class AwsS3Callback(TrainerCallback):
     def __init__(self, local_directory, s3_directory):
         self.local_directory = local_directory
@@ -242,3 +449,53 @@ class AwsS3Callback(TrainerCallback):
             ]
         )
         return
+
+
+class StreamingCursorCallback(TrainerCallback):
+    """
+    Saves the read position of a streaming train set with every checkpoint.
+
+    The cursor is written as `streaming_cursor.json` in the checkpoint directory;
+    `load` restores it before `trainer.train(resume_from_checkpoint=...)`, so training
+    continues with the first example the interrupted run had not consumed.
+    """
+
+    CURSOR_FILE = "streaming_cursor.json"
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.steps = 0
+        self._started = False
+
+    def load(self, checkpoint_dir):
+        path = os.path.join(checkpoint_dir, self.CURSOR_FILE)
+        if not os.path.isfile(path):
+            print(f"No streaming cursor in {checkpoint_dir}, starting from the top")
+            return
+        with open(path) as f:
+            self.dataset.load_state_dict(json.load(f))
+        print(f"Resuming streaming dataset from {path}")
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        # The first pass keeps the initial (or resumed) epoch; later passes reshuffle
+        if self._started:
+            self.dataset.set_epoch(self.dataset.epoch + 1)
+        self._started = True
+        self.steps = 0
+
+    def on_step_end(self, args, state, control, **kwargs):
+        self.steps += 1
+
+    def on_save(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        cursor = self.dataset.cursor_state(
+            consumed_batches=self.steps * args.gradient_accumulation_steps,
+            batch_size=args.train_batch_size * args.world_size,
+            num_workers=args.dataloader_num_workers,
+        )
+        checkpoint_dir = os.path.join(
+            args.output_dir, f"checkpoint-{state.global_step}"
+        )
+        with open(os.path.join(checkpoint_dir, self.CURSOR_FILE), "w") as f:
+            json.dump(cursor, f)
@@ -1,49 +1,275 @@
-"""Computes means and stds of RDKit descriptors on a .smi file, needed for MTR pretraining."""
+"""Computes means and stds of RDKit descriptors on a .smi file, needed for MTR pretraining.
 
+The file is processed in chunks of `chunk_bytes` (aligned to lines) on a process pool.
+Each worker reads its own chunk and reduces it to mergeable accumulators (running
+mean/variance/min/max, and optionally a quantile sketch), so memory does not depend on
+the size of the file. The merged accumulators and the list of finished chunks are
+saved to a state file as the run progresses; re-running the same command resumes
+from it. State files of different runs (e.g. of the shards of a corpus, computed on
+different machines) can be combined with --merge_states.
+
+The descriptors and accumulators are the ones `descriptor_cache.precompute_descriptors`
+uses (see `descriptors.py` and `running_stats.py`); when the descriptors are
+precomputed anyway, its normalization_values.json already holds the means and stds.
+
+Usage:
+    python compute_norms.py
+        --smiles_file=pubchem-10m.smi
+        --output_file=normalization_values.json
+        [--min_max] [--quantiles=0.01,0.5,0.99]
+
+    python compute_norms.py
+        --merge_states=shard0.json.state.npz,shard1.json.state.npz
+        --output_file=normalization_values.json
+"""
+
+import io
 import json
 import os
-import pandas as pd
-from tqdm import tqdm
+import time
+from multiprocessing import Pool
 
 import numpy as np
 from absl import app, flags
-from rdkit import Chem
-from rdkit.ML.Descriptors.MoleculeDescriptors import MolecularDescriptorCalculator
+
+from chemberta.utils.descriptors import descriptor_calculator, descriptor_rows
+from chemberta.utils.running_stats import QuantileSketch, RunningStats
 
 flags.DEFINE_string(name="smiles_file", default=None, help="")
 flags.DEFINE_string(name="output_file", default="normalization_values.json", help="")
+flags.DEFINE_string(
+    name="state_file",
+    default=None,
+    help="Resumable progress file (default: <output_file>.state.npz)",
+)
+flags.DEFINE_integer(
+    name="chunk_bytes", default=1 << 20, help="Bytes of the file per task"
+)
+flags.DEFINE_integer(name="num_workers", default=None, help="Default: one per CPU core")
+flags.DEFINE_boolean(name="min_max", default=False, help="Also write min and max")
+flags.DEFINE_list(
+    name="quantiles",
+    default=[],
+    help="Also write these quantiles, estimated within 1% relative error",
+)
+flags.DEFINE_list(
+    name="merge_states",
+    default=[],
+    help="Instead of computing, merge these state files into output_file",
+)
 
 
 FLAGS = flags.FLAGS
 
+BATCH_SIZE = 10_000  # Molecules per descriptor array inside a worker
+STATE_SAVE_SECONDS = 60
+
+
+def chunk_ranges(path, chunk_bytes):
+    """(start, end) byte ranges covering the file; each line belongs to one range."""
+    size = os.path.getsize(path)
+    starts = range(0, size, chunk_bytes)
+    return [(start, min(start + chunk_bytes, size)) for start in starts]
+
+
+def read_smiles(path, start, end):
+    """Non-empty lines starting in [start, end)."""
+    with open(path, "rb") as f:
+        if start > 0:
+            # The line under `start` belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            smiles = line.decode("utf-8").strip()
+            if smiles:
+                yield smiles
+
+
+_worker_calculator = None
+_worker_settings = None
+
+
+def _init_worker(path, sketch):
+    global _worker_calculator, _worker_settings
+    descriptors, _worker_calculator = descriptor_calculator()
+    _worker_settings = (path, len(descriptors), sketch)
+
+
+def _process_chunk(task):
+    """Worker: reduces the descriptors of one chunk to accumulators."""
+    index, start, end = task
+    path, n_descriptors, sketch = _worker_settings
+    stats = RunningStats(n_descriptors)
+    quantiles = QuantileSketch(n_descriptors) if sketch else None
+
+    def add(batch):
+        rows = descriptor_rows(batch, _worker_calculator, n_descriptors)
+        stats.update(rows)
+        if quantiles is not None:
+            quantiles.update(rows)
+
+    batch = []
+    for smiles in read_smiles(path, start, end):
+        batch.append(smiles)
+        if len(batch) == BATCH_SIZE:
+            add(batch)
+            batch = []
+    if batch:
+        add(batch)
+    return index, stats, quantiles
+
+
+def save_state(path, meta, stats, sketch):
+    arrays = {f"stats_{k}": np.asarray(v) for k, v in stats.to_dict().items()}
+    if sketch is not None:
+        arrays.update(
+            sketch_positive=sketch.positive,
+            sketch_negative=sketch.negative,
+            sketch_zero=sketch.zero,
+        )
+    buffer = io.BytesIO()
+    np.savez(buffer, meta=np.array(json.dumps(meta)), **arrays)
+    with open(path + ".tmp", "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(path + ".tmp", path)
+
+
+def load_state(path):
+    """(meta, RunningStats, QuantileSketch or None) saved by `save_state`."""
+    with np.load(path) as state:
+        meta = json.loads(str(state["meta"]))
+        stats = RunningStats.from_dict(
+            {k: state[f"stats_{k}"] for k in ("count", "mean", "m2", "min", "max")}
+        )
+        stats.count = int(stats.count)
+        sketch = None
+        if "sketch_zero" in state:
+            sketch = QuantileSketch(len(stats.mean))
+            sketch.positive = state["sketch_positive"]
+            sketch.negative = state["sketch_negative"]
+            sketch.zero = state["sketch_zero"]
+    return meta, stats, sketch
+
+
+def compute_norms(smiles_file, state_file, chunk_bytes, num_workers=None, sketch=False):
+    """
+    Accumulate the descriptor statistics of a SMILES file, resuming from `state_file`.
+
+    Args:
+        smiles_file: One SMILES per line
+        state_file: Progress file, written while running and kept afterwards
+        chunk_bytes: Bytes of the file per task (the unit of parallelism and resuming)
+        num_workers: Worker processes (default: one per CPU core)
+        sketch: Also accumulate a QuantileSketch
+
+    Returns:
+        tuple: (RunningStats, QuantileSketch or None)
+    """
+    descriptors, _ = descriptor_calculator()
+    settings = {
+        "smiles_file": os.path.abspath(smiles_file),
+        "file_size": os.path.getsize(smiles_file),
+        "chunk_bytes": chunk_bytes,
+        "descriptors": descriptors,
+        "sketch": sketch,
+    }
+    if os.path.isfile(state_file):
+        meta, stats, quantiles = load_state(state_file)
+        if {k: meta.get(k) for k in settings} != settings:
+            raise ValueError(
+                f"{state_file} belongs to another file or other settings; "
+                "delete it or pass another --state_file"
+            )
+        print(f"Resuming: {len(meta['done'])} chunks already processed")
+    else:
+        meta = {**settings, "done": []}
+        stats = RunningStats(len(descriptors))
+        quantiles = QuantileSketch(len(descriptors)) if sketch else None
+
+    ranges = chunk_ranges(smiles_file, chunk_bytes)
+    done = set(meta["done"])
+    tasks = [(i, start, end) for i, (start, end) in enumerate(ranges) if i not in done]
+
+    num_workers = num_workers or os.cpu_count() or 1
+    last_save = time.time()
+    with Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(smiles_file, sketch),
+    ) as pool:
+        for index, chunk_stats, chunk_quantiles in pool.imap_unordered(
+            _process_chunk, tasks
+        ):
+            stats.merge(chunk_stats)
+            if quantiles is not None:
+                quantiles.merge(chunk_quantiles)
+            meta["done"].append(index)
+            print(
+                f"Chunk {len(meta['done'])}/{len(ranges)}: {stats.count} molecules"
+            )
+            if time.time() - last_save > STATE_SAVE_SECONDS:
+                save_state(state_file, meta, stats, quantiles)
+                last_save = time.time()
+
+    save_state(state_file, meta, stats, quantiles)
+    return stats, quantiles
+
+
+def merge_state_files(paths):
+    """Merge the accumulators of several state files (e.g. of corpus shards)."""
+    stats, quantiles = None, None
+    for path in paths:
+        meta, file_stats, file_quantiles = load_state(path)
+        if len(meta["done"]) != -(-meta["file_size"] // meta["chunk_bytes"]):
+            raise ValueError(f"{path} is incomplete; finish it before merging")
+        if stats is None:
+            stats, quantiles = file_stats, file_quantiles
+            continue
+        stats.merge(file_stats)
+        if quantiles is not None and file_quantiles is not None:
+            quantiles.merge(file_quantiles)
+        else:
+            quantiles = None  # Quantiles only if every file has a sketch
+    return stats, quantiles
+
 
 def main(argv):
+    if not FLAGS.merge_states and not FLAGS.smiles_file:
+        raise app.UsageError("Pass --smiles_file, or --merge_states")
+    if FLAGS.merge_states:
+        stats, quantiles = merge_state_files(FLAGS.merge_states)
+    else:
+        state_file = FLAGS.state_file or FLAGS.output_file + ".state.npz"
+        stats, quantiles = compute_norms(
+            FLAGS.smiles_file,
+            state_file,
+            FLAGS.chunk_bytes,
+            num_workers=FLAGS.num_workers,
+            sketch=bool(FLAGS.quantiles),
+        )
 
-    descriptors = [name for name, _ in Chem.Descriptors.descList]
-    descriptors.remove("Ipc")
-    calculator = MolecularDescriptorCalculator(descriptors)
-    
-    df = pd.read_csv(FLAGS.smiles_file, names=["smiles"])
-    computed_descriptors = np.vstack([compute_descriptors(s, calculator, len(descriptors)) for s in tqdm(df["smiles"])])
-    
     d = {
-        "mean": list(np.mean(computed_descriptors, axis=0)),
-        "std": list(np.std(computed_descriptors, axis=0)),
+        "mean": stats.mean.tolist(),
+        "std": stats.std.tolist(),
     }
-    
+    if FLAGS.min_max:
+        d["min"] = stats.min.tolist()
+        d["max"] = stats.max.tolist()
+    if FLAGS.quantiles:
+        if quantiles is None:
+            raise ValueError("The state files were computed without --quantiles")
+        d["quantiles"] = {
+            q: np.clip(quantiles.quantile(float(q)), stats.min, stats.max).tolist()
+            for q in FLAGS.quantiles
+        }
+
     with open(FLAGS.output_file, "w") as f:
         json.dump(d, f)
+    print(f"Wrote statistics of {stats.count} molecules to {FLAGS.output_file}")
 
 
-def compute_descriptors(smiles, calculator, n_descriptors):
-    mol = Chem.MolFromSmiles(smiles)
-    if mol is None:
-        mol_descriptors = np.full(shape=(n_descriptors), fill_value=0.0)
-    else:
-        mol_descriptors = np.array(list(calculator.CalcDescriptors(mol)))
-        mol_descriptors = np.nan_to_num(mol_descriptors, nan=0.0, posinf=0.0, neginf=0.0)
-    return mol_descriptors
-    
-
 if __name__ == "__main__":
-    app.run(main=main)
\ No newline at end of file
+    app.run(main=main)
@@ -4,10 +4,37 @@ import torch
 from transformers.data.data_collator import InputDataClass
 from transformers.tokenization_utils_base import BatchEncoding
 
+PAD_TOKEN_ID = 1  # <pad> of the RoBERTa tokenizers
+PAD_TO_MULTIPLE_OF = 8  # Tensor-core friendly sequence lengths
 
-def multitask_data_collator(features: List[InputDataClass]) -> Dict[str, torch.Tensor]:
+
+def padded_length(lengths, pad_to_multiple_of=PAD_TO_MULTIPLE_OF):
+    """Longest length of the batch, rounded up to a multiple of `pad_to_multiple_of`."""
+    longest = max(lengths)
+    if pad_to_multiple_of:
+        longest = -(-longest // pad_to_multiple_of) * pad_to_multiple_of
+    return longest
+
+
+def pad_sequences(sequences, padding_value, length):
+    """Stack 1-D tensors, right-padded with `padding_value` to `length`."""
+    batch = sequences[0].new_full((len(sequences), length), padding_value)
+    for i, sequence in enumerate(sequences):
+        batch[i, : len(sequence)] = sequence
+    return batch
+
+
+def multitask_data_collator(
+    features: List[InputDataClass],
+    pad_token_id: int = PAD_TOKEN_ID,
+    pad_to_multiple_of: int = PAD_TO_MULTIPLE_OF,
+) -> Dict[str, torch.Tensor]:
     """
     Very simple data collator that simply collates batches of dict-like objects and performs special handling for potential keys named label
+
+    Token sequences (1-D tensors such as input_ids and attention_mask) are padded to the
+    longest sequence of the batch, rounded up to `pad_to_multiple_of`: input_ids with
+    `pad_token_id`, everything else with 0.
     """
 
     # In this function we'll make the assumption that all `features` in the batch
@@ -27,7 +54,12 @@ def multitask_data_collator(features: List[InputDataClass]) -> Dict[str, torch.T
     # Again, we will use the first element to figure out which key/values are not None for this model.
     for k, v in first.items():
         if k != "label" and v is not None and not isinstance(v, str):
-            if isinstance(v, torch.Tensor):
+            if isinstance(v, torch.Tensor) and v.dim() == 1:
+                sequences = [f[k] for f in features]
+                length = padded_length([len(s) for s in sequences], pad_to_multiple_of)
+                padding_value = pad_token_id if k == "input_ids" else 0
+                batch[k] = pad_sequences(sequences, padding_value, length)
+            elif isinstance(v, torch.Tensor):
                 batch[k] = torch.stack([f[k] for f in features])
             else:
                 batch[k] = torch.tensor([f[k] for f in features])
@@ -0,0 +1,249 @@
+"""Precomputed RDKit descriptor labels for regression pretraining.
+
+`LazyRegressionDataset` computes ~200 RDKit descriptors in every `__getitem__`, every
+epoch. `precompute_descriptors` computes them once, on a process pool:
+
+    <output_dir>/
+        meta.json                    descriptor names, corpus, shard list and the
+                                     running statistics of every shard
+        descriptors.f32              float32 matrix, one row per corpus line
+        normalization_values.json    {"mean": [...], "std": [...]} of all rows
+
+Row i of the matrix holds the descriptors of line i of the corpus (the lines of all
+files, in `get_data_files` order), exactly as `compute_descriptors` returns them.
+Each shard of `lines_per_shard` rows is written by a worker, which also returns the
+mean/variance accumulators of its rows; shards are recorded in meta.json as they
+finish, so an interrupted run resumes where it stopped and the statistics merge
+across runs.
+
+`DescriptorCache` maps the matrix read-only and returns None for rows of shards that
+are not computed yet, for which the dataset computes the descriptors on the fly.
+
+Examples
+--------
+>>> precompute_descriptors("pubchem-10m.txt", "pubchem-10m-descriptors")
+>>> cache = DescriptorCache("pubchem-10m-descriptors")
+>>> cache.get(0)
+array([11.09, -0.94, ...], dtype=float32)
+"""
+
+import json
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+from chemberta.utils.descriptors import descriptor_calculator, descriptor_rows
+from chemberta.utils.raw_text_dataset import TextLines, get_data_files
+from chemberta.utils.running_stats import RunningStats
+
+META_FILE = "meta.json"
+MATRIX_FILE = "descriptors.f32"
+NORMALIZATION_FILE = "normalization_values.json"
+FORMAT_VERSION = 1
+LINES_PER_SHARD = 100_000
+
+
+def is_descriptor_cache(path):
+    """Whether `path` is a directory written by `precompute_descriptors`."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def _load_meta(output_dir):
+    with open(os.path.join(output_dir, META_FILE)) as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _iter_chunks(data_files, lines_per_shard):
+    """
+    Yields (shard index, lines) for consecutive corpus rows, across files.
+
+    Lines are split on b"\\n" only and decoded as `TextLines` does, so row i is the
+    line `TextLines` returns for i (text mode would also split on a lone "\\r").
+    """
+    shard, lines = 0, []
+    for source in data_files:
+        with open(source, "rb") as f:
+            for line in f:
+                lines.append(line.decode("utf-8").rstrip("\r\n"))
+                if len(lines) == lines_per_shard:
+                    yield shard, lines
+                    shard, lines = shard + 1, []
+    if lines:
+        yield shard, lines
+
+
+_worker_calculator = None
+_worker_settings = None
+
+
+def _init_worker(output_dir, shape):
+    global _worker_calculator, _worker_settings
+    _, _worker_calculator = descriptor_calculator()
+    _worker_settings = (output_dir, shape)
+
+
+def _compute_shard(shard, lines_per_shard, lines):
+    """Worker: writes the descriptor rows of one shard and returns their statistics."""
+    output_dir, shape = _worker_settings
+    rows = descriptor_rows(lines, _worker_calculator, shape[1])
+    matrix = np.memmap(
+        os.path.join(output_dir, MATRIX_FILE), dtype=np.float32, mode="r+", shape=shape
+    )
+    start = shard * lines_per_shard
+    matrix[start : start + len(lines)] = rows
+    matrix.flush()
+    del matrix
+    return {"rows": len(lines), "stats": RunningStats(shape[1]).update(rows).to_dict()}
+
+
+def precompute_descriptors(
+    file_path, output_dir, lines_per_shard=LINES_PER_SHARD, num_workers=None
+):
+    """
+    Compute the RDKit descriptors of every line of a SMILES corpus into a matrix.
+
+    Args:
+        file_path: SMILES file, or directory of SMILES files (one molecule per line)
+        output_dir: Directory for meta.json, the matrix and the normalization values
+        lines_per_shard: Rows per task (the unit of parallelism and of resuming)
+        num_workers: Worker processes (default: one per CPU core)
+
+    Returns:
+        dict: The final meta.json contents
+    """
+    data_files = get_data_files(file_path)
+    data_files = data_files if isinstance(data_files, list) else [data_files]
+    descriptors, _ = descriptor_calculator()
+    num_lines = len(TextLines(data_files))
+    shape = (num_lines, len(descriptors))
+
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {
+        "format_version": FORMAT_VERSION,
+        "descriptors": descriptors,
+        "sources": [os.path.abspath(f) for f in data_files],
+        "num_lines": num_lines,
+        "lines_per_shard": lines_per_shard,
+    }
+    meta = _load_meta(output_dir) if is_descriptor_cache(output_dir) else None
+    if meta is not None and {k: meta.get(k) for k in settings} != settings:
+        raise ValueError(
+            f"{output_dir} was computed with different settings or another corpus; "
+            "use a new output directory"
+        )
+    matrix_path = os.path.join(output_dir, MATRIX_FILE)
+    if meta is None or not os.path.isfile(matrix_path):
+        np.memmap(matrix_path, dtype=np.float32, mode="w+", shape=shape).flush()
+        meta = {**settings, "complete": False, "shards": []}
+        _write_json(os.path.join(output_dir, META_FILE), meta)
+    done = {shard["shard"] for shard in meta["shards"]}
+    if done:
+        print(f"Resuming: {len(done)} shards already computed")
+
+    def record(shard, result):
+        meta["shards"].append({"shard": shard, **result})
+        _write_json(os.path.join(output_dir, META_FILE), meta)
+        print(f"Computed shard {shard}: {result['rows']} molecules")
+
+    num_workers = num_workers or os.cpu_count() or 1
+    with Pool(
+        num_workers, initializer=_init_worker, initargs=(output_dir, shape)
+    ) as pool:
+        # At most two shards per worker in flight: memory does not grow with the corpus
+        pending = deque()
+        for shard, lines in _iter_chunks(data_files, lines_per_shard):
+            if shard in done:
+                continue
+            args = (shard, lines_per_shard, lines)
+            pending.append((shard, pool.apply_async(_compute_shard, args)))
+            while len(pending) >= 2 * num_workers:
+                shard, result = pending.popleft()
+                record(shard, result.get())
+        while pending:
+            shard, result = pending.popleft()
+            record(shard, result.get())
+
+    meta["shards"].sort(key=lambda shard: shard["shard"])
+    stats = RunningStats(len(descriptors))
+    for shard in meta["shards"]:
+        stats.merge(RunningStats.from_dict(shard["stats"]))
+    meta["stats"] = stats.to_dict()
+    meta["complete"] = True
+    _write_json(os.path.join(output_dir, META_FILE), meta)
+    _write_json(
+        os.path.join(output_dir, NORMALIZATION_FILE),
+        {"mean": stats.mean.tolist(), "std": stats.std.tolist()},
+    )
+    print(f"Computed descriptors of {num_lines} molecules in {output_dir}")
+    return meta
+
+
+class DescriptorCache:
+    """
+    Read-only view of a `precompute_descriptors` output directory.
+
+    The matrix is memory-mapped lazily in each process (DataLoader workers share the
+    page cache). A partially computed directory can be used: rows of missing shards
+    are reported as None.
+
+    Args:
+        path: Output directory of `precompute_descriptors`
+        descriptors: Expected descriptor names (checked against the cache)
+        num_lines: Expected number of corpus lines (checked against the cache)
+    """
+
+    def __init__(self, path, descriptors=None, num_lines=None):
+        self.path = path
+        meta = _load_meta(path)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported descriptor cache format in {path}")
+        if descriptors is not None and meta["descriptors"] != list(descriptors):
+            raise ValueError(
+                f"{path} holds other descriptors than this RDKit version computes"
+            )
+        if num_lines is not None and meta["num_lines"] != num_lines:
+            raise ValueError(
+                f"{path} has {meta['num_lines']} rows, but the corpus has "
+                f"{num_lines} lines"
+            )
+
+        self.shape = (meta["num_lines"], len(meta["descriptors"]))
+        self.lines_per_shard = meta["lines_per_shard"]
+        n_shards = -(-self.shape[0] // self.lines_per_shard)
+        self.computed = np.zeros(n_shards, dtype=bool)
+        self.computed[[shard["shard"] for shard in meta["shards"]]] = True
+        self._matrix = None
+        if not self.computed.all():
+            print(
+                f"Descriptor cache {path}: {self.computed.sum()} of {n_shards} shards "
+                "computed, computing the rest on the fly"
+            )
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_matrix"] = None
+        return state
+
+    def get(self, i):
+        """Descriptors of corpus line i (read-only float32 view), None if missing."""
+        if not self.computed[i // self.lines_per_shard]:
+            return None
+        if self._matrix is None:
+            self._matrix = np.memmap(
+                os.path.join(self.path, MATRIX_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=self.shape,
+            )
+        return self._matrix[i]
@@ -0,0 +1,40 @@
+"""RDKit descriptors used as regression labels for MTR pretraining.
+
+Shared by the regression datasets, `descriptor_cache` and `compute_norms.py`, so
+labels, cached rows and normalization values all come from the same descriptors.
+Depends on RDKit and numpy only (no torch), for the preprocessing scripts.
+"""
+
+import numpy as np
+from rdkit import Chem
+from rdkit.ML.Descriptors.MoleculeDescriptors import MolecularDescriptorCalculator
+
+
+def descriptor_calculator():
+    """RDKit descriptor names used as regression labels, and their calculator."""
+    descriptors = [name for name, _ in Chem.Descriptors.descList]
+    descriptors.remove("Ipc")
+    return descriptors, MolecularDescriptorCalculator(descriptors)
+
+
+def compute_descriptors(smiles, calculator, num_labels):
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        mol_descriptors = np.full(shape=(num_labels), fill_value=0.0)
+    else:
+        mol_descriptors = np.array(list(calculator.CalcDescriptors(mol)))
+        mol_descriptors = np.nan_to_num(
+            mol_descriptors, nan=0.0, posinf=0.0, neginf=0.0
+        )
+    assert mol_descriptors.size == num_labels
+
+    return mol_descriptors
+
+
+def descriptor_rows(smiles_list, calculator, num_labels):
+    """(len(smiles_list), num_labels) array of `compute_descriptors` rows."""
+    if not smiles_list:
+        return np.zeros((0, num_labels))
+    return np.stack(
+        [compute_descriptors(smiles, calculator, num_labels) for smiles in smiles_list]
+    )
@@ -0,0 +1,313 @@
+"""Pre-tokenized, memory-mapped corpus format for MLM pretraining.
+
+`RawTextDataset` tokenizes one line per `__getitem__`, so every epoch re-tokenizes the
+whole corpus on the dataloader workers. `tokenize_corpus` does that work once, offline:
+
+    <output_dir>/
+        meta.json                    tokenizer, dtype, shard list, completion flag
+        <source>.<chunk>.ids         flat token ids of the shard (uint16, or uint32 for
+                                     vocabularies above 65535 tokens)
+        <source>.<chunk>.idx         int64 offsets into .ids (sequences + 1 entries)
+
+Each shard holds `lines_per_shard` consecutive lines of one input file, so sequence i
+of the dataset is line i of the corpus (empty lines included). Shards are tokenized on
+a process pool and recorded in meta.json as they finish; re-running the tool skips the
+recorded shards, so an interrupted run resumes where it stopped.
+
+`MemmapTokenDataset` maps the shards read-only and serves slices of them.
+
+Examples
+--------
+>>> tokenize_corpus(
+...     "seyonec/SMILES_tokenized_PubChem_shard00_160k", "pubchem-10m.txt", "pubchem-10m-tok"
+... )
+>>> dataset = MemmapTokenDataset(file_path="pubchem-10m-tok")
+>>> dataset[0]
+tensor([ 12,  16,  16, ...,  13])
+"""
+
+import bisect
+import json
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+LINES_PER_SHARD = 1_000_000
+TOKENIZE_BATCH_SIZE = 10_000
+
+
+def is_memmap_dataset(path):
+    """Whether `path` is a directory written by `tokenize_corpus`."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def token_dtype(vocab_size):
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+def _load_meta(output_dir):
+    with open(os.path.join(output_dir, META_FILE)) as f:
+        return json.load(f)
+
+
+def _write_meta(output_dir, meta):
+    path = os.path.join(output_dir, META_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _shard_name(source, chunk):
+    return f"{os.path.basename(source)}.{chunk:05d}"
+
+
+def _iter_chunks(data_files, lines_per_shard):
+    """Yields (source, chunk index, first line, lines) for every shard of the corpus."""
+    for source in data_files:
+        with open(source, encoding="utf-8") as f:
+            chunk, lines = 0, []
+            for line in f:
+                lines.append(line.rstrip("\r\n"))
+                if len(lines) == lines_per_shard:
+                    yield source, chunk, chunk * lines_per_shard, lines
+                    chunk, lines = chunk + 1, []
+            if lines:
+                yield source, chunk, chunk * lines_per_shard, lines
+
+
+_worker_tokenizer = None
+_worker_settings = None
+
+
+def _init_worker(tokenizer_path, block_size, dtype_name, output_dir):
+    global _worker_tokenizer, _worker_settings
+    from transformers import RobertaTokenizerFast
+
+    _worker_tokenizer = RobertaTokenizerFast.from_pretrained(tokenizer_path)
+    _worker_settings = (block_size, np.dtype(dtype_name), output_dir)
+
+
+def _tokenize_shard(name, lines):
+    """Worker: tokenizes one shard into its .ids/.idx files and returns its counts."""
+    block_size, dtype, output_dir = _worker_settings
+    ids_path = os.path.join(output_dir, name + ".ids")
+    idx_path = os.path.join(output_dir, name + ".idx")
+
+    offsets = [np.zeros(1, dtype=np.int64)]
+    total = 0
+    with open(ids_path + ".tmp", "wb") as f:
+        for start in range(0, len(lines), TOKENIZE_BATCH_SIZE):
+            # Same encoding as RawTextDataset.preprocess
+            encoded = _worker_tokenizer(
+                lines[start : start + TOKENIZE_BATCH_SIZE],
+                add_special_tokens=True,
+                truncation=True,
+                max_length=block_size,
+            )["input_ids"]
+            lengths = np.fromiter(
+                (len(ids) for ids in encoded), dtype=np.int64, count=len(encoded)
+            )
+            flat = np.fromiter(
+                (token for ids in encoded for token in ids),
+                dtype=dtype,
+                count=int(lengths.sum()),
+            )
+            f.write(flat.tobytes())
+            offsets.append(total + np.cumsum(lengths))
+            total += int(lengths.sum())
+    np.concatenate(offsets).tofile(idx_path + ".tmp")
+    os.replace(ids_path + ".tmp", ids_path)
+    os.replace(idx_path + ".tmp", idx_path)
+    return {"sequences": len(lines), "tokens": total}
+
+
+def tokenize_corpus(
+    tokenizer_path,
+    file_path,
+    output_dir,
+    block_size=512,
+    lines_per_shard=LINES_PER_SHARD,
+    num_workers=None,
+):
+    """
+    Tokenize a text corpus (one sequence per line) into memory-mapped shards.
+
+    Args:
+        tokenizer_path: Tokenizer name or path (loaded with RobertaTokenizerFast)
+        file_path: Text file, or directory of text files (see `get_data_files`)
+        output_dir: Directory for meta.json and the shard files
+        block_size: Truncation length, as for RawTextDataset
+        lines_per_shard: Lines per shard (the unit of parallelism and of resuming)
+        num_workers: Tokenizer processes (default: one per CPU core)
+
+    Returns:
+        dict: The final meta.json contents
+    """
+    from transformers import RobertaTokenizerFast
+
+    from chemberta.utils.raw_text_dataset import get_data_files
+
+    data_files = get_data_files(file_path)
+    data_files = sorted(data_files) if isinstance(data_files, list) else [data_files]
+    vocab_size = len(RobertaTokenizerFast.from_pretrained(tokenizer_path))
+    dtype = np.dtype(token_dtype(vocab_size))
+
+    os.makedirs(output_dir, exist_ok=True)
+    settings = {
+        "format_version": FORMAT_VERSION,
+        "tokenizer": tokenizer_path,
+        "vocab_size": vocab_size,
+        "dtype": dtype.name,
+        "block_size": block_size,
+        "lines_per_shard": lines_per_shard,
+        "sources": [os.path.abspath(f) for f in data_files],
+    }
+    meta = _load_meta(output_dir) if is_memmap_dataset(output_dir) else None
+    if meta is not None and {k: meta.get(k) for k in settings} != settings:
+        raise ValueError(
+            f"{output_dir} was tokenized with different settings; "
+            "use a new output directory"
+        )
+    if meta is None:
+        meta = {**settings, "complete": False, "shards": []}
+    done = {shard["name"] for shard in meta["shards"]}
+    if done:
+        print(f"Resuming: {len(done)} shards already tokenized")
+
+    def record(name, source, first_line, result):
+        shard = {
+            "name": name,
+            "source": os.path.abspath(source),
+            "first_line": first_line,
+        }
+        meta["shards"].append({**shard, **result})
+        _write_meta(output_dir, meta)
+        print(
+            f"Tokenized {name}: {result['sequences']} sequences, "
+            f"{result['tokens']} tokens"
+        )
+
+    num_workers = num_workers or os.cpu_count() or 1
+    with Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(tokenizer_path, block_size, dtype.name, output_dir),
+    ) as pool:
+        # At most two shards per worker in flight: memory does not grow with the corpus
+        pending = deque()
+        chunks = _iter_chunks(data_files, lines_per_shard)
+        for source, chunk, first_line, lines in chunks:
+            name = _shard_name(source, chunk)
+            if name in done:
+                continue
+            result = pool.apply_async(_tokenize_shard, (name, lines))
+            pending.append((name, source, first_line, result))
+            while len(pending) >= 2 * num_workers:
+                name, source, first_line, result = pending.popleft()
+                record(name, source, first_line, result.get())
+        while pending:
+            name, source, first_line, result = pending.popleft()
+            record(name, source, first_line, result.get())
+
+    # Dataset order is corpus order, whatever order the shards finished in
+    order = {source: i for i, source in enumerate(meta["sources"])}
+    meta["shards"].sort(key=lambda shard: (order[shard["source"]], shard["first_line"]))
+    meta["complete"] = True
+    _write_meta(output_dir, meta)
+    print(
+        f"Tokenized {sum(s['sequences'] for s in meta['shards'])} sequences into "
+        f"{len(meta['shards'])} shards in {output_dir}"
+    )
+    return meta
+
+
+class MemmapTokenDataset(Dataset):
+    """
+    Torch Dataset over a corpus pre-tokenized by `tokenize_corpus`.
+
+    The shards are memory-mapped read-only and opened lazily in each process, so
+    DataLoader workers share the page cache instead of receiving copies. Items are
+    slices of the mapped token array, widened to int64 for the embedding layer.
+    The constructor accepts the `RawTextDataset` arguments so either class can be
+    used by `create_trainer`.
+    """
+
+    def __init__(self, file_path: str, tokenizer=None, block_size: int = None):
+        super().__init__()
+        self.file_path = file_path
+        meta = _load_meta(file_path)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported pre-tokenized format in {file_path}")
+        if not meta["complete"]:
+            raise ValueError(
+                f"{file_path} is only partially tokenized; "
+                "re-run tokenize_corpus to finish it"
+            )
+        if tokenizer is not None and len(tokenizer) != meta["vocab_size"]:
+            raise ValueError(
+                f"Tokenizer has {len(tokenizer)} tokens, but {file_path} was tokenized "
+                f"with {meta['tokenizer']} ({meta['vocab_size']} tokens)"
+            )
+
+        self.dtype = np.dtype(meta["dtype"])
+        self.block_size = block_size or meta["block_size"]
+        self.shard_names = [shard["name"] for shard in meta["shards"]]
+        # starts[k] is the dataset index of the first sequence of shard k
+        counts = [shard["sequences"] for shard in meta["shards"]]
+        self.starts = np.cumsum([0] + counts).tolist()
+        self.len = self.starts[-1]
+        self._shards = None
+
+        print("Loaded pre-tokenized dataset")
+        print("Number of lines: " + str(self.len))
+        print("Block size: " + str(self.block_size))
+
+    def __len__(self):
+        return self.len
+
+    def __getstate__(self):
+        # np.memmap pickles as a full in-memory copy; workers re-open the files instead
+        state = dict(self.__dict__)
+        state["_shards"] = None
+        return state
+
+    def _open(self):
+        shards = []
+        for name in self.shard_names:
+            path = os.path.join(self.file_path, name)
+            ids = np.memmap(path + ".ids", dtype=self.dtype, mode="r")
+            offsets = np.memmap(path + ".idx", dtype=np.int64, mode="r")
+            shards.append((ids, offsets))
+        self._shards = shards
+
+    def lengths(self):
+        """Token count of every sequence (before block_size truncation)."""
+        if self._shards is None:
+            self._open()
+        return np.concatenate([np.diff(offsets) for _, offsets in self._shards])
+
+    def get_ids(self, i):
+        """Token ids of sequence i as a read-only view of the mapped shard (no copy)."""
+        if i < 0:
+            i += self.len
+        if not 0 <= i < self.len:
+            raise IndexError(i)
+        if self._shards is None:
+            self._open()
+        k = bisect.bisect_right(self.starts, i) - 1
+        ids, offsets = self._shards[k]
+        j = i - self.starts[k]
+        return ids[offsets[j] : offsets[j + 1]]
+
+    def __getitem__(self, i):
+        ids = self.get_ids(i)
+        if len(ids) > self.block_size:
+            # Tokenized with a larger block size: truncate, keep the final special token
+            ids = np.concatenate([ids[: self.block_size - 1], ids[-1:]])
+        return torch.from_numpy(ids.astype(np.int64))
@@ -0,0 +1,40 @@
+"""Precomputes the RDKit descriptor labels of a SMILES corpus for MTR pretraining.
+
+Usage:
+    python precompute_descriptors.py
+        --dataset_path=pubchem-10m.txt
+        --output_dir=pubchem-10m-descriptors
+
+Re-running with the same arguments resumes an interrupted run. Pass the output
+directory as `--descriptor_path` of train_roberta.py (model_type=regression_lazy);
+its normalization_values.json replaces the output of compute_norms.py.
+"""
+
+from absl import app, flags
+
+from chemberta.utils.descriptor_cache import LINES_PER_SHARD, precompute_descriptors
+
+flags.DEFINE_string(
+    name="dataset_path", default=None, help="SMILES file or directory of SMILES files"
+)
+flags.DEFINE_string(name="output_dir", default=None, help="")
+flags.DEFINE_integer(name="lines_per_shard", default=LINES_PER_SHARD, help="")
+flags.DEFINE_integer(name="num_workers", default=None, help="Default: one per CPU core")
+
+flags.mark_flag_as_required("dataset_path")
+flags.mark_flag_as_required("output_dir")
+
+FLAGS = flags.FLAGS
+
+
+def main(argv):
+    precompute_descriptors(
+        FLAGS.dataset_path,
+        FLAGS.output_dir,
+        lines_per_shard=FLAGS.lines_per_shard,
+        num_workers=FLAGS.num_workers,
+    )
+
+
+if __name__ == "__main__":
+    app.run(main)
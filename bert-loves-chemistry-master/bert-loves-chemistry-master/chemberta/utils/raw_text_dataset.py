@@ -1,27 +1,116 @@
+import bisect
 import os
 
 import numpy as np
 import torch
-from nlp import load_dataset
-from rdkit import Chem
-from rdkit.ML.Descriptors.MoleculeDescriptors import MolecularDescriptorCalculator
 from torch.utils.data import Dataset
 
+from chemberta.utils.descriptors import compute_descriptors, descriptor_calculator
+
+
+SCAN_CHUNK_BYTES = 1 << 24
+
+
+class TextLines:
+    """
+    Random access to the lines of one or more text files, read lazily from disk.
+
+    The files are scanned once for newlines (in chunks, so memory stays bounded) and
+    only the byte offset of every line is kept in memory; nothing is cached on disk.
+    File handles are opened on first access in each process, so instances can be
+    passed to DataLoader workers.
+
+    Args:
+        data_files: Path or list of paths (see `get_data_files`)
+        skip_header: Skip the first line of every file (CSV header)
+    """
+
+    def __init__(self, data_files, skip_header=False):
+        self.data_files = data_files if isinstance(data_files, list) else [data_files]
+        self.offsets = [self._scan(path, skip_header) for path in self.data_files]
+        # starts[k] is the index of the first line of file k
+        self.starts = np.cumsum([0] + [len(o) - 1 for o in self.offsets]).tolist()
+        self._handles = None
+
+    @staticmethod
+    def _scan(path, skip_header):
+        """Start offset of every line, followed by the end of the last line."""
+        offsets = [np.zeros(1, dtype=np.int64)]
+        position = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(SCAN_CHUNK_BYTES)
+                if not chunk:
+                    break
+                newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+                offsets.append(newlines.astype(np.int64) + position + 1)
+                position += len(chunk)
+        offsets = np.concatenate(offsets)
+        if offsets[-1] != position:
+            offsets = np.append(offsets, position)  # No newline after the last line
+        return offsets[1:] if skip_header else offsets
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def line_lengths(self):
+        """Byte length of every line (without the newline)."""
+        ends = [offsets[1:] - 1 for offsets in self.offsets]
+        return np.concatenate([e - o[:-1] for e, o in zip(ends, self.offsets)])
+
+    def field_lengths(self, sep=","):
+        """Byte length of the first `sep`-separated field of every line."""
+        lengths = []
+        for path, offsets in zip(self.data_files, self.offsets):
+            starts, ends = offsets[:-1], offsets[1:] - 1
+            field_ends = ends.copy()
+            position = 0
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(SCAN_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    chunk = np.frombuffer(chunk, dtype=np.uint8)
+                    seps = np.flatnonzero(chunk == ord(sep)) + position
+                    position += len(chunk)
+                    line = np.searchsorted(starts, seps, side="right") - 1
+                    keep = line >= 0  # Not in a skipped header
+                    line, seps = line[keep], seps[keep]
+                    # Separators are in file order: the first one of each line counts
+                    line, first = np.unique(line, return_index=True)
+                    field_ends[line] = np.minimum(field_ends[line], seps[first])
+            lengths.append(field_ends - starts)
+        return np.concatenate(lengths)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_handles"] = None
+        return state
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self._handles is None:
+            self._handles = [open(path, "rb") for path in self.data_files]
+        k = bisect.bisect_right(self.starts, i) - 1
+        j = i - self.starts[k]
+        start, end = self.offsets[k][j], self.offsets[k][j + 1]
+        f = self._handles[k]
+        f.seek(start)
+        return f.read(end - start).decode("utf-8").rstrip("\r\n")
+
 
 class RawTextDataset(Dataset):
     """
     Custom Torch Dataset for tokenizing large (up to 100,000,000+ sequences) text corpuses,
-    by not loading the entire dataset into cache and using lazy loading from disk (using huggingface's
-    'NLP' library. See 'https://github.com/huggingface/nlp' for more details on the NLP package.
+    by not loading the entire dataset into memory and reading lines lazily from disk.
+    To skip indexing the corpus up front, see `streaming_dataset.StreamingTextDataset`.
     Examples
     --------
     >>> from raw_text_dataset import RawTextDataset
     >>> dataset = RawTextDataset(tokenizer=tokenizer, file_path="shard_00_selfies.txt", block_size=512)
-    Downloading: 100%
-    1.52k/1.52k [00:03<00:00, 447B/s]
-    Using custom data configuration default
-    Downloading and preparing dataset text/default-f719ef2eb3ab586b (download: Unknown size, generated: Unknown size, post-processed: Unknown sizetotal: Unknown size) to /root/.cache/huggingface/datasets/text/default-f719ef2eb3ab586b/0.0.0/3a79870d85f1982d6a2af884fde86a71c771747b4b161fd302d28ad22adf985b...
-    Dataset text downloaded and prepared to /root/.cache/huggingface/datasets/text/default-f719ef2eb3ab586b/0.0.0/3a79870d85f1982d6a2af884fde86a71c771747b4b161fd302d28ad22adf985b. Subsequent calls will reuse this data.
     Loaded Dataset
     Number of lines: 999988
     Block size: 512
@@ -33,8 +122,7 @@ class RawTextDataset(Dataset):
         self.file_path = file_path
         self.block_size = block_size
 
-        data_files = get_data_files(file_path)
-        self.dataset = load_dataset("text", data_files=data_files)["train"]
+        self.dataset = TextLines(get_data_files(file_path))
         print("Loaded Dataset")
         self.len = len(self.dataset)
         print("Number of lines: " + str(self.len))
@@ -43,9 +131,13 @@ class RawTextDataset(Dataset):
     def __len__(self):
         return self.len
 
-    def preprocess(self, feature_dict):
+    def lengths(self):
+        """Per-line length estimates (bytes) for LengthGroupedBatchSampler."""
+        return self.dataset.line_lengths()
+
+    def preprocess(self, line):
         batch_encoding = self.tokenizer(
-            feature_dict["text"],
+            line,
             add_special_tokens=True,
             truncation=True,
             max_length=self.block_size,
@@ -66,20 +158,22 @@ class RegressionTextIterable(torch.utils.data.IterableDataset):
         self.file_path = file_path
         self.block_size = block_size
 
+        data_files = get_data_files(file_path)
+        self.data_files = data_files if isinstance(data_files, list) else [data_files]
+
         print("Inferring CSV structure from first line...")
-        self.dataset = load_dataset("text", data_files=get_data_files(file_path))[
-            "train"
-        ]
-        self.num_labels = len(self.dataset[0]["text"].split(",")) - 1
+        with open(self.data_files[0], encoding="utf-8") as f:
+            self.num_labels = len(f.readline().split(",")) - 1
 
         print("Loaded Dataset")
-        self.len = len(self.dataset)
-        print("Number of lines: " + str(self.len))
         print("Block size: " + str(self.block_size))
 
     def __iter__(self):
-        for example in self.dataset:
-            yield preprocess(example["text"], self.tokenizer, self.block_size)
+        for path in self.data_files:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\r\n")
+                    yield preprocess(line, self.tokenizer, self.block_size)
 
 
 class RegressionDataset(Dataset):
@@ -91,8 +185,10 @@ class RegressionDataset(Dataset):
         self.block_size = block_size
 
         data_files = get_data_files(file_path)
-        self.dataset = load_dataset("csv", data_files=data_files)["train"]
-        dataset_columns = list(self.dataset.features.keys())
+        first_file = data_files[0] if isinstance(data_files, list) else data_files
+        with open(first_file, encoding="utf-8") as f:
+            dataset_columns = f.readline().rstrip("\r\n").split(",")
+        self.dataset = TextLines(data_files, skip_header=True)
         self.smiles_column = dataset_columns[0]
         self.label_columns = dataset_columns[1:]
         self.num_labels = len(self.label_columns)
@@ -105,8 +201,12 @@ class RegressionDataset(Dataset):
     def __len__(self):
         return self.len
 
+    def lengths(self):
+        """Per-line SMILES length estimates (bytes) for LengthGroupedBatchSampler."""
+        return self.dataset.field_lengths()
+
     def __getitem__(self, i):
-        return preprocess(self.dataset[i]["text"], self.tokenizer, self.block_size)
+        return preprocess(self.dataset[i], self.tokenizer, self.block_size)
 
 
 class RegressionTextDataset(Dataset):
@@ -118,10 +218,8 @@ class RegressionTextDataset(Dataset):
         self.block_size = block_size
 
         print("Inferring CSV structure from first line...")
-        self.dataset = load_dataset("text", data_files=get_data_files(file_path))[
-            "train"
-        ]
-        self.num_labels = len(self.dataset[0]["text"].split(",")) - 1
+        self.dataset = TextLines(get_data_files(file_path))
+        self.num_labels = len(self.dataset[0].split(",")) - 1
         print("Loaded Dataset")
         self.len = len(self.dataset)
         print("Number of lines: " + str(self.len))
@@ -130,8 +228,12 @@ class RegressionTextDataset(Dataset):
     def __len__(self):
         return self.len
 
+    def lengths(self):
+        """Per-line SMILES length estimates (bytes) for LengthGroupedBatchSampler."""
+        return self.dataset.field_lengths()
+
     def __getitem__(self, i):
-        return preprocess(self.dataset[i]["text"], self.tokenizer, self.block_size)
+        return preprocess(self.dataset[i], self.tokenizer, self.block_size)
 
 
 def preprocess(line, tokenizer, block_size):
@@ -148,7 +250,6 @@ def preprocess(line, tokenizer, block_size):
         smiles,
         add_special_tokens=True,
         truncation=True,
-        padding="max_length",
         max_length=block_size,
     )
     batch_encoding["label"] = [_clean_property(x) for x in labels]
@@ -158,70 +259,81 @@ def preprocess(line, tokenizer, block_size):
 
 
 class LazyRegressionDataset(Dataset):
-    """Computes RDKit properties on-the-fly."""
+    """
+    Computes RDKit properties on-the-fly.
 
-    def __init__(self, tokenizer, file_path: str, block_size: int):
+    With `descriptor_path` (a `descriptor_cache.precompute_descriptors` output
+    directory for the same corpus), the labels are read from the precomputed matrix
+    and only rows missing from it are computed on the fly.
+    """
+
+    def __init__(
+        self, tokenizer, file_path: str, block_size: int, descriptor_path: str = None
+    ):
         super().__init__()
         print("init dataset")
         self.tokenizer = tokenizer
         self.file_path = file_path
         self.block_size = block_size
 
-        self.descriptors = [name for name, _ in Chem.Descriptors.descList]
-        self.descriptors.remove("Ipc")
-        self.calculator = MolecularDescriptorCalculator(self.descriptors)
+        self.descriptors, self.calculator = descriptor_calculator()
         self.num_labels = len(self.descriptors)
 
-        data_files = get_data_files(file_path)
-        self.dataset = load_dataset("text", data_files=data_files)["train"]
+        self.dataset = TextLines(get_data_files(file_path))
 
         print("Loaded Dataset")
         self.len = len(self.dataset)
         print("Number of lines: " + str(self.len))
         print("Block size: " + str(self.block_size))
 
+        self.descriptor_cache = None
+        if descriptor_path:
+            from chemberta.utils.descriptor_cache import DescriptorCache
+
+            self.descriptor_cache = DescriptorCache(
+                descriptor_path, descriptors=self.descriptors, num_lines=self.len
+            )
+
     def __len__(self):
         return self.len
 
-    def _compute_descriptors(self, smiles):
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
-            mol_descriptors = np.full(shape=(self.num_labels), fill_value=0.0)
-        else:
-            mol_descriptors = np.array(list(self.calculator.CalcDescriptors(mol)))
-            mol_descriptors = np.nan_to_num(
-                mol_descriptors, nan=0.0, posinf=0.0, neginf=0.0
-            )
-        assert mol_descriptors.size == self.num_labels
+    def lengths(self):
+        """Per-line length estimates (bytes) for LengthGroupedBatchSampler."""
+        return self.dataset.line_lengths()
 
-        return mol_descriptors
+    def _compute_descriptors(self, smiles):
+        return compute_descriptors(smiles, self.calculator, self.num_labels)
 
-    def preprocess(self, feature_dict):
-        smiles = feature_dict["text"]
+    def preprocess(self, smiles, mol_descriptors=None):
         batch_encoding = self.tokenizer(
             smiles,
             add_special_tokens=True,
             truncation=True,
-            padding="max_length",
             max_length=self.block_size,
         )
         batch_encoding = {k: torch.tensor(v) for k, v in batch_encoding.items()}
 
-        mol_descriptors = self._compute_descriptors(smiles)
+        if mol_descriptors is None:
+            mol_descriptors = self._compute_descriptors(smiles)
         batch_encoding["label"] = torch.tensor(mol_descriptors, dtype=torch.float32)
 
         return batch_encoding
 
     def __getitem__(self, i):
-        feature_dict = self.dataset[i]
-        example = self.preprocess(feature_dict)
+        smiles = self.dataset[i]
+        mol_descriptors = None
+        if self.descriptor_cache is not None:
+            mol_descriptors = self.descriptor_cache.get(i)
+        example = self.preprocess(smiles, mol_descriptors)
         return example
 
 
 def get_data_files(train_path):
     if os.path.isdir(train_path):
+        # Sorted, so the line order (and the streaming shard order) is reproducible
         return [
-            os.path.join(train_path, file_name) for file_name in os.listdir(train_path)
+            os.path.join(train_path, file_name)
+            for file_name in sorted(os.listdir(train_path))
         ]
     elif os.path.isfile(train_path):
         return train_path
@@ -0,0 +1,187 @@
+"""Numerically stable, mergeable per-column statistics.
+
+`RunningStats` uses Welford's update generalized to batches (Chan et al.): each batch
+is reduced to (count, mean, sum of squared deviations, min, max) and merged into the
+running values, so statistics of shards computed in different processes combine
+exactly, in any order, without keeping the data.
+
+`QuantileSketch` estimates per-column quantiles within a relative error from
+logarithmically spaced bucket counts (as DDSketch), which merge by addition.
+
+Examples
+--------
+>>> stats = RunningStats(n_columns=2).update(np.array([[1.0, 2.0], [3.0, 4.0]]))
+>>> stats.merge(RunningStats(n_columns=2).update(np.array([[5.0, 6.0]]))).mean
+array([3., 4.])
+"""
+
+import numpy as np
+
+
+class RunningStats:
+    """
+    Running count, mean, variance, min and max of every column of row batches.
+
+    Args:
+        n_columns: Number of columns
+    """
+
+    def __init__(self, n_columns: int):
+        self.count = 0
+        self.mean = np.zeros(n_columns, dtype=np.float64)
+        self.m2 = np.zeros(n_columns, dtype=np.float64)  # Sum of squared deviations
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+
+    def _combine(self, count, mean, m2, min_, max_):
+        if not count:
+            return
+        self.min = np.minimum(self.min, min_)
+        self.max = np.maximum(self.max, max_)
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta**2 * (self.count * count / total)
+        self.count = total
+
+    def update(self, rows):
+        """Add a (rows, columns) array."""
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.mean))
+        if not len(rows):
+            return self
+        mean = rows.mean(axis=0)
+        m2 = ((rows - mean) ** 2).sum(axis=0)
+        self._combine(len(rows), mean, m2, rows.min(axis=0), rows.max(axis=0))
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another RunningStats (e.g. of another shard)."""
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    @property
+    def variance(self):
+        """Population variance (as np.var)."""
+        if not self.count:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        """Population standard deviation (as np.std)."""
+        return np.sqrt(self.variance)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "min": self.min.tolist(),
+            "max": self.max.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(len(d["mean"]))
+        stats.count = d["count"]
+        stats.mean = np.asarray(d["mean"], dtype=np.float64)
+        stats.m2 = np.asarray(d["m2"], dtype=np.float64)
+        stats.min = np.asarray(d["min"], dtype=np.float64)
+        stats.max = np.asarray(d["max"], dtype=np.float64)
+        return stats
+
+
+class QuantileSketch:
+    """
+    Mergeable per-column quantile estimates with bounded relative error.
+
+    Values are counted in buckets (gamma^(i-1), gamma^i] of their magnitude, one set
+    for positive and one for negative values, plus a bucket for magnitudes below
+    `min_value`. Memory is fixed by the covered range: 2 x n_columns x ~2400 counts
+    for the defaults. Magnitudes above `max_value` fall in the last bucket.
+
+    Args:
+        n_columns: Number of columns
+        relative_accuracy: Relative error of the estimates (for |x| >= min_value)
+        min_value: Magnitudes below this count as zero
+        max_value: Upper end of the covered range
+    """
+
+    def __init__(
+        self,
+        n_columns: int,
+        relative_accuracy: float = 0.01,
+        min_value: float = 1e-9,
+        max_value: float = 1e12,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._offset = int(np.floor(np.log(min_value) / np.log(self.gamma)))
+        n_bins = int(np.ceil(np.log(max_value) / np.log(self.gamma))) - self._offset + 1
+        self.positive = np.zeros((n_columns, n_bins), dtype=np.int64)
+        self.negative = np.zeros((n_columns, n_bins), dtype=np.int64)
+        self.zero = np.zeros(n_columns, dtype=np.int64)
+
+    def _count(self, store, magnitudes, columns):
+        n_columns, n_bins = store.shape
+        bins = np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(np.int64)
+        bins = np.clip(bins - self._offset, 0, n_bins - 1)
+        store += np.bincount(
+            columns * n_bins + bins, minlength=n_columns * n_bins
+        ).reshape(n_columns, n_bins)
+
+    def update(self, rows):
+        """Add a (rows, columns) array."""
+        n_columns = len(self.zero)
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, n_columns)
+        columns = np.broadcast_to(np.arange(n_columns), rows.shape)
+        small = np.abs(rows) < self.min_value
+        self.zero += small.sum(axis=0)
+        for store, mask in (
+            (self.positive, (rows > 0) & ~small),
+            (self.negative, (rows < 0) & ~small),
+        ):
+            self._count(store, np.abs(rows[mask]), columns[mask])
+        return self
+
+    def merge(self, other):
+        """Add the counts of another sketch with the same parameters."""
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zero += other.zero
+        return self
+
+    def _bucket_value(self, bins):
+        # Midpoint of the bucket, within relative_accuracy of any value in it
+        return 2 * self.gamma ** (bins + self._offset) / (self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile of every column.
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            np.ndarray: One estimate per column (NaN for empty columns)
+        """
+        n_columns, n_bins = self.positive.shape
+        # All buckets in value order: negatives by decreasing magnitude, zero, positives
+        counts = np.concatenate(
+            [self.negative[:, ::-1], self.zero[:, None], self.positive], axis=1
+        )
+        values = np.concatenate(
+            [
+                -self._bucket_value(np.arange(n_bins))[::-1],
+                [0.0],
+                self._bucket_value(np.arange(n_bins)),
+            ]
+        )
+        cumulative = np.cumsum(counts, axis=1)
+        totals = cumulative[:, -1]
+        rank = q * np.maximum(totals - 1, 0)
+        index = (cumulative <= rank[:, None]).sum(axis=1)
+        estimates = values[np.minimum(index, len(values) - 1)]
+        return np.where(totals > 0, estimates, np.nan)
@@ -0,0 +1,103 @@
+"""Length-grouped batching, so dynamically padded batches carry little padding.
+
+Random batches of SMILES mix 20- and 200-token sequences, and every sequence is
+padded to the longest one. `LengthGroupedBatchSampler` shuffles the dataset, cuts it
+into buckets of `bucket_size` batches, sorts each bucket by length and splits it into
+batches, then shuffles the batch order. Batches hold sequences of similar length
+while the data order stays random between buckets.
+
+Lengths come from the dataset's `lengths()` method: exact token counts for
+`MemmapTokenDataset`, line (or SMILES field) byte lengths for the text datasets, which
+order sequences the same way at no tokenization cost.
+
+Examples
+--------
+>>> sampler = LengthGroupedBatchSampler(dataset_lengths(dataset), batch_size=64)
+>>> loader = DataLoader(dataset, batch_sampler=sampler, collate_fn=multitask_data_collator)
+"""
+
+import numpy as np
+from torch.utils.data import Sampler, Subset
+
+BUCKET_SIZE = 50  # Batches sorted together
+
+
+def dataset_lengths(dataset):
+    """Length estimate of every item, from `dataset.lengths()` (Subsets supported)."""
+    if isinstance(dataset, Subset):
+        return np.asarray(dataset_lengths(dataset.dataset))[np.asarray(dataset.indices)]
+    if not hasattr(dataset, "lengths"):
+        raise TypeError(
+            f"{type(dataset).__name__} has no lengths(); cannot group by length"
+        )
+    return np.asarray(dataset.lengths())
+
+
+class LengthGroupedBatchSampler(Sampler):
+    """
+    Yields batches of indices with similar lengths, in random order.
+
+    The order is derived from (seed, epoch), so a run is reproducible and a resumed
+    run can replay an epoch's order; call `set_epoch` before every epoch to reshuffle
+    (as with DistributedSampler). Under distributed training each process takes every
+    `num_replicas`-th batch.
+
+    Args:
+        lengths: Length (or length estimate) of every item
+        batch_size: Items per batch
+        bucket_size: Batches sorted by length together
+        drop_last: Drop the final batch if it is smaller than batch_size
+        seed: Seed of the shuffles
+        num_replicas: Number of processes
+        rank: Index of this process
+    """
+
+    def __init__(
+        self,
+        lengths,
+        batch_size: int,
+        bucket_size: int = BUCKET_SIZE,
+        drop_last: bool = False,
+        seed: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.drop_last = drop_last
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self, epoch):
+        rng = np.random.default_rng([self.seed, epoch])
+        order = rng.permutation(len(self.lengths))
+        bucket_items = self.batch_size * self.bucket_size
+        batches = []
+        for start in range(0, len(order), bucket_items):
+            bucket = order[start : start + bucket_items]
+            bucket = bucket[np.argsort(-self.lengths[bucket], kind="stable")]
+            batches += np.array_split(
+                bucket, range(self.batch_size, len(bucket), self.batch_size)
+            )
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+        # Every process gets the same number of batches
+        usable = len(batches) - len(batches) % self.num_replicas
+        return batches[self.rank : usable : self.num_replicas]
+
+    def __iter__(self):
+        for batch in self._batches(self.epoch):
+            yield batch.tolist()
+
+    def __len__(self):
+        batches = len(self.lengths) // self.batch_size
+        if not self.drop_last and len(self.lengths) % self.batch_size:
+            batches += 1
+        return batches // self.num_replicas
@@ -0,0 +1,307 @@
+"""Streaming, resumable text datasets for pretraining on large corpora.
+
+Unlike the map-style datasets in `raw_text_dataset.py`, these read the corpus files
+sequentially while training, so startup does not depend on corpus size: nothing is
+indexed or cached up front.
+
+Sharding: every data file (see `get_data_files`) is split into one byte range per
+dataloader worker, aligned to line boundaries, and each worker streams its range of
+every file, so any number of files works with any number of workers. Under
+distributed training the Trainer splits each worker's stream between processes.
+
+Shuffling: the file order is shuffled per epoch and each worker shuffles blocks of
+`shuffle_buffer_size` consecutive lines, seeded by (seed, epoch, file, block offset).
+The order is fully determined by the seed, which is what makes resuming exact.
+
+Resuming: each worker publishes its (shard, byte offset, lines skipped) cursor to
+shared memory after every `cursor_interval` examples, i.e. after every batch it
+produces. `cursor_state` turns the number of batches the trainer has consumed into
+the cursor of every worker, and `load_state_dict` restarts each worker from it. `chemberta.train.utils.StreamingCursorCallback` saves the state
+with every checkpoint.
+
+Examples
+--------
+>>> dataset = StreamingTextDataset(
+...     tokenizer=tokenizer, file_path="pubchem-100m/", block_size=512
+... )
+>>> next(iter(dataset))
+tensor([ 12,  16,  16, ...,  13])
+"""
+
+import ctypes
+import multiprocessing
+import os
+import random
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+from chemberta.utils.descriptors import compute_descriptors, descriptor_calculator
+from chemberta.utils.raw_text_dataset import get_data_files, preprocess
+
+SHUFFLE_BUFFER_SIZE = 10_000
+MAX_WORKERS = 64  # Dataloader workers whose cursors can be saved
+CURSOR_HISTORY = 4096  # Per-worker cursors (one per batch) kept; must exceed the prefetched batches
+
+# Cursor ring entry: examples yielded, epoch, shard, block offset, lines skipped
+_COUNT, _EPOCH, _SHARD, _OFFSET, _SKIP = range(5)
+_FIELDS = 5
+
+
+class StreamingTextDataset(IterableDataset):
+    """
+    Streams one tokenized sequence per line of a text file or directory of text files.
+
+    Args:
+        tokenizer: Tokenizer applied to each line (as in RawTextDataset)
+        file_path: Text file or directory of text files
+        block_size: Truncation length
+        shuffle_buffer_size: Lines shuffled together; 0 or 1 keeps file order (eval)
+        seed: Seed of the shard and block shuffles
+        skip_header: Skip the first line of every file (CSV header)
+        cursor_interval: Examples per batch taken from a worker's stream (the per
+            process batch size times the number of processes); a cursor is kept
+            after every batch
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        file_path: str,
+        block_size: int,
+        shuffle_buffer_size: int = SHUFFLE_BUFFER_SIZE,
+        seed: int = 0,
+        skip_header: bool = False,
+        cursor_interval: int = 1,
+    ):
+        super().__init__()
+        self.tokenizer = tokenizer
+        self.file_path = file_path
+        self.block_size = block_size
+        self.shuffle_buffer_size = max(1, shuffle_buffer_size)
+        self.seed = seed
+        self.skip_header = skip_header
+        self.cursor_interval = max(1, cursor_interval)
+
+        data_files = get_data_files(file_path)
+        self.data_files = data_files if isinstance(data_files, list) else [data_files]
+        self.epoch = 0
+        self._resume = None
+
+        # Shared with the dataloader workers (inherited on fork, passed on spawn)
+        self._cursors = multiprocessing.RawArray(
+            ctypes.c_int64, MAX_WORKERS * CURSOR_HISTORY * _FIELDS
+        )
+        self._resume_pending = multiprocessing.RawArray(ctypes.c_bool, MAX_WORKERS)
+        self._rings()[:, :, _COUNT] = -1
+
+        print("Streaming dataset: " + str(len(self.data_files)) + " files")
+        print("Block size: " + str(self.block_size))
+
+    def preprocess(self, line):
+        batch_encoding = self.tokenizer(
+            line,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.block_size,
+        )
+        return torch.tensor(batch_encoding["input_ids"])
+
+    def set_epoch(self, epoch):
+        """Called by the Trainer at the start of every epoch; reshuffles the order."""
+        self.epoch = epoch
+
+    def _rings(self):
+        return np.frombuffer(self._cursors, dtype=np.int64).reshape(
+            MAX_WORKERS, CURSOR_HISTORY, _FIELDS
+        )
+
+    def _shards(self, epoch, worker_id, num_workers):
+        """The worker's (file index, start byte, end byte) ranges, in epoch order."""
+        shards = []
+        for i, path in enumerate(self.data_files):
+            size = os.path.getsize(path)
+            start = worker_id * size // num_workers
+            shards.append((i, start, (worker_id + 1) * size // num_workers))
+        if self.shuffle_buffer_size > 1:
+            random.Random(f"{self.seed}-{epoch}-{worker_id}").shuffle(shards)
+        return shards
+
+    def _read_block(self, f, end):
+        lines = []
+        while len(lines) < self.shuffle_buffer_size and f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line.decode("utf-8").rstrip("\r\n"))
+        return lines
+
+    def _start_cursor(self, worker_id, num_workers):
+        if self._resume is None or not self._resume_pending[worker_id]:
+            return self.epoch, 0, -1, 0
+        self._resume_pending[worker_id] = False
+        if self._resume["num_workers"] != num_workers:
+            raise ValueError(
+                f"Streaming cursor was saved with {self._resume['num_workers']} "
+                f"dataloader workers; resume with the same number of workers"
+            )
+        cursor = self._resume["workers"][worker_id]
+        return self._resume["epoch"], cursor["shard"], cursor["offset"], cursor["skip"]
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker_id, num_workers = (info.id, info.num_workers) if info else (0, 1)
+        if num_workers > MAX_WORKERS:
+            raise ValueError(f"At most {MAX_WORKERS} dataloader workers are supported")
+        epoch, shard_pos, offset, skip = self._start_cursor(worker_id, num_workers)
+        ring = self._rings()[worker_id]
+        ring[:, _COUNT] = -1
+        ring[0] = (0, epoch, shard_pos, offset, skip)
+
+        interval = self.cursor_interval
+        count = 0
+        shards = self._shards(epoch, worker_id, num_workers)
+        for pos in range(shard_pos, len(shards)):
+            file_index, start, end = shards[pos]
+            with open(self.data_files[file_index], "rb") as f:
+                if offset >= 0:
+                    f.seek(offset)
+                elif start > 0:
+                    # The range starts after the newline at or following `start`
+                    f.seek(start - 1)
+                    f.readline()
+                elif self.skip_header:
+                    f.readline()
+
+                while True:
+                    block_offset = f.tell()
+                    lines = self._read_block(f, end)
+                    if not lines:
+                        break
+                    if self.shuffle_buffer_size > 1:
+                        block_seed = f"{self.seed}-{epoch}-{file_index}-{block_offset}"
+                        random.Random(block_seed).shuffle(lines)
+                    for k in range(skip, len(lines)):
+                        count += 1
+                        if count % interval == 0:
+                            # Position after this batch: where a resumed worker continues
+                            cursor = (count, epoch, pos, block_offset, k + 1)
+                            ring[(count // interval) % CURSOR_HISTORY] = cursor
+                        yield self.preprocess(lines[k])
+                    skip = 0
+            offset = -1
+        if count % interval:
+            # The stream ended inside a batch: resuming after it continues nowhere
+            batches = count // interval + 1
+            cursor = (batches * interval, epoch, len(shards), -1, 0)
+            ring[batches % CURSOR_HISTORY] = cursor
+
+    def cursor_state(self, consumed_batches, batch_size, num_workers):
+        """
+        Read positions after `consumed_batches` batches of the current pass.
+
+        The dataloader takes batches from its workers in turn, so worker w has
+        produced every num_workers-th batch starting at w.
+
+        Args:
+            consumed_batches: Batches the training loop has consumed in this pass
+            batch_size: Examples each batch takes from a worker's stream (the per
+                process batch size times the number of processes); a multiple of
+                `cursor_interval`
+            num_workers: Dataloader workers (0 = main process)
+
+        Returns:
+            dict: Cursor state for `load_state_dict`, JSON serializable
+        """
+        if batch_size % self.cursor_interval:
+            raise ValueError(
+                f"batch_size {batch_size} is not a multiple of the cursor interval "
+                f"{self.cursor_interval}"
+            )
+        num_workers = max(1, num_workers)
+        rings = self._rings()
+        workers = []
+        epoch = self.epoch
+        for w in range(num_workers):
+            batches = consumed_batches // num_workers
+            batches += w < consumed_batches % num_workers
+            count = batches * batch_size
+            entry = rings[w, (count // self.cursor_interval) % CURSOR_HISTORY]
+            if entry[_COUNT] != count:
+                if count:
+                    raise RuntimeError(
+                        f"Cursor of worker {w} after {count} examples is not "
+                        f"available; check cursor_interval or increase CURSOR_HISTORY"
+                    )
+                entry = (0, self.epoch, 0, -1, 0)  # Worker has not started yet
+            epoch = int(entry[_EPOCH])
+            workers.append(
+                {
+                    "shard": int(entry[_SHARD]),
+                    "offset": int(entry[_OFFSET]),
+                    "skip": int(entry[_SKIP]),
+                }
+            )
+        return {
+            "epoch": epoch,
+            "seed": self.seed,
+            "shuffle_buffer_size": self.shuffle_buffer_size,
+            "data_files": [os.path.abspath(f) for f in self.data_files],
+            "num_workers": num_workers,
+            "workers": workers,
+        }
+
+    def load_state_dict(self, state):
+        """Start the next pass at a `cursor_state` (same files, seed and workers)."""
+        expected = {
+            "seed": self.seed,
+            "shuffle_buffer_size": self.shuffle_buffer_size,
+            "data_files": [os.path.abspath(f) for f in self.data_files],
+        }
+        for key, value in expected.items():
+            if state[key] != value:
+                raise ValueError(
+                    f"Streaming cursor has {key}={state[key]!r}, expected {value!r}"
+                )
+        self._resume = state
+        self.epoch = state["epoch"]
+        for w in range(len(state["workers"])):
+            self._resume_pending[w] = True
+
+
+class StreamingRegressionDataset(StreamingTextDataset):
+    """
+    Streams "smiles,label_1,...,label_n" lines (as RegressionTextDataset).
+
+    The number of labels is read from the first line of the first file.
+    """
+
+    def __init__(self, tokenizer, file_path: str, block_size: int, **kwargs):
+        super().__init__(tokenizer, file_path, block_size, **kwargs)
+        with open(self.data_files[0], encoding="utf-8") as f:
+            self.num_labels = len(f.readline().split(",")) - 1
+
+    def preprocess(self, line):
+        return preprocess(line, self.tokenizer, self.block_size)
+
+
+class StreamingLazyRegressionDataset(StreamingTextDataset):
+    """Streams SMILES lines and computes the RDKit descriptor labels on the fly."""
+
+    def __init__(self, tokenizer, file_path: str, block_size: int, **kwargs):
+        super().__init__(tokenizer, file_path, block_size, **kwargs)
+        self.descriptors, self.calculator = descriptor_calculator()
+        self.num_labels = len(self.descriptors)
+
+    def preprocess(self, smiles):
+        batch_encoding = self.tokenizer(
+            smiles,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.block_size,
+        )
+        batch_encoding = {k: torch.tensor(v) for k, v in batch_encoding.items()}
+        mol_descriptors = compute_descriptors(smiles, self.calculator, self.num_labels)
+        batch_encoding["label"] = torch.tensor(mol_descriptors, dtype=torch.float32)
+        return batch_encoding
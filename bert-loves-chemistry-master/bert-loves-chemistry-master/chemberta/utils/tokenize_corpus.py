@@ -0,0 +1,48 @@
+"""Tokenizes a text corpus once into memory-mapped shards for MLM pretraining.
+
+Usage:
+    python tokenize_corpus.py
+        --tokenizer_path=seyonec/SMILES_tokenized_PubChem_shard00_160k
+        --dataset_path=pubchem-10m.txt
+        --output_dir=pubchem-10m-tok
+
+Re-running with the same arguments resumes an interrupted run. Pass the output
+directory as `--dataset_path` of train_roberta.py (model_type=mlm) to train on it.
+"""
+
+from absl import app, flags
+
+from chemberta.utils.memmap_dataset import LINES_PER_SHARD, tokenize_corpus
+
+flags.DEFINE_string(
+    name="tokenizer_path",
+    default="seyonec/SMILES_tokenized_PubChem_shard00_160k",
+    help="",
+)
+flags.DEFINE_string(
+    name="dataset_path", default=None, help="Text file or directory of text files"
+)
+flags.DEFINE_string(name="output_dir", default=None, help="")
+flags.DEFINE_integer(name="block_size", default=512, help="Truncation length")
+flags.DEFINE_integer(name="lines_per_shard", default=LINES_PER_SHARD, help="")
+flags.DEFINE_integer(name="num_workers", default=None, help="Default: one per CPU core")
+
+flags.mark_flag_as_required("dataset_path")
+flags.mark_flag_as_required("output_dir")
+
+FLAGS = flags.FLAGS
+
+
+def main(argv):
+    tokenize_corpus(
+        FLAGS.tokenizer_path,
+        FLAGS.dataset_path,
+        FLAGS.output_dir,
+        block_size=FLAGS.block_size,
+        lines_per_shard=FLAGS.lines_per_shard,
+        num_workers=FLAGS.num_workers,
+    )
+
+
+if __name__ == "__main__":
+    app.run(main)
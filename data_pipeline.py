@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Data Pipeline - Incremental SMARTS.txt -> parsed_reactions.json -> reactions.js
+增量数据管线：只重新解析 SMARTS.txt 中改动过的行，输出与 tools/ 下的 Node 脚本逐字节一致
+
+Python port of tools/convert_smarts.js, tools/assign_difficulty.js,
+tools/validate_reactions.js and tools/rebuild_reactions.js. Every reaction
+line is hashed together with its category; the parsed entry, its difficulty
+and its validation issues are kept in data/pipeline_manifest.json, so a run
+after a one-line edit only re-parses that line. Outputs are rewritten
+atomically and only when their content changed, which also keeps the mtime
+of parsed_reactions.json stable for the problem bank producer.
+
+Usage:
+    python data_pipeline.py build [--force]
+    python data_pipeline.py info
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SMARTS_FILE = os.path.join(BASE_DIR, 'SMARTS.txt')
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+REACTIONS_JS = os.path.join(BASE_DIR, 'reactions.js')
+PROBLEMS_JSON = os.path.join(BASE_DIR, 'tools', 'problem_reactions.json')
+MANIFEST_FILE = os.path.join(BASE_DIR, 'data', 'pipeline_manifest.json')
+
+# Bump when parsing/difficulty/validation rules change so cached entries are discarded
+PIPELINE_VERSION = 1
+
+# ==========================================
+# Parsing (convert_smarts.js)
+# ==========================================
+CATEGORY_MAP = {
+    '烯烃': 'alkene',
+    '炔烃': 'alkyne',
+    '醇': 'alcohol',
+    '苯及其同系物（吡咯、呋喃、噻吩）': 'benzene',
+    '苯及其同系物': 'benzene',
+    '醛、酮': 'carbonyl',
+    '羧酸': 'acid',
+    '卤代烃': 'halide',
+    '醚': 'ether',
+    '硫醇': 'thiol',
+    '环烷烃': 'cycloalkane'
+}
+
+SOURCE_MAP = {
+    'alkene': ['alkenes'],
+    'alkyne': ['alkynes'],
+    'alcohol': ['alcohols'],
+    'benzene': ['benzenes'],
+    'carbonyl': ['carbonyls'],
+    'acid': ['acids'],
+    'halide': ['halides'],
+    'ether': ['ethers'],
+    'thiol': ['thiols'],
+    'cycloalkane': ['cycloalkanes']
+}
+
+# Maps reactant SMARTS to searchable SMILES or marks them as reagents
+COMMON_REAGENTS = {
+    # Diatomic halogens
+    '[Br][Br]': {'smiles': 'BrBr', 'isReagent': True},
+    '[Cl][Cl]': {'smiles': 'ClCl', 'isReagent': True},
+    '[I][I]': {'smiles': 'II', 'isReagent': True},
+    '[F][F]': {'smiles': 'FF', 'isReagent': True},
+    'BrBr': {'smiles': 'BrBr', 'isReagent': True},
+    'ClCl': {'smiles': 'ClCl', 'isReagent': True},
+
+    # Hydrogen halides
+    '[H][Br]': {'smiles': 'Br', 'isReagent': True},
+    '[H][Cl]': {'smiles': 'Cl', 'isReagent': True},
+    '[H][I]': {'smiles': 'I', 'isReagent': True},
+    '[H][F]': {'smiles': 'F', 'isReagent': True},
+    '[Br][H]': {'smiles': 'Br', 'isReagent': True},
+    '[Cl][H]': {'smiles': 'Cl', 'isReagent': True},
+
+    # Hypohalous acids
+    '[OH][Br]': {'smiles': 'OBr', 'isReagent': True},
+    '[OH][Cl]': {'smiles': 'OCl', 'isReagent': True},
+    '[OH][I]': {'smiles': 'OI', 'isReagent': True},
+
+    # Water and hydroxide
+    '[O][H]': {'smiles': 'O', 'isReagent': True},
+    '[OH2]': {'smiles': 'O', 'isReagent': True},
+    'O': {'smiles': 'O', 'isReagent': True},
+    '[OH-]': {'smiles': '[OH-]', 'isReagent': True},
+    '[Na+]': {'smiles': '[Na+]', 'isReagent': True, 'skip': True},
+    '[Na+].[OH-]': {'smiles': '[Na+].[OH-]', 'isReagent': True, 'skip': True},
+
+    # Metals and metal ions (should not search PubChem)
+    '[Hg]': {'smiles': '[Hg]', 'isReagent': True, 'skip': True},
+    '[Mg]': {'smiles': '[Mg]', 'isReagent': True, 'skip': True},
+    '[Li]': {'smiles': '[Li]', 'isReagent': True, 'skip': True},
+    '[Na]': {'smiles': '[Na]', 'isReagent': True, 'skip': True},
+    '[K]': {'smiles': '[K]', 'isReagent': True, 'skip': True},
+
+    # Hydrogen gas
+    '[H][H]': {'smiles': '[H][H]', 'isReagent': True},
+
+    # Nitrogen compounds
+    '[NH2]': {'smiles': 'N', 'isReagent': True},
+    '[NH3]': {'smiles': 'N', 'isReagent': True},
+
+    # Cyanide
+    '[C-]#N': {'smiles': '[C-]#N', 'isReagent': True},
+    '[C-]#[N]': {'smiles': '[C-]#N', 'isReagent': True},
+
+    # Sulfur compounds
+    '[S](=O)(=O)O': {'smiles': 'OS(=O)(=O)O', 'isReagent': True},
+
+    # Nitro group (for nitration)
+    '[N+](=O)[O-]': {'smiles': '[N+](=O)[O-]', 'isReagent': True, 'skip': True},
+    '[N+](=O)([O-])[O]': {'smiles': 'O[N+](=O)[O-]', 'isReagent': True, 'skip': True},
+
+    # Phosphorus halides
+    '[P](Cl)(Cl)(Cl)': {'smiles': 'ClP(Cl)Cl', 'isReagent': True, 'skip': True},
+    '[S](=O)(Cl)(Cl)': {'smiles': 'ClS(Cl)=O', 'isReagent': True, 'skip': True},
+
+    # Acetic anhydride
+    'CC(=O)OC(=O)C': {'smiles': 'CC(=O)OC(=O)C', 'isReagent': True},
+}
+
+# JavaScript's \s, trim() and '.' differ from Python's; spell them out so the
+# output stays byte-identical to the Node scripts
+_JS_SPACE = ('\t\n\v\f\r \u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a'
+             '\u2028\u2029\u202f\u205f\u3000\ufeff')
+_S = f'[{_JS_SPACE}]'
+_DOT = '[^\n\r\u2028\u2029]'
+
+COMMENT_PATTERNS = [
+    re.compile(f'{_S}+#{_S}*({_DOT}*)$'),       # space(s) + # + comment
+    re.compile(f'，{_S}*#{_S}*({_DOT}*)$'),     # Chinese comma + optional space + # + comment
+    re.compile(f',{_S}*#{_S}*({_DOT}*)$'),      # English comma + optional space + # + comment
+    re.compile(f'{_S}{{2,}}({_DOT}*)$'),        # Multiple spaces followed by Chinese text (fallback)
+]
+_TRAILING_COMMAS = re.compile('[,，]+$')
+_WHITESPACE = re.compile(f'{_S}+')
+_NAME_LEADING = re.compile(f'^[#，,{_JS_SPACE}]+')
+_NAME_TRAILING = re.compile(f'[，,{_JS_SPACE}]+$')
+_MAPPING = re.compile(r':\d+')
+
+
+def _trim(text):
+    return text.strip(_JS_SPACE)
+
+
+def detect_category(line):
+    """Category of a header line (None if the line is not a known header)"""
+    for key, category in CATEGORY_MAP.items():
+        if line.startswith(key):
+            return category
+    return None
+
+
+def extract_smarts_and_comment(line):
+    """
+    Split a reaction line into SMARTS and trailing comment
+
+    The '#' of a triple bond is attached to atoms ([C:1]#[C:2]), while a
+    comment '#' follows whitespace or a comma.
+
+    Returns:
+        tuple: (smarts, comment)
+    """
+    smarts = line
+    comment = ''
+    for pattern in COMMENT_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            idx = line.rfind(match.group(0))
+            smarts = _trim(line[:idx])
+            comment = _trim(match.group(1)) if match.group(1) else ''
+            break
+    smarts = _trim(_TRAILING_COMMAS.sub('', smarts))
+    return smarts, comment
+
+
+def extract_search_smarts(smarts):
+    """
+    Reactant search patterns of a reaction SMARTS
+
+    Returns:
+        tuple: (patterns, reactant_info) as stored in parsed_reactions.json
+    """
+    arrow = smarts.find('>>')
+    if arrow == -1:
+        return [], []
+    block = _trim(smarts[:arrow])
+
+    # Split on '.' outside brackets and parentheses
+    reactants = []
+    current = ''
+    depth = 0
+    for char in block:
+        if char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif char == '.' and depth == 0:
+            if _trim(current):
+                reactants.append(_WHITESPACE.sub('', _trim(current)))
+            current = ''
+            continue
+        current += char
+    if _trim(current):
+        reactants.append(_WHITESPACE.sub('', _trim(current)))
+
+    counts = {}
+    for reactant in reactants:
+        normalized = _MAPPING.sub('', reactant)
+        counts[normalized] = counts.get(normalized, 0) + 1
+
+    patterns = []
+    reactant_info = []
+    for normalized, count in counts.items():
+        reagent = COMMON_REAGENTS.get(normalized, {})
+        smiles = reagent.get('smiles')
+        skip = reagent.get('skip', False)
+        search_pattern = smiles if smiles and not skip else normalized
+        patterns.append(search_pattern)
+        reactant_info.append({
+            'smarts': search_pattern,
+            'count': count,
+            'isReagent': reagent.get('isReagent', False),
+            'skip': skip,
+            'smiles': smiles
+        })
+    return patterns, reactant_info
+
+
+# ==========================================
+# Difficulty (assign_difficulty.js)
+# ==========================================
+EASY_KEYWORDS = [
+    '与溴加成', '与氯加成', '与碘加成',
+    '与溴化氢加成', '与氯化氢加成', '与碘化氢加成',
+    '与水加成', '与水反应',
+    '催化加氢', '氢化', '加氢',
+    '卤化', '溴化', '氯化',
+    '硝化', '磺化',
+    '酯化', '水解',
+]
+
+HARD_KEYWORDS = [
+    '格氏', 'Grignard', 'grignard',
+    '羟醛', '醇醛', 'aldol', 'Aldol',
+    '重排', 'rearrangement',
+    'Claisen', 'claisen',
+    'Cannizzaro', 'cannizzaro',
+    'Baeyer-Villiger', 'baeyer',
+    'Wittig', 'wittig',
+    'Hofmann', 'hofmann',
+    'Diels-Alder', 'diels',
+    '复分解', 'metathesis',
+    '偶联', 'coupling',
+    '有机锂', 'organolithium',
+    '炔化物', 'alkynide',
+    '烯醇', 'enol',
+    '卤仿', 'haloform',
+    '共轭加成',
+    '臭氧', 'ozone',
+    '硼氢化', 'hydroboration',
+    '环氧化',
+    'Williamson', 'williamson', '威廉姆逊',
+]
+
+_QUALIFIED_ATOM = re.compile(r'\[.*?;.*?\]')
+
+
+def smarts_complexity(smarts):
+    """Complexity score of a reaction SMARTS (reactant count, mappings, special features)"""
+    if not smarts:
+        return 0
+    score = 0
+    arrow = smarts.find('>>')
+    if arrow > 0:
+        score += smarts[:arrow].count('.') * 0.5
+    mappings = len(_MAPPING.findall(smarts))
+    if mappings > 6:
+        score += 1
+    if mappings > 10:
+        score += 1
+    if '#' in smarts:
+        score += 0.5
+    if 'c' in smarts:
+        score += 0.3
+    if _QUALIFIED_ATOM.search(smarts):
+        score += 0.5
+    return score
+
+
+def assign_difficulty(name, condition, smarts):
+    """Difficulty 1-3: keywords first, then SMARTS complexity"""
+    text = f"{name or ''} {condition or ''}"
+    if any(keyword in text for keyword in HARD_KEYWORDS):
+        return 3
+    if any(keyword in text for keyword in EASY_KEYWORDS):
+        return 1
+    return 3 if smarts_complexity(smarts) >= 2.5 else 2
+
+
+# ==========================================
+# Validation (validate_reactions.js)
+# ==========================================
+PROBLEMATIC_PATTERNS = [
+    (re.compile(r'\(=O\)\(O\)'), '碳同时连接=O和O，价态不对'),
+    (re.compile(r'\[C\].*\[C\].*\[C\].*\[C\].*\[C\].*\[C\]'), '过于复杂的产物结构'),
+    (re.compile(r'\[H\]\[H\]\[H\]\[H\]'), '4个氢原子 - 不合理'),
+    (re.compile(r'\[Br\]\[Br\]\[Br\]'), '3个连续溴原子'),
+    (re.compile(r'>>-\['), '产物以-开头 (聚合物表示法)'),
+    (re.compile(r'-\[.*\]-$'), '产物以-结尾 (聚合物表示法)'),
+]
+
+
+def validate_smarts(smarts):
+    """Structural issues on the product side of a reaction SMARTS"""
+    if not smarts or '>>' not in smarts:
+        return ['无效的反应 SMARTS 格式']
+    products = smarts.split('>>')[1]
+    issues = [desc for pattern, desc in PROBLEMATIC_PATTERNS if pattern.search(products)]
+    if products.count('(') != products.count(')'):
+        issues.append('产物中括号不匹配')
+    if products.count('[') != products.count(']'):
+        issues.append('产物中方括号不匹配')
+    return issues
+
+
+# ==========================================
+# Output rendering (rebuild_reactions.js)
+# ==========================================
+REACTIONS_JS_HEADER = """// 难度等级定义：
+// 1 = easy (简单) - 基础反应，如简单加成、氢化
+// 2 = medium (中等) - 需要理解选择性或机理，如马氏规则、Lindlar催化剂
+// 3 = hard (高级) - 复杂反应，如格氏反应、羟醛缩合、多步反应
+
+window.REACTION_DB_EXTENDED = {
+"""
+
+REACTIONS_JS_FOOTER = """
+};
+
+// 难度等级名称映射
+window.DIFFICULTY_NAMES = {
+  1: "简单",
+  2: "中等",
+  3: "高级"
+};
+
+// 根据难度等级获取反应列表
+window.getReactionsByDifficulty = function(level) {
+  const result = {};
+  for (const key in window.REACTION_DB_EXTENDED) {
+    const reaction = window.REACTION_DB_EXTENDED[key];
+    if (reaction.difficulty === level) {
+      result[key] = reaction;
+    }
+  }
+  return result;
+};
+
+// 根据难度范围获取反应列表 (例如：level 1-2)
+window.getReactionsByDifficultyRange = function(minLevel, maxLevel) {
+  const result = {};
+  for (const key in window.REACTION_DB_EXTENDED) {
+    const reaction = window.REACTION_DB_EXTENDED[key];
+    if (reaction.difficulty >= minLevel && reaction.difficulty <= maxLevel) {
+      result[key] = reaction;
+    }
+  }
+  return result;
+};
+
+window.CHEMICAL_CABINET_EXTENDED = {
+  // 基础试剂
+  reagents_br2: ["BrBr"],
+  reagents_cl2: ["ClCl"],
+  reagents_hbr: ["Br"],
+  reagents_h2o: ["O"],
+  reagents_h2: ["[H][H]"],
+  reagents_peracid: ["CC(=O)OO"],
+  reagents_hno3: ["[O-][N+](=O)O"],
+
+  // 烃类
+  alkenes: [
+    "C=C", "CC=C", "CC(=C)C", "C1=CCCCC1", "c1ccccc1C=C", "CC=CC", "C1=CCCC1"
+  ],
+  alkynes: [
+    "C#C", "CC#C", "CC#CC", "c1ccccc1C#C", "CCC#C"
+  ],
+  alkynes_terminal: [
+    "C#C", "CC#C", "c1ccccc1C#C", "CCC#C"
+  ],
+
+  // 醇类
+  alcohols: ["CO", "CCO", "CCCO", "CC(O)C", "OCc1ccccc1", "C1CCCCC1O"],
+  alcohols_primary: ["CO", "CCO", "CCCO", "OCc1ccccc1"],
+  alcohols_secondary: ["CC(O)C", "C1CCCCC1O"],
+  
+  // 羧酸
+  acids: ["CC(=O)O", "CCC(=O)O", "c1ccccc1C(=O)O"],
+
+  // 卤代烃
+  halides: ["CBr", "CCBr", "CCCCl", "CI", "BrCc1ccccc1", "CC(C)Cl"],
+  halides_alkyl: ["CCl", "CCCl", "CCCCl", "CC(C)Cl"],
+  halides_acyl: ["CC(=O)Cl", "CCC(=O)Cl", "c1ccccc1C(=O)Cl"],
+
+  // 芳香族
+  benzenes: ["c1ccccc1", "Cc1ccccc1", "COc1ccccc1", "Clc1ccccc1", "c1ccc(C)cc1"],
+
+  // 羰基化合物
+  carbonyls: ["CC=O", "CCC=O", "CC(=O)C", "c1ccccc1C=O", "c1ccccc1C(=O)C"],
+  grignard_reagents: ["C[Mg]Cl", "CC[Mg]Cl", "c1ccccc1[Mg]Cl"],
+
+  // 新增类别
+  ethers: ["COC", "CCOCC", "COc1ccccc1"],
+  thiols: ["CS", "CCS", "Sc1ccccc1"],
+  cycloalkanes: ["C1CCCCC1", "C1CCCC1"],
+  amines: ["CN", "CCN", "Nc1ccccc1"],
+  esters: ["CC(=O)OC", "CC(=O)OCC"]
+};
+"""
+
+
+def _js(value):
+    """JSON.stringify(value)"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _pretty(value):
+    """JSON.stringify(value, null, 2)"""
+    return json.dumps(value, ensure_ascii=False, indent=2, separators=(',', ': '))
+
+
+def render_reactions_js(reactions):
+    """reactions.js content for the frontend"""
+    entries = []
+    for key, reaction in reactions.items():
+        entries.append(
+            f'  "{key}": {{\n'
+            f'    category: "{reaction["category"]}",\n'
+            f'    name: {_js(reaction["name"])},\n'
+            f'    difficulty: {reaction["difficulty"]},\n'
+            f'    smarts: {_js(reaction["smarts"])},\n'
+            f'    source: {_js(reaction["source"])},\n'
+            f'    search_smarts: {_js(reaction["search_smarts"])},\n'
+            f'    condition: {_js(reaction["condition"])}\n'
+            f'  }}'
+        )
+    return REACTIONS_JS_HEADER + ',\n'.join(entries) + REACTIONS_JS_FOOTER
+
+
+# ==========================================
+# Incremental build
+# ==========================================
+def line_hash(category, line):
+    """Cache key of one reaction line; the category header it sits under is part of the entry"""
+    return hashlib.sha1(f"{category}\n{line}".encode('utf-8')).hexdigest()
+
+
+def parse_line(category, line):
+    """
+    Parse one reaction line into a cacheable entry
+
+    The id and the fallback name depend on the line's position in its
+    category, so they are filled in by build_reactions; 'comment' is empty
+    when the fallback is needed.
+
+    Returns:
+        dict or None: None if the line holds no reaction SMARTS
+    """
+    smarts, comment = extract_smarts_and_comment(line)
+    if not smarts or '>>' not in smarts:
+        return None
+    patterns, reactant_info = extract_search_smarts(smarts)
+    name = _NAME_TRAILING.sub('', _NAME_LEADING.sub('', comment)) if comment else ''
+    clean_smarts = _WHITESPACE.sub('', smarts)
+    return {
+        'name': name,
+        'smarts': clean_smarts,
+        'search_smarts': patterns,
+        'reactant_info': reactant_info,
+        'difficulty': assign_difficulty(name, name, clean_smarts) if name else None,
+        'issues': validate_smarts(clean_smarts)
+    }
+
+
+def build_reactions(lines, cache=None):
+    """
+    Turn SMARTS.txt lines into the reaction database
+
+    Args:
+        lines: Lines of SMARTS.txt
+        cache: {line hash: parse_line result} from the previous run
+
+    Returns:
+        tuple: (reactions, problems, entries, parsed) where entries is the
+               cache for the next run and parsed the number of lines that
+               were not in the cache
+    """
+    cache = cache or {}
+    reactions = {}
+    problems = []
+    entries = {}
+    counters = {}
+    category = 'uncategorized'
+    parsed = 0
+
+    for line in lines:
+        line = _trim(line)
+        if not line:
+            continue
+        if '>>' not in line:
+            header = detect_category(line)
+            if header:
+                category = header
+                counters.setdefault(category, 0)
+            continue
+
+        digest = line_hash(category, line)
+        if digest in entries:
+            entry = entries[digest]
+        elif digest in cache:
+            entry = entries[digest] = cache[digest]
+        else:
+            entry = entries[digest] = parse_line(category, line)
+            parsed += 1
+        if entry is None:
+            continue
+
+        counters[category] = counters.get(category, 0) + 1
+        key = f"{category}_gen_{counters[category]}"
+        name = entry['name'] or f"{category} 反应 {counters[category]}"
+        difficulty = entry['difficulty']
+        if difficulty is None:
+            difficulty = assign_difficulty(name, name, entry['smarts'])
+        reactions[key] = {
+            'category': category,
+            'name': name,
+            'difficulty': difficulty,
+            'smarts': entry['smarts'],
+            'source': SOURCE_MAP.get(category, [category + 's']),
+            'search_smarts': entry['search_smarts'],
+            'reactant_info': entry['reactant_info'],
+            'condition': name
+        }
+        if entry['issues']:
+            problems.append({'key': key, 'name': name, 'smarts': entry['smarts'], 'issues': entry['issues']})
+
+    return reactions, problems, entries, parsed
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """Previous run's manifest (empty if missing, unreadable or from another pipeline version)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != PIPELINE_VERSION:
+        return {}
+    return manifest
+
+
+def _write_atomic(path, data):
+    """Write bytes via a temp file and os.replace (readers never see a half-written file)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _write_if_changed(path, data):
+    """Atomically write data unless the file already holds exactly that; returns True if written"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    _write_atomic(path, data)
+    return True
+
+
+def run_pipeline(smarts_file=SMARTS_FILE, parsed_json=PARSED_JSON, reactions_js=REACTIONS_JS,
+                 problems_json=PROBLEMS_JSON, manifest_path=MANIFEST_FILE, force=False, progress=print):
+    """
+    Sync parsed_reactions.json, reactions.js and problem_reactions.json with SMARTS.txt
+
+    Args:
+        force: Ignore the manifest and re-parse every line
+
+    Returns:
+        dict: reactions, lines parsed/reused, problem count, written files and seconds
+    """
+    start = time.perf_counter()
+    manifest = {} if force else load_manifest(manifest_path)
+
+    with open(smarts_file, 'r', encoding='utf-8', newline='') as f:
+        lines = re.split(r'\r?\n', f.read())
+    reactions, problems, entries, parsed = build_reactions(lines, manifest.get('entries'))
+
+    outputs = {
+        parsed_json: _pretty(reactions).encode('utf-8'),
+        reactions_js: render_reactions_js(reactions).encode('utf-8'),
+        problems_json: _pretty(problems).encode('utf-8')
+    }
+    written = [os.path.basename(path) for path, data in outputs.items() if _write_if_changed(path, data)]
+
+    if parsed or written or manifest.get('entries', {}).keys() != entries.keys():
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        _write_atomic(manifest_path, json.dumps({
+            'version': PIPELINE_VERSION,
+            'entries': entries,
+            'outputs': {os.path.basename(path): hashlib.sha1(data).hexdigest() for path, data in outputs.items()}
+        }, ensure_ascii=False).encode('utf-8'))
+
+    summary = {
+        'reactions': len(reactions),
+        'parsed': parsed,
+        'reused': len(entries) - parsed,
+        'problems': len(problems),
+        'written': written,
+        'seconds': round(time.perf_counter() - start, 4)
+    }
+    progress(f"[Pipeline] {summary['reactions']} reactions ({parsed} lines parsed, {summary['reused']} reused), "
+             f"{summary['problems']} flagged, wrote {', '.join(written) or 'nothing'} "
+             f"in {summary['seconds'] * 1000:.1f} ms")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync parsed_reactions.json and reactions.js with SMARTS.txt")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="incrementally rebuild the reaction data files")
+    build.add_argument('--force', action='store_true', help="ignore the manifest and re-parse every line")
+    sub.add_parser('info', help="show the manifest of the last build")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        run_pipeline(force=args.force)
+    else:
+        manifest = load_manifest()
+        if not manifest:
+            print("[Pipeline] No manifest; run 'build' first")
+            return
+        print(json.dumps({'cached_lines': len(manifest['entries']), 'outputs': manifest['outputs']}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
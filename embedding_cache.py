@@ -0,0 +1,360 @@
+"""
+Embedding Cache - Persistent SMILES -> embedding store for the AI validator
+分子向量缓存：内存 LRU + 磁盘内存映射 (float16)，重启后依然有效
+
+Layout of one store (one directory per model):
+    meta.json     model name, vector dimension and row capacity
+    vectors.f16   NumPy memmap of shape (capacity, dim), float16
+    index.log     append-only "row<TAB>key" lines; the last line for a row wins
+
+Rows are reused in FIFO order once the store is full. Only one process
+(the holder of writer.lock) appends; other processes open the store
+read-only and pick up new rows as index.log grows.
+"""
+
+import json
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+try:
+    from rdkit import Chem
+    from rdkit import RDLogger
+    RDLogger.DisableLog('rdApp.*')
+except ImportError:
+    Chem = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from server_log import get_logger
+
+log = get_logger('embedding_cache')
+
+# Default locations and limits
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_CACHE_DIR = os.path.join(DATA_DIR, 'embedding_cache')
+MEMORY_CACHE_SIZE = 4096
+DISK_CACHE_CAPACITY = 50000
+
+
+def canonicalize(smiles):
+    """Canonical SMILES used as cache key (input is returned unchanged if RDKit can't parse it)"""
+    if Chem is None or not smiles:
+        return smiles
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return smiles
+    return Chem.MolToSmiles(mol, canonical=True)
+
+
+def _slugify(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name)
+
+
+class EmbeddingCache:
+    """
+    Two-level embedding cache for one model
+
+    Args:
+        model_name: Model identifier; every model gets its own store directory
+        cache_dir: Parent directory of the on-disk store (None = memory only)
+        memory_size: Max vectors kept in the in-memory LRU
+        disk_capacity: Max vectors kept on disk
+    """
+
+    def __init__(self, model_name, cache_dir=DEFAULT_CACHE_DIR,
+                 memory_size=MEMORY_CACHE_SIZE, disk_capacity=DISK_CACHE_CAPACITY):
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.disk_capacity = disk_capacity
+        self.store_dir = os.path.join(cache_dir, _slugify(model_name)) if cache_dir else None
+
+        self._lock = Lock()
+        self._memory = OrderedDict()
+        self._row_of = {}
+        self._key_at = {}
+        self._next_row = 0
+        self._index_lines = 0
+        self._index_offset = 0
+        self._index_identity = None
+        self._vectors = None
+        self._dim = None
+        self._index_file = None
+        self._lock_file = None
+        self._writable = False
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0
+        }
+
+        if self.store_dir:
+            try:
+                self._open_store()
+            except Exception as e:
+                log.warning(f"Disk store disabled: {e}")
+                self._close_store()
+
+    # ------------------------------------------------------------------
+    # Disk store
+    # ------------------------------------------------------------------
+    def _meta_path(self):
+        return os.path.join(self.store_dir, 'meta.json')
+
+    def _vectors_path(self):
+        return os.path.join(self.store_dir, 'vectors.f16')
+
+    def _index_path(self):
+        return os.path.join(self.store_dir, 'index.log')
+
+    def _open_store(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        # Only one process may append to a store; others use it read-only
+        self._lock_file = open(os.path.join(self.store_dir, 'writer.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._writable = True
+            except OSError:
+                self._writable = False
+        else:
+            self._writable = True
+
+        if self._map_vectors() and self._writable:
+            self._index_file = open(self._index_path(), 'a', encoding='utf-8')
+
+    def _map_vectors(self):
+        """Map an existing store; returns False if there is none (or it was reset)"""
+        if not os.path.exists(self._meta_path()):
+            return False
+
+        with open(self._meta_path(), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta.get('model') != self.model_name or meta.get('capacity') != self.disk_capacity:
+            if self._writable:
+                log.info("Store settings changed, starting a new store")
+                self._reset_store()
+            return False
+
+        self._dim = meta['dim']
+        self._vectors = np.memmap(
+            self._vectors_path(), dtype=np.float16,
+            mode='r+' if self._writable else 'r',
+            shape=(self.disk_capacity, self._dim)
+        )
+        self._read_index()
+        return True
+
+    def _read_index(self):
+        """Apply index.log lines written since the last read"""
+        if not os.path.exists(self._index_path()):
+            return
+        if self._index_offset == 0:
+            stat = os.stat(self._index_path())
+            self._index_identity = (stat.st_dev, stat.st_ino)
+        last_row = None
+        with open(self._index_path(), 'rb') as f:
+            f.seek(self._index_offset)
+            for raw_line in f:
+                if not raw_line.endswith(b'\n'):
+                    break  # Partially written line; read it next time
+                self._index_offset += len(raw_line)
+                row_text, sep, key = raw_line.decode('utf-8').rstrip('\n').partition('\t')
+                if not sep or not row_text.isdigit():
+                    continue
+                self._index_lines += 1
+                self._assign(int(row_text), key)
+                last_row = int(row_text)
+        if last_row is not None:
+            self._next_row = (last_row + 1) % self.disk_capacity
+
+    def _refresh_readonly(self):
+        """Pick up rows appended by the writer process"""
+        try:
+            if self._vectors is None:
+                self._map_vectors()
+                return
+            stat = os.stat(self._index_path())
+            identity = (stat.st_dev, stat.st_ino)
+            if identity != self._index_identity:
+                # Writer compacted the index; rebuild the mapping from scratch
+                self._index_identity = identity
+                self._row_of.clear()
+                self._key_at.clear()
+                self._index_offset = 0
+                self._index_lines = 0
+            if stat.st_size > self._index_offset:
+                self._read_index()
+        except (OSError, ValueError):
+            pass
+
+    def _reset_store(self):
+        for path in (self._meta_path(), self._vectors_path(), self._index_path()):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _create_vectors(self, dim):
+        """Allocate the memmap once the embedding dimension is known"""
+        self._dim = dim
+        self._vectors = np.memmap(
+            self._vectors_path(), dtype=np.float16, mode='w+',
+            shape=(self.disk_capacity, dim)
+        )
+        with open(self._meta_path(), 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'dim': dim, 'capacity': self.disk_capacity}, f)
+        self._index_file = open(self._index_path(), 'a', encoding='utf-8')
+
+    def _close_store(self):
+        for handle in (self._index_file, self._lock_file):
+            try:
+                if handle:
+                    handle.close()
+            except Exception:
+                pass
+        self._index_file = None
+        self._lock_file = None
+        self._vectors = None
+        self._writable = False
+
+    def _assign(self, row, key):
+        old_key = self._key_at.get(row)
+        if old_key is not None and self._row_of.get(old_key) == row:
+            del self._row_of[old_key]
+        self._key_at[row] = key
+        self._row_of[key] = row
+
+    def _write_disk(self, key, vector):
+        if not self._writable or key in self._row_of:
+            return
+        if self._vectors is None:
+            self._create_vectors(vector.shape[0])
+
+        row = self._next_row
+        if row in self._key_at:
+            self._counters['disk_evictions'] += 1
+        self._vectors[row] = vector
+        self._assign(row, key)
+        self._next_row = (row + 1) % self.disk_capacity
+
+        self._index_file.write(f"{row}\t{key}\n")
+        self._index_lines += 1
+        if self._index_lines > 2 * self.disk_capacity:
+            self._compact_index()
+
+    def _compact_index(self):
+        """Rewrite index.log with one line per live row, oldest first"""
+        self._index_file.close()
+        tmp_path = self._index_path() + '.tmp'
+        rows = sorted(self._key_at, key=lambda r: (r - self._next_row) % self.disk_capacity)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(f"{row}\t{self._key_at[row]}\n")
+        os.replace(tmp_path, self._index_path())
+        self._index_lines = len(rows)
+        self._index_file = open(self._index_path(), 'a', encoding='utf-8')
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def get_many(self, smiles_list):
+        """
+        Look up embeddings for canonical SMILES
+
+        Args:
+            smiles_list: List of canonical SMILES
+
+        Returns:
+            list: float16 vectors, None for every miss
+        """
+        results = []
+        with self._lock:
+            if self.store_dir and not self._writable and self._lock_file is not None:
+                self._refresh_readonly()
+            for key in smiles_list:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    results.append(vector)
+                    continue
+
+                row = self._row_of.get(key)
+                if row is not None and self._vectors is not None:
+                    vector = np.array(self._vectors[row])
+                    self._remember(key, vector)
+                    self._counters['disk_hits'] += 1
+                    results.append(vector)
+                    continue
+
+                self._counters['misses'] += 1
+                results.append(None)
+        return results
+
+    def put_many(self, smiles_list, vectors):
+        """
+        Store embeddings for canonical SMILES
+
+        Args:
+            smiles_list: List of canonical SMILES
+            vectors: Matching 2-D array-like of embeddings (stored as float16)
+        """
+        vectors = np.asarray(vectors, dtype=np.float16)
+        with self._lock:
+            for key, vector in zip(smiles_list, vectors):
+                self._remember(key, vector)
+                if self._writable:
+                    try:
+                        self._write_disk(key, vector)
+                    except Exception as e:
+                        log.warning(f"Disk write failed, continuing in memory: {e}")
+                        self._close_store()
+            if self._index_file is not None:
+                # Make new rows visible to read-only processes
+                self._index_file.flush()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._counters['memory_evictions'] += 1
+
+    def flush(self):
+        """Flush vectors and index to disk"""
+        with self._lock:
+            if self._vectors is not None and self._writable:
+                self._vectors.flush()
+            if self._index_file is not None:
+                self._index_file.flush()
+
+    def close(self):
+        """Flush and release file handles"""
+        self.flush()
+        with self._lock:
+            self._close_store()
+
+    def stats(self):
+        """Get cache sizes and hit/miss counters"""
+        with self._lock:
+            hits = self._counters['memory_hits'] + self._counters['disk_hits']
+            lookups = hits + self._counters['misses']
+            return {
+                'model': self.model_name,
+                'memory_size': len(self._memory),
+                'memory_max_size': self.memory_size,
+                'disk_size': len(self._row_of),
+                'disk_capacity': self.disk_capacity if self.store_dir else 0,
+                'disk_writable': self._writable,
+                **self._counters,
+                'hit_rate': round(hits / lookups * 100, 2) if lookups else 0.0
+            }
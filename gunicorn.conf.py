@@ -0,0 +1,39 @@
+"""
+gunicorn config for production serving
+生产环境启动：gunicorn -c gunicorn.conf.py "server:create_app()"
+
+Settings come from server_config.ServerConfig (environment variables
+SERVER_WORKERS, SERVER_THREADS, SERVER_TIMEOUT, ... override them).
+"""
+
+import request_metrics
+from server_config import ServerConfig
+
+_config = ServerConfig()
+
+bind = _config.bind
+workers = _config.workers
+# Threaded workers: requests mostly wait on the reaction pool or the model,
+# and the worker heartbeat keeps running while a request thread is busy
+worker_class = 'gthread'
+threads = _config.threads
+timeout = _config.timeout
+graceful_timeout = _config.graceful_timeout
+keepalive = _config.keepalive
+
+# Load RDKit templates and ChemBERTa once in the master; workers share the
+# pages through fork copy-on-write instead of each loading their own copy
+preload_app = _config.preload
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Request counters start from zero with every server start
+    request_metrics.clear_shared_dir(_config.metrics_dir)
+
+
+def post_worker_init(worker):
+    import server
+    server.init_worker()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Load Test - Measure /api/react throughput against worker count
+压力测试：分别以 1、2、4... 个 gunicorn worker 启动服务器，测量吞吐量和延迟
+
+Usage:
+    python load_test.py                       # workers 1,2,4,... up to CPU count
+    python load_test.py --workers 1 2 4 8 --duration 20
+    python load_test.py --url http://127.0.0.1:8000   # test a server that is already running
+
+Jobs are built from parsed_reactions.json: each reactant slot without a fixed
+SMILES gets the first sample molecule that matches its SMARTS, so the load
+looks like real problem generation (without PubChem lookups).
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+from rdkit import Chem
+from rdkit import RDLogger
+
+RDLogger.DisableLog('rdApp.*')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+
+# Common substrates used to fill reactant slots
+SAMPLE_MOLECULES = [
+    'CC=C', 'CC=CC', 'C=CC=C', 'CC#C', 'CC#CC', 'C1=CCCCC1', 'c1ccccc1', 'Cc1ccccc1',
+    'Oc1ccccc1', 'Nc1ccccc1', 'CCO', 'CC(C)O', 'CC(C)(C)O', 'OCCO', 'CC=O', 'CC(C)=O',
+    'O=Cc1ccccc1', 'CC(=O)O', 'CC(=O)OC', 'CC(=O)Cl', 'CC(=O)N', 'CCN', 'CCNCC', 'CC#N',
+    'CCBr', 'CC(C)Br', 'CC(C)(C)Br', 'CCCl', 'CCI', 'CCOCC', 'C1CO1', 'CCS', 'CC(=O)CC(=O)OC',
+    'O=C1CCCCC1', 'CCCCCC', 'CC(C)C',
+]
+
+
+def build_jobs(limit=None):
+    """
+    Build reaction jobs that produce products on the sample molecules
+
+    Returns:
+        list: {'smarts', 'reactants', 'reaction_name'} dicts
+    """
+    with open(PARSED_JSON, 'r', encoding='utf-8') as f:
+        reactions = json.load(f)
+    samples = [(smi, Chem.MolFromSmiles(smi)) for smi in SAMPLE_MOLECULES]
+
+    jobs = []
+    for key, rxn in reactions.items():
+        reactants = []
+        for info in rxn.get('reactant_info', []):
+            if info.get('skip'):
+                continue
+            smiles = info.get('smiles')
+            if not smiles:
+                pattern = Chem.MolFromSmarts(info.get('smarts') or '')
+                if pattern is None:
+                    break
+                smiles = next((smi for smi, mol in samples if mol.HasSubstructMatch(pattern)), None)
+                if smiles is None:
+                    break
+            reactants.append(smiles)
+        else:
+            if reactants and rxn.get('smarts'):
+                jobs.append({'smarts': rxn['smarts'], 'reactants': reactants, 'reaction_name': key})
+        if limit and len(jobs) >= limit:
+            break
+    return jobs
+
+
+def _client(args):
+    """One client process: send requests until the deadline, return latencies"""
+    url, jobs, deadline, seed = args
+    parsed = urllib.parse.urlparse(url)
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+    while time.time() < deadline:
+        body = json.dumps(rng.choice(jobs))
+        started = time.perf_counter()
+        try:
+            conn.request('POST', '/api/react', body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def run_load(url, jobs, concurrency, duration):
+    """
+    Drive the server with `concurrency` client processes for `duration` seconds
+
+    Returns:
+        dict: requests, errors, throughput (req/s) and latency percentiles (ms)
+    """
+    deadline = time.time() + duration
+    with multiprocessing.Pool(concurrency) as pool:
+        results = pool.map(_client, [(url, jobs, deadline, seed) for seed in range(concurrency)])
+
+    latencies = sorted(l for result, _ in results for l in result)
+    errors = sum(e for _, e in results)
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'throughput': 0.0}
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / duration, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 1),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99)
+        }
+    }
+
+
+def _wait_ready(url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/api/ready', timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def start_server(workers, port, ai_validation):
+    """Start gunicorn with the production config and `workers` workers"""
+    env = dict(os.environ)
+    env.update({
+        'SERVER_WORKERS': str(workers),
+        'SERVER_BIND': f'127.0.0.1:{port}',
+        'AI_VALIDATION_ENABLED': '1' if ai_validation else '0',
+        'DATA_LOGGING_ENABLED': '0',
+        'PROBLEM_BANK_PRODUCER': '0',
+    })
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'server:create_app()'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({w for w in (1, 2, 4, 8, cpu_count) if w <= cpu_count})
+
+    parser = argparse.ArgumentParser(description="Load test /api/react")
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers,
+                        help="gunicorn worker counts to compare")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="client processes (default: 4 x the largest worker count)")
+    parser.add_argument('--duration', type=float, default=15, help="seconds per run")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ai', action='store_true', help="enable ChemBERTa validation")
+    parser.add_argument('--url', help="test an already running server instead of starting gunicorn")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    jobs = build_jobs()
+    print(f"[LoadTest] {len(jobs)} reaction jobs, {cpu_count} CPUs")
+    concurrency = args.concurrency or 4 * max(args.workers)
+
+    results = []
+    if args.url:
+        result = run_load(args.url.rstrip('/'), jobs, concurrency, args.duration)
+        results.append({'url': args.url, 'concurrency': concurrency, **result})
+        print(json.dumps(result, indent=2))
+    else:
+        url = f'http://127.0.0.1:{args.port}'
+        for workers in args.workers:
+            process = start_server(workers, args.port, args.ai)
+            try:
+                if not _wait_ready(url):
+                    print(f"[LoadTest] Server with {workers} workers did not become ready")
+                    continue
+                result = run_load(url, jobs, concurrency, args.duration)
+            finally:
+                stop_server(process)
+            results.append({'workers': workers, 'concurrency': concurrency, **result})
+            print(f"[LoadTest] workers={workers:<3} {result['throughput']:>8} req/s  "
+                  f"p50={result.get('latency_ms', {}).get('p50')} ms  "
+                  f"p95={result.get('latency_ms', {}).get('p95')} ms  errors={result['errors']}")
+
+        if results and results[0]['throughput']:
+            base = results[0]['throughput'] / results[0]['workers']
+            print("\nScaling (throughput relative to one worker):")
+            for r in results:
+                speedup = r['throughput'] / results[0]['throughput']
+                efficiency = r['throughput'] / (base * r['workers']) * 100
+                print(f"  {r['workers']:>3} workers: {speedup:.2f}x ({efficiency:.0f}% efficiency)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': cpu_count, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
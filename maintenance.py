@@ -8,10 +8,11 @@ Author: Antigravity (Google DeepMind)
 
 This script serves as a central hub for maintaining the project's data and AI validation workflow.
 Features:
-1. Data Pipeline: Convert SMARTS -> JSON -> JS
-2. Health Check: Validate reaction rules
+1. Data Pipeline: Convert SMARTS -> JSON -> JS (incremental, see data_pipeline.py)
+2. Health Check: Compile and test-run every reaction rule with RDKit
 3. AI Analytics: View validation stats and failure logs
 4. Backup: Snapshot critical data files
+5. Molecule Pools: Precompute reactant pools from a local SMILES corpus
 """
 
 import os
@@ -86,21 +87,24 @@ def run_node_script(script_name):
 # ==========================================
 def update_data_pipeline():
     print("\n>>> Updating Data Pipeline (SMARTS -> JSON -> JS)")
-    
-    # Step 1: Convert SMARTS.txt to parsed_reactions.json
-    if not run_node_script('convert_smarts.js'):
+
+    # Incremental Python port of convert_smarts.js -> assign_difficulty.js ->
+    # validate_reactions.js -> rebuild_reactions.js; only edited lines are re-parsed
+    try:
+        import data_pipeline
+    except ImportError as e:
+        print(f"[Error] Could not import data_pipeline.py: {e}")
+        return
+    try:
+        summary = data_pipeline.run_pipeline()
+    except Exception as e:
+        print(f"[Error] Pipeline failed: {e}")
         return
-    
-    # Step 2: Validate the generated JSON
-    if not run_node_script('validate_reactions.js'):
-        print("[Warning] Validation found issues. Please review detailed output above.")
-        choice = input("Continue anyway? (y/n): ").lower()
-        if choice != 'y':
-            return
 
-    # Step 3: Rebuild reactions.js for Frontend
-    if run_node_script('rebuild_reactions.js'):
-        print("\n[Done] All data files updated successfully.")
+    if summary['problems']:
+        print(f"[Warning] {summary['problems']} reactions flagged by validation, "
+              f"see {os.path.relpath(data_pipeline.PROBLEMS_JSON, BASE_DIR)}")
+    print("\n[Done] All data files updated successfully.")
 
 # ==========================================
 # Feature 2: Health Check
@@ -116,9 +120,27 @@ def run_health_check():
         size = f"{os.path.getsize(f)/1024:.1f} KB" if os.path.exists(f) else "0 KB"
         print(f"{os.path.basename(f):<25} {status} ({size})")
     
-    # 2. Run structural validation
+    # 2. Compile and test-run every template (parallel, RDKit)
     print("\n--- Logic Validation ---")
-    run_node_script('validate_reactions.js')
+    try:
+        import reaction_validation
+    except ImportError as e:
+        print(f"[Error] Could not import reaction_validation.py (RDKit required): {e}")
+        return
+    try:
+        report = reaction_validation.validate_database()
+    except Exception as e:
+        print(f"[Error] Validation failed: {e}")
+        return
+
+    for issue, count in report['summary']['issues'].items():
+        print(f"  {issue:<24} {count}")
+    errors = [(key, r) for key, r in report['reactions'].items() if r['status'] == 'error']
+    for key, r in errors[:10]:
+        print(f"  ❌ {key}: {r['name']} - {'; '.join(i['type'] for i in r['issues'])}")
+    if len(errors) > 10:
+        print(f"  ... and {len(errors) - 10} more")
+    print(f"\nFull report: {os.path.relpath(reaction_validation.REPORT_FILE, BASE_DIR)}")
 
 # ==========================================
 # Feature 3: Backup
@@ -207,26 +229,49 @@ def run_annotator():
 def clean_logs():
     print("\n>>> Cleaning Logs")
     stats_file = os.path.join(DATA_DIR, 'reaction_stats.json')
-    failed_file = os.path.join(DATA_DIR, 'failed_reactions.json')
+    failed_file = os.path.join(DATA_DIR, 'failed_reactions.jsonl')
     
-    if os.path.exists(stats_file):
-        size = os.path.getsize(stats_file) / 1024
-        print(f"Stats file size: {size:.1f} KB")
+    for path in (stats_file, failed_file):
+        if os.path.exists(path):
+            size = os.path.getsize(path) / 1024
+            print(f"{os.path.basename(path)} size: {size:.1f} KB")
     
     choice = input("\nDo you want to archive current logs and start fresh? (y/n): ").lower()
     if choice == 'y':
         create_backup() # Backup first
         
         # Clear files but keep structure
+        if not reaction_logger:
+            print("[Error] reaction_logger module not available.")
+            return
         try:
-            with open(stats_file, 'w') as f:
-                json.dump({}, f)
-            with open(failed_file, 'w') as f:
-                json.dump([], f)
+            reaction_logger.clear_logs()
             print("[Success] Logs cleared (Previous data backed up).")
         except Exception as e:
             print(f"[Error] Could not clear logs: {e}")
 
+# ==========================================
+# Feature 6: Offline Molecule Pools
+# ==========================================
+def build_molecule_pools():
+    """Precompute per-template reactant pools from a local SMILES corpus"""
+    print("\n>>> Building Molecule Pools")
+    corpus = input("SMILES corpus file (one molecule per line): ").strip().strip('"')
+    if not corpus or not os.path.exists(corpus):
+        print(f"[Error] Corpus not found: {corpus}")
+        return
+
+    try:
+        import molecule_pools
+    except ImportError as e:
+        print(f"[Error] Could not import molecule_pools.py: {e}")
+        return
+    try:
+        index = molecule_pools.build_pools(corpus)
+        print(f"[Success] Pools for {len(index['templates'])} templates written to {molecule_pools.POOL_DIR}")
+    except Exception as e:
+        print(f"[Error] Pool build failed: {e}")
+
 # ==========================================
 # Main Menu
 # ==========================================
@@ -240,9 +285,10 @@ def main_menu():
         print("4. [AI]   Stats: View Validation Success Rates")
         print("5. [AI]   Logs: Clean/Reset Logs")
         print("6. [AI]   Train: Annotate Failed Reactions (Label for Fine-tuning)")
+        print("7. [Data] Pools: Build offline molecule pools from a SMILES corpus")
         print("0. Exit")
         
-        choice = input("\nSelect option (0-6): ")
+        choice = input("\nSelect option (0-7): ")
         
         if choice == '1':
             update_data_pipeline()
@@ -256,6 +302,8 @@ def main_menu():
             clean_logs()
         elif choice == '6':
             run_annotator()
+        elif choice == '7':
+            build_molecule_pools()
         elif choice == '0':
             print("Goodbye!")
             break
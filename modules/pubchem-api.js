@@ -5,6 +5,7 @@
 import { appState } from './state.js';
 import { showStatus } from './utils.js';
 import { REACTION_DB } from './state.js';
+import { getServerApiUrl } from './reaction-engine.js';
 
 // 缓存配置
 const CACHE_CONFIG = {
@@ -300,6 +301,30 @@ async function fetchCidsWithPolling(smarts) {
     throw new Error('轮询超时');
 }
 
+/**
+ * 通过服务器端 PubChem 代理获取分子（所有用户共享同一份缓存）
+ * @param {string} smarts - SMARTS 模式
+ * @returns {Promise<string[]|null>} SMILES 数组；服务器不可用或查询失败时返回 null
+ */
+async function fetchMoleculesFromServer(smarts) {
+    try {
+        const url = `${getServerApiUrl('/api/molecules')}?smarts=${encodeURIComponent(smarts)}`;
+        const response = await fetch(url);
+        if (!response.ok) return null;
+
+        const data = await response.json();
+        if (!Array.isArray(data.molecules)) return null;
+        if (data.error && data.molecules.length === 0) {
+            console.warn(`⚠️ 服务器 PubChem 查询失败 (${data.error})，改为浏览器直接查询`);
+            return null;
+        }
+        console.log(`🌐 服务器分子库: ${smarts} (${data.molecules.length} 个分子, ${data.source}${data.stale ? ', 后台刷新中' : ''})`);
+        return data.molecules;
+    } catch (e) {
+        return null;
+    }
+}
+
 /**
  * 从 PubChem 获取匹配 SMARTS 的分子
  * @param {string} smarts - SMARTS 模式
@@ -318,6 +343,17 @@ export async function fetchMoleculesFromPubChem(smarts, verificationSmarts = nul
     }
     
     cacheStats.misses++;
+
+    // 优先使用服务器端代理；服务器不可用时回退到浏览器直接查询 PubChem
+    const serverMolecules = await fetchMoleculesFromServer(smarts);
+    if (serverMolecules !== null) {
+        if (serverMolecules.length > 0) {
+            appState.moleculeCache[cacheKey] = serverMolecules;
+            saveCacheToStorage();
+        }
+        return serverMolecules;
+    }
+
     console.log(`🔍 从 PubChem 搜索: ${smarts}`);
     
     // 尝试使用 fastsubstructure（更快但不稳定），失败时回退到异步轮询模式
@@ -499,6 +535,44 @@ export async function preloadCommonMolecules() {
     console.log("✅ 常用分子库预热完成");
 }
 
+/**
+ * 从服务器获取离线预计算的分子池（molecule_pools.py 生成，无需联网查询 PubChem）
+ * @param {string[]} typeKeys - 反应类型键数组
+ * @returns {Promise<number>} 写入缓存的分子池数量；服务器不可用时返回 0
+ */
+async function loadPrecomputedPools(typeKeys) {
+    if (typeKeys.length === 0) return 0;
+    try {
+        const response = await fetch(getServerApiUrl('/api/pools'), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ keys: typeKeys })
+        });
+        if (!response.ok) return 0;
+
+        const data = await response.json();
+        let loaded = 0;
+        for (const [typeKey, slots] of Object.entries(data.pools || {})) {
+            const def = REACTION_DB[typeKey];
+            if (!def) continue;
+            for (const slot of slots) {
+                const cacheKey = slot.smarts + (def.smarts ? `|${def.smarts}` : "");
+                if (slot.molecules.length > 0 && !(appState.moleculeCache[cacheKey] && appState.moleculeCache[cacheKey].length > 0)) {
+                    appState.moleculeCache[cacheKey] = slot.molecules;
+                    loaded++;
+                }
+            }
+        }
+        if (loaded > 0) {
+            console.log(`🗂️ 预计算分子池: ${loaded} 类分子 (构建于 ${data.built_at})`);
+            saveCacheToStorage();
+        }
+        return loaded;
+    } catch (e) {
+        return 0;
+    }
+}
+
 /**
  * 为选定的反应类型准备分子池 (并行优化版)
  * @param {string[]} availableTypes - 可用的反应类型键数组
@@ -506,6 +580,9 @@ export async function preloadCommonMolecules() {
 export async function prepareMoleculePools(availableTypes) {
     const neededItemsMap = new Map(); // 使用 Map 防止重复
     
+    // 先用服务器上的离线分子池填充缓存，剩下的再从 PubChem 获取
+    await loadPrecomputedPools(availableTypes.filter(typeKey => REACTION_DB[typeKey]));
+    
     for (const typeKey of availableTypes) {
         const def = REACTION_DB[typeKey];
         if (!def) continue;
@@ -514,7 +591,8 @@ export async function prepareMoleculePools(availableTypes) {
                      (def.search_smarts ? def.search_smarts.map(s => ({ smarts: s })) : []);
         
         infos.forEach(info => {
-            if (info && info.smarts && !info.skip) {
+            // 带固定 SMILES 的试剂出题时直接使用，无需分子池
+            if (info && info.smarts && !info.skip && !(info.isReagent && info.smiles)) {
                 const cacheKey = info.smarts + (def.smarts ? `|${def.smarts}` : "");
                 if (!appState.moleculeCache[cacheKey] || appState.moleculeCache[cacheKey].length === 0) {
                     neededItemsMap.set(cacheKey, { search: info.smarts, verification: def.smarts });
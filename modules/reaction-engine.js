@@ -136,14 +136,14 @@ function tryBrowserRDKit(smarts, reactantSmiles) {
  * 获取服务器 API 的 URL
  * 支持通过服务器访问和直接打开的两种情况
  */
-function getServerApiUrl() {
+export function getServerApiUrl(path = '/api/react') {
     // 如果通过 localhost/127.0.0.1 访问，使用同源请求
     if (window.location.hostname === 'localhost' || 
         window.location.hostname === '127.0.0.1') {
-        return '/api/react';
+        return path;
     }
     // 如果是 file:// 协议或其他，使用完整 URL
-    return 'http://127.0.0.1:8000/api/react';
+    return `http://127.0.0.1:8000${path}`;
 }
 
 /**
@@ -241,19 +241,13 @@ function countReactantTemplates(smarts) {
 }
 
 /**
- * 主反应执行函数 - 按优先级尝试不同方法
- * @param {string} rxnKey - 反应类型键
+ * 根据反应定义整理反应物列表
+ * @param {Object} def - 反应定义
  * @param {string} r1Smiles - 反应物1的SMILES
  * @param {string} r2Smiles - 反应物2的SMILES
- * @returns {Promise<string[]>} 产物SMILES数组（最多2个主产物）
+ * @returns {string[]} 反应物 SMILES 列表（可能为空）
  */
-export async function runReactionWithRDKit(rxnKey, r1Smiles, r2Smiles) {
-    const def = REACTION_DB[rxnKey];
-    if (!def || !def.smarts) {
-        console.error("未定义的反应或缺少 SMARTS:", rxnKey);
-        return ["?"];
-    }
-
+function buildReactantList(def, r1Smiles, r2Smiles) {
     // 计算 SMARTS 中需要的反应物数量
     const requiredReactants = countReactantTemplates(def.smarts);
     
@@ -269,13 +263,32 @@ export async function runReactionWithRDKit(rxnKey, r1Smiles, r2Smiles) {
     else if (reactantSmiles.length > requiredReactants) {
         reactantSmiles = reactantSmiles.slice(0, requiredReactants);
     }
+
+    return reactantSmiles;
+}
+
+/**
+ * 主反应执行函数 - 按优先级尝试不同方法
+ * @param {string} rxnKey - 反应类型键
+ * @param {string} r1Smiles - 反应物1的SMILES
+ * @param {string} r2Smiles - 反应物2的SMILES
+ * @returns {Promise<string[]>} 产物SMILES数组（最多2个主产物）
+ */
+export async function runReactionWithRDKit(rxnKey, r1Smiles, r2Smiles) {
+    const def = REACTION_DB[rxnKey];
+    if (!def || !def.smarts) {
+        console.error("未定义的反应或缺少 SMARTS:", rxnKey);
+        return ["?"];
+    }
+
+    const reactantSmiles = buildReactantList(def, r1Smiles, r2Smiles);
     
     if (reactantSmiles.length === 0) {
         console.warn("没有有效的反应物");
         return ["?"];
     }
 
-    console.log(`🧪 执行反应: ${def.name} | 反应物: ${reactantSmiles.join(' + ')} (需要${requiredReactants}个)`);
+    console.log(`🧪 执行反应: ${def.name} | 反应物: ${reactantSmiles.join(' + ')}`);
 
     // 1. 先尝试服务器端 RDKit（更可靠）
     let products = await tryServerRDKit(def.smarts, reactantSmiles);
@@ -294,4 +307,94 @@ export async function runReactionWithRDKit(rxnKey, r1Smiles, r2Smiles) {
     return ["?"];
 }
 
+/**
+ * 批量执行反应 - 一次请求 /api/react/batch 完成整组题目
+ * 服务器不可用时逐个回退到 runReactionWithRDKit
+ * @param {{rxnKey: string, r1: string, r2: string}[]} jobs - 反应任务列表
+ * @returns {Promise<string[][]>} 与 jobs 顺序一致的产物SMILES数组
+ */
+export async function runReactionBatchWithRDKit(jobs) {
+    const results = jobs.map(() => ["?"]);
+    const requests = [];
+
+    jobs.forEach((job, idx) => {
+        const def = REACTION_DB[job.rxnKey];
+        if (!def || !def.smarts) {
+            console.error("未定义的反应或缺少 SMARTS:", job.rxnKey);
+            return;
+        }
+        const reactantSmiles = buildReactantList(def, job.r1, job.r2);
+        if (reactantSmiles.length === 0) return;
+        requests.push({ idx, smarts: def.smarts, reactants: reactantSmiles, reaction_name: job.rxnKey });
+    });
+
+    if (requests.length === 0) return results;
 
+    let serverResults = null;
+    try {
+        const apiUrl = getServerApiUrl('/api/react/batch');
+        console.log(`🌐 批量调用服务器 API: ${apiUrl} (${requests.length} 个反应)`);
+        const response = await fetch(apiUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                jobs: requests.map(({ smarts, reactants, reaction_name }) => ({ smarts, reactants, reaction_name }))
+            })
+        });
+        const data = await response.json();
+        if (data.error) {
+            console.warn(`服务器返回错误信息: ${data.error}`);
+        }
+        if (Array.isArray(data.results) && data.results.length === requests.length) {
+            serverResults = data.results;
+        }
+    } catch (e) {
+        console.warn(`🔴 批量请求失败，回退到逐个请求: ${e.message}`);
+    }
+
+    if (!serverResults) {
+        for (const req of requests) {
+            const job = jobs[req.idx];
+            results[req.idx] = await runReactionWithRDKit(job.rxnKey, job.r1, job.r2);
+        }
+        return results;
+    }
+
+    requests.forEach((req, i) => {
+        let products = serverResults[i] && serverResults[i].products;
+        if (!products || products.length === 0) {
+            // 服务器没有产物时尝试浏览器端 RDKit（作为备选）
+            products = tryBrowserRDKit(req.smarts, req.reactants);
+        }
+        if (products && products.length > 0) {
+            results[req.idx] = filterMainProducts(products);
+        }
+    });
+
+    return results;
+}
+
+/**
+ * 服务器端出题 - 一次请求 /api/problems 返回 N 道已验证的题目
+ * @param {string[]} types - 反应类型键数组
+ * @param {number} count - 题目数量
+ * @returns {Promise<Object[]|null>} 题目数组 ({key, reactants, products, ...})；服务器不可用时返回 null
+ */
+export async function generateProblemsOnServer(types, count) {
+    try {
+        const response = await fetch(getServerApiUrl('/api/problems'), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ types, count })
+        });
+        if (!response.ok) return null;
+
+        const data = await response.json();
+        if (!Array.isArray(data.problems)) return null;
+        console.log(`🌐 服务器出题: ${data.problems.length}/${count} 道 (尝试 ${data.attempts} 次)`);
+        return data.problems;
+    } catch (e) {
+        console.warn(`🔴 服务器出题失败，改为浏览器出题: ${e.message}`);
+        return null;
+    }
+}
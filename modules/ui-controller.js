@@ -4,7 +4,7 @@
 import { appState, CHEMICAL_CABINET, REACTION_DB } from './state.js';
 import { $, showStatus } from './utils.js';
 import { prepareMoleculePools } from './pubchem-api.js';
-import { runReactionWithRDKit } from './reaction-engine.js';
+import { generateProblemsOnServer, runReactionBatchWithRDKit } from './reaction-engine.js';
 import { createStructureSVG } from './renderer.js';
 
 // 配置：每次生成的题目数量（控制 API 请求数量）
@@ -203,43 +203,11 @@ export function refreshExistingStructures() {
 }
 
 /**
- * 生成化学反应题目
+ * 随机选择一个反应类型并为其挑选反应物
+ * @param {string[]} availableTypes - 已勾选的反应类型
+ * @returns {{typeKey: string, def: Object, reactants: string[]}} 候选题目
  */
-export async function generateProblems() {
-  if (!appState.rdkitModule) {
-    showStatus("RDKit 未就绪", "loading");
-    return;
-  }
-
-  const availableTypes = [];
-  const checkboxes = document.querySelectorAll("#reactionTypes input[type='checkbox']");
-  checkboxes.forEach(chk => {
-      if (chk.checked) availableTypes.push(chk.value);
-  });
-
-  if (availableTypes.length === 0) {
-    showStatus("请选择至少一种反应类型！", "error");
-    return;
-  }
-
-  // 从 PubChem 准备分子池
-  await prepareMoleculePools(availableTypes);
-
-  showStatus("生成题目中...", "loading");
-  problemsEl.innerHTML = "";
-  appState.currentProblemsData = [];
-
-  const grid = document.createElement("div");
-  grid.className = "grid";
-  const template = document.getElementById("problem-template");
-
-  let attempts = 0;
-  const maxAttempts = PROBLEM_COUNT * 4; // 最多尝试数量，防止死循环
-  let successfulCount = 0;
-
-  while (successfulCount < PROBLEM_COUNT && attempts < maxAttempts) {
-    attempts++;
-    
+function pickProblemCandidate(availableTypes) {
     // 1. 随机选择反应类型
     const typeKey = availableTypes[Math.floor(Math.random() * availableTypes.length)];
     const def = REACTION_DB[typeKey];
@@ -294,37 +262,23 @@ export async function generateProblems() {
         }
     }
 
-    const r1 = reactants[0] || null;
-    const r2 = reactants[1] || null;
-
-    if (!r1) continue;
-
-    // 3. 生成产物
-    const productSmilesArray = await runReactionWithRDKit(typeKey, r1, r2);
-    
-    // 验证产物有效性
-    const validProducts = (productSmilesArray || []).filter(smi => {
-        if (!smi || typeof smi !== 'string') return false;
-        if (smi === 'FAILED' || smi === '?' || smi.trim() === '') return false;
-        return true;
-    });
-
-    if (validProducts.length === 0) {
-        console.warn(`⚠️ 反应 [${def.name}] 生成失败，正在尝试其他反应物... (尝试次数: ${attempts}/${maxAttempts})`);
-        continue; // 失败了，跳过，不增加 successfulCount
-    }
-
-    // 成功生成！
-    successfulCount++;
-    appState.currentProblemsData.push({
-      r1, r2, reactants, products: productSmilesArray
-    });
+    return { typeKey, def, reactants };
+}
 
-    // 4. 渲染 UI
+/**
+ * 渲染一道题目到网格中
+ * @param {HTMLElement} grid - 题目网格
+ * @param {HTMLTemplateElement} template - 题目模板
+ * @param {number} index - 题号
+ * @param {Object} def - 反应定义
+ * @param {string[]} reactants - 反应物 SMILES
+ * @param {string[]} validProducts - 有效产物 SMILES
+ */
+function renderProblem(grid, template, index, def, reactants, validProducts) {
     const clone = template.content.cloneNode(true);
     const problemEl = clone.querySelector(".problem");
 
-    clone.querySelector(".index").textContent = successfulCount;
+    clone.querySelector(".index").textContent = index;
     clone.querySelector(".problem-type").textContent = `${def.name}`;
     clone.querySelector(".arrow-text").innerHTML = def.condition;
 
@@ -375,6 +329,103 @@ export async function generateProblems() {
     }
 
     grid.appendChild(problemEl);
+}
+
+/**
+ * 生成化学反应题目
+ */
+export async function generateProblems() {
+  if (!appState.rdkitModule) {
+    showStatus("RDKit 未就绪", "loading");
+    return;
+  }
+
+  const availableTypes = [];
+  const checkboxes = document.querySelectorAll("#reactionTypes input[type='checkbox']");
+  checkboxes.forEach(chk => {
+      if (chk.checked) availableTypes.push(chk.value);
+  });
+
+  if (availableTypes.length === 0) {
+    showStatus("请选择至少一种反应类型！", "error");
+    return;
+  }
+
+  showStatus("生成题目中...", "loading");
+  problemsEl.innerHTML = "";
+  appState.currentProblemsData = [];
+
+  const grid = document.createElement("div");
+  grid.className = "grid";
+  const template = document.getElementById("problem-template");
+
+  let attempts = 0;
+  const maxAttempts = PROBLEM_COUNT * 4; // 最多尝试数量，防止死循环
+  let successfulCount = 0;
+
+  // 优先由服务器一次生成全部题目（选择、反应和验证都在服务器端完成）
+  const serverProblems = await generateProblemsOnServer(availableTypes, PROBLEM_COUNT) || [];
+  for (const problem of serverProblems) {
+    const def = REACTION_DB[problem.key];
+    if (!def || successfulCount >= PROBLEM_COUNT) continue;
+    successfulCount++;
+    appState.currentProblemsData.push({
+      r1: problem.reactants[0] || null, r2: problem.reactants[1] || null,
+      reactants: problem.reactants, products: problem.products
+    });
+    renderProblem(grid, template, successfulCount, def, problem.reactants, problem.products);
+  }
+
+  // 服务器不可用或题目不足时，回退到浏览器端逐轮生成
+  if (successfulCount < PROBLEM_COUNT) {
+    await prepareMoleculePools(availableTypes);
+    showStatus("生成题目中...", "loading");
+  }
+
+  // 每轮把仍缺少的题目一次性发送给服务器（/api/react/batch），失败的再进入下一轮
+  while (successfulCount < PROBLEM_COUNT && attempts < maxAttempts) {
+    const roundSize = Math.min(PROBLEM_COUNT - successfulCount, maxAttempts - attempts);
+    const candidates = [];
+    for (let i = 0; i < roundSize; i++) {
+      attempts++;
+      const candidate = pickProblemCandidate(availableTypes);
+      if (candidate.reactants[0]) candidates.push(candidate);
+    }
+    if (candidates.length === 0) continue;
+
+    // 3. 生成产物
+    const productResults = await runReactionBatchWithRDKit(candidates.map(c => ({
+      rxnKey: c.typeKey,
+      r1: c.reactants[0] || null,
+      r2: c.reactants[1] || null
+    })));
+
+    candidates.forEach((candidate, idx) => {
+      if (successfulCount >= PROBLEM_COUNT) return;
+      const { def, reactants } = candidate;
+      const productSmilesArray = productResults[idx];
+
+      // 验证产物有效性
+      const validProducts = (productSmilesArray || []).filter(smi => {
+          if (!smi || typeof smi !== 'string') return false;
+          if (smi === 'FAILED' || smi === '?' || smi.trim() === '') return false;
+          return true;
+      });
+
+      if (validProducts.length === 0) {
+          console.warn(`⚠️ 反应 [${def.name}] 生成失败，正在尝试其他反应物... (尝试次数: ${attempts}/${maxAttempts})`);
+          return; // 失败了，跳过，不增加 successfulCount
+      }
+
+      // 成功生成！
+      successfulCount++;
+      appState.currentProblemsData.push({
+        r1: reactants[0] || null, r2: reactants[1] || null, reactants, products: productSmilesArray
+      });
+
+      // 4. 渲染 UI
+      renderProblem(grid, template, successfulCount, def, reactants, validProducts);
+    });
   }
 
   if (successfulCount === 0) {
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Molecule Pools - Precompute substrate pools per reaction template offline
+离线分子池：用本地 SMILES 语料库为每个反应模板预先筛选反应物，出题时无需联网查询 PubChem
+
+Build steps:
+    1. Every corpus molecule goes through the same complexity filter as the
+       PubChem path and is fingerprinted into a SubstructureIndex; every
+       reactant SMARTS is then searched with fingerprint screening
+       (both steps run in parallel, one process per core).
+    2. For every template, candidates are dry-run through the full reaction
+       SMARTS; only molecules that give a valid product are kept.
+    3. The result is written atomically to data/molecule_pools/:
+
+        index.json        build info and, per template, the slots and pool sizes
+        molecules.smi     every pooled SMILES once; line number = molecule id
+        pools/<key>.json  per template: slot SMARTS and molecule ids
+        corpus_index.npz  screening index over the filtered corpus (/api/molecules)
+
+Usage:
+    python molecule_pools.py build corpus.smi [--workers N] [--max-per-slot 100]
+    python molecule_pools.py info
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from threading import Lock
+
+from rdkit import Chem
+from rdkit import RDLogger
+
+import reaction_cache
+from molecule_service import VERIFICATION_SMARTS, check_molecule_complexity
+from reaction_executor import collect_products
+from substructure_index import SubstructureIndex
+
+RDLogger.DisableLog('rdApp.*')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+POOL_DIR = os.path.join(BASE_DIR, 'data', 'molecule_pools')
+CORPUS_INDEX_FILE = 'corpus_index.npz'
+
+MAX_POOL_SIZE = 100              # Molecules kept per reactant slot
+MAX_CANDIDATES = 400             # Candidates dry-run per slot before giving up
+DRY_RUN_MAX_PRODUCTS = 20
+PARTNER_PROBES = 3               # Partner molecules tried for the other slots
+
+
+def read_corpus(path):
+    """
+    Read a SMILES corpus (one molecule per line, optional name after whitespace)
+
+    Returns:
+        list: SMILES strings in file order, duplicates removed
+    """
+    seen = set()
+    smiles_list = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            smi = line.split()[0]
+            if smi not in seen:
+                seen.add(smi)
+                smiles_list.append(smi)
+    return smiles_list
+
+
+def plan_slots(reaction):
+    """
+    Reactant slots of a template, in the order the frontend builds reactants
+
+    Returns:
+        list: (search_smarts or None, fixed_smiles or None) per slot; pooled
+              slots have a search SMARTS, fixed slots a reagent SMILES
+    """
+    slots = []
+    for info in reaction.get('reactant_info') or []:
+        if not info or not info.get('smarts'):
+            continue
+        if info.get('skip') or (info.get('isReagent') and info.get('smiles')):
+            fixed = info.get('smiles') or info['smarts']
+            if info.get('smiles') or Chem.MolFromSmiles(fixed) is not None:
+                slots.append((None, fixed))
+            continue
+        slots.append((info['smarts'], None))
+    return slots
+
+
+_worker_index = None
+
+
+def _init_match_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _match_smarts(smarts):
+    """Worker: first MAX_CANDIDATES corpus molecules containing a search SMARTS"""
+    return smarts, _worker_index.search_smiles(VERIFICATION_SMARTS.get(smarts, smarts), limit=MAX_CANDIDATES)
+
+
+def _dry_run(rxn, reactants_smiles):
+    """True if the reaction gives at least one valid product for these reactants"""
+    mols = [Chem.MolFromSmiles(s) for s in reactants_smiles]
+    if not mols or any(m is None for m in mols):
+        return False
+    while len(mols) < rxn.GetNumReactantTemplates():
+        mols.append(mols[0])
+    try:
+        products = rxn.RunReactants(tuple(mols), maxProducts=DRY_RUN_MAX_PRODUCTS)
+    except Exception:
+        return False
+    return bool(collect_products(products))
+
+
+def _build_template(args):
+    """Worker: dry-run the candidates of one template, keep those that react"""
+    key, reaction_smarts, slots, candidates, max_per_slot = args
+    try:
+        rxn = reaction_cache.get_reaction(reaction_smarts)
+    except Exception:
+        rxn = None
+    if rxn is None:
+        return key, None
+
+    pools = []
+    for slot_index, (search_smarts, _) in enumerate(slots):
+        if search_smarts is None:
+            pools.append(None)
+            continue
+        # Partners for the other pooled slots: their first few candidates
+        partner_sets = [[]]
+        for other_index, (other_smarts, fixed) in enumerate(slots):
+            if other_index == slot_index:
+                options = [None]
+            elif other_smarts is None:
+                options = [fixed]
+            else:
+                options = candidates[other_index][:PARTNER_PROBES] or [None]
+            partner_sets = [p + [o] for p in partner_sets for o in options]
+
+        kept = []
+        for smi in candidates[slot_index][:MAX_CANDIDATES]:
+            for partners in partner_sets:
+                reactants = [smi if i == slot_index else p for i, p in enumerate(partners)]
+                if None in reactants:
+                    reactants = [r for r in reactants if r is not None]
+                if _dry_run(rxn, reactants):
+                    kept.append(smi)
+                    break
+            if len(kept) >= max_per_slot:
+                break
+        pools.append(kept)
+    return key, pools
+
+
+def _write_atomic_dir(out_dir, files):
+    """Write {relative path: text or bytes} into out_dir, replacing the previous build at once"""
+    tmp_dir = out_dir + '.tmp'
+    old_dir = out_dir + '.old'
+    for path in (tmp_dir, old_dir):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    for rel_path, text in files.items():
+        path = os.path.join(tmp_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(text, bytes):
+            with open(path, 'wb') as f:
+                f.write(text)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+
+def build_pools(corpus_path, json_path=PARSED_JSON, out_dir=POOL_DIR, workers=None,
+                max_per_slot=MAX_POOL_SIZE, progress=print):
+    """
+    Build precomputed molecule pools for every template in the reaction database
+
+    Args:
+        corpus_path: SMILES corpus file
+        json_path: Reaction database (parsed_reactions.json)
+        out_dir: Output directory (replaced atomically)
+        workers: Worker processes (default: one per CPU core)
+        max_per_slot: Molecules kept per reactant slot
+        progress: Callable for progress messages
+
+    Returns:
+        dict: The written index
+    """
+    started = time.time()
+    workers = workers or os.cpu_count() or 1
+    with open(json_path, 'r', encoding='utf-8') as f:
+        reactions = json.load(f)
+    corpus = read_corpus(corpus_path)
+    progress(f"[Pools] {len(corpus)} corpus molecules, {len(reactions)} templates, {workers} workers")
+
+    template_slots = {key: plan_slots(rxn) for key, rxn in reactions.items() if rxn.get('smarts')}
+    search_smarts = sorted({s for slots in template_slots.values() for s, _ in slots if s})
+
+    # 1. Fingerprint the filtered corpus, then screened substructure search
+    corpus_index = SubstructureIndex.build(corpus, workers=workers, mol_filter=check_molecule_complexity)
+    passed = len(corpus_index)
+    progress(f"[Pools] {passed} molecules passed the complexity filter and were indexed")
+    with Pool(workers, initializer=_init_match_worker, initargs=(corpus_index,)) as pool:
+        matches = dict(pool.imap_unordered(_match_smarts, search_smarts, chunksize=8))
+    progress(f"[Pools] {len(search_smarts)} search patterns searched")
+
+    # 2. Dry-run every template, parallel over templates
+    tasks = []
+    for key, slots in template_slots.items():
+        candidates = [matches[s] if s else [] for s, _ in slots]
+        tasks.append((key, reactions[key]['smarts'], slots, candidates, max_per_slot))
+
+    results = {}
+    with Pool(workers) as pool:
+        for done, (key, pools) in enumerate(pool.imap_unordered(_build_template, tasks, chunksize=4), 1):
+            results[key] = pools
+            if done % 50 == 0 or done == len(tasks):
+                progress(f"[Pools] Dry-run {done}/{len(tasks)} templates")
+
+    # 3. Write molecules.smi, per-template files and the index
+    molecule_ids = {}
+    files = {}
+    templates = {}
+    for key in sorted(results):
+        pools = results[key]
+        if pools is None:
+            continue
+        slots_out = []
+        for (smarts, _), kept in zip(template_slots[key], pools):
+            if smarts is None:
+                continue
+            ids = [molecule_ids.setdefault(smi, len(molecule_ids)) for smi in kept]
+            slots_out.append({'smarts': smarts, 'molecules': ids})
+        if not any(slot['molecules'] for slot in slots_out):
+            continue
+        rel_path = f"pools/{key}.json"
+        files[rel_path] = json.dumps({'key': key, 'smarts': reactions[key]['smarts'], 'slots': slots_out},
+                                     separators=(',', ':'))
+        templates[key] = {'file': rel_path, 'sizes': [len(slot['molecules']) for slot in slots_out]}
+
+    files['molecules.smi'] = ''.join(f"{smi}\n" for smi in molecule_ids)
+    with open(corpus_path, 'rb') as f:
+        corpus_sha1 = hashlib.sha1(f.read()).hexdigest()
+    index = {
+        'version': 1,
+        'built_at': datetime.now().isoformat(),
+        'build_seconds': round(time.time() - started, 1),
+        'corpus': {'path': os.path.abspath(corpus_path), 'sha1': corpus_sha1,
+                   'molecules': len(corpus), 'passed_filter': passed},
+        'molecules': len(molecule_ids),
+        'templates': templates
+    }
+    files[CORPUS_INDEX_FILE] = corpus_index.to_bytes()
+    files['index.json'] = json.dumps(index, ensure_ascii=False, indent=2)
+    _write_atomic_dir(out_dir, files)
+
+    progress(f"[Pools] {len(templates)}/{len(tasks)} templates have pools, "
+             f"{len(molecule_ids)} distinct molecules, {index['build_seconds']}s -> {out_dir}")
+    return index
+
+
+class PoolStore:
+    """
+    Read-only access to built pools for the server (reloads after a rebuild)
+
+    Args:
+        pool_dir: Directory written by build_pools
+    """
+
+    def __init__(self, pool_dir=POOL_DIR):
+        self.pool_dir = pool_dir
+        self._lock = Lock()
+        self._index = None
+        self._index_mtime = None
+        self._molecules = []
+        self._pools = {}
+        self._corpus_index = None
+
+    def _refresh(self):
+        index_path = os.path.join(self.pool_dir, 'index.json')
+        try:
+            mtime = os.path.getmtime(index_path)
+        except OSError:
+            self._index, self._index_mtime, self._molecules, self._pools = None, None, [], {}
+            self._corpus_index = None
+            return
+        if mtime == self._index_mtime:
+            return
+        with open(index_path, 'r', encoding='utf-8') as f:
+            self._index = json.load(f)
+        with open(os.path.join(self.pool_dir, 'molecules.smi'), 'r', encoding='utf-8') as f:
+            self._molecules = f.read().split()
+        self._pools = {}
+        self._corpus_index = None
+        self._index_mtime = mtime
+
+    def get(self, key):
+        """
+        Pools of one template
+
+        Returns:
+            list or None: [{'smarts': ..., 'molecules': [SMILES, ...]}] per pooled slot
+        """
+        with self._lock:
+            self._refresh()
+            if self._index is None or key not in self._index['templates']:
+                return None
+            if key not in self._pools:
+                path = os.path.join(self.pool_dir, self._index['templates'][key]['file'])
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._pools[key] = [
+                    {'smarts': slot['smarts'], 'molecules': [self._molecules[i] for i in slot['molecules']]}
+                    for slot in data['slots']
+                ]
+            return self._pools[key]
+
+    def search_smiles(self, smarts, limit=None):
+        """
+        Screened substructure search over the filtered build corpus
+
+        Returns:
+            list: Matching SMILES in corpus order (empty if no corpus index was built)
+        """
+        with self._lock:
+            self._refresh()
+            if self._corpus_index is None and self._index is not None:
+                path = os.path.join(self.pool_dir, CORPUS_INDEX_FILE)
+                if os.path.exists(path):
+                    self._corpus_index = SubstructureIndex.load(path)
+            corpus_index = self._corpus_index
+        if corpus_index is None:
+            return []
+        return corpus_index.search_smiles(VERIFICATION_SMARTS.get(smarts, smarts), limit)
+
+    def info(self):
+        """Build info (None if no pools have been built)"""
+        with self._lock:
+            self._refresh()
+            if self._index is None:
+                return None
+            return {k: v for k, v in self._index.items() if k != 'templates'} | {
+                'templates': len(self._index['templates'])
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute molecule pools per reaction template")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="build pools from a SMILES corpus")
+    build.add_argument('corpus', help="SMILES file, one molecule per line")
+    build.add_argument('--workers', type=int, default=None)
+    build.add_argument('--max-per-slot', type=int, default=MAX_POOL_SIZE)
+    build.add_argument('--out', default=POOL_DIR)
+    sub.add_parser('info', help="show the current build")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.exists(args.corpus):
+            print(f"[Error] Corpus not found: {args.corpus}")
+            sys.exit(1)
+        build_pools(args.corpus, out_dir=args.out, workers=args.workers, max_per_slot=args.max_per_slot)
+    else:
+        info = PoolStore().info()
+        print(json.dumps(info, indent=2, ensure_ascii=False) if info else "No molecule pools built yet.")
+
+
+if __name__ == '__main__':
+    main()
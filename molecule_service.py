@@ -0,0 +1,457 @@
+"""
+Molecule Service - Server-side PubChem search with a shared persistent cache
+分子服务：在服务器端完成 PubChem 子结构搜索、属性获取和 RDKit 验证，结果存入共享的 SQLite 缓存
+
+The browser used to run the PubChem flow itself and cache the results per
+user in localStorage. Here the search runs once per SMARTS for everybody:
+
+    fresh   age < FRESH_TTL            served from the cache
+    stale   age < STALE_TTL            served from the cache, refreshed in the background
+    expired older, or never fetched    fetched from PubChem before answering
+
+Concurrent requests for the same SMARTS share one PubChem fetch. Point
+PUBCHEM_BASE_URL at a local stub to run without network access.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from threading import Event, Lock, Thread
+
+from rdkit import Chem
+from rdkit import RDLogger
+
+from server_log import get_logger
+
+log = get_logger('molecules')
+
+RDLogger.DisableLog('rdApp.*')
+
+# PubChem config
+PUBCHEM_BASE_URL = os.environ.get('PUBCHEM_BASE_URL', 'https://pubchem.ncbi.nlm.nih.gov/rest/pug')
+MAX_RECORDS = 50                 # CIDs requested per search
+REQUEST_TIMEOUT = 15             # Seconds per HTTP request
+MIN_REQUEST_INTERVAL = 0.2       # PubChem allows about 5 requests per second
+MAX_POLLS = 10                   # Listkey polls before giving up
+POLL_DELAY = 2.0
+
+# Cache config
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, 'molecule_cache.sqlite')
+FRESH_TTL = 7 * 24 * 3600        # Serve without refreshing
+STALE_TTL = 30 * 24 * 3600       # Serve, but refresh in the background
+EMPTY_TTL = 3600                 # Searches that found nothing are retried sooner
+
+# Stricter verification patterns than the search SMARTS (exclude aromatic carbons)
+VERIFICATION_SMARTS = {
+    'C=C': '[#6;!a]=[#6;!a]',
+    'C#C': '[#6;!a]#[#6;!a]',
+}
+
+
+class PubChemError(Exception):
+    """Raised when PubChem cannot be reached or returns an unexpected response"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+# ----------------------------------------------------------------------
+# Molecule filters (same rules as checkMoleculeComplexity in modules/pubchem-api.js)
+# ----------------------------------------------------------------------
+_METAL_PATTERN = re.compile(r'\[(?:Fe|Cu|Zn|Mg|Ca|Na|K|Li|Al|Pd|Pt|Au|Ag|Hg|Pb|Sn|Si|B(?!r)|As|Se)\]')
+_STRONG_EWG_PATTERNS = [re.compile(p) for p in (
+    r'\[N\+\]\(=O\)\[O-\]',      # 硝基 -NO2
+    r'C\(=O\)\[O-\]',            # 羧酸根
+    r'S\(=O\)\(=O\)',            # 磺酰基
+    r'C#N',                      # 氰基 -CN
+    r'\[N\+\]#\[C-\]',           # 异氰基
+)]
+_HETEROCYCLE_PATTERNS = [re.compile(p) for p in (
+    r'n1ccnc1', r'n1cccc1', r'n1ccccc1', r'n1nccc1', r'n1nncn1', r'n1cncnc1', r'O=C1NC',
+)]
+_PROTECTING_GROUP_PATTERNS = [re.compile(p) for p in (
+    r'\[Si\]\(C\)\(C\)C',        # TBS 保护基
+    r'OC\(=O\)OC\(C\)\(C\)C',    # Boc 保护基
+    r'Cc1ccccc1C',               # 苄基保护基
+)]
+
+
+def check_molecule_complexity(smiles, category=None):
+    """
+    Whether a molecule is a suitable problem substrate (not too simple or complex)
+
+    Args:
+        smiles: SMILES string
+        category: Target reaction category (optional)
+
+    Returns:
+        bool: True if the molecule passes every filter
+    """
+    if not smiles or len(smiles) > 50:
+        return False
+
+    atom_count = len(re.sub(r'[\[\]()0-9@\\/=#+-]', '', smiles))
+    if atom_count < 3 or atom_count > 20:
+        return False
+
+    if len(re.findall(r'C\(=O\)N', smiles)) >= 2:
+        return False
+
+    halogen_count = len(re.findall(r'Cl|Br|F|I', smiles))
+    if halogen_count > 2:
+        return False
+
+    if len(re.findall(r'[0-9]', smiles)) / 2 > 2:
+        return False
+
+    if _METAL_PATTERN.search(smiles):
+        return False
+
+    if sum(1 for p in _STRONG_EWG_PATTERNS if p.search(smiles)) >= 2:
+        return False
+
+    if category not in ('heterocycle', 'benzene'):
+        lowered = smiles.lower()
+        if any(p.search(lowered) for p in _HETEROCYCLE_PATTERNS):
+            return False
+
+    if any(p.search(smiles) for p in _PROTECTING_GROUP_PATTERNS):
+        return False
+
+    functional_groups = 0
+    if re.search(r'C=C(?![a-z])', smiles):
+        functional_groups += 1
+    if 'C#C' in smiles:
+        functional_groups += 1
+    if re.search(r'C=O(?![a-zA-Z])', smiles):
+        functional_groups += 1
+    if re.search(r'[^c]O[^=]', smiles):
+        functional_groups += 1
+    if re.search(r'N(?![+\]])', smiles) and 'n' not in smiles:
+        functional_groups += 1
+    if functional_groups > 3:
+        return False
+
+    if category in ('alkene', 'alkyne') and halogen_count > 0 and re.search(r'C=C|C#C', smiles):
+        return False
+
+    return True
+
+
+def verify_substructure(smiles_list, smarts):
+    """
+    Keep molecules that RDKit can parse and that really contain the SMARTS
+
+    Args:
+        smiles_list: Candidate SMILES from PubChem
+        smarts: Search SMARTS (C=C and C#C are checked with non-aromatic patterns)
+
+    Returns:
+        list: Verified SMILES, in input order
+    """
+    pattern = Chem.MolFromSmarts(VERIFICATION_SMARTS.get(smarts, smarts))
+    verified = []
+    for smi in smiles_list:
+        mol = Chem.MolFromSmiles(smi)
+        if mol is None:
+            continue
+        if pattern is not None and not mol.HasSubstructMatch(pattern):
+            continue
+        verified.append(smi)
+    return verified
+
+
+# ----------------------------------------------------------------------
+# PubChem client
+# ----------------------------------------------------------------------
+class PubChemClient:
+    """
+    Minimal PUG REST client for substructure searches
+
+    Args:
+        base_url: PUG REST root URL (a local stub in tests)
+        max_records: CIDs requested per search
+    """
+
+    def __init__(self, base_url=None, max_records=MAX_RECORDS):
+        self.base_url = (base_url or PUBCHEM_BASE_URL).rstrip('/')
+        self.max_records = max_records
+        self.poll_delay = POLL_DELAY
+        self._throttle_lock = Lock()
+        self._last_request = 0.0
+
+    def _get_json(self, path, retries=3, delay=1.0):
+        """GET base_url + path, retrying on 429/500/503 with exponential backoff"""
+        url = self.base_url + path
+        for attempt in range(retries):
+            with self._throttle_lock:
+                wait = self._last_request + MIN_REQUEST_INTERVAL - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                self._last_request = time.time()
+            try:
+                with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+                    return response.status, json.loads(response.read().decode('utf-8'))
+            except urllib.error.HTTPError as e:
+                if e.code in (429, 500, 503) and attempt < retries - 1:
+                    log.warning(f"PubChem HTTP {e.code}, retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                raise PubChemError(f'PubChem API error: {e.code}', status=e.code)
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                if attempt < retries - 1:
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                raise PubChemError(f'PubChem request failed: {e}')
+
+    def fetch_cids(self, smarts):
+        """Substructure search: fastsubstructure first, asynchronous listkey flow as fallback"""
+        quoted = urllib.parse.quote(smarts, safe='')
+        try:
+            _, data = self._get_json(
+                f'/compound/fastsubstructure/smarts/{quoted}/cids/JSON?MaxRecords={self.max_records}', retries=2)
+            return data.get('IdentifierList', {}).get('CID', [])
+        except PubChemError as fast_error:
+            if fast_error.status == 404:
+                return []  # PubChem answers 404 when nothing matches
+            log.warning(f"PubChem fastsubstructure failed ({fast_error}), falling back to listkey polling")
+
+        _, data = self._get_json(f'/compound/substructure/smarts/{quoted}/JSON', retries=2, delay=2.0)
+        if 'IdentifierList' in data:
+            return data['IdentifierList'].get('CID', [])
+        list_key = data.get('Waiting', {}).get('ListKey')
+        if not list_key:
+            raise PubChemError('No ListKey in PubChem response')
+
+        for _ in range(MAX_POLLS):
+            time.sleep(self.poll_delay)
+            status, data = self._get_json(
+                f'/compound/listkey/{list_key}/cids/JSON?MaxRecords={self.max_records}', retries=1)
+            if status == 202 or 'Waiting' in data:
+                continue
+            return data.get('IdentifierList', {}).get('CID', [])
+        raise PubChemError('PubChem search polling timed out')
+
+    def fetch_smiles(self, cids):
+        """SMILES for a list of CIDs (PubChem names the field SMILES, IsomericSMILES or CanonicalSMILES)"""
+        if not cids:
+            return []
+        cid_list = ','.join(str(cid) for cid in cids)
+        _, data = self._get_json(f'/compound/cid/{cid_list}/property/SMILES/JSON')
+        properties = data.get('PropertyTable', {}).get('Properties', [])
+        smiles = (p.get('SMILES') or p.get('IsomericSMILES') or p.get('CanonicalSMILES') for p in properties)
+        return [s for s in smiles if s]
+
+    def search(self, smarts):
+        """Search, fetch SMILES, filter and verify; returns the molecule list"""
+        cids = self.fetch_cids(smarts)
+        smiles_list = [s for s in self.fetch_smiles(cids) if check_molecule_complexity(s)]
+        return verify_substructure(smiles_list, smarts)
+
+
+# ----------------------------------------------------------------------
+# Cached service
+# ----------------------------------------------------------------------
+class _Inflight:
+    def __init__(self):
+        self.done = Event()
+        self.molecules = None
+        self.error = None
+
+
+class MoleculeService:
+    """
+    PubChem search results shared by every user, cached in SQLite
+
+    Args:
+        db_path: SQLite file (shared by all server worker processes)
+        client: PubChemClient (default: one for PUBCHEM_BASE_URL)
+        fresh_ttl / stale_ttl / empty_ttl: Cache lifetimes in seconds
+        local_index: Optional object with search_smiles(smarts, limit) over a local
+                     corpus (molecule_pools.PoolStore); answered before PubChem
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, client=None,
+                 fresh_ttl=FRESH_TTL, stale_ttl=STALE_TTL, empty_ttl=EMPTY_TTL, local_index=None):
+        self.db_path = db_path
+        self.client = client or PubChemClient()
+        self.local_index = local_index
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.empty_ttl = empty_ttl
+
+        self._db_lock = Lock()
+        self._inflight_lock = Lock()
+        self._inflight = {}
+        self._counters = {
+            'local_hits': 0,
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'fetch_errors': 0
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS molecules ('
+                ' smarts TEXT PRIMARY KEY,'
+                ' smiles TEXT NOT NULL,'
+                ' fetched_at REAL NOT NULL)'
+            )
+            self._conn.commit()
+
+    def _read(self, smarts):
+        with self._db_lock:
+            row = self._conn.execute(
+                'SELECT smiles, fetched_at FROM molecules WHERE smarts = ?', (smarts,)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, smarts, molecules):
+        fetched_at = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO molecules (smarts, smiles, fetched_at) VALUES (?, ?, ?)',
+                (smarts, json.dumps(molecules), fetched_at)
+            )
+            self._conn.commit()
+        return fetched_at
+
+    def _count(self, name):
+        with self._inflight_lock:
+            self._counters[name] += 1
+
+    def _fetch(self, smarts):
+        """
+        Fetch from PubChem, sharing one fetch between concurrent callers
+
+        Returns:
+            list: Molecules (also written to the cache)
+
+        Raises:
+            PubChemError: The fetch failed
+        """
+        with self._inflight_lock:
+            inflight = self._inflight.get(smarts)
+            owner = inflight is None
+            if owner:
+                inflight = self._inflight[smarts] = _Inflight()
+            else:
+                self._counters['coalesced'] += 1
+
+        if not owner:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.molecules
+
+        try:
+            log.info(f"Searching PubChem: {smarts}")
+            inflight.molecules = self.client.search(smarts)
+            self._write(smarts, inflight.molecules)
+            log.info(f"Cached {len(inflight.molecules)} molecules for {smarts}")
+            return inflight.molecules
+        except Exception as e:
+            self._count('fetch_errors')
+            inflight.error = e if isinstance(e, PubChemError) else PubChemError(str(e))
+            raise inflight.error
+        finally:
+            with self._inflight_lock:
+                del self._inflight[smarts]
+            inflight.done.set()
+
+    def _refresh_in_background(self, smarts):
+        with self._inflight_lock:
+            if smarts in self._inflight:
+                return
+        self._count('refreshes')
+
+        def refresh():
+            try:
+                self._fetch(smarts)
+            except PubChemError as e:
+                log.warning(f"Background refresh failed for {smarts}: {e}")
+
+        Thread(target=refresh, name='molecule-refresh', daemon=True).start()
+
+    def get_molecules(self, smarts):
+        """
+        Molecules matching a search SMARTS
+
+        Args:
+            smarts: Search SMARTS (reactant_info smarts in the reaction database)
+
+        Returns:
+            dict: 'molecules', 'source' ('local', 'cache' or 'pubchem'), 'stale', 'fetched_at'
+                  and 'error' when PubChem failed and nothing usable was cached
+        """
+        if self.local_index is not None:
+            local = self.local_index.search_smiles(smarts, limit=MAX_RECORDS)
+            if local:
+                self._count('local_hits')
+                return {'molecules': local, 'source': 'local', 'stale': False, 'fetched_at': None}
+
+        molecules, fetched_at = self._read(smarts)
+        if molecules is not None:
+            age = time.time() - fetched_at
+            fresh_ttl = self.fresh_ttl if molecules else self.empty_ttl
+            if age < fresh_ttl:
+                self._count('hits')
+                return {'molecules': molecules, 'source': 'cache', 'stale': False, 'fetched_at': fetched_at}
+            if age < self.stale_ttl and molecules:
+                self._count('stale_hits')
+                self._refresh_in_background(smarts)
+                return {'molecules': molecules, 'source': 'cache', 'stale': True, 'fetched_at': fetched_at}
+
+        self._count('misses')
+        try:
+            fresh = self._fetch(smarts)
+            return {'molecules': fresh, 'source': 'pubchem', 'stale': False, 'fetched_at': time.time()}
+        except PubChemError as e:
+            # An expired entry is still better than nothing
+            if molecules:
+                return {'molecules': molecules, 'source': 'cache', 'stale': True,
+                        'fetched_at': fetched_at, 'error': str(e)}
+            return {'molecules': [], 'source': 'pubchem', 'stale': False, 'fetched_at': None, 'error': str(e)}
+
+    def stats(self):
+        """Get cache size and counters"""
+        with self._db_lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM molecules').fetchone()[0]
+        with self._inflight_lock:
+            return {
+                'entries': entries,
+                'inflight': len(self._inflight),
+                **self._counters
+            }
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+
+# Test code
+if __name__ == "__main__":
+    import sys
+    service = MoleculeService()
+    for query in sys.argv[1:] or ['C=C']:
+        result = service.get_molecules(query)
+        print(query, result['source'], len(result['molecules']), result.get('error', ''))
+        print(result['molecules'][:10])
+    print(service.stats())
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Problem Bank - Persistent store of generated problems, filled by a background producer
+题库：预先生成的题目存入 SQLite，出题时只需按索引随机读取
+
+The producer (python problem_bank.py produce --watch) keeps
+PROBLEMS_PER_TEMPLATE problems for every template in parsed_reactions.json.
+Problems are marked validated when the producer checked their products with
+ChemBERTa (--ai); a server with AI validation enabled only serves those.
+Each template is stored with a hash of its SMARTS and reactant_info; when the
+database is regenerated from SMARTS.txt, only templates whose hash changed
+(or that were added/removed) are recomputed. server.py reads the bank for
+/api/problems and generates live only what the bank cannot provide.
+
+Usage:
+    python problem_bank.py produce [--watch] [--ai] [--workers N]
+    python problem_bank.py info
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'data', 'problem_bank.sqlite')
+PRODUCER_LOCK_FILE = os.path.join(BASE_DIR, 'data', 'problem_bank.lock')
+
+PROBLEMS_PER_TEMPLATE = 20
+RETRY_INTERVAL = 6 * 3600        # Seconds before retrying a template that could not be filled
+WATCH_INTERVAL = 10              # Seconds between checks for a changed reaction database
+COUNTS_TTL = 30                  # Seconds the server caches per-template counts
+
+
+def template_hash(reaction):
+    """Hash of everything that decides which problems a template produces"""
+    payload = json.dumps({'smarts': reaction.get('smarts'), 'reactant_info': reaction.get('reactant_info')},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ProblemBank:
+    """
+    SQLite problem store shared by the producer and every server worker
+
+    Args:
+        db_path: SQLite file
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._db_lock = Lock()
+        self._counts = None
+        self._counts_loaded_at = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._db_lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(
+                'CREATE TABLE IF NOT EXISTS templates ('
+                ' key TEXT PRIMARY KEY,'
+                ' smarts_hash TEXT NOT NULL,'
+                ' category TEXT,'
+                ' difficulty INTEGER,'
+                ' problem_count INTEGER NOT NULL DEFAULT 0,'
+                ' validated_count INTEGER NOT NULL DEFAULT 0,'
+                ' attempted_at REAL);'
+                'CREATE INDEX IF NOT EXISTS templates_category ON templates (category, difficulty);'
+                'CREATE TABLE IF NOT EXISTS problems ('
+                ' id INTEGER PRIMARY KEY,'
+                ' key TEXT NOT NULL,'
+                ' category TEXT,'
+                ' difficulty INTEGER,'
+                ' reactants TEXT NOT NULL,'
+                ' data TEXT NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' validated INTEGER NOT NULL DEFAULT 0,'
+                ' UNIQUE (key, reactants));'
+                'CREATE INDEX IF NOT EXISTS problems_key ON problems (key);'
+                'CREATE INDEX IF NOT EXISTS problems_category ON problems (category, difficulty);'
+            )
+            # Banks written before problems were marked: their rows count as unvalidated
+            for table, column in (('templates', 'validated_count'), ('problems', 'validated')):
+                columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')]
+                if column not in columns:
+                    self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+            self._conn.commit()
+
+    # ---- producer side ----
+
+    def templates(self):
+        """{key: {'smarts_hash', 'problem_count', 'validated_count', 'attempted_at'}}"""
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT key, smarts_hash, problem_count, validated_count, attempted_at FROM templates').fetchall()
+        return {key: {'smarts_hash': h, 'problem_count': n, 'validated_count': v, 'attempted_at': t}
+                for key, h, n, v, t in rows}
+
+    def remove_templates(self, keys):
+        with self._db_lock:
+            for key in keys:
+                self._conn.execute('DELETE FROM problems WHERE key = ?', (key,))
+                self._conn.execute('DELETE FROM templates WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def reset_template(self, key, reaction):
+        """Drop a template's problems and store its new hash"""
+        with self._db_lock:
+            self._conn.execute('DELETE FROM problems WHERE key = ?', (key,))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO templates'
+                ' (key, smarts_hash, category, difficulty, problem_count, validated_count, attempted_at)'
+                ' VALUES (?, ?, ?, ?, 0, 0, NULL)',
+                (key, template_hash(reaction), reaction.get('category'), reaction.get('difficulty') or 1))
+            self._conn.commit()
+
+    def add_problems(self, key, problems, validated=False):
+        """
+        Store generated problems of one template
+
+        A reactant set that is already stored is kept, unless the new problem is
+        validated and the stored one is not: then the validated one replaces it.
+
+        Args:
+            key: Template key
+            problems: Problem dicts from ProblemGenerator.generate
+            validated: The products were checked with ChemBERTa
+
+        Returns:
+            int: The template's problem count afterwards (validated only, if validated)
+        """
+        now = time.time()
+        with self._db_lock:
+            for problem in problems:
+                self._conn.execute(
+                    'INSERT INTO problems (key, category, difficulty, reactants, data, created_at, validated)'
+                    ' SELECT key, category, difficulty, ?, ?, ?, ? FROM templates WHERE key = ?'
+                    ' ON CONFLICT (key, reactants) DO UPDATE SET'
+                    ' data = excluded.data, created_at = excluded.created_at, validated = 1'
+                    ' WHERE excluded.validated = 1 AND problems.validated = 0',
+                    (json.dumps(problem['reactants']), json.dumps(problem, ensure_ascii=False), now,
+                     int(validated), key))
+            count, validated_count = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(validated), 0) FROM problems WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'UPDATE templates SET problem_count = ?, validated_count = ?, attempted_at = ? WHERE key = ?',
+                (count, validated_count, now, key))
+            self._conn.commit()
+        return validated_count if validated else count
+
+    # ---- server side ----
+
+    def counts(self):
+        """
+        {key: (problem_count, validated_count, smarts_hash, category, difficulty)},
+        cached for COUNTS_TTL seconds
+        """
+        now = time.time()
+        if self._counts is None or now - self._counts_loaded_at > COUNTS_TTL:
+            with self._db_lock:
+                rows = self._conn.execute(
+                    'SELECT key, problem_count, validated_count, smarts_hash, category, difficulty FROM templates'
+                    ' WHERE problem_count > 0').fetchall()
+            self._counts = {key: (n, v, h, c, d) for key, n, v, h, c, d in rows}
+            self._counts_loaded_at = now
+        return self._counts
+
+    def sample(self, keys, count, rng, current_hashes=None, validated_only=False):
+        """
+        Random problems for the given templates (one indexed read per problem)
+
+        Args:
+            keys: Candidate template keys
+            count: Number of problems wanted
+            rng: random.Random instance
+            current_hashes: {key: template_hash}; templates stored under another
+                            hash are skipped until the producer has refreshed them
+            validated_only: Only problems the producer validated with ChemBERTa
+
+        Returns:
+            list: Problem dicts (fewer than count if the bank cannot provide them)
+        """
+        counts = self.counts()
+        column = 1 if validated_only else 0
+        available = [key for key in keys if key in counts and counts[key][column] > 0 and
+                     (current_hashes is None or current_hashes.get(key) == counts[key][2])]
+        if not available:
+            return []
+
+        # Distinct templates when there are enough of them, like a teacher's worksheet
+        if len(available) >= count:
+            picks = rng.sample(available, count)
+        else:
+            picks = [rng.choice(available) for _ in range(count)]
+
+        problems = []
+        seen = set()
+        with self._db_lock:
+            for key in picks:
+                n = counts[key][column]
+                for _ in range(3):
+                    offset = rng.randrange(n)
+                    if (key, offset) not in seen:
+                        break
+                if (key, offset) in seen:
+                    continue
+                seen.add((key, offset))
+                row = self._conn.execute(
+                    'SELECT data FROM problems WHERE key = ? AND validated >= ? ORDER BY id LIMIT 1 OFFSET ?',
+                    (key, int(validated_only), offset)).fetchone()
+                if row:
+                    problems.append(json.loads(row[0]))
+        return problems
+
+    def stats(self):
+        with self._db_lock:
+            templates, filled = self._conn.execute(
+                'SELECT COUNT(*), SUM(problem_count > 0) FROM templates').fetchone()
+            problems, validated = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(validated), 0) FROM problems').fetchone()
+        return {'templates': templates, 'templates_with_problems': filled or 0, 'problems': problems,
+                'validated_problems': validated}
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
+
+
+def refresh(bank, reactions, generator, per_template=PROBLEMS_PER_TEMPLATE, retry_interval=RETRY_INTERVAL,
+            progress=print, validated=False):
+    """
+    Bring the bank in line with the reaction database
+
+    Removed templates are dropped, templates whose hash changed are reset, and
+    every template below per_template problems is topped up (templates that
+    could not be filled are retried after retry_interval). With validated=True
+    (the generator validates with ChemBERTa) only validated problems count, so
+    a bank filled without validation is topped up with validated problems (at
+    the next retry_interval for templates attempted recently).
+
+    Returns:
+        dict: Counts of removed, changed and filled templates and problems added
+    """
+    stored = bank.templates()
+    current = {key: rxn for key, rxn in reactions.items() if rxn.get('smarts')}
+
+    removed = [key for key in stored if key not in current]
+    bank.remove_templates(removed)
+
+    changed = [key for key, rxn in current.items()
+               if key not in stored or stored[key]['smarts_hash'] != template_hash(rxn)]
+    for key in changed:
+        bank.reset_template(key, current[key])
+    if removed or changed:
+        progress(f"[Bank] {len(removed)} templates removed, {len(changed)} new or changed")
+
+    stored = bank.templates()
+    count_field = 'validated_count' if validated else 'problem_count'
+    now = time.time()
+    todo = [key for key in current
+            if stored[key][count_field] < per_template and
+            (stored[key]['attempted_at'] is None or now - stored[key]['attempted_at'] > retry_interval)]
+
+    added = 0
+    for done, key in enumerate(todo, 1):
+        before = stored[key][count_field]
+        result = generator.generate(types=[key], count=per_template - before)
+        added += bank.add_problems(key, result['problems'], validated=validated) - before
+        if done % 25 == 0 or done == len(todo):
+            progress(f"[Bank] Filled {done}/{len(todo)} templates, {added} problems added")
+
+    return {'removed': len(removed), 'changed': len(changed), 'filled': len(todo), 'added': added}
+
+
+def _make_run_jobs(pool, validator):
+    """Producer counterpart of server._run_problem_jobs"""
+    import reaction_executor
+
+    def run_jobs(jobs):
+        if pool is not None:
+            executions = pool.map([(job['smarts'], job['reactants'], None) for job in jobs])
+        else:
+            executions = [(*reaction_executor.execute_reaction(job['smarts'], job['reactants']), False)
+                          for job in jobs]
+        products = [[] if error else result for result, error, _ in executions]
+        if validator is None:
+            return [(p, []) for p in products]
+
+        pairs = [(job['reactants'], smi) for job, p in zip(jobs, products) for smi in p]
+        validations = iter(validator.batch_validate(pairs))
+        outcomes = []
+        for p in products:
+            valid, details = [], []
+            for smi in p:
+                validation = next(validations)
+                details.append({'product': smi, 'similarity': validation['similarity'],
+                                'is_valid': validation['is_valid'], 'reason': validation['reason']})
+                if validation['is_valid']:
+                    valid.append(smi)
+            outcomes.append((valid, details))
+        return outcomes
+
+    return run_jobs
+
+
+def _molecule_source():
+    """Reactant candidates: dry-run checked pools first, then the PubChem molecule cache"""
+    from molecule_pools import PoolStore
+    from molecule_service import MoleculeService
+
+    store = PoolStore()
+    service = MoleculeService(local_index=store)
+
+    def source(key, slot_smarts):
+        for slot in store.get(key) or []:
+            if slot['smarts'] == slot_smarts and slot['molecules']:
+                return slot['molecules']
+        return service.get_molecules(slot_smarts)['molecules']
+
+    return source
+
+
+def _acquire_producer_lock(wait):
+    """
+    Only one producer per bank
+
+    Args:
+        wait: Block until a running producer exits (watch mode, e.g. after a
+              server reload) instead of giving up
+
+    Returns:
+        The open lock file, or None if another producer runs and wait is False
+        (without fcntl or msvcrt the lock is not enforced)
+    """
+    os.makedirs(os.path.dirname(PRODUCER_LOCK_FILE), exist_ok=True)
+    handle = open(PRODUCER_LOCK_FILE, 'w')
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            # Windows has no blocking lock without a timeout; poll while waiting
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not wait:
+                        raise
+                    time.sleep(1)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def produce(args):
+    lock = _acquire_producer_lock(wait=args.watch)
+    if lock is None:
+        print("[Bank] Another producer is already running")
+        return
+
+    import reaction_logger
+    from problem_generator import ProblemGenerator, SuccessSampler, load_reactions
+    from reaction_executor import ReactionPool
+
+    if hasattr(os, 'nice'):     # Not available on Windows
+        try:
+            os.nice(10)  # Stay out of the way of request handling
+        except OSError:
+            pass
+
+    validator = None
+    if args.ai:
+        import ai_validator
+        ai_validator.warm_up()
+        validator = ai_validator
+
+    pool = None
+    if args.workers > 0:
+        pool = ReactionPool(workers=args.workers)
+        pool.start()
+    bank = ProblemBank(args.db)
+    parent = os.getppid()
+    try:
+        last_mtime = None
+        last_run = 0.0
+        while True:
+            mtime = os.path.getmtime(args.reactions)
+            if mtime != last_mtime or time.time() - last_run > RETRY_INTERVAL:
+                reactions = load_reactions(args.reactions)
+                generator = ProblemGenerator(reactions, _molecule_source(), _make_run_jobs(pool, validator),
+                                             sampler=SuccessSampler(reaction_logger.get_stats))
+                summary = refresh(bank, reactions, generator, per_template=args.per_template,
+                                  validated=validator is not None)
+                print(f"[Bank] Refresh done: {summary}, {bank.stats()}")
+                last_mtime, last_run = mtime, time.time()
+            if not args.watch:
+                break
+            time.sleep(WATCH_INTERVAL)
+            if args.exit_with_parent and os.getppid() != parent:
+                print("[Bank] Server exited, stopping producer")
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+        bank.close()
+        lock.close()
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(description="Persistent problem bank")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    # Also accepted after the command; SUPPRESS keeps a --db given before it
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', default=argparse.SUPPRESS, help="bank database path")
+    sub = parser.add_subparsers(dest='command', required=True)
+    prod = sub.add_parser('produce', parents=[common],
+                          help="fill the bank (only changed templates are recomputed)")
+    prod.add_argument('--reactions', default=PARSED_JSON)
+    prod.add_argument('--per-template', type=int, default=PROBLEMS_PER_TEMPLATE)
+    prod.add_argument('--workers', type=int, default=1, help="reaction pool workers (0 = run inline)")
+    prod.add_argument('--ai', action='store_true', help="validate products with ChemBERTa")
+    prod.add_argument('--watch', action='store_true', help="keep running and refresh when the database changes")
+    prod.add_argument('--exit-with-parent', action='store_true', help=argparse.SUPPRESS)
+    sub.add_parser('info', parents=[common], help="show bank contents")
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+
+    if args.command == 'produce':
+        produce(args)
+    else:
+        bank = ProblemBank(args.db)
+        print(json.dumps(bank.stats(), indent=2))
+        bank.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Problem Generator - Server-side problem generation for /api/problems
+服务器端出题：选择反应类型、挑选反应物、运行反应并验证，一次返回 N 道有效题目
+
+Templates are drawn by a success-rate-aware sampler: the prior for each
+template comes from data/reaction_stats.json (AI validation pass rate), and
+every generation attempt in this process updates it, so templates that keep
+producing nothing are tried less often instead of wasting whole rounds.
+"""
+
+import math
+import os
+import random
+import time
+from threading import Lock
+
+import reaction_cache
+from molecule_pools import plan_slots
+from reaction_catalog import SNAPSHOT_FILE, ReactionCatalog
+
+from server_log import get_logger
+
+log = get_logger('sampler')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+
+DIFFICULTY_LEVELS = {'easy': 1, 'medium': 2, 'hard': 3}
+ATTEMPTS_PER_PROBLEM = 4         # Same budget as the browser retry loop
+MAX_ROUND_FACTOR = 3             # A round runs at most 3x the problems still missing
+PRIOR_STRENGTH = 10              # Pseudo-attempts given to the reaction_stats prior
+DEFAULT_SUCCESS_RATE = 0.5       # Prior for templates without stats
+MIN_WEIGHT = 0.05                # Failing templates are still tried now and then
+STATS_REFRESH_INTERVAL = 60      # Seconds between reaction_stats reloads
+MAX_MAIN_PRODUCTS = 2
+
+
+def parse_difficulty(value):
+    """'easy'/'medium'/'hard' or 1-3 -> level (None for missing, 'custom' or invalid)"""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    if value in DIFFICULTY_LEVELS:
+        return DIFFICULTY_LEVELS[value]
+    return int(value) if value in ('1', '2', '3') else None
+
+
+def select_main_products(products, max_count=MAX_MAIN_PRODUCTS):
+    """
+    Keep the main products (port of filterMainProducts in reaction-engine.js)
+
+    Longer SMILES usually belong to the main product; trivial by-products such
+    as O or Br are dropped when something larger is available.
+    """
+    if len(products) <= max_count:
+        return list(products)
+    filtered = sorted((s for s in products if len(s) > 3), key=len, reverse=True)[:max_count]
+    return filtered or list(products[:max_count])
+
+
+class SuccessSampler:
+    """
+    Weighted template sampler that learns which templates fail
+
+    Args:
+        stats_provider: Callable returning reaction_stats (reaction_logger.get_stats)
+        prior_strength: Pseudo-attempts given to the stats prior
+        refresh_interval: Seconds between stats_provider calls
+    """
+
+    def __init__(self, stats_provider=None, prior_strength=PRIOR_STRENGTH,
+                 refresh_interval=STATS_REFRESH_INTERVAL):
+        self.stats_provider = stats_provider
+        self.prior_strength = prior_strength
+        self.refresh_interval = refresh_interval
+        self._lock = Lock()
+        self._priors = {}
+        self._priors_loaded_at = None
+        self._attempts = {}
+        self._successes = {}
+
+    def _refresh_priors(self):
+        if self.stats_provider is None:
+            return
+        now = time.time()
+        if self._priors_loaded_at is not None and now - self._priors_loaded_at < self.refresh_interval:
+            return
+        self._priors_loaded_at = now
+        try:
+            stats = self.stats_provider() or {}
+        except Exception as e:
+            log.warning(f"Could not load reaction stats: {e}")
+            return
+        priors = {}
+        for key, entry in stats.items():
+            total = entry.get('total_products') or 0
+            if total > 0:
+                # Laplace smoothing so one lucky run doesn't read as 100%
+                priors[key] = (entry.get('valid_products', 0) + 1) / (total + 2)
+        self._priors = priors
+
+    def success_rate(self, key):
+        """Expected chance that an attempt with this template yields a problem"""
+        with self._lock:
+            self._refresh_priors()
+            return self._rate(key)
+
+    def _rate(self, key):
+        prior = self._priors.get(key, DEFAULT_SUCCESS_RATE)
+        attempts = self._attempts.get(key, 0)
+        successes = self._successes.get(key, 0)
+        return (successes + prior * self.prior_strength) / (attempts + self.prior_strength)
+
+    def sample(self, keys, k, rng=random):
+        """
+        Draw k template keys (with replacement), weighted by success rate
+
+        Returns:
+            list: Sampled keys
+        """
+        if not keys or k <= 0:
+            return []
+        with self._lock:
+            self._refresh_priors()
+            weights = [max(self._rate(key), MIN_WEIGHT) for key in keys]
+        return rng.choices(keys, weights=weights, k=k)
+
+    def record(self, key, success):
+        """Record one generation attempt"""
+        with self._lock:
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+            if success:
+                self._successes[key] = self._successes.get(key, 0) + 1
+
+    def stats(self):
+        """Attempt counters and the templates that currently fail most"""
+        with self._lock:
+            attempts = sum(self._attempts.values())
+            successes = sum(self._successes.values())
+            worst = sorted(self._attempts, key=self._rate)[:10]
+            return {
+                'templates_tried': len(self._attempts),
+                'attempts': attempts,
+                'successes': successes,
+                'priors': len(self._priors),
+                'lowest_success_rates': {key: round(self._rate(key), 3) for key in worst}
+            }
+
+
+class ProblemGenerator:
+    """
+    Generate validated problems for a set of reaction templates
+
+    Args:
+        reactions: Reaction database (ReactionCatalog or parsed_reactions.json dict)
+        molecule_source: Callable(key, slot_smarts) -> list of SMILES for a pooled slot
+        run_jobs: Callable(jobs) -> list of (products, validation_results) in job order;
+                  jobs are dicts with 'smarts', 'reactants' and 'reaction_name'
+        sampler: SuccessSampler (default: one without stats)
+        rng: random.Random instance
+    """
+
+    def __init__(self, reactions, molecule_source, run_jobs, sampler=None, rng=None):
+        self.reactions = reactions
+        self.molecule_source = molecule_source
+        self.run_jobs = run_jobs
+        self.sampler = sampler or SuccessSampler()
+        self.rng = rng or random.Random()
+        self._slots = {}
+        self._template_counts = {}
+
+    def _reactant_templates(self, key):
+        """Number of reactant templates of a reaction (None if the SMARTS doesn't compile)"""
+        if key not in self._template_counts:
+            try:
+                rxn = reaction_cache.get_reaction(self.reactions[key]['smarts'])
+            except Exception:
+                rxn = None
+            self._template_counts[key] = rxn.GetNumReactantTemplates() if rxn is not None else None
+        return self._template_counts[key]
+
+    def eligible_keys(self, types=None, difficulty=None):
+        """Template keys that exist, have a SMARTS and match the difficulty"""
+        keys = types if types else list(self.reactions)
+        eligible = []
+        for key in keys:
+            rxn = self.reactions.get(key)
+            if not rxn or not rxn.get('smarts'):
+                continue
+            if difficulty is not None and (rxn.get('difficulty') or 1) != difficulty:
+                continue
+            eligible.append(key)
+        return eligible
+
+    def pick_reactants(self, key):
+        """
+        Reactants for one attempt, in the order the frontend renders them
+
+        Returns:
+            list or None: Reactant SMILES, None if a pooled slot has no molecules
+        """
+        if key not in self._slots:
+            self._slots[key] = plan_slots(self.reactions[key])
+        reactants = []
+        for search_smarts, fixed in self._slots[key]:
+            if search_smarts is None:
+                reactants.append(fixed)
+                continue
+            pool = self.molecule_source(key, search_smarts)
+            if not pool:
+                return None
+            reactants.append(self.rng.choice(pool))
+        return reactants or None
+
+    def generate(self, types=None, count=5, difficulty=None):
+        """
+        Generate up to `count` problems
+
+        Args:
+            types: Template keys to draw from (None = every template)
+            count: Number of problems wanted
+            difficulty: Difficulty level 1-3 (None = any)
+
+        Returns:
+            dict: 'problems' (key, name, condition, reactants, products and
+                  optionally validation), 'attempts' and 'complete'
+        """
+        keys = self.eligible_keys(types, difficulty)
+        problems = []
+        attempts = 0
+        max_attempts = count * ATTEMPTS_PER_PROBLEM
+        unavailable = set()
+
+        while len(problems) < count and attempts < max_attempts:
+            candidates = [key for key in keys if key not in unavailable]
+            if not candidates:
+                break
+            missing = count - len(problems)
+            # Oversample by the expected success rate so most requests finish in one round
+            expected = sum(self.sampler.success_rate(key) for key in candidates) / len(candidates)
+            round_size = min(max_attempts - attempts,
+                             max(missing, min(missing * MAX_ROUND_FACTOR, math.ceil(missing / max(expected, MIN_WEIGHT)))))
+
+            jobs = []
+            for key in self.sampler.sample(candidates, round_size, self.rng):
+                attempts += 1
+                reactants = self.pick_reactants(key)
+                if reactants is None:
+                    unavailable.add(key)
+                    self.sampler.record(key, False)
+                    continue
+                required = self._reactant_templates(key)
+                if required is None:
+                    unavailable.add(key)
+                    continue
+                jobs.append({
+                    'key': key,
+                    'smarts': self.reactions[key]['smarts'],
+                    'reactants': reactants[:required],
+                    'reaction_name': key,
+                    'display_reactants': reactants
+                })
+            if not jobs:
+                continue
+
+            for job, (products, validation) in zip(jobs, self.run_jobs(jobs)):
+                success = bool(products)
+                self.sampler.record(job['key'], success)
+                if not success or len(problems) >= count:
+                    continue
+                rxn = self.reactions[job['key']]
+                problem = {
+                    'key': job['key'],
+                    'name': rxn.get('name'),
+                    'condition': rxn.get('condition'),
+                    'difficulty': rxn.get('difficulty') or 1,
+                    'reactants': job['display_reactants'],
+                    'products': select_main_products(products)
+                }
+                if validation:
+                    problem['validation'] = validation
+                problems.append(problem)
+
+        return {'problems': problems, 'attempts': attempts, 'complete': len(problems) >= count}
+
+
+def load_reactions(json_path=PARSED_JSON):
+    """Load the reaction database as a ReactionCatalog (from its snapshot for the default database)"""
+    return ReactionCatalog.load(json_path, snapshot_path=SNAPSHOT_FILE if json_path == PARSED_JSON else None)
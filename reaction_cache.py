@@ -0,0 +1,174 @@
+"""
+Reaction Cache - Process-wide LRU cache of compiled SMARTS reactions
+缓存已编译的反应模板，避免每次请求重复解析 SMARTS
+"""
+
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from rdkit.Chem import AllChem
+
+from server_log import get_logger
+
+log = get_logger('reaction_cache')
+
+# Data file paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+
+# Upper bound on cached reactions (the catalog holds ~400 templates)
+MAX_CACHE_SIZE = 1024
+
+_cache = OrderedDict()
+_cache_lock = Lock()
+_counters = {
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0
+}
+
+
+def _compile(smarts):
+    """Compile and initialize a reaction (raises on SMARTS parse errors)"""
+    rxn = AllChem.ReactionFromSmarts(smarts)
+    if rxn is None:
+        return None
+    # Initialize up front so the shared object is never lazily mutated
+    # by concurrent RunReactants calls
+    rxn.Initialize()
+    return rxn
+
+
+def get_reaction(smarts):
+    """
+    Get a compiled reaction for a SMARTS string, compiling it on a cache miss
+
+    Args:
+        smarts: Reaction SMARTS string
+
+    Returns:
+        ChemicalReaction or None: Initialized reaction, None if SMARTS is invalid
+
+    Raises:
+        Exception: Whatever ReactionFromSmarts raises for malformed SMARTS
+    """
+    with _cache_lock:
+        rxn = _cache.get(smarts)
+        if rxn is not None:
+            _cache.move_to_end(smarts)
+            _counters['hits'] += 1
+            return rxn
+        _counters['misses'] += 1
+
+    # Compile outside the lock; a concurrent miss on the same SMARTS
+    # only costs a duplicate compile
+    rxn = _compile(smarts)
+    if rxn is None:
+        return None
+
+    _store(smarts, rxn)
+    return rxn
+
+
+def put(smarts, rxn):
+    """
+    Insert an already compiled and initialized reaction (e.g. from the
+    reaction catalog snapshot) without touching the hit/miss counters
+    """
+    _store(smarts, rxn)
+
+
+def _store(smarts, rxn):
+    """Insert a compiled reaction, evicting least recently used entries"""
+    with _cache_lock:
+        _cache[smarts] = rxn
+        _cache.move_to_end(smarts)
+        while len(_cache) > MAX_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _counters['evictions'] += 1
+
+
+def warm_up(json_path=PARSED_JSON, progress=None):
+    """
+    Precompile every reaction SMARTS from parsed_reactions.json
+
+    Args:
+        json_path: Path to the parsed reaction database
+        progress: Optional callback(done, total) called as templates compile
+
+    Returns:
+        int: Number of distinct reactions compiled into the cache
+    """
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            reactions = json.load(f)
+    except Exception as e:
+        log.warning(f"Could not load {json_path}: {e}")
+        return 0
+
+    # Several catalog entries share one SMARTS; compile each template once
+    unique_smarts = {
+        definition.get('smarts')
+        for definition in reactions.values()
+        if isinstance(definition, dict) and definition.get('smarts')
+    }
+
+    compiled = 0
+    failed = 0
+    for done, smarts in enumerate(unique_smarts, 1):
+        try:
+            if _compile_into_cache(smarts):
+                compiled += 1
+            else:
+                failed += 1
+        except Exception:
+            failed += 1
+        if progress:
+            progress(done, len(unique_smarts))
+
+    log.info(f"Warmed up {compiled} reactions ({failed} failed to compile)")
+    return compiled
+
+
+def _compile_into_cache(smarts):
+    """Insert a reaction without touching the hit/miss counters"""
+    with _cache_lock:
+        if smarts in _cache:
+            return True
+    rxn = _compile(smarts)
+    if rxn is None:
+        return False
+    _store(smarts, rxn)
+    return True
+
+
+def clear():
+    """Drop all cached reactions and reset counters"""
+    with _cache_lock:
+        _cache.clear()
+        for key in _counters:
+            _counters[key] = 0
+
+
+def get_cache_stats():
+    """Get cache size and hit/miss counters"""
+    with _cache_lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return {
+            'size': len(_cache),
+            'max_size': MAX_CACHE_SIZE,
+            'hits': _counters['hits'],
+            'misses': _counters['misses'],
+            'evictions': _counters['evictions'],
+            'hit_rate': round(_counters['hits'] / lookups * 100, 2) if lookups else 0.0
+        }
+
+
+# Test code
+if __name__ == "__main__":
+    print("=== Reaction Cache Test ===")
+    warm_up()
+    get_reaction('[C:1]=[C:2].[Br][Br]>>[C:1]([Br])-[C:2]([Br])')
+    print(json.dumps(get_cache_stats(), indent=2))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Reaction Catalog - The reaction database loaded once, compact and precompiled
+反应目录：一次加载 parsed_reactions.json，记录用 __slots__ 存储并预编译反应模板
+
+Each template becomes a ReactionRecord with __slots__; category, source and
+slot SMARTS strings are interned and identical reactant_info entries are
+shared, so ~400 templates cost a fraction of the nested JSON dicts. Every
+record carries its compiled ChemicalReaction and the query molecules of its
+reactant slots, and the catalog keeps secondary indexes by category,
+difficulty and subcategory.
+
+Records answer record['smarts'] / record.get('reactant_info') like the JSON
+dicts, so the catalog can be handed to code written for the plain database.
+Treat records (and their shared reactant_info dicts) as read-only.
+
+The loaded catalog, including the RDKit binaries of every reaction, is saved
+to data/reaction_catalog.snapshot. Later loads (every gunicorn worker,
+reaction pool worker and tool) read that one file instead of re-parsing
+JSON and recompiling SMARTS; the snapshot is rebuilt whenever the SHA-1 of
+parsed_reactions.json changes.
+
+Usage:
+    python reaction_catalog.py build
+    python reaction_catalog.py info
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from collections.abc import Mapping
+
+from rdkit import Chem, RDLogger
+from rdkit.Chem import rdChemReactions
+
+import reaction_cache
+from server_log import get_logger
+
+log = get_logger('catalog')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+SNAPSHOT_FILE = os.path.join(BASE_DIR, 'data', 'reaction_catalog.snapshot')
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SUBCATEGORY = 'general'  # Same fallback as the frontend's reaction list
+
+
+class ReactionRecord:
+    """One reaction template (read-only)"""
+
+    __slots__ = ('key', 'category', 'subcategory', 'name', 'condition', 'difficulty', 'smarts',
+                 'source', 'search_smarts', 'reactant_info', 'rxn', 'query_mols', 'error')
+
+    # Fields readable through record[...] / record.get(...), in parsed_reactions.json order
+    FIELDS = ('category', 'name', 'difficulty', 'smarts', 'source', 'search_smarts',
+              'reactant_info', 'condition', 'subcategory')
+
+    def __init__(self, key, category, subcategory, name, condition, difficulty, smarts,
+                 source, search_smarts, reactant_info, rxn=None, query_mols=(), error=None):
+        self.key = key
+        self.category = category
+        self.subcategory = subcategory
+        self.name = name
+        self.condition = condition
+        self.difficulty = difficulty
+        self.smarts = smarts
+        self.source = source
+        self.search_smarts = search_smarts
+        self.reactant_info = reactant_info
+        self.rxn = rxn
+        self.query_mols = query_mols
+        self.error = error
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in self.FIELDS else None
+        return default if value is None else value
+
+    def to_dict(self):
+        """The record as a parsed_reactions.json entry"""
+        entry = {field: getattr(self, field) for field in self.FIELDS}
+        entry['source'] = list(self.source)
+        entry['search_smarts'] = list(self.search_smarts)
+        entry['reactant_info'] = [dict(info) for info in self.reactant_info]
+        return entry
+
+    def __repr__(self):
+        return f"ReactionRecord({self.key!r}, {self.smarts!r})"
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Interner:
+    """Interns strings and shares identical reactant_info entries across records"""
+
+    def __init__(self):
+        self._infos = {}
+
+    def strings(self, values):
+        return tuple(_intern(value) for value in values or ())
+
+    def reactant_info(self, infos):
+        shared = []
+        for info in infos or ():
+            info = {_intern(k): _intern(v) for k, v in info.items()}
+            key = json.dumps(info, sort_keys=True)
+            shared.append(self._infos.setdefault(key, info))
+        return tuple(shared)
+
+
+def _compile(smarts):
+    """(reaction, error) for a template SMARTS"""
+    try:
+        rxn = reaction_cache.get_reaction(smarts)
+    except Exception as e:
+        return None, str(e).strip() or type(e).__name__
+    if rxn is None:
+        return None, 'ReactionFromSmarts returned None'
+    return rxn, None
+
+
+def _query_mols(reactant_info):
+    """Query molecule per reactant slot (None where the SMARTS doesn't parse)"""
+    return tuple(Chem.MolFromSmarts(info['smarts']) if info.get('smarts') else None for info in reactant_info)
+
+
+class ReactionCatalog(Mapping):
+    """
+    Read-only mapping key -> ReactionRecord with secondary indexes
+
+    Args:
+        records: ReactionRecords in catalog order
+        source_sha1: SHA-1 of the JSON the records were loaded from
+    """
+
+    def __init__(self, records, source_sha1=None):
+        self._records = {record.key: record for record in records}
+        self.source_sha1 = source_sha1
+        self.loaded_from = None
+        self.load_seconds = None
+        by_category, by_difficulty, by_subcategory = {}, {}, {}
+        for record in self._records.values():
+            by_category.setdefault(record.category, []).append(record.key)
+            by_difficulty.setdefault(record.difficulty, []).append(record.key)
+            by_subcategory.setdefault(record.subcategory, []).append(record.key)
+        self._by_category = {k: tuple(v) for k, v in by_category.items()}
+        self._by_difficulty = {k: tuple(v) for k, v in by_difficulty.items()}
+        self._by_subcategory = {k: tuple(v) for k, v in by_subcategory.items()}
+
+    def __getitem__(self, key):
+        return self._records[key]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def categories(self):
+        """Category -> number of templates"""
+        return {category: len(keys) for category, keys in self._by_category.items()}
+
+    def keys_for(self, category=None, difficulty=None, subcategory=None):
+        """
+        Template keys matching every given filter, in catalog order
+
+        Args:
+            category: Category name or list of names
+            difficulty: Level 1-3 or list of levels
+            subcategory: Subcategory name or list of names
+
+        Returns:
+            list: Matching keys
+        """
+        selected = None
+        for index, wanted in ((self._by_category, category), (self._by_difficulty, difficulty),
+                              (self._by_subcategory, subcategory)):
+            if wanted is None:
+                continue
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            keys = {key for value in values for key in index.get(value, ())}
+            selected = keys if selected is None else selected & keys
+        if selected is None:
+            return list(self._records)
+        return [key for key in self._records if key in selected]
+
+    def seed_reaction_cache(self):
+        """Put every compiled reaction into reaction_cache so execute_reaction never recompiles"""
+        seeded = 0
+        for record in self._records.values():
+            if record.rxn is not None:
+                reaction_cache.put(record.smarts, record.rxn)
+                seeded += 1
+        return seeded
+
+    def stats(self):
+        """Template counts per index and where the catalog was loaded from"""
+        return {
+            'templates': len(self._records),
+            'compile_errors': sum(1 for record in self._records.values() if record.rxn is None),
+            'categories': self.categories(),
+            'difficulties': {level: len(keys) for level, keys in sorted(self._by_difficulty.items())},
+            'subcategories': len(self._by_subcategory),
+            'loaded_from': self.loaded_from,
+            'load_seconds': self.load_seconds,
+            'source_sha1': self.source_sha1
+        }
+
+    # ==========================================
+    # Loading
+    # ==========================================
+    @classmethod
+    def from_reactions(cls, reactions, source_sha1=None, progress=None):
+        """
+        Build a catalog from the parsed_reactions.json dict, compiling every template
+
+        Args:
+            reactions: {key: entry} reaction database
+            source_sha1: SHA-1 of the JSON file (recorded in snapshots)
+            progress: Optional callback(done, total)
+        """
+        interner = _Interner()
+        records = []
+        for done, (key, entry) in enumerate(reactions.items(), 1):
+            if not isinstance(entry, dict):
+                continue
+            smarts = entry.get('smarts') or ''
+            reactant_info = interner.reactant_info(entry.get('reactant_info'))
+            rxn, error = _compile(smarts) if smarts else (None, 'Missing smarts')
+            records.append(ReactionRecord(
+                key=_intern(key),
+                category=_intern(entry.get('category') or 'uncategorized'),
+                subcategory=_intern(entry.get('subcategory') or DEFAULT_SUBCATEGORY),
+                name=entry.get('name'),
+                condition=entry.get('condition'),
+                difficulty=entry.get('difficulty') or 1,
+                smarts=smarts,
+                source=interner.strings(entry.get('source')),
+                search_smarts=interner.strings(entry.get('search_smarts')),
+                reactant_info=reactant_info,
+                rxn=rxn,
+                query_mols=_query_mols(reactant_info),
+                error=error
+            ))
+            if progress:
+                progress(done, len(reactions))
+        return cls(records, source_sha1)
+
+    @classmethod
+    def from_json(cls, json_path=PARSED_JSON, progress=None):
+        """Parse and compile parsed_reactions.json"""
+        with open(json_path, 'rb') as f:
+            data = f.read()
+        reactions = json.loads(data.decode('utf-8'))
+        return cls.from_reactions(reactions, hashlib.sha1(data).hexdigest(), progress)
+
+    def save_snapshot(self, path=SNAPSHOT_FILE):
+        """Write the catalog, with RDKit binaries of every reaction, as one snapshot file"""
+        records = []
+        for record in self._records.values():
+            fields = [getattr(record, name) for name in ReactionRecord.__slots__
+                      if name not in ('rxn', 'query_mols')]
+            records.append((fields,
+                            record.rxn.ToBinary() if record.rxn is not None else None,
+                            [mol.ToBinary() if mol is not None else None for mol in record.query_mols]))
+        payload = {'version': SNAPSHOT_VERSION, 'source_sha1': self.source_sha1,
+                   'rdkit_version': Chem.rdBase.rdkitVersion, 'records': records}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_snapshot(cls, path=SNAPSHOT_FILE, source_sha1=None):
+        """
+        Load a snapshot written by save_snapshot
+
+        Returns:
+            ReactionCatalog or None: None if the snapshot is missing, from another
+            version/RDKit build, or not built from source_sha1 (when given)
+        """
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return None
+        if (payload.get('version') != SNAPSHOT_VERSION
+                or payload.get('rdkit_version') != Chem.rdBase.rdkitVersion
+                or (source_sha1 is not None and payload.get('source_sha1') != source_sha1)):
+            return None
+
+        names = [name for name in ReactionRecord.__slots__ if name not in ('rxn', 'query_mols')]
+        records = []
+        for fields, rxn_binary, mol_binaries in payload['records']:
+            values = dict(zip(names, fields))
+            for name in ('key', 'category', 'subcategory'):
+                values[name] = _intern(values[name])
+            values['source'] = tuple(_intern(s) for s in values['source'])
+            values['search_smarts'] = tuple(_intern(s) for s in values['search_smarts'])
+            rxn = None
+            if rxn_binary is not None:
+                rxn = rdChemReactions.ChemicalReaction(rxn_binary)
+                rxn.Initialize()
+            values['rxn'] = rxn
+            values['query_mols'] = tuple(Chem.Mol(b) if b is not None else None for b in mol_binaries)
+            records.append(ReactionRecord(**values))
+        return cls(records, payload.get('source_sha1'))
+
+    @classmethod
+    def load(cls, json_path=PARSED_JSON, snapshot_path=SNAPSHOT_FILE, progress=None):
+        """
+        Load the catalog, from the snapshot when it matches the JSON, else from JSON
+        (writing a fresh snapshot for the next process)
+
+        Args:
+            json_path: Reaction database
+            snapshot_path: Snapshot file (None = always load from JSON)
+            progress: Optional callback(done, total) while compiling from JSON
+        """
+        started = time.perf_counter()
+        with open(json_path, 'rb') as f:
+            sha1 = hashlib.sha1(f.read()).hexdigest()
+
+        # Template warnings are reported by reaction_validation.py, not logged on every load
+        RDLogger.DisableLog('rdApp.*')
+        try:
+            catalog = cls.from_snapshot(snapshot_path, sha1) if snapshot_path else None
+            loaded_from = 'snapshot'
+            if catalog is None:
+                catalog = cls.from_json(json_path, progress)
+                loaded_from = 'json'
+        finally:
+            RDLogger.EnableLog('rdApp.*')
+        catalog.loaded_from = loaded_from
+        if loaded_from == 'json' and snapshot_path:
+            try:
+                catalog.save_snapshot(snapshot_path)
+            except OSError as e:
+                log.warning(f"Could not write snapshot {snapshot_path}: {e}")
+        catalog.load_seconds = round(time.perf_counter() - started, 4)
+        return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the reaction catalog snapshot")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help="rebuild the snapshot from parsed_reactions.json")
+    sub.add_parser('info', help="load the catalog and print its indexes")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        catalog = ReactionCatalog.load(snapshot_path=None)
+        catalog.save_snapshot()
+        print(f"[Catalog] {len(catalog)} templates written to {SNAPSHOT_FILE}")
+    else:
+        print(json.dumps(ReactionCatalog.load().stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
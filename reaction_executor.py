@@ -0,0 +1,528 @@
+"""
+Reaction Executor - Run RDKit reactions in a managed process pool
+反应执行器：在独立的工作进程中运行 RunReactants，支持超时、进程回收和产物数量上限
+
+A pathological SMARTS/reactant combination can keep RunReactants busy for a
+long time. Running it in a worker process lets the server give up after
+JOB_TIMEOUT seconds, kill the worker and start a fresh one, while other
+requests keep using the remaining workers. Workers are also retired after
+MAX_JOBS_PER_WORKER jobs so memory growth inside RDKit cannot accumulate.
+"""
+
+import atexit
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, LifoQueue
+from threading import Lock
+
+from rdkit import Chem
+
+import reaction_cache
+from server_log import get_logger
+
+log = get_logger('executor')
+
+# Pool configuration (environment variables override the defaults)
+POOL_WORKERS = int(os.environ.get('REACTION_POOL_WORKERS', max(1, min(4, os.cpu_count() or 1))))
+JOB_TIMEOUT = float(os.environ.get('REACTION_JOB_TIMEOUT', 10))            # Seconds per job
+MAX_JOBS_PER_WORKER = int(os.environ.get('REACTION_MAX_JOBS_PER_WORKER', 500))
+MAX_PRODUCTS = int(os.environ.get('REACTION_MAX_PRODUCTS', 200))          # Product sets enumerated per job
+START_METHOD = os.environ.get('REACTION_POOL_START_METHOD', 'forkserver')
+RECENT_TIMEOUTS = 20                                                       # Timed-out jobs kept for /api/stats
+
+# Product filters
+MAX_PRODUCT_ATOMS = 30            # Heavy atoms
+MAX_PRODUCT_SMILES_LENGTH = 80
+
+# Timed stages of one job, in execution order (see collect_products)
+STAGES = ('compile', 'mol_parse', 'run_reactants', 'dedup', 'filter', 'sanitize', 'smiles', 'reparse', 'postprocess')
+
+
+class ReactionTimeout(Exception):
+    """Raised when a reaction job exceeds its wall-clock timeout"""
+
+
+def execute_reaction(smarts, reactants_smiles, max_products=MAX_PRODUCTS, timings=None):
+    """
+    Run a SMARTS reaction on reactant SMILES and collect unique products
+
+    Args:
+        smarts: Reaction SMARTS string
+        reactants_smiles: List of reactant SMILES (a single string is accepted)
+        max_products: Maximum number of product sets RunReactants enumerates
+        timings: Optional dict that receives per-stage seconds and product counts
+
+    Returns:
+        tuple: (list of product SMILES, error message or None)
+    """
+    if timings is None:
+        timings = {}
+    if not smarts:
+        return [], 'Missing smarts'
+
+    if not reactants_smiles:
+        return [], 'Missing reactants'
+
+    # 确保 reactants_smiles 是列表
+    if isinstance(reactants_smiles, str):
+        reactants_smiles = [reactants_smiles]
+
+    # Get compiled reaction (cached by SMARTS string)
+    started = time.perf_counter()
+    try:
+        rxn = reaction_cache.get_reaction(smarts)
+    except Exception as smarts_error:
+        log.warning(f"SMARTS 解析错误: {smarts_error}")
+        return [], f'SMARTS parse error: {smarts_error}'
+    finally:
+        timings['compile'] = round(time.perf_counter() - started, 6)
+
+    if rxn is None:
+        log.warning(f"Invalid SMARTS: {smarts}")
+        return [], 'Invalid SMARTS - ReactionFromSmarts returned None'
+
+    # Log reaction details
+    num_reactant_templates = rxn.GetNumReactantTemplates()
+    num_product_templates = rxn.GetNumProductTemplates()
+    log.debug(f"Reaction: {num_reactant_templates} reactants -> {num_product_templates} products")
+
+    # Create reactant molecules
+    started = time.perf_counter()
+    reactants = []
+    for smi in reactants_smiles:
+        if not smi or not isinstance(smi, str):
+            log.debug(f"  Reactant: {smi} (SKIPPED - invalid type)")
+            continue
+        try:
+            mol = Chem.MolFromSmiles(smi)
+            if mol:
+                reactants.append(mol)
+                log.debug(f"  Reactant: {smi} (valid)")
+            else:
+                log.debug(f"  Reactant: {smi} (INVALID - MolFromSmiles returned None)")
+        except Exception as mol_error:
+            log.debug(f"  Reactant: {smi} (ERROR: {mol_error})")
+    timings['mol_parse'] = round(time.perf_counter() - started, 6)
+
+    if len(reactants) == 0:
+        log.debug("No valid reactants")
+        return [], 'No valid reactant molecules'
+
+    # Check if number of reactants matches the reaction template
+    if len(reactants) < num_reactant_templates:
+        log.debug(f"Need {num_reactant_templates} reactants, got {len(reactants)}; "
+                  f"duplicating the first reactant to meet the template")
+        # 尝试复制反应物以满足模板需求
+        while len(reactants) < num_reactant_templates and len(reactants) > 0:
+            reactants.append(reactants[0])
+
+    # Run reaction
+    try:
+        run_started = time.perf_counter()
+        products_tuple = rxn.RunReactants(tuple(reactants), maxProducts=max_products)
+        run_seconds = time.perf_counter() - run_started
+        log.debug(f"Reaction produced {len(products_tuple)} product sets")
+    except Exception as run_error:
+        log.warning(f"Reaction run failed: {run_error}", exc_info=True)
+        return [], f'Reaction execution failed: {run_error}'
+
+    products = collect_products(products_tuple, timings)
+    timings['run_reactants'] = round(run_seconds, 6)
+    log.debug(f"Products: {len(products)} unique "
+              f"({timings['candidates']} candidates, {timings['duplicates']} duplicates, "
+              f"{timings['rejected']} rejected) in {timings['postprocess']:.4f}s")
+    return products, None
+
+
+def _needs_reparse(mol):
+    """
+    Whether a sanitized product's SMILES must be re-parsed to be trusted
+
+    Aromatic flags and radicals assigned by the reaction template are the
+    cases where the written SMILES may fail to round-trip (e.g. aromatic atoms
+    that only kekulize in the original graph); everything else is written from
+    a molecule that has just passed sanitization.
+    """
+    for atom in mol.GetAtoms():
+        if atom.GetIsAromatic() or atom.GetNumRadicalElectrons():
+            return True
+    return False
+
+
+def collect_products(products_tuple, timings=None):
+    """
+    Post-process RunReactants output into unique, valid product SMILES
+
+    Stages (cheapest first, each recorded in `timings` in seconds):
+        dedup     non-canonical SMILES of the raw product; symmetric template
+                  matches usually produce identical raw graphs
+        filter    heavy-atom count (> MAX_PRODUCT_ATOMS) before any SMILES work
+        sanitize  SanitizeMol on the survivors
+        smiles    canonical SMILES, second dedup, length filter
+        reparse   MolFromSmiles round trip, only where _needs_reparse()
+    """
+    if timings is None:
+        timings = {}
+    stage = {'dedup': 0.0, 'filter': 0.0, 'sanitize': 0.0, 'smiles': 0.0, 'reparse': 0.0}
+    counts = {'candidates': 0, 'duplicates': 0, 'rejected': 0}
+    seen_raw = set()
+    seen_canonical = set()
+    unique_products = []
+    started = time.perf_counter()
+
+    for product_set in products_tuple:
+        for mol in product_set:
+            counts['candidates'] += 1
+
+            t0 = time.perf_counter()
+            try:
+                raw_key = Chem.MolToSmiles(mol, canonical=False)
+            except Exception:
+                raw_key = None
+            t1 = time.perf_counter()
+            stage['dedup'] += t1 - t0
+            if raw_key is not None:
+                if raw_key in seen_raw:
+                    counts['duplicates'] += 1
+                    continue
+                seen_raw.add(raw_key)
+
+            # 过滤过于复杂的分子（原子数 > 30）
+            atom_count = mol.GetNumHeavyAtoms()
+            t2 = time.perf_counter()
+            stage['filter'] += t2 - t1
+            if atom_count > MAX_PRODUCT_ATOMS:
+                counts['rejected'] += 1
+                continue
+
+            failed = Chem.SanitizeMol(mol, catchErrors=True)
+            t3 = time.perf_counter()
+            stage['sanitize'] += t3 - t2
+            if failed != Chem.SanitizeFlags.SANITIZE_NONE:
+                counts['rejected'] += 1
+                continue
+
+            # 生成规范 SMILES
+            try:
+                smi = Chem.MolToSmiles(mol, canonical=True)
+            except Exception:
+                smi = None
+            t4 = time.perf_counter()
+            stage['smiles'] += t4 - t3
+            if smi in seen_canonical:
+                counts['duplicates'] += 1
+                continue
+            seen_canonical.add(smi)
+            # 过滤过于复杂的分子（长度 > 80）
+            if not smi or len(smi) > MAX_PRODUCT_SMILES_LENGTH:
+                counts['rejected'] += 1
+                continue
+
+            # 验证：只在可能无法往返的情况下重新解析 SMILES
+            if _needs_reparse(mol):
+                valid = Chem.MolFromSmiles(smi) is not None
+                stage['reparse'] += time.perf_counter() - t4
+                if not valid:
+                    log.debug(f"Product SMILES cannot be reparsed: {smi}")
+                    counts['rejected'] += 1
+                    continue
+
+            unique_products.append(smi)
+
+    timings.update({name: round(seconds, 6) for name, seconds in stage.items()})
+    timings.update(counts)
+    timings['product_sets'] = len(products_tuple)
+    timings['postprocess'] = round(time.perf_counter() - started, 6)
+    return unique_products
+
+
+def _worker_main(conn):
+    """Worker process loop: receive jobs until told to stop (None) or the pipe closes"""
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        # Compiled templates come from the catalog snapshot instead of re-parsing every SMARTS
+        from reaction_catalog import ReactionCatalog
+        ReactionCatalog.load().seed_reaction_cache()
+    except Exception as e:
+        log.warning(f"[ReactionPool] Worker cache warm-up failed: {e}")
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        smarts, reactants_smiles, max_products = job
+        timings = {}
+        try:
+            products, error = execute_reaction(smarts, reactants_smiles, max_products, timings)
+            result = (products, error, timings)
+        except Exception as e:
+            result = ([], f'Reaction execution failed: {e}', timings)
+        try:
+            conn.send(result)
+        except (EOFError, OSError):
+            break
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.jobs = 0
+
+
+class ReactionPool:
+    """
+    Fixed-size pool of reaction worker processes
+
+    Args:
+        workers: Number of worker processes
+        job_timeout: Wall-clock seconds a job may run before its worker is killed
+        max_jobs_per_worker: Jobs a worker runs before it is replaced
+        max_products: Upper bound for the per-job maxProducts
+        start_method: multiprocessing start method ('forkserver', 'spawn' or 'fork')
+    """
+
+    def __init__(self, workers=POOL_WORKERS, job_timeout=JOB_TIMEOUT,
+                 max_jobs_per_worker=MAX_JOBS_PER_WORKER, max_products=MAX_PRODUCTS,
+                 start_method=START_METHOD):
+        self.workers = max(1, workers)
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_products = max_products
+
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = 'spawn'
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # Import RDKit once in the fork server so new workers start quickly
+            self._context.set_forkserver_preload(['reaction_executor'])
+
+        self._lock = Lock()
+        self._idle = LifoQueue()
+        self._live = 0
+        self._closed = False
+        self._recent_timeouts = deque(maxlen=RECENT_TIMEOUTS)
+        self._stage_seconds = {name: 0.0 for name in STAGES}
+        self._counters = {
+            'jobs': 0,
+            'timeouts': 0,
+            'crashes': 0,
+            'workers_started': 0,
+            'workers_recycled': 0
+        }
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn,), name='reaction-worker', daemon=True
+        )
+        process.start()
+        child_conn.close()
+        with self._lock:
+            self._counters['workers_started'] += 1
+        return _Worker(process, parent_conn)
+
+    def start(self):
+        """Start all workers up front (otherwise they start on first use)"""
+        started = []
+        for _ in range(self.workers):
+            with self._lock:
+                if self._live >= self.workers:
+                    break
+                self._live += 1
+            try:
+                started.append(self._spawn())
+            except Exception:
+                with self._lock:
+                    self._live -= 1
+                raise
+        for worker in started:
+            self._idle.put(worker)
+
+    def _acquire(self, timeout):
+        """Take an idle worker, start one if below capacity, else wait (raises Empty)"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except Empty:
+                pass
+
+            with self._lock:
+                spawn = self._live < self.workers
+                if spawn:
+                    self._live += 1
+            if spawn:
+                try:
+                    return self._spawn()
+                except Exception:
+                    with self._lock:
+                        self._live -= 1
+                    raise
+
+            # Wake up regularly: a killed worker frees a slot without going idle
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise Empty
+            try:
+                return self._idle.get(timeout=min(remaining, 0.1))
+            except Empty:
+                continue
+
+    def _release(self, worker):
+        if self._closed or worker.jobs >= self.max_jobs_per_worker:
+            self._stop_worker(worker)
+            with self._lock:
+                self._counters['workers_recycled'] += 1
+        else:
+            self._idle.put(worker)
+
+    def _stop_worker(self, worker, kill=False):
+        try:
+            if kill:
+                worker.process.kill()
+            else:
+                worker.conn.send(None)
+        except (EOFError, OSError):
+            pass
+        worker.process.join(timeout=1)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join(timeout=1)
+        worker.conn.close()
+        with self._lock:
+            self._live -= 1
+
+    def run(self, smarts, reactants_smiles, max_products=None, timings=None):
+        """
+        Run one reaction job on a worker process
+
+        Args:
+            smarts: Reaction SMARTS string
+            reactants_smiles: List of reactant SMILES
+            max_products: Requested maxProducts (capped at the pool's max_products)
+            timings: Optional dict that receives the job's per-stage timings
+
+        Returns:
+            tuple: (list of product SMILES, error message or None)
+
+        Raises:
+            ReactionTimeout: No worker became free within job_timeout, or the
+                             job did not finish within job_timeout of starting
+        """
+        if self._closed:
+            raise RuntimeError('Reaction pool is closed')
+        max_products = min(max_products or self.max_products, self.max_products)
+
+        try:
+            worker = self._acquire(self.job_timeout)
+        except Empty:
+            self._record_timeout(smarts, reactants_smiles, 'queue')
+            raise ReactionTimeout(f'No reaction worker free within {self.job_timeout}s')
+
+        # The full budget from here: time spent queueing must not get a
+        # healthy worker killed and respawned
+        try:
+            worker.conn.send((smarts, reactants_smiles, max_products))
+            finished = worker.conn.poll(self.job_timeout)
+            result = worker.conn.recv() if finished else None
+        except (EOFError, OSError) as e:
+            self._stop_worker(worker, kill=True)
+            with self._lock:
+                self._counters['jobs'] += 1
+                self._counters['crashes'] += 1
+            return [], f'Reaction worker crashed: {e}'
+
+        if not finished:
+            self._stop_worker(worker, kill=True)
+            self._record_timeout(smarts, reactants_smiles, 'run')
+            raise ReactionTimeout(f'Reaction timed out after {self.job_timeout}s')
+
+        products, error, job_timings = result
+        worker.jobs += 1
+        with self._lock:
+            self._counters['jobs'] += 1
+            for name in STAGES:
+                if name in job_timings:
+                    self._stage_seconds[name] += job_timings[name]
+        self._release(worker)
+        if timings is not None:
+            timings.update(job_timings)
+        return products, error
+
+    def map(self, jobs):
+        """
+        Run several jobs concurrently, one per free worker
+
+        Args:
+            jobs: List of (smarts, reactants_smiles, max_products) tuples
+
+        Returns:
+            list: (products, error, timed_out) tuples in job order
+        """
+        def run_one(job):
+            try:
+                products, error = self.run(*job)
+                return products, error, False
+            except ReactionTimeout as e:
+                return [], str(e), True
+            except Exception as e:
+                return [], str(e), False
+
+        if len(jobs) <= 1:
+            return [run_one(job) for job in jobs]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs))) as executor:
+            return list(executor.map(run_one, jobs))
+
+    def _record_timeout(self, smarts, reactants_smiles, stage):
+        with self._lock:
+            self._counters['jobs'] += 1
+            self._counters['timeouts'] += 1
+            self._recent_timeouts.append({
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'smarts': smarts,
+                'reactants': reactants_smiles,
+                'stage': stage
+            })
+
+    def stats(self):
+        """Get pool configuration, counters and the most recent timed-out jobs"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'live_workers': self._live,
+                'idle_workers': self._idle.qsize(),
+                'job_timeout': self.job_timeout,
+                'max_jobs_per_worker': self.max_jobs_per_worker,
+                'max_products': self.max_products,
+                **self._counters,
+                'stage_seconds': {k: round(v, 3) for k, v in self._stage_seconds.items()},
+                'recent_timeouts': list(self._recent_timeouts)
+            }
+
+    def close(self):
+        """Stop all idle workers; busy workers stop when their job returns"""
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except Empty:
+                break
+            self._stop_worker(worker)
+
+
+# Test code
+if __name__ == "__main__":
+    pool = ReactionPool(workers=2)
+    pool.start()
+    atexit.register(pool.close)
+    print(pool.run("[C:1]=[C:2].[Br:3][Br:4]>>[C:1]([Br:3])[C:2]([Br:4])", ['C=C', 'BrBr']))
+    print(pool.stats())
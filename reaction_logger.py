@@ -1,27 +1,75 @@
 """
 Reaction Data Logger - Collect and store reaction validation data for analysis
 收集并存储反应验证数据，用于后续分析和学习
+
+Failed reactions are appended to a JSONL log by a background writer thread
+and rotated by size (failed_reactions.jsonl -> failed_reactions.1.jsonl ...).
+Statistics and summary aggregates live in memory and are updated
+incrementally; reaction_stats.json is a periodic snapshot of the statistics.
+Callers on the request path only touch memory and a queue.
+
+Several server worker processes may log at once: log writes and rotation
+happen under an inter-process file lock, and each process merges its stats
+increments into reaction_stats.json instead of overwriting it. Failure
+summary counts are per process (disk scan at start plus own writes).
 """
 
+import atexit
+import copy
 import json
 import os
+import time
+from collections import deque
 from datetime import datetime
-from threading import Lock
+from queue import Empty, Queue
+from threading import Lock, Thread
+
+from server_log import get_logger
+
+log = get_logger('logger')
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Data file paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-FAILED_REACTIONS_FILE = os.path.join(DATA_DIR, 'failed_reactions.json')
+FAILED_REACTIONS_FILE = os.path.join(DATA_DIR, 'failed_reactions.jsonl')
+LEGACY_FAILED_REACTIONS_FILE = os.path.join(DATA_DIR, 'failed_reactions.json')
 STATS_FILE = os.path.join(DATA_DIR, 'reaction_stats.json')
 
-# Thread lock for file operations
-_file_lock = Lock()
+# Rotation and buffering config
+MAX_LOG_BYTES = 1024 * 1024      # Rotate the failed reaction log at 1 MB
+LOG_BACKUP_COUNT = 3             # Rotated files kept (failed_reactions.1.jsonl ...)
+RECENT_ENTRIES = 1000            # Recent failures kept in memory for get_failed_reactions
+FLUSH_INTERVAL = 1.0             # Seconds between writer thread wake-ups
+STATS_FLUSH_INTERVAL = 5.0       # Minimum seconds between stats snapshots
+
+# In-memory state (guarded by _state_lock)
+_state_lock = Lock()
+_loaded = False
+_stats = {}
+_stats_delta = {}                # Increments not yet merged into STATS_FILE
+_stats_reset = False             # clear_logs() ran; next snapshot starts from {}
+_recent = deque(maxlen=RECENT_ENTRIES)
+_segment_counts = []             # Per log file, newest first: {'total': n, 'reasons': {...}}
+_pending_counts = {'total': 0, 'reasons': {}}
+
+# Writer state (file I/O is guarded by _io_lock)
+_io_lock = Lock()
+_queue = Queue()
+_log_handle = None
+_last_stats_write = 0.0
+_writer = None
+_writer_pid = None
 
 
 def _ensure_data_dir():
     """Ensure data directory exists"""
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
-        print(f"[Logger] Created data directory: {DATA_DIR}")
+        log.info(f"Created data directory: {DATA_DIR}")
 
 
 def _load_json(filepath, default=None):
@@ -33,26 +81,258 @@ def _load_json(filepath, default=None):
             with open(filepath, 'r', encoding='utf-8') as f:
                 return json.load(f)
     except Exception as e:
-        print(f"[Logger] Error loading {filepath}: {e}")
+        log.warning(f"Error loading {filepath}: {e}")
     return default
 
 
 def _save_json(filepath, data):
-    """Save JSON file safely"""
+    """Save JSON file atomically (write to a temp file, then rename)"""
     _ensure_data_dir()
+    tmp_path = filepath + '.tmp'
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, filepath)
         return True
     except Exception as e:
-        print(f"[Logger] Error saving {filepath}: {e}")
+        log.warning(f"Error saving {filepath}: {e}")
         return False
 
 
+class _FileLock:
+    """Exclusive inter-process lock on a side file (no-op without fcntl)"""
+
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self.handle = None
+
+    def __enter__(self):
+        _ensure_data_dir()
+        self.handle = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+        self.handle.close()
+
+
+def _apply_stats_delta(stats, delta):
+    """Add per-reaction increments to a stats dict (in place)"""
+    for reaction_name, increment in delta.items():
+        entry = stats.setdefault(reaction_name, {
+            'total_runs': 0,
+            'total_products': 0,
+            'valid_products': 0,
+            'failed_products': 0,
+            'last_run': None
+        })
+        for key in ('total_runs', 'total_products', 'valid_products', 'failed_products'):
+            entry[key] = entry.get(key, 0) + increment[key]
+        if increment['last_run'] and (entry['last_run'] or '') < increment['last_run']:
+            entry['last_run'] = increment['last_run']
+
+        # Calculate success rate
+        total = entry['total_products']
+        if total > 0:
+            entry['success_rate'] = round(entry['valid_products'] / total * 100, 2)
+
+
+def _reason_key(reason):
+    """Simplify a validation reason into a summary bucket"""
+    reason = (reason or 'Unknown').lower()
+    if 'too much' in reason or 'differs' in reason:
+        return 'Too Different'
+    if 'too similar' in reason or 'no effective' in reason:
+        return 'Too Similar'
+    return 'Other'
+
+
+def _count(counts, entry, delta=1):
+    key = _reason_key(entry.get('reason'))
+    counts['total'] += delta
+    counts['reasons'][key] = counts['reasons'].get(key, 0) + delta
+
+
+def _log_path(index):
+    """Path of the current log (0) or of rotated log number `index`"""
+    if index == 0:
+        return FAILED_REACTIONS_FILE
+    base, ext = os.path.splitext(FAILED_REACTIONS_FILE)
+    return f"{base}.{index}{ext}"
+
+
+def _read_log(path):
+    """Read all entries of one JSONL log file (skips damaged lines)"""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def _migrate_legacy_log():
+    """Convert the old rewrite-the-whole-file JSON log to JSONL once"""
+    if os.path.exists(FAILED_REACTIONS_FILE) or not os.path.exists(LEGACY_FAILED_REACTIONS_FILE):
+        return
+    legacy = _load_json(LEGACY_FAILED_REACTIONS_FILE, [])
+    _ensure_data_dir()
+    with open(FAILED_REACTIONS_FILE, 'w', encoding='utf-8') as f:
+        for entry in legacy:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(LEGACY_FAILED_REACTIONS_FILE, LEGACY_FAILED_REACTIONS_FILE + '.migrated')
+    log.info(f"Migrated {len(legacy)} failed reactions to {FAILED_REACTIONS_FILE}")
+
+
+def _ensure_loaded():
+    """Build in-memory aggregates from disk (once per process)"""
+    global _loaded, _stats
+    if _loaded:
+        return
+    with _io_lock, _state_lock:
+        if _loaded:
+            return
+        try:
+            _migrate_legacy_log()
+        except Exception as e:
+            log.warning(f"Could not migrate legacy log: {e}")
+
+        _stats = _load_json(STATS_FILE, {})
+        _segment_counts.clear()
+        _recent.clear()
+        # Oldest rotated file first so _recent ends with the newest entries
+        segments = []
+        for index in range(LOG_BACKUP_COUNT, -1, -1):
+            counts = {'total': 0, 'reasons': {}}
+            for entry in _read_log(_log_path(index)):
+                _count(counts, entry)
+                _recent.append(entry)
+            segments.append(counts)
+        _segment_counts.extend(reversed(segments))
+        _loaded = True
+
+
+def _ensure_writer():
+    """Start the background writer thread (again after a fork)"""
+    global _writer, _writer_pid
+    if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+        return
+    with _state_lock:
+        if _writer is not None and _writer_pid == os.getpid() and _writer.is_alive():
+            return
+        _writer_pid = os.getpid()
+        _writer = Thread(target=_writer_loop, name='reaction-logger', daemon=True)
+        _writer.start()
+
+
+def _writer_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            _write_pending()
+        except Exception as e:
+            log.warning(f"Background write failed: {e}")
+
+
+def _write_pending(force_stats=False):
+    """Drain queued entries to the log and merge stats into the snapshot if due"""
+    global _log_handle, _stats, _stats_delta, _stats_reset, _last_stats_write
+    with _io_lock:
+        entries = []
+        while True:
+            try:
+                entries.append(_queue.get_nowait())
+            except Empty:
+                break
+
+        if entries:
+            with _FileLock(FAILED_REACTIONS_FILE):
+                _reopen_if_rotated()
+                for entry in entries:
+                    if _log_handle is None:
+                        _log_handle = open(FAILED_REACTIONS_FILE, 'a', encoding='utf-8')
+                    _log_handle.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    with _state_lock:
+                        _count(_pending_counts, entry, -1)
+                        _count(_segment_counts[0], entry)
+                    if _log_handle.tell() >= MAX_LOG_BYTES:
+                        _rotate()
+                if _log_handle is not None:
+                    _log_handle.flush()
+
+        now = time.time()
+        with _state_lock:
+            dirty = bool(_stats_delta) or _stats_reset
+            due = dirty and (force_stats or now - _last_stats_write >= STATS_FLUSH_INTERVAL)
+            if due:
+                delta, _stats_delta = _stats_delta, {}
+                reset, _stats_reset = _stats_reset, False
+        if due:
+            # Merge under the file lock so other worker processes' counts survive
+            with _FileLock(STATS_FILE):
+                merged = {} if reset else _load_json(STATS_FILE, {})
+                _apply_stats_delta(merged, delta)
+                _save_json(STATS_FILE, merged)
+            with _state_lock:
+                _stats = copy.deepcopy(merged)
+                _apply_stats_delta(_stats, _stats_delta)
+            _last_stats_write = now
+
+
+def _reopen_if_rotated():
+    """Reopen the log if another process rotated it (caller holds the file lock)"""
+    global _log_handle
+    if _log_handle is None:
+        return
+    try:
+        current = os.stat(FAILED_REACTIONS_FILE)
+        opened = os.fstat(_log_handle.fileno())
+        rotated = (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+    except OSError:
+        rotated = True
+    if rotated:
+        _log_handle.close()
+        _log_handle = None
+
+
+def _rotate():
+    """Size-based rotation: current -> .1 -> .2 ... oldest dropped (caller holds _io_lock)"""
+    global _log_handle
+    if _log_handle is not None:
+        _log_handle.close()
+        _log_handle = None
+    for index in range(LOG_BACKUP_COUNT, 0, -1):
+        src = _log_path(index - 1)
+        if os.path.exists(src):
+            os.replace(src, _log_path(index))
+    with _state_lock:
+        _segment_counts.insert(0, {'total': 0, 'reasons': {}})
+        del _segment_counts[LOG_BACKUP_COUNT + 1:]
+
+
+def flush():
+    """Write everything buffered so far (also runs at interpreter exit)"""
+    if _loaded:
+        _write_pending(force_stats=True)
+
+
+atexit.register(flush)
+
+
 def log_failed_reaction(reactants, product, smarts, validation_result, reaction_name=None):
     """
     Log a failed reaction for later analysis
-    
+
     Args:
         reactants: List of reactant SMILES
         product: Product SMILES that failed validation
@@ -60,107 +340,96 @@ def log_failed_reaction(reactants, product, smarts, validation_result, reaction_
         validation_result: Dict with similarity, is_valid, reason
         reaction_name: Optional reaction type name
     """
-    with _file_lock:
-        failed_reactions = _load_json(FAILED_REACTIONS_FILE, [])
-        
-        entry = {
-            'timestamp': datetime.now().isoformat(),
-            'reactants': reactants if isinstance(reactants, list) else [reactants],
-            'product': product,
-            'smarts': smarts,
-            'reaction_name': reaction_name,
-            'similarity': validation_result.get('similarity'),
-            'reason': validation_result.get('reason'),
-            'validation_type': 'ai_chemberta'
-        }
-        
-        failed_reactions.append(entry)
-        
-        # Keep only last 1000 entries to prevent file from growing too large
-        if len(failed_reactions) > 1000:
-            failed_reactions = failed_reactions[-1000:]
-        
-        _save_json(FAILED_REACTIONS_FILE, failed_reactions)
-        print(f"[Logger] Logged failed reaction: {product[:30]}...")
+    _ensure_loaded()
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'reactants': reactants if isinstance(reactants, list) else [reactants],
+        'product': product,
+        'smarts': smarts,
+        'reaction_name': reaction_name,
+        'similarity': validation_result.get('similarity'),
+        'reason': validation_result.get('reason'),
+        'validation_type': 'ai_chemberta'
+    }
+
+    with _state_lock:
+        _recent.append(entry)
+        _count(_pending_counts, entry)
+    _queue.put(entry)
+    _ensure_writer()
+    log.debug(f"Logged failed reaction: {product[:30]}...")
 
 
 def update_stats(reaction_name, total_products, valid_products, failed_products):
     """
     Update reaction statistics
-    
+
     Args:
         reaction_name: Name of the reaction type
         total_products: Total number of products generated
         valid_products: Number of products that passed validation
         failed_products: Number of products that failed validation
     """
-    with _file_lock:
-        stats = _load_json(STATS_FILE, {})
-        
-        if reaction_name not in stats:
-            stats[reaction_name] = {
-                'total_runs': 0,
-                'total_products': 0,
-                'valid_products': 0,
-                'failed_products': 0,
-                'last_run': None
-            }
-        
-        stats[reaction_name]['total_runs'] += 1
-        stats[reaction_name]['total_products'] += total_products
-        stats[reaction_name]['valid_products'] += valid_products
-        stats[reaction_name]['failed_products'] += failed_products
-        stats[reaction_name]['last_run'] = datetime.now().isoformat()
-        
-        # Calculate success rate
-        total = stats[reaction_name]['total_products']
-        if total > 0:
-            stats[reaction_name]['success_rate'] = round(
-                stats[reaction_name]['valid_products'] / total * 100, 2
-            )
-        
-        _save_json(STATS_FILE, stats)
+    _ensure_loaded()
+    increment = {reaction_name: {
+        'total_runs': 1,
+        'total_products': total_products,
+        'valid_products': valid_products,
+        'failed_products': failed_products,
+        'last_run': datetime.now().isoformat()
+    }}
+    with _state_lock:
+        _apply_stats_delta(_stats, increment)
+        _apply_stats_delta(_stats_delta, increment)
+    _ensure_writer()
 
 
 def get_failed_reactions(limit=100):
-    """Get recent failed reactions"""
-    with _file_lock:
-        failed = _load_json(FAILED_REACTIONS_FILE, [])
-        return failed[-limit:]
+    """
+    Get recent failed reactions
+
+    Args:
+        limit: Number of most recent entries; None reads every retained log file
+
+    Returns:
+        list: Entries, oldest first
+    """
+    _ensure_loaded()
+    if limit is None:
+        flush()
+        with _io_lock:
+            entries = []
+            for index in range(LOG_BACKUP_COUNT, -1, -1):
+                entries.extend(_read_log(_log_path(index)))
+            return entries
+    with _state_lock:
+        return list(_recent)[-limit:] if limit > 0 else []
 
 
 def get_stats():
     """Get reaction statistics"""
-    with _file_lock:
-        return _load_json(STATS_FILE, {})
+    _ensure_loaded()
+    with _state_lock:
+        return copy.deepcopy(_stats)
 
 
 def get_summary():
     """Get a summary of all logged data"""
-    with _file_lock:
-        failed = _load_json(FAILED_REACTIONS_FILE, [])
-        stats = _load_json(STATS_FILE, {})
-        
-        # Calculate overall stats
-        total_failed = len(failed)
-        
-        # Group failed by reason
-        reason_counts = {}
-        for entry in failed:
-            reason = entry.get('reason', 'Unknown')
-            # Simplify reason
-            if 'too much' in reason.lower() or 'differs' in reason.lower():
-                key = 'Too Different'
-            elif 'too similar' in reason.lower() or 'no effective' in reason.lower():
-                key = 'Too Similar'
-            else:
-                key = 'Other'
-            reason_counts[key] = reason_counts.get(key, 0) + 1
-        
+    _ensure_loaded()
+    with _state_lock:
+        total_failed = _pending_counts['total']
+        reason_counts = dict(_pending_counts['reasons'])
+        for counts in _segment_counts:
+            total_failed += counts['total']
+            for key, value in counts['reasons'].items():
+                reason_counts[key] = reason_counts.get(key, 0) + value
+        reason_counts = {key: value for key, value in reason_counts.items() if value}
+
         return {
             'total_failed_logged': total_failed,
             'failure_reasons': reason_counts,
-            'reaction_stats': stats,
+            'reaction_stats': copy.deepcopy(_stats),
+            'pending_writes': _queue.qsize(),
             'data_files': {
                 'failed_reactions': FAILED_REACTIONS_FILE,
                 'stats': STATS_FILE
@@ -168,10 +437,56 @@ def get_summary():
         }
 
 
+def replace_failed_reactions(entries):
+    """
+    Replace the whole failed reaction log (used by the annotation tool)
+
+    Args:
+        entries: Entries to keep, oldest first
+    """
+    global _log_handle
+    _ensure_loaded()
+    flush()
+    with _io_lock, _FileLock(FAILED_REACTIONS_FILE):
+        if _log_handle is not None:
+            _log_handle.close()
+            _log_handle = None
+        for index in range(1, LOG_BACKUP_COUNT + 1):
+            if os.path.exists(_log_path(index)):
+                os.remove(_log_path(index))
+        _ensure_data_dir()
+        tmp_path = FAILED_REACTIONS_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, FAILED_REACTIONS_FILE)
+
+        with _state_lock:
+            counts = {'total': 0, 'reasons': {}}
+            _recent.clear()
+            for entry in entries:
+                _count(counts, entry)
+                _recent.append(entry)
+            _segment_counts[:] = [counts] + [
+                {'total': 0, 'reasons': {}} for _ in range(LOG_BACKUP_COUNT)
+            ]
+
+
+def clear_logs():
+    """Delete all failed reaction logs and reset statistics"""
+    global _stats_reset
+    replace_failed_reactions([])
+    with _state_lock:
+        _stats.clear()
+        _stats_delta.clear()
+        _stats_reset = True
+    flush()
+
+
 # Test code
 if __name__ == "__main__":
     print("=== Reaction Logger Test ===")
-    
+
     # Test logging a failed reaction
     log_failed_reaction(
         reactants=['CC=C', 'BrBr'],
@@ -184,10 +499,10 @@ if __name__ == "__main__":
         },
         reaction_name='test_reaction'
     )
-    
+
     # Test updating stats
     update_stats('test_reaction', 5, 3, 2)
-    
+
     # Print summary
     print("\nSummary:")
     print(json.dumps(get_summary(), indent=2, ensure_ascii=False))
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Reaction Validation - Check every template of the reaction database with RDKit
+反应规则体检：用 RDKit 编译每条 SMARTS，并在本地分子池的样本上实际运行
+
+For every template in parsed_reactions.json:
+    1. The product-side checks of tools/validate_reactions.js (data_pipeline.validate_smarts)
+    2. Compile with RDKit; ChemicalReaction.Validate() errors
+    3. Atom maps: duplicate map numbers, product maps that no reactant defines
+    4. Run against a few reactant sets from the local molecule pools (or the
+       pool build's corpus index for templates without a pool) and count
+       zero-product runs and products that fail sanitization
+
+Templates are checked in parallel, one process per core, and the result is
+written to data/validation_report.json.
+
+Usage:
+    python reaction_validation.py [--workers N] [--samples 8] [--output report.json]
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from multiprocessing import Pool
+
+from rdkit import Chem, RDLogger
+
+import reaction_cache
+from data_pipeline import validate_smarts
+from molecule_pools import POOL_DIR, PoolStore, plan_slots
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+REPORT_FILE = os.path.join(BASE_DIR, 'data', 'validation_report.json')
+
+SAMPLES_PER_TEMPLATE = 8         # Reactant sets run per template
+SEARCH_LIMIT = 20                # Corpus molecules per slot for templates without a pool
+MAX_PRODUCTS = 20                # Product sets enumerated per run
+MAX_EXAMPLES = 3                 # Sanitization error messages kept per template
+
+# Severity of each issue type; a template with any error is reported as 'error'
+ISSUE_SEVERITY = {
+    'parse_error': 'error',
+    'rdkit_validate': 'error',
+    'duplicate_map': 'error',
+    'unknown_product_map': 'error',
+    'run_error': 'error',
+    'no_products': 'error',
+    'sanitize_failed': 'error',
+    'partial_sanitize_failed': 'warning',
+    'lint': 'warning',
+}
+
+
+def _issue(kind, detail):
+    return {'type': kind, 'severity': ISSUE_SEVERITY[kind], 'detail': detail}
+
+
+def _map_numbers(templates):
+    numbers = []
+    for template in templates:
+        numbers.extend(atom.GetAtomMapNum() for atom in template.GetAtoms() if atom.GetAtomMapNum())
+    return numbers
+
+
+def check_atom_maps(rxn):
+    """Atom-map problems of a compiled reaction"""
+    issues = []
+    reactant_maps = _map_numbers(rxn.GetReactants())
+    product_maps = _map_numbers(rxn.GetProducts())
+    for side, numbers in (('reactants', reactant_maps), ('products', product_maps)):
+        duplicates = sorted(n for n, c in Counter(numbers).items() if c > 1)
+        if duplicates:
+            issues.append(_issue('duplicate_map', f"{side}: {duplicates}"))
+    unknown = sorted(set(product_maps) - set(reactant_maps))
+    if unknown:
+        issues.append(_issue('unknown_product_map', f"{unknown}"))
+    return issues
+
+
+def sample_reactant_sets(reaction, molecule_source, samples=SAMPLES_PER_TEMPLATE):
+    """
+    Reactant sets to run a template on, in the order the frontend builds reactants
+
+    Args:
+        reaction: Reaction database entry
+        molecule_source: Callable(slot_smarts) -> list of SMILES
+
+    Returns:
+        list or None: Up to `samples` reactant lists, None if a pooled slot has no molecules
+    """
+    slots = []
+    for search_smarts, fixed in plan_slots(reaction):
+        if search_smarts is None:
+            slots.append([fixed])
+            continue
+        molecules = molecule_source(search_smarts)
+        if not molecules:
+            return None
+        slots.append(molecules)
+    if not slots:
+        return None
+    count = min(samples, max(len(molecules) for molecules in slots))
+    return [[molecules[i % len(molecules)] for molecules in slots] for i in range(count)]
+
+
+def check_reaction(reaction, molecule_source, samples=SAMPLES_PER_TEMPLATE):
+    """
+    Validate one template
+
+    Args:
+        reaction: Reaction database entry
+        molecule_source: Callable(slot_smarts) -> list of SMILES
+        samples: Reactant sets to run
+
+    Returns:
+        dict: status ('ok', 'warning', 'error' or 'untested'), issues and run counters
+    """
+    smarts = reaction.get('smarts') or ''
+    result = {'status': 'ok', 'issues': [], 'samples': 0, 'product_sets': 0,
+              'products': 0, 'sanitize_failures': 0}
+    issues = result['issues']
+    issues.extend(_issue('lint', desc) for desc in validate_smarts(smarts))
+
+    try:
+        rxn = reaction_cache.get_reaction(smarts)
+    except Exception as e:
+        rxn = None
+        issues.append(_issue('parse_error', str(e)))
+    else:
+        if rxn is None:
+            issues.append(_issue('parse_error', 'ReactionFromSmarts returned None'))
+
+    if rxn is not None:
+        _, errors = rxn.Validate()
+        if errors:
+            issues.append(_issue('rdkit_validate', f"{errors} errors"))
+        issues.extend(check_atom_maps(rxn))
+
+        reactant_sets = sample_reactant_sets(reaction, molecule_source, samples)
+        if reactant_sets is None:
+            result['status'] = 'untested'
+        else:
+            _run_samples(rxn, reactant_sets, result)
+
+    if any(issue['severity'] == 'error' for issue in issues):
+        result['status'] = 'error'
+    elif issues and result['status'] == 'ok':
+        result['status'] = 'warning'
+    return result
+
+
+def _run_samples(rxn, reactant_sets, result):
+    """Run the compiled reaction on each reactant set and count products / sanitization failures"""
+    required = rxn.GetNumReactantTemplates()
+    examples = []
+    for reactants_smiles in reactant_sets:
+        mols = [Chem.MolFromSmiles(smi) for smi in reactants_smiles[:required]]
+        mols = [mol for mol in mols if mol is not None]
+        if not mols:
+            continue
+        while len(mols) < required:
+            mols.append(mols[0])
+        result['samples'] += 1
+        try:
+            product_sets = rxn.RunReactants(tuple(mols), maxProducts=MAX_PRODUCTS)
+        except Exception as e:
+            result['issues'].append(_issue('run_error', f"{'.'.join(reactants_smiles)}: {e}"))
+            return
+        result['product_sets'] += len(product_sets)
+        for product_set in product_sets:
+            for mol in product_set:
+                result['products'] += 1
+                try:
+                    Chem.SanitizeMol(mol)
+                except Exception as e:
+                    result['sanitize_failures'] += 1
+                    if len(examples) < MAX_EXAMPLES:
+                        examples.append(str(e).strip())
+
+    if result['samples'] and not result['product_sets']:
+        result['issues'].append(_issue('no_products', f"{result['samples']} reactant sets gave no products"))
+    elif result['sanitize_failures']:
+        kind = 'sanitize_failed' if result['sanitize_failures'] == result['products'] else 'partial_sanitize_failed'
+        result['issues'].append(_issue(kind, f"{result['sanitize_failures']}/{result['products']} products: "
+                                             + '; '.join(examples)))
+
+
+_worker_store = None
+_worker_samples = SAMPLES_PER_TEMPLATE
+
+
+def _init_worker(pool_dir, samples):
+    global _worker_store, _worker_samples
+    RDLogger.DisableLog('rdApp.*')
+    _worker_store = PoolStore(pool_dir)
+    _worker_samples = samples
+
+
+def _pool_molecule_source(store, key):
+    """Slot molecules of a template: its precomputed pool, else a corpus search"""
+    pools = {slot['smarts']: slot['molecules'] for slot in store.get(key) or []}
+
+    def source(slot_smarts):
+        return pools.get(slot_smarts) or store.search_smiles(slot_smarts, limit=SEARCH_LIMIT)
+    return source
+
+
+def _check_template(item):
+    """Worker: validate one (key, reaction)"""
+    key, reaction = item
+    return key, check_reaction(reaction, _pool_molecule_source(_worker_store, key), _worker_samples)
+
+
+def validate_database(json_path=PARSED_JSON, pool_dir=POOL_DIR, output=REPORT_FILE, workers=None,
+                      samples=SAMPLES_PER_TEMPLATE, progress=print):
+    """
+    Validate every template of the reaction database and write the report
+
+    Args:
+        json_path: Reaction database (parsed_reactions.json)
+        pool_dir: Molecule pools used as sample reactants (see molecule_pools.py)
+        output: Report path (None = don't write)
+        workers: Worker processes (default: one per CPU core)
+        samples: Reactant sets run per template
+
+    Returns:
+        dict: The report ('summary' and per-template 'reactions')
+    """
+    started = time.time()
+    workers = workers or os.cpu_count() or 1
+    with open(json_path, 'r', encoding='utf-8') as f:
+        reactions = json.load(f)
+
+    results = {}
+    with Pool(workers, initializer=_init_worker, initargs=(pool_dir, samples)) as pool:
+        for key, result in pool.imap_unordered(_check_template, reactions.items(), chunksize=8):
+            results[key] = result
+
+    statuses = Counter(result['status'] for result in results.values())
+    issue_counts = Counter(issue['type'] for result in results.values() for issue in result['issues'])
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'seconds': round(time.time() - started, 2),
+        'workers': workers,
+        'pools_built': PoolStore(pool_dir).info() is not None,
+        'summary': {
+            'templates': len(results),
+            **{status: statuses.get(status, 0) for status in ('ok', 'warning', 'error', 'untested')},
+            'issues': dict(issue_counts.most_common())
+        },
+        'reactions': {
+            key: {'name': reactions[key].get('name'), 'smarts': reactions[key].get('smarts'), **results[key]}
+            for key in reactions
+        }
+    }
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        tmp_path = output + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, output)
+
+    summary = report['summary']
+    progress(f"[Validate] {summary['templates']} templates in {report['seconds']}s ({workers} workers): "
+             f"{summary['ok']} ok, {summary['warning']} warning, {summary['error']} error, "
+             f"{summary['untested']} untested")
+    if not report['pools_built']:
+        progress("[Validate] No molecule pools built; sample runs were skipped (see molecule_pools.py)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate every reaction template with RDKit")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--samples', type=int, default=SAMPLES_PER_TEMPLATE)
+    parser.add_argument('--pools', default=POOL_DIR, help="molecule pool directory")
+    parser.add_argument('--output', default=REPORT_FILE)
+    args = parser.parse_args()
+
+    report = validate_database(pool_dir=args.pools, output=args.output, workers=args.workers,
+                               samples=args.samples)
+    for issue, count in report['summary']['issues'].items():
+        print(f"  {issue:<24} {count}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
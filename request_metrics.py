@@ -0,0 +1,348 @@
+"""
+Request Metrics - Per-stage latency histograms for the reaction API
+请求指标：按阶段统计 /api/react 的耗时分布，输出 p50/p95/p99 和 Prometheus 文本格式
+
+Every /api/react and /api/react/batch request records the seconds spent in
+each stage (see STAGES) into a fixed-bucket histogram. Quantiles are
+estimated from the buckets the same way Prometheus' histogram_quantile()
+does, so the numbers on /api/stats match what a Prometheus server computes
+from /api/metrics.
+
+Histograms live in process memory. Under gunicorn a scrape reaches a single
+worker, so each worker also writes a snapshot of its histograms to a shared
+directory (see share(), at most once per FLUSH_INTERVAL) and reports the sum
+of all snapshots: /api/metrics and /api/stats cover every worker, lagging the
+other workers by up to FLUSH_INTERVAL. Snapshots of exited workers are kept so
+counters never go backwards; gunicorn.conf.py clears the directory when the
+server starts.
+"""
+
+import glob
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from threading import Lock
+
+# Timed stages of a reaction request, in execution order
+STAGES = (
+    'json_parse',       # Request body → dict
+    'compile',          # SMARTS → ChemicalReaction (reaction cache lookup)
+    'mol_parse',        # Reactant SMILES → Mol
+    'run_reactants',    # RDKit RunReactants
+    'dedup', 'filter', 'sanitize', 'smiles', 'reparse',   # collect_products stages
+    'postprocess',      # All collect_products stages together
+    'execute',          # Whole reaction job as seen by the server (incl. pool dispatch)
+    'ai_validation',    # ChemBERTa batch validation
+    'logging',          # reaction_logger writes
+    'total',            # Whole request
+)
+
+# Upper bounds in seconds (+Inf is implicit)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+METRIC_PREFIX = 'reaction_server'
+
+# Seconds between snapshots of a worker's metrics in the shared directory
+FLUSH_INTERVAL = 1.0
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (not thread-safe; RequestMetrics locks)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)     # Last slot: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        value = max(0.0, float(value))
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation inside its bucket
+
+        Args:
+            q: Quantile in [0, 1]
+
+        Returns:
+            float or None: Estimated seconds, None without observations
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            in_bucket = self.counts[i]
+            if in_bucket and cumulative + in_bucket >= rank:
+                estimate = lower + (bound - lower) * (rank - cumulative) / in_bucket
+                # Never report more than was actually observed
+                return min(estimate, self.max)
+            cumulative += in_bucket
+            lower = bound
+        # Rank falls in the +Inf bucket
+        return self.max
+
+    def merge(self, other):
+        """Add the observations of a histogram with the same buckets"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def to_dict(self):
+        return {'counts': list(self.counts), 'count': self.count, 'sum': self.sum, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, buckets, data):
+        histogram = cls(buckets)
+        histogram.counts = list(data['counts'])
+        histogram.count = data['count']
+        histogram.sum = data['sum']
+        histogram.max = data['max']
+        return histogram
+
+    def cumulative_counts(self):
+        """(upper bound, cumulative count) pairs including +Inf"""
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    return repr(float(value))
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def clear_shared_dir(shared_dir):
+    """Delete the worker snapshots of a previous server run (gunicorn on_starting hook)"""
+    for path in glob.glob(os.path.join(shared_dir, 'worker-*.json')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class RequestMetrics:
+    """
+    Thread-safe per-endpoint, per-stage latency histograms and request counters
+
+    Args:
+        buckets: Histogram upper bounds in seconds
+        shared_dir: Directory shared with the other server workers (see share())
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, shared_dir=None):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}       # (endpoint, stage) -> Histogram
+        self._requests = Counter()  # (endpoint, outcome) -> count
+        self._lock = Lock()
+        self._shared_dir = None
+        self._snapshot_path = None
+        self._last_flush = 0.0
+        self._flush_timer = None
+        if shared_dir:
+            self.share(shared_dir)
+
+    def share(self, shared_dir):
+        """
+        Report the metrics of all processes sharing shared_dir
+
+        Call once in each worker process after fork. The snapshot file is
+        named by pid and start time, so a restarted worker never overwrites
+        the counts of the worker it replaces.
+        """
+        os.makedirs(shared_dir, exist_ok=True)
+        with self._lock:
+            self._shared_dir = shared_dir
+            self._snapshot_path = os.path.join(
+                shared_dir, f'worker-{os.getpid()}-{time.time_ns()}.json')
+            self._flush_timer = None
+
+    def observe(self, endpoint, timings, outcome='ok'):
+        """
+        Record one request
+
+        Args:
+            endpoint: Endpoint label, e.g. 'react'
+            timings: Dict of stage -> seconds; keys outside STAGES (product counts) are ignored
+            outcome: Request outcome label ('ok', 'error', 'timeout', ...)
+        """
+        with self._lock:
+            self._requests[(endpoint, outcome)] += 1
+            for stage in STAGES:
+                seconds = timings.get(stage)
+                if seconds is None:
+                    continue
+                histogram = self._histograms.get((endpoint, stage))
+                if histogram is None:
+                    histogram = self._histograms[(endpoint, stage)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+        if self._shared_dir:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        # One pending flush at a time: at most one write per FLUSH_INTERVAL,
+        # and never more than FLUSH_INTERVAL after an observation
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            delay = max(0.0, self._last_flush + FLUSH_INTERVAL - time.monotonic())
+            timer = self._flush_timer = threading.Timer(delay, self.flush)
+            timer.daemon = True
+        timer.start()
+
+    def flush(self):
+        """Write this worker's snapshot to the shared directory now"""
+        with self._lock:
+            self._flush_timer = None
+            path = self._snapshot_path
+            if path is None:
+                return
+            snapshot = self._snapshot()
+            self._last_flush = time.monotonic()
+        tmp_path = f'{path}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass    # Metrics must never fail a request; retried on the next flush
+
+    def _snapshot(self):
+        return {
+            'buckets': list(self.buckets),
+            'requests': [[endpoint, outcome, count]
+                         for (endpoint, outcome), count in self._requests.items()],
+            'histograms': [[endpoint, stage, histogram.to_dict()]
+                           for (endpoint, stage), histogram in self._histograms.items()],
+        }
+
+    def _collect(self):
+        """(histograms, requests) of this process plus the other workers' snapshots"""
+        with self._lock:
+            own = self._snapshot()
+            shared_dir, own_path = self._shared_dir, self._snapshot_path
+        snapshots = [own]
+        if shared_dir:
+            for path in glob.glob(os.path.join(shared_dir, 'worker-*.json')):
+                if path == own_path:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if tuple(snapshot.get('buckets', ())) == self.buckets:
+                    snapshots.append(snapshot)
+
+        histograms, requests = {}, Counter()
+        for snapshot in snapshots:
+            for endpoint, outcome, count in snapshot['requests']:
+                requests[(endpoint, outcome)] += count
+            for endpoint, stage, data in snapshot['histograms']:
+                histogram = Histogram.from_dict(self.buckets, data)
+                if (endpoint, stage) in histograms:
+                    histograms[(endpoint, stage)].merge(histogram)
+                else:
+                    histograms[(endpoint, stage)] = histogram
+        return histograms, requests
+
+    def summary(self):
+        """
+        Request counts and p50/p95/p99 per endpoint and stage, in milliseconds
+
+        Returns:
+            dict: {endpoint: {'requests': {outcome: n}, 'stages': {stage: {...}}}}
+        """
+        histograms, requests = self._collect()
+        result = {}
+        for (endpoint, outcome), count in sorted(requests.items()):
+            entry = result.setdefault(endpoint, {'requests': {}, 'stages': {}})
+            entry['requests'][outcome] = count
+        for (endpoint, stage), histogram in _ordered(histograms):
+            entry = result.setdefault(endpoint, {'requests': {}, 'stages': {}})
+            stats = {'count': histogram.count,
+                     'mean_ms': round(histogram.sum / histogram.count * 1000, 3)}
+            for q in QUANTILES:
+                stats[f'p{round(q * 100)}_ms'] = round(histogram.quantile(q) * 1000, 3)
+            stats['max_ms'] = round(histogram.max * 1000, 3)
+            entry['stages'][stage] = stats
+        return result
+
+    def render_prometheus(self):
+        """
+        Metrics in the Prometheus text exposition format (version 0.0.4)
+
+        Returns:
+            str: Request counters, stage histograms and estimated quantiles
+        """
+        name = f'{METRIC_PREFIX}_stage_seconds'
+        lines = [
+            f'# HELP {METRIC_PREFIX}_requests_total Reaction API requests by outcome',
+            f'# TYPE {METRIC_PREFIX}_requests_total counter',
+        ]
+        histograms, requests = self._collect()
+        for (endpoint, outcome), count in sorted(requests.items()):
+            lines.append(f'{METRIC_PREFIX}_requests_total{_labels(endpoint=endpoint, outcome=outcome)} {count}')
+
+        histograms = _ordered(histograms)
+        lines += [f'# HELP {name} Seconds spent in each stage of a reaction request',
+                  f'# TYPE {name} histogram']
+        for (endpoint, stage), histogram in histograms:
+            for bound, count in histogram.cumulative_counts():
+                labels = _labels(endpoint=endpoint, stage=stage, le=_format_bound(bound))
+                lines.append(f'{name}_bucket{labels} {count}')
+            labels = _labels(endpoint=endpoint, stage=stage)
+            lines.append(f'{name}_sum{labels} {_format_value(histogram.sum)}')
+            lines.append(f'{name}_count{labels} {histogram.count}')
+
+        lines += [f'# HELP {name}_quantile Stage latency quantiles estimated from the histogram buckets',
+                  f'# TYPE {name}_quantile gauge']
+        for (endpoint, stage), histogram in histograms:
+            for q in QUANTILES:
+                labels = _labels(endpoint=endpoint, stage=stage, quantile=q)
+                lines.append(f'{name}_quantile{labels} {_format_value(histogram.quantile(q))}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Forget this process's observations (other workers' snapshots are kept)"""
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+        if self._shared_dir:
+            self.flush()
+
+
+def _ordered(histograms):
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    return sorted(histograms.items(), key=lambda item: (item[0][0], order[item[0][1]]))
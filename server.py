@@ -1,8 +1,20 @@
+import atexit
 import os
 import sys
-from flask import Flask, request, jsonify, send_from_directory
+import time
+from threading import Lock
+from flask import Flask, Response, request, jsonify, send_from_directory
 from rdkit import Chem
-from rdkit.Chem import AllChem
+
+import reaction_cache
+import reaction_executor
+import server_log
+import warmup
+from reaction_executor import ReactionTimeout
+from request_metrics import RequestMetrics
+from server_config import ServerConfig
+
+log = server_log.get_logger('server')
 
 # AI Validation configuration
 AI_VALIDATION_ENABLED = True  # Set to False to disable AI validation
@@ -10,9 +22,39 @@ AI_VALIDATION_ENABLED = True  # Set to False to disable AI validation
 # Data logging configuration
 DATA_LOGGING_ENABLED = True  # Set to False to disable data logging
 
+# Reaction process pool configuration (size, timeouts: see reaction_executor)
+REACTION_POOL_ENABLED = True  # Set to False to run RunReactants in the request thread
+REACTION_POOL_WORKERS = None  # None = reaction_executor default (REACTION_POOL_WORKERS env)
+
+# PubChem proxy configuration (cache lifetimes: see molecule_service)
+MOLECULE_SERVICE_ENABLED = True  # Set to False to let browsers query PubChem directly
+
+# Problem bank configuration (see problem_bank.py)
+PROBLEM_BANK_ENABLED = True  # Set to False to always generate /api/problems live
+# The producer is a second process using CPU and PubChem (and, with
+# PROBLEM_BANK_PRODUCER_AI, a second ChemBERTa copy), so it is opt-in
+PROBLEM_BANK_PRODUCER = False  # Start the background producer that fills the bank
+PROBLEM_BANK_PRODUCER_AI = False  # Validate produced problems with ChemBERTa
+
 # Lazy import of ai_validator (only when needed)
 ai_validator = None
 reaction_logger = None
+reaction_pool = None
+_reaction_pool_lock = Lock()
+molecule_service = None
+_molecule_service_lock = Lock()
+pool_store = None
+_pool_store_lock = Lock()
+reaction_catalog = None
+_reaction_catalog_lock = Lock()
+problem_generator = None
+_problem_generator_lock = Lock()
+problem_bank = None
+_problem_bank_lock = Lock()
+_template_hashes = None
+problem_producer = None
+# Per-stage latency histograms of /api/react and /api/react/batch (see /api/metrics)
+request_metrics = RequestMetrics()
 
 def get_ai_validator():
     """Lazy load ai_validator module to avoid slow startup"""
@@ -21,9 +63,9 @@ def get_ai_validator():
         try:
             import ai_validator as av
             ai_validator = av
-            print("[INFO] AI Validator module loaded successfully")
+            log.info("AI Validator module loaded successfully")
         except ImportError as e:
-            print(f"[WARNING] Could not load AI Validator: {e}")
+            log.warning(f"Could not load AI Validator: {e}")
             return None
     return ai_validator
 
@@ -34,12 +76,198 @@ def get_reaction_logger():
         try:
             import reaction_logger as rl
             reaction_logger = rl
-            print("[INFO] Reaction Logger module loaded successfully")
+            log.info("Reaction Logger module loaded successfully")
         except ImportError as e:
-            print(f"[WARNING] Could not load Reaction Logger: {e}")
+            log.warning(f"Could not load Reaction Logger: {e}")
             return None
     return reaction_logger
 
+def get_reaction_pool():
+    """Lazy create the reaction process pool (None when disabled)"""
+    global reaction_pool
+    if reaction_pool is None and REACTION_POOL_ENABLED:
+        with _reaction_pool_lock:
+            if reaction_pool is None:
+                reaction_pool = reaction_executor.ReactionPool(
+                    workers=REACTION_POOL_WORKERS or reaction_executor.POOL_WORKERS)
+                atexit.register(reaction_pool.close)
+                log.info(f"Reaction pool created ({reaction_pool.workers} workers)")
+    return reaction_pool if REACTION_POOL_ENABLED else None
+
+def get_molecule_service():
+    """Lazy create the PubChem proxy and its SQLite cache (None when disabled)"""
+    global molecule_service
+    if molecule_service is None and MOLECULE_SERVICE_ENABLED:
+        with _molecule_service_lock:
+            if molecule_service is None:
+                try:
+                    from molecule_service import MoleculeService
+                    # Answer from the offline pool corpus first when one has been built
+                    molecule_service = MoleculeService(local_index=get_pool_store())
+                    log.info("Molecule service loaded successfully")
+                except Exception as e:
+                    log.warning(f"Could not load Molecule service: {e}")
+                    return None
+    return molecule_service if MOLECULE_SERVICE_ENABLED else None
+
+def get_pool_store():
+    """Lazy open the offline molecule pools built by molecule_pools.py"""
+    global pool_store
+    if pool_store is None:
+        with _pool_store_lock:
+            if pool_store is None:
+                try:
+                    from molecule_pools import PoolStore
+                    pool_store = PoolStore()
+                except Exception as e:
+                    log.warning(f"Could not load molecule pools: {e}")
+                    return None
+    return pool_store
+
+def _reaction_stats():
+    """reaction_stats.json contents for the problem sampler ({} when logging is off)"""
+    logger = get_reaction_logger()
+    return logger.get_stats() if logger else {}
+
+def _problem_molecules(key, slot_smarts):
+    """Reactant candidates for /api/problems: dry-run checked pools first, then the molecule service"""
+    store = get_pool_store()
+    pool = store.get(key) if store is not None else None
+    for slot in pool or []:
+        if slot['smarts'] == slot_smarts and slot['molecules']:
+            return slot['molecules']
+    service = get_molecule_service()
+    if service is not None:
+        return service.get_molecules(slot_smarts)['molecules']
+    return []
+
+def get_reaction_catalog(progress=None):
+    """Lazy load the reaction catalog (snapshot when current) and seed the reaction cache from it"""
+    global reaction_catalog
+    if reaction_catalog is None:
+        with _reaction_catalog_lock:
+            if reaction_catalog is None:
+                from reaction_catalog import ReactionCatalog
+                catalog = ReactionCatalog.load(progress=progress)
+                catalog.seed_reaction_cache()
+                log.info(f"Reaction catalog loaded from {catalog.loaded_from} "
+                         f"({len(catalog)} templates, {catalog.load_seconds}s)")
+                reaction_catalog = catalog
+    return reaction_catalog
+
+def get_problem_generator():
+    """Lazy create the server-side problem generator"""
+    global problem_generator
+    if problem_generator is None:
+        with _problem_generator_lock:
+            if problem_generator is None:
+                from problem_generator import ProblemGenerator, SuccessSampler
+                problem_generator = ProblemGenerator(
+                    get_reaction_catalog(), _problem_molecules, _run_problem_jobs,
+                    sampler=SuccessSampler(_reaction_stats))
+    return problem_generator
+
+def get_problem_bank():
+    """Lazy open the problem bank (None when disabled)"""
+    global problem_bank
+    if problem_bank is None and PROBLEM_BANK_ENABLED:
+        with _problem_bank_lock:
+            if problem_bank is None:
+                try:
+                    from problem_bank import ProblemBank
+                    problem_bank = ProblemBank()
+                except Exception as e:
+                    log.warning(f"Could not open problem bank: {e}")
+                    return None
+    return problem_bank if PROBLEM_BANK_ENABLED else None
+
+def _bank_problems(keys, count, rng):
+    """
+    Problems from the bank whose template hash matches the loaded reaction database
+
+    With AI validation enabled only problems the producer validated are served,
+    like the live path; they carry its 'validation' results.
+    """
+    global _template_hashes
+    bank = get_problem_bank()
+    if bank is None:
+        return []
+    if _template_hashes is None:
+        from problem_bank import template_hash
+        _template_hashes = {key: template_hash(rxn) for key, rxn in get_problem_generator().reactions.items()}
+    try:
+        return bank.sample(keys, count, rng, _template_hashes, validated_only=AI_VALIDATION_ENABLED)
+    except Exception as e:
+        log.warning(f"Problem bank read failed: {e}")
+        return []
+
+def start_problem_producer():
+    """Start the background process that fills the problem bank (one per server)"""
+    global problem_producer
+    if not (PROBLEM_BANK_ENABLED and PROBLEM_BANK_PRODUCER) or problem_producer is not None:
+        return
+    import subprocess
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'problem_bank.py'),
+               'produce', '--watch', '--exit-with-parent']
+    if PROBLEM_BANK_PRODUCER_AI:
+        command.append('--ai')
+    problem_producer = subprocess.Popen(command)
+    owner = os.getpid()
+
+    def stop():
+        # Forked gunicorn workers inherit this handler; only the starting process stops the producer
+        if os.getpid() == owner:
+            problem_producer.terminate()
+    atexit.register(stop)
+    log.info(f"Problem bank producer started (pid {problem_producer.pid})")
+
+def _load_ai_model():
+    """Import ai_validator and load ChemBERTa (runs on the warm-up thread)"""
+    validator = get_ai_validator()
+    if validator is None:
+        raise RuntimeError('AI Validator module could not be imported')
+    validator.warm_up()
+
+def _start_reaction_pool():
+    get_reaction_pool().start()
+
+def start_warmup(background=True, include_pool=True):
+    """
+    Compile the reaction cache, start the reaction pool and load the AI model
+
+    Args:
+        background: Run on a daemon thread (True) or block until done (False)
+        include_pool: Start the reaction pool here; False when the pool must be
+                      started after fork in each server worker (see init_worker)
+    """
+    steps = [
+        ('reaction_cache', lambda: get_reaction_catalog(
+            progress=lambda done, total: warmup.set_progress('reaction_cache', done, total))),
+        ('ai_model', _load_ai_model if AI_VALIDATION_ENABLED else None),
+    ]
+    if include_pool:
+        steps.insert(1, ('reaction_pool', _start_reaction_pool if REACTION_POOL_ENABLED else None))
+    if background:
+        warmup.start(steps)
+    else:
+        warmup.run(steps)
+
+def ai_validation_status():
+    """
+    Whether requests may use the AI validator right now
+
+    Returns:
+        str: warmup status of the model; 'ready' when no warm-up was started
+             (the validator is then loaded lazily on first use)
+    """
+    if not AI_VALIDATION_ENABLED:
+        return warmup.DISABLED
+    if not warmup.is_started():
+        return warmup.READY
+    return warmup.status('ai_model')
+
+SERVER_STARTED_AT = time.time()
+
 app = Flask(__name__, static_folder='.')
 
 # Add CORS headers to all responses
@@ -63,9 +291,28 @@ def serve_static(path):
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get reaction validation statistics and failed reactions log"""
+    cache_stats = {'reaction_cache': reaction_cache.get_cache_stats()}
+    if reaction_catalog is not None:
+        cache_stats['reaction_catalog'] = reaction_catalog.stats()
+    # Only report the embedding cache if the validator is already loaded
+    if ai_validator is not None:
+        cache_stats['embedding_cache'] = ai_validator.get_cache_stats()
+    if reaction_pool is not None:
+        cache_stats['reaction_pool'] = reaction_pool.stats()
+    if molecule_service is not None:
+        cache_stats['molecule_cache'] = molecule_service.stats()
+    if pool_store is not None:
+        cache_stats['molecule_pools'] = pool_store.info()
+    if problem_generator is not None:
+        cache_stats['problem_sampler'] = problem_generator.sampler.stats()
+    if problem_bank is not None:
+        cache_stats['problem_bank'] = problem_bank.stats()
+    cache_stats['request_latency'] = request_metrics.summary()
+
     logger = get_reaction_logger()
     if logger:
         summary = logger.get_summary()
+        summary.update(cache_stats)
         return jsonify({
             'success': True,
             'data': summary
@@ -73,15 +320,85 @@ def get_stats():
     else:
         return jsonify({
             'success': False,
-            'error': 'Reaction logger not available'
+            'error': 'Reaction logger not available',
+            'data': cache_stats
         })
 
+# Liveness probe: the process is up and serving requests
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({
+        'status': 'ok',
+        'uptime_seconds': round(time.time() - SERVER_STARTED_AT, 3),
+        'rdkit_version': Chem.rdBase.rdkitVersion
+    })
+
+# Readiness probe: warm-up progress and timings (503 until warm-up has finished)
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    state = warmup.get_status()
+    state['ready'] = warmup.is_finished()
+    state['ai_validation'] = ai_validation_status()
+    return jsonify(state), 200 if state['ready'] else 503
+
+# Prometheus scrape endpoint: per-stage latency histograms of the reaction API
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return Response(request_metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# PubChem proxy: substrate molecules for a search SMARTS, shared by all users
+@app.route('/api/molecules', methods=['GET'])
+def get_molecules():
+    smarts = request.args.get('smarts', '').strip()
+    if not smarts:
+        return jsonify({'error': 'Missing smarts', 'molecules': []}), 400
+
+    service = get_molecule_service()
+    if service is None:
+        return jsonify({'error': 'Molecule service not available', 'molecules': []}), 503
+
+    result = service.get_molecules(smarts)
+    result['smarts'] = smarts
+    return jsonify(result)
+
+MAX_POOL_KEYS = 500
+
+@app.route('/api/pools', methods=['GET', 'POST'])
+def get_pools():
+    """
+    Precomputed molecule pools for reaction templates
+
+    GET ?keys=a,b or POST {"keys": [...]}; templates without a pool are
+    listed under 'missing' so the client can fall back to PubChem
+    """
+    if request.method == 'POST':
+        keys = (request.get_json(silent=True) or {}).get('keys')
+    else:
+        keys = [k for k in request.args.get('keys', '').split(',') if k]
+    if not isinstance(keys, list) or not keys:
+        return jsonify({'error': 'Missing keys', 'pools': {}}), 400
+    if len(keys) > MAX_POOL_KEYS:
+        return jsonify({'error': f'Too many keys (max {MAX_POOL_KEYS})', 'pools': {}}), 400
+
+    store = get_pool_store()
+    info = store.info() if store is not None else None
+    if info is None:
+        return jsonify({'pools': {}, 'missing': keys, 'built_at': None})
+
+    pools = {}
+    missing = []
+    for key in keys:
+        pool = store.get(str(key))
+        if pool is None:
+            missing.append(key)
+        else:
+            pools[key] = pool
+    return jsonify({'pools': pools, 'missing': missing, 'built_at': info['built_at']})
+
 # Global error handler for all unhandled exceptions
 @app.errorhandler(Exception)
 def handle_exception(e):
-    import traceback
-    error_msg = f"Unhandled exception: {e}\n{traceback.format_exc()}"
-    print(error_msg)
+    log.error(f"Unhandled exception: {e}", exc_info=True)
     # Check if it's a 404 error
     from werkzeug.exceptions import NotFound
     if isinstance(e, NotFound):
@@ -96,219 +413,470 @@ def handle_404(e):
 def handle_500(e):
     return jsonify({'error': 'Internal server error', 'products': []}), 500
 
+# Maximum number of jobs accepted by /api/react/batch
+MAX_BATCH_JOBS = 200
+
+def _parse_max_products(value):
+    """Read a client supplied maxProducts (None if missing or invalid)"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+def _execute_reaction(smarts, reactants_smiles, max_products=None, timings=None):
+    """
+    Run a SMARTS reaction on the process pool (or inline if the pool is disabled)
+
+    Args:
+        smarts: Reaction SMARTS string
+        reactants_smiles: List of reactant SMILES
+        max_products: Requested maxProducts, capped by the server setting
+        timings: Optional dict that receives per-stage timings
+
+    Returns:
+        tuple: (list of product SMILES, error message or None)
+
+    Raises:
+        ReactionTimeout: The job exceeded the pool's job timeout
+    """
+    pool = get_reaction_pool()
+    if pool:
+        return pool.run(smarts, reactants_smiles, max_products, timings)
+    max_products = min(max_products or reaction_executor.MAX_PRODUCTS, reaction_executor.MAX_PRODUCTS)
+    return reaction_executor.execute_reaction(smarts, reactants_smiles, max_products, timings)
+
+def _execute_reactions(jobs):
+    """
+    Run several reaction jobs, in parallel when the process pool is enabled
+
+    Args:
+        jobs: List of (smarts, reactants_smiles, max_products) tuples
+
+    Returns:
+        list: (products, error, timed_out) tuples in job order
+    """
+    pool = get_reaction_pool()
+    if pool:
+        return pool.map(jobs)
+
+    outcomes = []
+    for smarts, reactants_smiles, max_products in jobs:
+        try:
+            products, error = _execute_reaction(smarts, reactants_smiles, max_products)
+        except Exception as job_error:
+            products, error = [], str(job_error)
+        outcomes.append((products, error, False))
+    return outcomes
+
+
+def _validate_jobs(jobs, timings=None):
+    """
+    Run AI validation for the products of several reaction jobs in one pass
+
+    Args:
+        jobs: List of dicts with 'smarts', 'reactants', 'reaction_name' and 'products'
+        timings: Optional dict that receives 'ai_validation' and 'logging' seconds
+
+    Returns:
+        list or None: Per-job (validated products, validation results) tuples,
+                      None if the AI validator is not available
+    """
+    # Never block a request on the model load; callers return unvalidated products
+    if ai_validation_status() != warmup.READY:
+        return None
+
+    validator = get_ai_validator()
+    if not validator:
+        return None
+
+    # Flatten every (reactants, product) pair so the validator sees a single batch
+    pairs = []
+    for job in jobs:
+        for product_smiles in job['products']:
+            pairs.append((job['reactants'], product_smiles))
+
+    if not pairs:
+        return [([], []) for _ in jobs]
+
+    log.debug(f"[AI] Starting AI validation for {len(pairs)} products...")
+    started = time.perf_counter()
+    try:
+        validations = validator.batch_validate(pairs)
+    except Exception as val_error:
+        log.warning(f"[AI] Validation error: {val_error}")
+        # If validation fails, keep the products by default
+        validations = [{
+            'similarity': None,
+            'is_valid': True,
+            'reason': f'Validation skipped: {val_error}'
+        } for _ in pairs]
+    validation_seconds = time.perf_counter() - started
+
+    logger = get_reaction_logger()
+    logging_seconds = 0.0
+    outcomes = []
+    offset = 0
+    for job in jobs:
+        validated_products = []
+        validation_results = []
+        for product_smiles in job['products']:
+            validation = validations[offset]
+            offset += 1
+
+            validation_results.append({
+                'product': product_smiles,
+                'similarity': validation['similarity'],
+                'is_valid': validation['is_valid'],
+                'reason': validation['reason']
+            })
+
+            if validation['is_valid']:
+                validated_products.append(product_smiles)
+                log.debug(f"  [OK] {product_smiles}: similarity={validation['similarity']} (VALID)")
+            else:
+                log.debug(f"  [X] {product_smiles}: similarity={validation['similarity']} - {validation['reason']}")
+                # Log failed reaction for learning
+                if logger:
+                    started = time.perf_counter()
+                    logger.log_failed_reaction(
+                        reactants=job['reactants'],
+                        product=product_smiles,
+                        smarts=job['smarts'],
+                        validation_result=validation,
+                        reaction_name=job.get('reaction_name')
+                    )
+                    logging_seconds += time.perf_counter() - started
+
+        if job['products']:
+            log.debug(f"[AI] Validation complete: {len(validated_products)}/{len(job['products'])} products passed")
+
+            # Update statistics
+            if logger:
+                started = time.perf_counter()
+                logger.update_stats(
+                    reaction_name=job.get('reaction_name') or 'unknown',
+                    total_products=len(job['products']),
+                    valid_products=len(validated_products),
+                    failed_products=len(job['products']) - len(validated_products)
+                )
+                logging_seconds += time.perf_counter() - started
+
+        outcomes.append((validated_products, validation_results))
+
+    if timings is not None:
+        timings['ai_validation'] = round(validation_seconds, 6)
+        timings['logging'] = round(logging_seconds, 6)
+    return outcomes
+
+
+def _build_reaction_response(products, validation_results, error=None, timed_out=False):
+    """Build the JSON payload shared by /api/react and /api/react/batch"""
+    response_data = {'products': products}
+    if timed_out:
+        response_data['timed_out'] = True
+    # Include validation info in response if AI validation was performed
+    if validation_results:
+        response_data['validation'] = validation_results
+        response_data['ai_validated'] = True
+    elif products:
+        response_data['ai_validated'] = False
+        ai_status = ai_validation_status()
+        if ai_status != warmup.READY:
+            response_data['ai_status'] = ai_status
+    if error:
+        response_data['error'] = error
+    return response_data
+
+
+def _finish_timings(timings, started):
+    """Add the request total to a timings dict"""
+    timings['total'] = round(time.perf_counter() - started, 6)
+    return timings
+
+
 # Reaction API Endpoint
 @app.route('/api/react', methods=['POST', 'OPTIONS'])
 def run_reaction():
+    """
+    Run one reaction
+
+    Request body: {"smarts": ..., "reactants": [...], "reaction_name": ..., "maxProducts": ...,
+                   "timings": true}
+    With "timings": true the response carries the per-stage seconds of this
+    request; every request is recorded in the /api/metrics histograms.
+    """
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
         return jsonify({'status': 'ok'})
-    
+
+    started = time.perf_counter()
+    timings = {}
     try:
         # 安全解析 JSON
         try:
             data = request.json
         except Exception as json_error:
-            print(f"JSON 解析错误: {json_error}")
+            log.info(f"JSON 解析错误: {json_error}")
+            request_metrics.observe('react', _finish_timings(timings, started), 'invalid_request')
             return jsonify({'error': f'Invalid JSON: {json_error}', 'products': []})
-        
+        timings['json_parse'] = round(time.perf_counter() - started, 6)
+
         if data is None:
-            print("请求体为空或不是 JSON 格式")
+            log.info("请求体为空或不是 JSON 格式")
+            request_metrics.observe('react', _finish_timings(timings, started), 'invalid_request')
             return jsonify({'error': 'Request body is empty or not JSON', 'products': []})
-        
+
         smarts = data.get('smarts')
         reactants_smiles = data.get('reactants', [])
+        return_timings = bool(data.get('timings'))
+
+        log.debug(f"Received request - SMARTS: {smarts}")
+        log.debug(f"Reactants: {reactants_smiles}")
 
-        print(f"\n{'='*60}")
-        print(f"Received request - SMARTS: {smarts}")
-        print(f"Reactants: {reactants_smiles}")
-        print(f"Reactants type: {type(reactants_smiles)}")
-
-        if not smarts:
-            return jsonify({'error': 'Missing smarts', 'products': []})
-        
-        if not reactants_smiles:
-            return jsonify({'error': 'Missing reactants', 'products': []})
-        
-        # 确保 reactants_smiles 是列表
         if isinstance(reactants_smiles, str):
             reactants_smiles = [reactants_smiles]
 
-        # Create reaction from SMARTS
+        execute_started = time.perf_counter()
         try:
-            rxn = AllChem.ReactionFromSmarts(smarts)
-        except Exception as smarts_error:
-            print(f"SMARTS 解析错误: {smarts_error}")
-            return jsonify({'error': f'SMARTS parse error: {smarts_error}', 'products': []})
-        
-        if rxn is None:
-            print(f"Invalid SMARTS: {smarts}")
-            return jsonify({'error': 'Invalid SMARTS - ReactionFromSmarts returned None', 'products': []})
-
-        # Log reaction details
-        num_reactant_templates = rxn.GetNumReactantTemplates()
-        num_product_templates = rxn.GetNumProductTemplates()
-        print(f"Reaction: {num_reactant_templates} reactants -> {num_product_templates} products")
-
-        # Create reactant molecules
-        reactants = []
-        for smi in reactants_smiles:
-            if not smi or not isinstance(smi, str):
-                print(f"  Reactant: {smi} (SKIPPED - invalid type)")
-                continue
-            try:
-                mol = Chem.MolFromSmiles(smi)
-                if mol:
-                    reactants.append(mol)
-                    print(f"  Reactant: {smi} (valid)")
-                else:
-                    print(f"  Reactant: {smi} (INVALID - MolFromSmiles returned None)")
-            except Exception as mol_error:
-                print(f"  Reactant: {smi} (ERROR: {mol_error})")
-
-        if len(reactants) == 0:
-            print("No valid reactants")
-            return jsonify({'error': 'No valid reactant molecules', 'products': []})
-
-        # Check if number of reactants matches the reaction template
-        if len(reactants) < num_reactant_templates:
-            print(f"Warning: Need {num_reactant_templates} reactants, got {len(reactants)}")
-            # 尝试复制反应物以满足模板需求
-            while len(reactants) < num_reactant_templates and len(reactants) > 0:
-                reactants.append(reactants[0])
-                print(f"Duplicated first reactant to meet template requirement")
-        
-        # Run reaction
-        try:
-            products_tuple = rxn.RunReactants(tuple(reactants))
-            print(f"Reaction produced {len(products_tuple)} product sets")
-        except Exception as run_error:
-            import traceback
-            print(f"Reaction run failed: {run_error}")
-            print(traceback.format_exc())
-            return jsonify({'products': [], 'error': f'Reaction execution failed: {run_error}'})
-
-        unique_products = set()
-        
-        for product_set in products_tuple:
-            for mol in product_set:
-                try:
-                    Chem.SanitizeMol(mol)
-                    # 生成规范 SMILES
-                    smi = Chem.MolToSmiles(mol, canonical=True)
-                    
-                    # 验证：重新解析 SMILES 确保有效
-                    verify_mol = Chem.MolFromSmiles(smi)
-                    if verify_mol is None:
-                        print(f"  [!] Product SMILES cannot be reparsed: {smi}")
-                        continue
-                    
-                    # 过滤过于复杂的分子（长度 > 80 或原子数 > 30）
-                    if len(smi) > 80:
-                        print(f"  [!] Product too complex (length {len(smi)}): {smi[:40]}...")
-                        continue
-                    
-                    atom_count = verify_mol.GetNumAtoms()
-                    if atom_count > 30:
-                        print(f"  [!] Product atom count too high ({atom_count}): {smi[:40]}...")
-                        continue
-                    
-                    unique_products.add(smi)
-                    print(f"  [OK] Product: {smi}")
-                except Exception as sanitize_error:
-                    print(f"  Sanitization error: {sanitize_error}")
-                    continue
-
-        result = list(unique_products)
-        
-        # AI Validation step
-        validated_products = []
+            result, error = _execute_reaction(
+                smarts, reactants_smiles, _parse_max_products(data.get('maxProducts')), timings)
+        except ReactionTimeout as timeout_error:
+            log.warning(f"{timeout_error} - SMARTS: {smarts}, reactants: {reactants_smiles}")
+            request_metrics.observe('react', _finish_timings(timings, started), 'timeout')
+            return jsonify(_build_reaction_response([], [], str(timeout_error), timed_out=True))
+        timings['execute'] = round(time.perf_counter() - execute_started, 6)
+        if error:
+            log.info(f"Reaction failed: {error}")
+            request_metrics.observe('react', _finish_timings(timings, started), 'error')
+            response_data = {'error': error, 'products': []}
+            if return_timings:
+                response_data['timings'] = timings
+            return jsonify(response_data)
+
+        job = {
+            'smarts': smarts,
+            'reactants': reactants_smiles,
+            'reaction_name': data.get('reaction_name'),
+            'products': result
+        }
         validation_results = []
-        
-        validator = get_ai_validator()
-        if validator and len(result) > 0:
-            print(f"\n[AI] Starting AI validation for {len(result)} products...")
-            
-            for product_smiles in result:
-                try:
-                    # Use all reactants for validation
-                    validation = validator.check_reaction_validity(
-                        reactants_smiles, 
-                        product_smiles
-                    )
-                    
-                    validation_info = {
-                        'product': product_smiles,
-                        'similarity': validation['similarity'],
-                        'is_valid': validation['is_valid'],
-                        'reason': validation['reason']
-                    }
-                    validation_results.append(validation_info)
-                    
-                    if validation['is_valid']:
-                        validated_products.append(product_smiles)
-                        print(f"  [OK] {product_smiles}: similarity={validation['similarity']:.4f} (VALID)")
-                    else:
-                        print(f"  [X] {product_smiles}: similarity={validation['similarity']:.4f} - {validation['reason']}")
-                        # Log failed reaction for learning
-                        logger = get_reaction_logger()
-                        if logger:
-                            logger.log_failed_reaction(
-                                reactants=reactants_smiles,
-                                product=product_smiles,
-                                smarts=smarts,
-                                validation_result=validation,
-                                reaction_name=data.get('reaction_name')
-                            )
-                        
-                except Exception as val_error:
-                    print(f"  [!] Validation error for {product_smiles}: {val_error}")
-                    # If validation fails, keep the product by default
-                    validated_products.append(product_smiles)
-                    validation_results.append({
-                        'product': product_smiles,
-                        'similarity': None,
-                        'is_valid': True,
-                        'reason': f'Validation skipped: {val_error}'
-                    })
-            
-            print(f"[AI] Validation complete: {len(validated_products)}/{len(result)} products passed")
-            
-            # Update statistics
-            logger = get_reaction_logger()
-            if logger:
-                failed_count = len(result) - len(validated_products)
-                logger.update_stats(
-                    reaction_name=data.get('reaction_name', 'unknown'),
-                    total_products=len(result),
-                    valid_products=len(validated_products),
-                    failed_products=failed_count
-                )
-            
-            result = validated_products
-        
-        if len(result) == 0:
-            print(f"No valid products generated - reactants may not match SMARTS pattern")
-        else:
-            print(f"Returning {len(result)} unique products")
-        
-        print(f"{'='*60}\n")
-        
-        # Include validation info in response if AI validation was performed
-        response_data = {'products': result}
-        if validation_results:
-            response_data['validation'] = validation_results
-            response_data['ai_validated'] = True
-        
+        outcomes = _validate_jobs([job], timings) if result else None
+        if outcomes:
+            result, validation_results = outcomes[0]
+
+        response_data = _build_reaction_response(result, validation_results)
+        _finish_timings(timings, started)
+        request_metrics.observe('react', timings)
+        log.info(f"/api/react {data.get('reaction_name') or smarts}: {len(result)} products "
+                 f"in {timings['total'] * 1000:.1f} ms")
+        if return_timings:
+            response_data['timings'] = timings
         return jsonify(response_data)
 
     except Exception as e:
-        import traceback
-        error_msg = f"Error executing reaction: {e}\n{traceback.format_exc()}"
-        print(error_msg)
+        log.error(f"Error executing reaction: {e}", exc_info=True)
+        request_metrics.observe('react', _finish_timings(timings, started), 'exception')
         # Return empty products instead of 500 error for graceful degradation
         return jsonify({'products': [], 'error': str(e)})
 
+# Batch Reaction API Endpoint
+@app.route('/api/react/batch', methods=['POST', 'OPTIONS'])
+def run_reaction_batch():
+    """
+    Run a list of reaction jobs in one request
+
+    Request body: {"jobs": [{"smarts": ..., "reactants": [...], "reaction_name": ...,
+                             "maxProducts": ...}, ...], "maxProducts": ..., "timings": true}
+    Response: {"results": [...]} with one /api/react style payload per job, in order
+    """
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'})
+
+    started = time.perf_counter()
+    timings = {}
+    try:
+        data = request.get_json(silent=True)
+        timings['json_parse'] = round(time.perf_counter() - started, 6)
+        if data is None:
+            request_metrics.observe('react_batch', _finish_timings(timings, started), 'invalid_request')
+            return jsonify({'error': 'Request body is empty or not JSON', 'results': []})
+
+        jobs_data = data.get('jobs') if isinstance(data, dict) else data
+        if not isinstance(jobs_data, list):
+            request_metrics.observe('react_batch', _finish_timings(timings, started), 'invalid_request')
+            return jsonify({'error': 'Missing jobs list', 'results': []})
+
+        if len(jobs_data) > MAX_BATCH_JOBS:
+            request_metrics.observe('react_batch', _finish_timings(timings, started), 'invalid_request')
+            return jsonify({'error': f'Too many jobs (max {MAX_BATCH_JOBS})', 'results': []})
+
+        log.debug(f"Received batch request - {len(jobs_data)} jobs")
+
+        default_max_products = _parse_max_products(data.get('maxProducts')) if isinstance(data, dict) else None
+        jobs = []
+        for job_data in jobs_data:
+            if not isinstance(job_data, dict):
+                job_data = {}
+            reactants_smiles = job_data.get('reactants', [])
+            if isinstance(reactants_smiles, str):
+                reactants_smiles = [reactants_smiles]
+            jobs.append({
+                'smarts': job_data.get('smarts'),
+                'reactants': reactants_smiles,
+                'reaction_name': job_data.get('reaction_name'),
+                'max_products': _parse_max_products(job_data.get('maxProducts')) or default_max_products
+            })
+
+        execute_started = time.perf_counter()
+        executions = _execute_reactions(
+            [(job['smarts'], job['reactants'], job['max_products']) for job in jobs])
+        timings['execute'] = round(time.perf_counter() - execute_started, 6)
+        for job, (products, error, timed_out) in zip(jobs, executions):
+            job.update(products=products, error=error, timed_out=timed_out)
+
+        # Single validation pass over the products of every job
+        outcomes = _validate_jobs(jobs, timings)
+
+        results = []
+        for idx, job in enumerate(jobs):
+            products, validation_results = job['products'], []
+            if outcomes and job['products']:
+                products, validation_results = outcomes[idx]
+            results.append(_build_reaction_response(
+                products, validation_results, job['error'], job['timed_out']))
+
+        produced = sum(1 for r in results if r['products'])
+        timed_out = sum(1 for job in jobs if job['timed_out'])
+        _finish_timings(timings, started)
+        request_metrics.observe('react_batch', timings, 'timeout' if timed_out else 'ok')
+        log.info(f"/api/react/batch: {produced}/{len(results)} jobs returned products, {timed_out} timed out "
+                 f"in {timings['total'] * 1000:.1f} ms")
+
+        response_data = {'results': results}
+        if isinstance(data, dict) and data.get('timings'):
+            response_data['timings'] = timings
+        return jsonify(response_data)
+
+    except Exception as e:
+        log.error(f"Error executing reaction batch: {e}", exc_info=True)
+        request_metrics.observe('react_batch', _finish_timings(timings, started), 'exception')
+        return jsonify({'results': [], 'error': str(e)})
+
+def _run_problem_jobs(jobs):
+    """Run and validate the attempts of one /api/problems round (same path as /api/react/batch)"""
+    executions = _execute_reactions([(job['smarts'], job['reactants'], None) for job in jobs])
+    for job, (products, error, timed_out) in zip(jobs, executions):
+        job['products'] = [] if error else products
+    outcomes = _validate_jobs(jobs)
+    if outcomes is None:
+        return [(job['products'], []) for job in jobs]
+    return outcomes
+
+# Maximum number of problems per /api/problems request
+MAX_PROBLEMS = 50
+
+# Problem Generation API Endpoint
+@app.route('/api/problems', methods=['GET', 'POST'])
+def get_problems():
+    """
+    Generate validated problems server-side
+
+    GET ?types=a,b&count=5&difficulty=easy or POST {"types": [...], "count": 5,
+    "difficulty": "easy"}. Response: {"problems": [{"key", "name", "condition",
+    "reactants", "products", ...}], "requested", "attempts", "complete"}
+    """
+    from problem_generator import parse_difficulty
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        types = data.get('types')
+    else:
+        data = request.args
+        types = [t for t in data.get('types', '').split(',') if t]
+    if types is not None and not isinstance(types, list):
+        return jsonify({'error': 'types must be a list', 'problems': []}), 400
+
+    try:
+        count = int(data.get('count', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid count', 'problems': []}), 400
+    count = max(1, min(count, MAX_PROBLEMS))
+
+    generator = get_problem_generator()
+    difficulty = parse_difficulty(data.get('difficulty'))
+    if not generator.eligible_keys(types, difficulty):
+        return jsonify({'error': 'No matching reaction types', 'problems': []}), 400
+
+    started = time.time()
+    # Random indexed reads from the bank first; generate live only what is missing
+    keys = generator.eligible_keys(types, difficulty)
+    banked = _bank_problems(keys, count, generator.rng)
+    result = {'problems': banked, 'attempts': 0, 'complete': len(banked) >= count}
+    if len(banked) < count:
+        result = generator.generate(keys, count - len(banked))
+        result['problems'] = banked + result['problems']
+        result['complete'] = len(result['problems']) >= count
+    result['requested'] = count
+    result['from_bank'] = len(banked)
+    log.info(f"[Problems] {len(result['problems'])}/{count} problems ({len(banked)} from bank, "
+             f"{result['attempts']} attempts, {time.time() - started:.2f}s)")
+    return jsonify(result)
+
+def create_app(config=None):
+    """
+    App factory for production WSGI servers (gunicorn: "server:create_app()")
+
+    Applies the config and runs warm-up synchronously in the calling process.
+    With gunicorn's preload_app this is the master, so the compiled reaction
+    templates and model weights are loaded once and shared by the forked
+    workers through copy-on-write pages. Processes and threads do not survive
+    fork, so the reaction pool is started per worker in init_worker().
+
+    Args:
+        config: ServerConfig (defaults read from environment variables)
+
+    Returns:
+        Flask: The configured application
+    """
+    global AI_VALIDATION_ENABLED, DATA_LOGGING_ENABLED, REACTION_POOL_ENABLED, REACTION_POOL_WORKERS
+    global MOLECULE_SERVICE_ENABLED, PROBLEM_BANK_ENABLED, PROBLEM_BANK_PRODUCER, PROBLEM_BANK_PRODUCER_AI
+    config = config or ServerConfig()
+    AI_VALIDATION_ENABLED = config.ai_validation
+    DATA_LOGGING_ENABLED = config.data_logging
+    REACTION_POOL_ENABLED = config.reaction_pool
+    MOLECULE_SERVICE_ENABLED = config.molecule_service
+    PROBLEM_BANK_ENABLED = config.problem_bank
+    PROBLEM_BANK_PRODUCER = config.problem_bank_producer
+    PROBLEM_BANK_PRODUCER_AI = config.problem_bank_producer_ai
+    REACTION_POOL_WORKERS = config.reaction_pool_workers
+    server_log.set_level(config.log_level)
+    app.config['SERVER_CONFIG'] = config
+
+    if not warmup.is_started():
+        log.info(f"Preloading server: {config}")
+        start_warmup(background=False, include_pool=False)
+        # In the gunicorn master, so all workers share one producer
+        start_problem_producer()
+    return app
+
+def init_worker():
+    """Per-process setup in each server worker (gunicorn post_worker_init hook)"""
+    config = app.config.get('SERVER_CONFIG') or ServerConfig()
+    if ai_validator is not None:
+        ai_validator.set_num_threads(config.torch_threads)
+    # Each worker serves some of the scrapes; report the requests of all workers
+    request_metrics.share(config.metrics_dir)
+    # Registered here so /api/ready in this worker reports the pool as well
+    warmup.run([('reaction_pool', _start_reaction_pool if REACTION_POOL_ENABLED else None)])
+
 if __name__ == '__main__':
     print("Starting Flask Reaction Server on port 8000...")
     print("RDKit Version:", Chem.rdBase.rdkitVersion)
+    # With debug=True the reloader re-runs this file in a child process;
+    # only warm up in the process that actually serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_warmup()
+        start_problem_producer()
     app.run(port=8000, debug=True)
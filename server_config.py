@@ -0,0 +1,78 @@
+"""
+Server Config - Settings for running server.py under a production WSGI server
+生产部署配置：工作进程数、线程数、超时等，环境变量可覆盖默认值
+
+Used by gunicorn.conf.py and server.create_app(). Defaults assume one
+gunicorn worker per CPU core; the reaction pool and PyTorch thread counts
+are split across workers so the box is not oversubscribed.
+"""
+
+import os
+
+# Workers' request metrics snapshots, merged on /api/metrics (see request_metrics)
+DEFAULT_METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'metrics')
+
+
+def _env(name, default):
+    return os.environ.get(name, default)
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class ServerConfig:
+    """
+    Production server settings
+
+    Every attribute can be overridden by keyword argument or by the
+    environment variable noted next to it.
+    """
+
+    def __init__(self, **overrides):
+        cpu_count = os.cpu_count() or 1
+
+        # gunicorn
+        self.bind = _env('SERVER_BIND', '0.0.0.0:8000')                    # SERVER_BIND
+        self.workers = int(_env('SERVER_WORKERS', cpu_count))               # SERVER_WORKERS
+        self.threads = int(_env('SERVER_THREADS', 4))                       # SERVER_THREADS
+        self.timeout = int(_env('SERVER_TIMEOUT', 120))                     # SERVER_TIMEOUT
+        self.graceful_timeout = int(_env('SERVER_GRACEFUL_TIMEOUT', 30))    # SERVER_GRACEFUL_TIMEOUT
+        self.keepalive = int(_env('SERVER_KEEPALIVE', 5))                   # SERVER_KEEPALIVE
+        self.preload = _env_bool('SERVER_PRELOAD', True)                    # SERVER_PRELOAD
+        self.metrics_dir = _env('SERVER_METRICS_DIR', DEFAULT_METRICS_DIR)   # SERVER_METRICS_DIR
+
+        # Application features
+        self.ai_validation = _env_bool('AI_VALIDATION_ENABLED', True)       # AI_VALIDATION_ENABLED
+        self.data_logging = _env_bool('DATA_LOGGING_ENABLED', True)         # DATA_LOGGING_ENABLED
+        self.reaction_pool = _env_bool('REACTION_POOL_ENABLED', True)       # REACTION_POOL_ENABLED
+        self.molecule_service = _env_bool('MOLECULE_SERVICE_ENABLED', True) # MOLECULE_SERVICE_ENABLED
+        self.problem_bank = _env_bool('PROBLEM_BANK_ENABLED', True)         # PROBLEM_BANK_ENABLED
+        self.problem_bank_producer = _env_bool('PROBLEM_BANK_PRODUCER', False)  # PROBLEM_BANK_PRODUCER
+        self.problem_bank_producer_ai = _env_bool('PROBLEM_BANK_PRODUCER_AI', False)  # PROBLEM_BANK_PRODUCER_AI
+        self.log_level = _env('LOG_LEVEL', 'INFO')                          # LOG_LEVEL (DEBUG/INFO/WARNING/ERROR/OFF)
+
+        # Per-worker resources; by default the CPUs are split across gunicorn workers
+        self.reaction_pool_workers = None                                   # REACTION_POOL_WORKERS
+        self.torch_threads = None                                           # SERVER_TORCH_THREADS
+
+        for name, value in overrides.items():
+            if not hasattr(self, name):
+                raise TypeError(f"Unknown server setting: {name}")
+            setattr(self, name, value)
+
+        share = max(1, cpu_count // max(1, self.workers))
+        if self.reaction_pool_workers is None:
+            self.reaction_pool_workers = int(_env('REACTION_POOL_WORKERS', share))
+        if self.torch_threads is None:
+            self.torch_threads = int(_env('SERVER_TORCH_THREADS', share))
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        settings = ', '.join(f"{k}={v!r}" for k, v in vars(self).items())
+        return f"ServerConfig({settings})"
@@ -0,0 +1,91 @@
+"""
+Server Log - Leveled logger for the request path
+请求路径日志：按级别输出，生产环境可用 LOG_LEVEL 调低或关闭
+
+Replaces the per-request print() calls of server.py and reaction_executor.py.
+Per-reactant / per-product detail is logged at DEBUG, one summary line per
+request at INFO, problems at WARNING and ERROR.
+
+    LOG_LEVEL=DEBUG | INFO (default) | WARNING | ERROR | OFF
+
+The level is read from the environment at import, so reaction pool workers
+(started later by forkserver) follow set_level() through LOG_LEVEL as well.
+"""
+
+import logging
+import os
+import sys
+
+LOGGER_NAME = 'chem'
+DEFAULT_LEVEL = 'INFO'
+OFF = logging.CRITICAL + 10
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'OFF': OFF,
+}
+
+
+def parse_level(value):
+    """
+    Resolve a LOG_LEVEL value
+
+    Args:
+        value: Level name (case-insensitive) or logging level number
+
+    Returns:
+        int: logging level
+
+    Raises:
+        ValueError: Unknown level name
+    """
+    if isinstance(value, int):
+        return value
+    name = str(value).strip().upper()
+    if name not in LEVELS:
+        raise ValueError(f"Unknown log level: {value} (expected one of {', '.join(LEVELS)})")
+    return LEVELS[name]
+
+
+def get_logger(name):
+    """Child logger of the server logger, e.g. get_logger('server') -> 'chem.server'"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def set_level(level):
+    """
+    Set the level of every server logger (and of processes started afterwards)
+
+    Args:
+        level: Level name or logging level number
+    """
+    level = parse_level(level)
+    logging.getLogger(LOGGER_NAME).setLevel(level)
+    os.environ['LOG_LEVEL'] = next((name for name, value in LEVELS.items() if value == level), str(level))
+
+
+def get_level():
+    """Current level name of the server logger"""
+    level = logging.getLogger(LOGGER_NAME).level
+    return next((name for name, value in LEVELS.items() if value == level), str(level))
+
+
+def _configure():
+    root = logging.getLogger(LOGGER_NAME)
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('[%(levelname)s] %(message)s'))
+    root.addHandler(handler)
+    # Output goes to stdout like the print() calls it replaces, not through the root logger
+    root.propagate = False
+    try:
+        root.setLevel(parse_level(os.environ.get('LOG_LEVEL', DEFAULT_LEVEL)))
+    except ValueError:
+        root.setLevel(LEVELS[DEFAULT_LEVEL])
+
+
+_configure()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Substructure Index - Fingerprint prefilter for SMARTS searches over a SMILES corpus
+子结构筛选索引：用 pattern fingerprint 先排除不可能匹配的分子，再对剩余分子做精确匹配
+
+Every corpus molecule's RDKit pattern fingerprint is stored as one row of a
+packed bit matrix (uint64 words). A molecule can only contain the query if
+its fingerprint has every bit of the query's fingerprint set, so a single
+vectorized AND/compare over the matrix screens out most of the corpus before
+HasSubstructMatch runs.
+
+Usage:
+    python substructure_index.py bench corpus.smi [--json results.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from rdkit import Chem
+from rdkit import DataStructs
+from rdkit import RDLogger
+
+RDLogger.DisableLog('rdApp.*')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSED_JSON = os.path.join(BASE_DIR, 'parsed_reactions.json')
+
+FP_SIZE = 2048                   # Bits per fingerprint (multiple of 64)
+CHUNK_SIZE = 2000                # Molecules per parallel fingerprint task
+
+
+def _pack(fp, fp_size):
+    """ExplicitBitVect -> packed uint8 row"""
+    bits = np.zeros(fp_size, dtype=np.uint8)
+    DataStructs.ConvertToNumpyArray(fp, bits)
+    return np.packbits(bits)
+
+
+def _fingerprint_chunk(args):
+    """Worker: parse, filter and fingerprint a chunk of SMILES"""
+    smiles_chunk, fp_size, mol_filter = args
+    kept = []
+    rows = []
+    for smi in smiles_chunk:
+        if mol_filter is not None and not mol_filter(smi):
+            continue
+        mol = Chem.MolFromSmiles(smi)
+        if mol is None:
+            continue
+        kept.append(smi)
+        rows.append(_pack(Chem.PatternFingerprint(mol, fpSize=fp_size), fp_size))
+    fingerprints = np.array(rows, dtype=np.uint8).reshape(len(rows), fp_size // 8)
+    return kept, fingerprints
+
+
+class SubstructureIndex:
+    """
+    Pattern-fingerprint screening index over a list of SMILES
+
+    Args:
+        smiles: Indexed SMILES (all parseable)
+        fingerprints: uint8 array (len(smiles), fp_size // 8) of packed pattern fingerprints
+        fp_size: Fingerprint size in bits
+    """
+
+    def __init__(self, smiles, fingerprints, fp_size=FP_SIZE):
+        if fp_size % 64:
+            raise ValueError(f"fp_size must be a multiple of 64, got {fp_size}")
+        self.smiles = list(smiles)
+        self.fp_size = fp_size
+        self._words = np.ascontiguousarray(fingerprints, dtype=np.uint8).view(np.uint64)
+        self._mols = [None] * len(self.smiles)
+        self._counters = {'queries': 0, 'candidates': 0, 'matches': 0}
+
+    @classmethod
+    def build(cls, smiles_list, workers=1, fp_size=FP_SIZE, mol_filter=None):
+        """
+        Fingerprint a corpus (in parallel when workers > 1)
+
+        Args:
+            smiles_list: Corpus SMILES; unparseable ones are dropped
+            workers: Worker processes
+            fp_size: Fingerprint size in bits
+            mol_filter: Optional picklable callable(smiles) -> bool applied first
+
+        Returns:
+            SubstructureIndex: Index over the kept SMILES, in corpus order
+        """
+        chunks = [(smiles_list[i:i + CHUNK_SIZE], fp_size, mol_filter)
+                  for i in range(0, len(smiles_list), CHUNK_SIZE)]
+        if workers > 1 and len(chunks) > 1:
+            with Pool(workers) as pool:
+                results = pool.map(_fingerprint_chunk, chunks)
+        else:
+            results = [_fingerprint_chunk(chunk) for chunk in chunks]
+
+        smiles = [smi for kept, _ in results for smi in kept]
+        if results:
+            fingerprints = np.concatenate([fps for _, fps in results])
+        else:
+            fingerprints = np.zeros((0, fp_size // 8), dtype=np.uint8)
+        return cls(smiles, fingerprints, fp_size)
+
+    def __len__(self):
+        return len(self.smiles)
+
+    def __getstate__(self):
+        # Parsed molecules are a per-process cache; don't ship them to workers
+        state = self.__dict__.copy()
+        state['_mols'] = [None] * len(self.smiles)
+        return state
+
+    def _mol(self, i):
+        mol = self._mols[i]
+        if mol is None:
+            mol = self._mols[i] = Chem.MolFromSmiles(self.smiles[i])
+        return mol
+
+    def screen(self, query):
+        """
+        Positions whose fingerprint contains every bit of the query's
+
+        Args:
+            query: SMARTS string or query Mol
+
+        Returns:
+            ndarray: Candidate positions (a superset of the true matches)
+        """
+        if isinstance(query, str):
+            query = Chem.MolFromSmarts(query)
+        if query is None:
+            return np.zeros(0, dtype=np.intp)
+        try:
+            qwords = _pack(Chem.PatternFingerprint(query, fpSize=self.fp_size), self.fp_size).view(np.uint64)
+        except Exception:
+            # No fingerprint for this query: everything is a candidate
+            return np.arange(len(self.smiles))
+        return np.flatnonzero(((self._words & qwords) == qwords).all(axis=1))
+
+    def search(self, smarts, limit=None):
+        """
+        Exact substructure search with fingerprint screening
+
+        Args:
+            smarts: Query SMARTS
+            limit: Stop after this many matches (None = all)
+
+        Returns:
+            list: Matching positions in corpus order
+        """
+        query = Chem.MolFromSmarts(smarts)
+        if query is None:
+            return []
+        candidates = self.screen(query)
+        matches = []
+        for i in candidates:
+            mol = self._mol(i)
+            if mol is not None and mol.HasSubstructMatch(query):
+                matches.append(int(i))
+                if limit is not None and len(matches) >= limit:
+                    break
+        self._counters['queries'] += 1
+        self._counters['candidates'] += len(candidates)
+        self._counters['matches'] += len(matches)
+        return matches
+
+    def search_smiles(self, smarts, limit=None):
+        """Same as search() but returns the matching SMILES"""
+        return [self.smiles[i] for i in self.search(smarts, limit)]
+
+    def stats(self):
+        """Index size and screening counters"""
+        return {'molecules': len(self.smiles), 'fp_size': self.fp_size, **self._counters}
+
+    def to_bytes(self):
+        """Serialize to .npz bytes"""
+        buffer = io.BytesIO()
+        np.savez(buffer,
+                 fingerprints=self._words.view(np.uint8),
+                 smiles=np.frombuffer('\n'.join(self.smiles).encode('utf-8'), dtype=np.uint8),
+                 fp_size=np.array(self.fp_size))
+        return buffer.getvalue()
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            text = data['smiles'].tobytes().decode('utf-8')
+            smiles = text.split('\n') if text else []
+            return cls(smiles, data['fingerprints'], int(data['fp_size']))
+
+
+def benchmark(corpus_smiles, queries, workers=1, fp_size=FP_SIZE):
+    """
+    Compare screened search against HasSubstructMatch on every molecule
+
+    Args:
+        corpus_smiles: Corpus SMILES
+        queries: Query SMARTS strings
+        workers: Worker processes for building the index
+        fp_size: Fingerprint size in bits
+
+    Returns:
+        dict: Build time, screen-out rate, brute-force vs indexed search times,
+              speedup and the number of queries whose results differ (should be 0)
+    """
+    started = time.perf_counter()
+    index = SubstructureIndex.build(corpus_smiles, workers=workers, fp_size=fp_size)
+    build_seconds = time.perf_counter() - started
+    mols = [index._mol(i) for i in range(len(index))]
+
+    brute_seconds = indexed_seconds = 0.0
+    candidates = matches = mismatches = 0
+    patterns = [(q, Chem.MolFromSmarts(q)) for q in queries]
+    patterns = [(q, p) for q, p in patterns if p is not None]
+    for smarts, pattern in patterns:
+        started = time.perf_counter()
+        expected = [i for i, mol in enumerate(mols) if mol.HasSubstructMatch(pattern)]
+        brute_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        found = index.search(smarts)
+        indexed_seconds += time.perf_counter() - started
+
+        candidates += len(index.screen(pattern))
+        matches += len(expected)
+        mismatches += found != expected
+
+    pairs = max(1, len(patterns) * len(index))
+    return {
+        'molecules': len(index),
+        'queries': len(patterns),
+        'fp_size': fp_size,
+        'build_seconds': round(build_seconds, 3),
+        'screen_out_rate': round(1 - candidates / pairs, 4),
+        'match_rate': round(matches / pairs, 4),
+        'brute_force_seconds': round(brute_seconds, 3),
+        'indexed_seconds': round(indexed_seconds, 3),
+        'speedup': round(brute_seconds / indexed_seconds, 2) if indexed_seconds else None,
+        'mismatched_queries': mismatches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Substructure screening index")
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help="benchmark screened search against brute force")
+    bench.add_argument('corpus', help="SMILES file, one molecule per line")
+    bench.add_argument('--reactions', default=PARSED_JSON,
+                       help="take query SMARTS from this reaction database")
+    bench.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    bench.add_argument('--fp-size', type=int, default=FP_SIZE)
+    bench.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    from molecule_pools import read_corpus
+    from molecule_service import VERIFICATION_SMARTS
+
+    with open(args.reactions, 'r', encoding='utf-8') as f:
+        reactions = json.load(f)
+    queries = sorted({VERIFICATION_SMARTS.get(info['smarts'], info['smarts'])
+                      for rxn in reactions.values() for info in rxn.get('reactant_info') or []
+                      if info and info.get('smarts')})
+    result = benchmark(read_corpus(args.corpus), queries, workers=args.workers, fp_size=args.fp_size)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""测试 ChemBERTa 向量：模型始终嵌入原始 SMILES，缓存只按规范 SMILES 查找"""
+import os
+import sys
+import zlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_validator
+from embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Replaces the model with a deterministic per-string embedding; records its inputs"""
+    seen = []
+
+    def embed(unique_smiles, backend_name=None):
+        seen.extend(unique_smiles)
+        rows = [np.random.default_rng(zlib.crc32(smi.encode())).standard_normal(8)
+                for smi in unique_smiles]
+        return torch.tensor(np.stack(rows), dtype=torch.float32)
+
+    monkeypatch.setattr(ai_validator, '_embed_uncached', embed)
+    return seen
+
+
+def test_embeddings_match_with_and_without_cache(tmp_path, monkeypatch, fake_model):
+    smiles = ['OCC', 'CC(=O)O', 'OCC']
+
+    monkeypatch.setattr(ai_validator, 'get_embedding_cache', lambda: None)
+    uncached = ai_validator.get_molecule_embeddings(smiles)
+    uncached_inputs = list(fake_model)
+
+    cache = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+    monkeypatch.setattr(ai_validator, 'get_embedding_cache', lambda: cache)
+    fake_model.clear()
+    cached = ai_validator.get_molecule_embeddings(smiles)
+
+    # The model sees the raw strings on both paths
+    assert uncached_inputs == fake_model == ['OCC', 'CC(=O)O']
+    # The cache stores float16
+    np.testing.assert_allclose(cached.numpy(), uncached.numpy(), atol=1e-2)
+    assert torch.equal(uncached[0], uncached[2])
+    cache.close()
+
+
+def test_cache_key_is_canonical(tmp_path, monkeypatch, fake_model):
+    # Non-canonical spellings of ethanol
+    cache = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+    monkeypatch.setattr(ai_validator, 'get_embedding_cache', lambda: cache)
+    first = ai_validator.get_molecule_embeddings(['OCC', 'C(O)C'])
+    again = ai_validator.get_molecule_embeddings(['CCO'])
+
+    # Only the first spelling reaches the model; the others hit its cached vector
+    assert fake_model == ['OCC']
+    assert torch.equal(first[0], first[1])
+    assert torch.equal(first[0], again[0])
+    cache.close()
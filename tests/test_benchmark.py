@@ -0,0 +1,40 @@
+"""基准测试框架测试（结果文件与对比）"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+
+
+def test_run_writes_json_results(tmp_path):
+    output = tmp_path / 'result.json'
+    document = benchmark.run_benchmarks('compile', repeat=2, quick=True, output=str(output),
+                                        progress=lambda message: None)
+
+    saved = json.loads(output.read_text(encoding='utf-8'))
+    assert saved['benchmarks'].keys() == document['benchmarks'].keys() == {'compile.smarts', 'compile.cache_hit'}
+    result = saved['benchmarks']['compile.smarts']
+    assert len(result['samples']) == 2
+    assert result['items'] == saved['settings']['templates']
+    assert result['per_item_us'] > 0
+    assert saved['machine']['rdkit']
+
+
+def _document(**per_item_us):
+    return {'benchmarks': {name: {'per_item_us': value} for name, value in per_item_us.items()}}
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = _document(a=10.0, b=10.0, c=10.0, gone=1.0)
+    current = _document(a=10.5, b=12.0, c=5.0, new=1.0)
+    current['benchmarks']['skipped'] = baseline['benchmarks']['skipped'] = {'skipped': 'no torch'}
+
+    status = {row['name']: row['status'] for row in benchmark.compare(baseline, current, threshold=0.1)}
+    assert status == {'a': 'unchanged', 'b': 'regression', 'c': 'improvement', 'gone': 'removed',
+                      'skipped': 'skipped', 'new': 'added'}
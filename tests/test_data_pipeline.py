@@ -0,0 +1,100 @@
+"""测试增量数据管线 (SMARTS.txt -> parsed_reactions.json -> reactions.js)"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_pipeline
+from data_pipeline import extract_smarts_and_comment, extract_search_smarts, run_pipeline
+
+SMARTS_TXT = """烯烃
+[C:1]=[C:2].[Br:3][Br:4]>>[C:1]([Br:3])[C:2]([Br:4])   # 与溴加成
+[C:1]=[C:2]>>-[C:1]-[C:2]-，# 聚合反应
+[C:1]=[C:2].[O:3]>>[C:1][C:2][O:3]
+
+醇
+[C:1][OH:2].[C:3][Mg:4][Br:5]>>[C:1][C:3]  # 格氏试剂
+"""
+
+
+@pytest.fixture
+def paths(tmp_path):
+    (tmp_path / 'SMARTS.txt').write_text(SMARTS_TXT, encoding='utf-8')
+    return {
+        'smarts_file': str(tmp_path / 'SMARTS.txt'),
+        'parsed_json': str(tmp_path / 'parsed_reactions.json'),
+        'reactions_js': str(tmp_path / 'reactions.js'),
+        'problems_json': str(tmp_path / 'problem_reactions.json'),
+        'manifest_path': str(tmp_path / 'data' / 'manifest.json'),
+        'progress': lambda msg: None
+    }
+
+
+def test_line_parsing_matches_convert_smarts():
+    assert extract_smarts_and_comment('[C:1]#[C:2]>>[C:1]=[C:2]  # Lindlar') == ('[C:1]#[C:2]>>[C:1]=[C:2]', 'Lindlar')
+    assert extract_smarts_and_comment('[C:1]#[C:2]>>[C:1]=[C:2]，#催化加氢') == ('[C:1]#[C:2]>>[C:1]=[C:2]', '催化加氢')
+    assert extract_smarts_and_comment('[C:1]#[C:2]>>[C:1][C:2],') == ('[C:1]#[C:2]>>[C:1][C:2]', '')
+
+    patterns, info = extract_search_smarts('[C:1]=[C:2].[Br:3][Br:4].[Br:5][Br:6]>>[C:1][C:2]')
+    assert patterns == ['[C]=[C]', 'BrBr']
+    assert info[1] == {'smarts': 'BrBr', 'count': 2, 'isReagent': True, 'skip': False, 'smiles': 'BrBr'}
+
+
+def test_pipeline_outputs(paths):
+    summary = run_pipeline(**paths)
+    assert summary['reactions'] == 4 and summary['parsed'] == 4
+    assert summary['problems'] == 1
+
+    with open(paths['parsed_json'], encoding='utf-8') as f:
+        reactions = json.load(f)
+    assert list(reactions) == ['alkene_gen_1', 'alkene_gen_2', 'alkene_gen_3', 'alcohol_gen_1']
+    assert reactions['alkene_gen_1']['difficulty'] == 1
+    assert reactions['alcohol_gen_1']['difficulty'] == 3
+    assert reactions['alkene_gen_3']['name'] == 'alkene 反应 3'
+    assert reactions['alkene_gen_3']['search_smarts'] == ['[C]=[C]', '[O]']
+
+    with open(paths['reactions_js'], encoding='utf-8') as f:
+        js = f.read()
+    assert js.startswith('// 难度等级定义')
+    assert '    search_smarts: ["[C]=[C]","BrBr"],\n' in js
+    with open(paths['problems_json'], encoding='utf-8') as f:
+        assert [p['key'] for p in json.load(f)] == ['alkene_gen_2']
+
+
+def test_pipeline_only_reparses_edited_lines(paths, monkeypatch):
+    run_pipeline(**paths)
+    mtime = os.stat(paths['reactions_js']).st_mtime_ns
+
+    # Nothing changed: nothing parsed, nothing rewritten
+    summary = run_pipeline(**paths)
+    assert summary['parsed'] == 0 and summary['written'] == []
+    assert os.stat(paths['reactions_js']).st_mtime_ns == mtime
+
+    with open(paths['smarts_file'], 'a', encoding='utf-8') as f:
+        f.write('[C:1][OH:2]>>[C:1]Cl   # 氯化\n')
+    parsed = []
+    original = data_pipeline.parse_line
+    monkeypatch.setattr(data_pipeline, 'parse_line', lambda cat, line: parsed.append(line) or original(cat, line))
+
+    summary = run_pipeline(**paths)
+    assert parsed == ['[C:1][OH:2]>>[C:1]Cl   # 氯化']
+    assert summary['reactions'] == 5 and summary['reused'] == 4
+    assert 'parsed_reactions.json' in summary['written']
+    assert not os.path.exists(paths['parsed_json'] + '.tmp')
+
+
+def test_checked_in_files_are_in_sync(tmp_path):
+    """The Python pipeline reproduces the checked-in outputs of the Node scripts byte for byte"""
+    outputs = {
+        'parsed_json': data_pipeline.PARSED_JSON,
+        'reactions_js': data_pipeline.REACTIONS_JS,
+        'problems_json': data_pipeline.PROBLEMS_JSON
+    }
+    run_pipeline(smarts_file=data_pipeline.SMARTS_FILE, manifest_path=str(tmp_path / 'manifest.json'),
+                 progress=lambda msg: None, **{name: str(tmp_path / name) for name in outputs})
+    for name, path in outputs.items():
+        with open(path, 'rb') as expected, open(tmp_path / name, 'rb') as actual:
+            assert actual.read() == expected.read(), name
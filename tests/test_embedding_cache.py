@@ -0,0 +1,80 @@
+"""测试持久化分子向量缓存"""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import EmbeddingCache
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_round_trip_and_hit_counters(tmp_path):
+    cache = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+    vecs = _vectors(2)
+
+    assert cache.get_many(['CCO', 'CC=O']) == [None, None]
+    cache.put_many(['CCO', 'CC=O'], vecs)
+    hits = cache.get_many(['CCO', 'CC=O'])
+
+    np.testing.assert_allclose(hits[0], vecs[0], atol=1e-2)
+    stats = cache.stats()
+    assert stats['misses'] == 2
+    assert stats['memory_hits'] == 2
+    cache.close()
+
+
+def test_store_survives_restart(tmp_path):
+    vecs = _vectors(3)
+    first = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+    first.put_many(['C', 'CC', 'CCC'], vecs)
+    first.close()
+
+    second = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+    hits = second.get_many(['CC', 'CCCC'])
+
+    np.testing.assert_allclose(hits[0], vecs[1], atol=1e-2)
+    assert hits[1] is None
+    assert second.stats()['disk_hits'] == 1
+    second.close()
+
+
+def test_disk_rows_are_reused_fifo(tmp_path):
+    cache = EmbeddingCache('test-model', cache_dir=str(tmp_path), memory_size=1, disk_capacity=2)
+    cache.put_many(['C', 'CC', 'CCC'], _vectors(3))
+    cache.close()
+
+    reopened = EmbeddingCache('test-model', cache_dir=str(tmp_path), memory_size=1, disk_capacity=2)
+    hits = reopened.get_many(['C', 'CC', 'CCC'])
+
+    assert hits[0] is None
+    assert hits[1] is not None and hits[2] is not None
+    assert reopened.stats()['disk_size'] == 2
+    reopened.close()
+
+
+def test_memory_lru_evicts_oldest(tmp_path):
+    cache = EmbeddingCache('test-model', cache_dir=None, memory_size=2)
+    cache.put_many(['C', 'CC', 'CCC'], _vectors(3))
+
+    assert cache.get_many(['C'])[0] is None
+    assert cache.stats()['memory_evictions'] == 1
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="writer lock uses fcntl")
+def test_second_process_is_read_only_and_sees_new_rows(tmp_path):
+    writer = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+    writer.put_many(['C'], _vectors(1))
+    reader = EmbeddingCache('test-model', cache_dir=str(tmp_path))
+
+    assert not reader.stats()['disk_writable']
+    writer.put_many(['CC'], _vectors(1, seed=1))
+    assert reader.get_many(['CC'])[0] is not None
+    reader.close()
+    writer.close()
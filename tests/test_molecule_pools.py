@@ -0,0 +1,119 @@
+"""测试离线分子池的构建与读取"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import molecule_pools
+from molecule_pools import PoolStore, build_pools
+
+BROMINATION = "[C:1]=[C:2].[Br:3][Br:4]>>[C:1]([Br:3])[C:2]([Br:4])"
+ESTERIFICATION = "[C:1](=[O:2])[OH].[OH][C:3]>>[C:1](=[O:2])O[C:3]"
+
+REACTIONS = {
+    'bromination': {
+        'smarts': BROMINATION,
+        'reactant_info': [
+            {'smarts': '[C]=[C]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None},
+            {'smarts': '[Br][Br]', 'count': 1, 'isReagent': True, 'skip': False, 'smiles': 'BrBr'}
+        ]
+    },
+    'esterification': {
+        'smarts': ESTERIFICATION,
+        'reactant_info': [
+            {'smarts': '[C](=O)[OH]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None},
+            {'smarts': '[OH][C]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None}
+        ]
+    },
+    'no_match': {
+        'smarts': "[N:1]=[N+:2]=[N-:3]>>[N:1]",
+        'reactant_info': [
+            {'smarts': '[N]=[N+]=[N-]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None}
+        ]
+    }
+}
+
+# Benzene (aromatic C=C must not match), and a molecule too large for the complexity filter
+CORPUS = ['CC=C', 'CC=CC', 'c1ccccc1', 'CC(=O)O', 'CCO', 'CC(C)O', 'C=C' + 'C' * 30]
+
+
+@pytest.fixture
+def built(tmp_path):
+    json_path = tmp_path / 'reactions.json'
+    json_path.write_text(json.dumps(REACTIONS))
+    corpus = tmp_path / 'corpus.smi'
+    corpus.write_text('# test corpus\n' + '\n'.join(f"{smi} mol{i}" for i, smi in enumerate(CORPUS)) + '\n')
+    out_dir = str(tmp_path / 'pools')
+    index = build_pools(str(corpus), json_path=str(json_path), out_dir=out_dir,
+                        workers=1, progress=lambda msg: None)
+    return index, out_dir
+
+
+def test_build_pools_index(built):
+    index, _ = built
+
+    assert set(index['templates']) == {'bromination', 'esterification'}
+    assert index['corpus']['molecules'] == len(CORPUS)
+    assert index['templates']['bromination']['sizes'] == [2]
+
+
+def test_pool_store_serves_dry_run_checked_molecules(built):
+    _, out_dir = built
+    store = PoolStore(out_dir)
+
+    bromination = store.get('bromination')
+    assert bromination == [{'smarts': '[C]=[C]', 'molecules': ['CC=C', 'CC=CC']}]
+
+    acid, alcohol = store.get('esterification')
+    assert acid['molecules'] == ['CC(=O)O']
+    # The acid's OH also matches [OH][C]; the dry run keeps every molecule that reacts
+    assert set(alcohol['molecules']) == {'CC(=O)O', 'CCO', 'CC(C)O'}
+
+    assert store.get('no_match') is None
+    assert store.info()['templates'] == 2
+
+
+def test_pool_store_searches_filtered_corpus(built):
+    _, out_dir = built
+    store = PoolStore(out_dir)
+
+    # Aromatic bonds don't count as C=C; the oversized alkene was filtered out at build time
+    assert store.search_smiles('C=C') == ['CC=C', 'CC=CC']
+    assert store.search_smiles('[OH][C]', limit=1) == ['CC(=O)O']
+
+
+def test_rebuild_replaces_pools(built, tmp_path):
+    _, out_dir = built
+    store = PoolStore(out_dir)
+    assert store.get('bromination') is not None
+
+    corpus = tmp_path / 'corpus2.smi'
+    corpus.write_text('CCO\n')
+    build_pools(str(corpus), json_path=str(tmp_path / 'reactions.json'), out_dir=out_dir,
+                workers=1, progress=lambda msg: None)
+    os.utime(os.path.join(out_dir, 'index.json'), (0, 1))  # Force an mtime change
+
+    assert store.get('bromination') is None
+    assert not os.path.exists(out_dir + '.tmp')
+
+
+def test_pools_endpoint(built, monkeypatch):
+    import server
+
+    _, out_dir = built
+    monkeypatch.setattr(server, 'pool_store', PoolStore(out_dir))
+    server.app.config['TESTING'] = True
+    with server.app.test_client() as client:
+        data = client.post('/api/pools', json={'keys': ['bromination', 'unknown']}).get_json()
+        assert data['pools']['bromination'][0]['molecules'] == ['CC=C', 'CC=CC']
+        assert data['missing'] == ['unknown']
+
+        data = client.get('/api/pools?keys=esterification').get_json()
+        assert len(data['pools']['esterification']) == 2
+
+        assert client.post('/api/pools', json={}).status_code == 400
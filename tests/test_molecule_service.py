@@ -0,0 +1,170 @@
+"""使用本地 PubChem 替身测试分子服务"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import molecule_service
+from molecule_service import MoleculeService, PubChemClient
+
+# CID -> SMILES served by the stub; benzene and the huge molecule must be filtered out
+COMPOUNDS = {1: 'CCC=C', 2: 'CC(C)=CC', 3: 'c1ccccc1CC', 4: 'C=C' + 'C' * 30}
+
+
+class StubPubChem(BaseHTTPRequestHandler):
+    calls = []
+    delay = 0.0
+    fail = False
+
+    def do_GET(self):
+        StubPubChem.calls.append(self.path)
+        time.sleep(StubPubChem.delay)
+        if StubPubChem.fail:
+            self.send_response(400)
+            self.end_headers()
+            return
+        if '/fastsubstructure/' in self.path:
+            body = {'IdentifierList': {'CID': list(COMPOUNDS)}}
+        elif '/property/SMILES/' in self.path:
+            cids = self.path.split('/cid/')[1].split('/')[0].split(',')
+            body = {'PropertyTable': {'Properties': [
+                {'CID': int(c), 'SMILES': COMPOUNDS[int(c)]} for c in cids]}}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url(monkeypatch):
+    monkeypatch.setattr(molecule_service, 'MIN_REQUEST_INTERVAL', 0)
+    StubPubChem.calls = []
+    StubPubChem.delay = 0.0
+    StubPubChem.fail = False
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubPubChem)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/rest/pug'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def service(tmp_path, stub_url):
+    svc = MoleculeService(str(tmp_path / 'molecules.sqlite'), client=PubChemClient(stub_url))
+    yield svc
+    svc.close()
+
+
+def _searches():
+    return [c for c in StubPubChem.calls if '/fastsubstructure/' in c]
+
+
+def test_search_is_filtered_verified_and_cached(service):
+    first = service.get_molecules('C=C')
+    assert first['source'] == 'pubchem'
+    assert first['molecules'] == ['CCC=C', 'CC(C)=CC']
+
+    second = service.get_molecules('C=C')
+    assert second['source'] == 'cache'
+    assert second['molecules'] == first['molecules']
+    assert len(_searches()) == 1
+    assert service.stats()['entries'] == 1
+
+
+def test_cache_is_shared_between_service_instances(tmp_path, stub_url):
+    db_path = str(tmp_path / 'molecules.sqlite')
+    MoleculeService(db_path, client=PubChemClient(stub_url)).get_molecules('C=C')
+    other = MoleculeService(db_path, client=PubChemClient(stub_url))
+
+    assert other.get_molecules('C=C')['source'] == 'cache'
+    assert len(_searches()) == 1
+
+
+def test_concurrent_identical_queries_are_coalesced(service):
+    StubPubChem.delay = 0.3
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_molecules('C=C')))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(_searches()) == 1
+    assert all(r['molecules'] == ['CCC=C', 'CC(C)=CC'] for r in results)
+    assert service.stats()['coalesced'] == 3
+
+
+def test_stale_entry_is_served_and_refreshed(service):
+    service.get_molecules('C=C')
+    service.fresh_ttl = 0
+
+    result = service.get_molecules('C=C')
+    assert result['stale'] is True
+    assert result['molecules'] == ['CCC=C', 'CC(C)=CC']
+
+    deadline = time.time() + 5
+    while len(_searches()) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(_searches()) == 2
+    assert service.stats()['refreshes'] == 1
+
+
+def test_pubchem_failure_falls_back_to_expired_entry(service):
+    service.get_molecules('C=C')
+    service.fresh_ttl = service.stale_ttl = 0
+    StubPubChem.fail = True
+
+    result = service.get_molecules('C=C')
+    assert result['molecules'] == ['CCC=C', 'CC(C)=CC']
+    assert 'error' in result
+
+    empty = service.get_molecules('C#C')
+    assert empty['molecules'] == []
+    assert 'error' in empty
+
+
+def test_molecules_endpoint(service, monkeypatch):
+    import server
+    monkeypatch.setattr(server, 'MOLECULE_SERVICE_ENABLED', True)
+    monkeypatch.setattr(server, 'molecule_service', service)
+    client = server.app.test_client()
+
+    data = client.get('/api/molecules', query_string={'smarts': 'C=C'}).get_json()
+    assert data['smarts'] == 'C=C'
+    assert data['molecules'] == ['CCC=C', 'CC(C)=CC']
+
+    assert client.get('/api/molecules').status_code == 400
+
+
+def test_local_index_answers_before_pubchem(tmp_path, stub_url):
+    from substructure_index import SubstructureIndex
+
+    index = SubstructureIndex.build(['CC=C', 'c1ccccc1', 'CCO'])
+    svc = MoleculeService(str(tmp_path / 'molecules.sqlite'), client=PubChemClient(stub_url), local_index=index)
+
+    result = svc.get_molecules('[C]=[C]')
+    assert result['source'] == 'local'
+    assert result['molecules'] == ['CC=C']
+    # No local match: fall through to PubChem
+    assert svc.get_molecules('C#N')['source'] == 'pubchem'
+    assert len(_searches()) == 1
+    svc.close()
@@ -0,0 +1,174 @@
+"""测试题库的增量刷新和随机读取"""
+import copy
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import problem_bank
+from problem_bank import DEFAULT_DB_PATH, ProblemBank, _build_parser, refresh, template_hash
+
+REACTIONS = {
+    'a': {'category': 'alkene', 'difficulty': 1, 'smarts': '[C:1]=[C:2]>>[C:1][C:2]O', 'reactant_info': []},
+    'b': {'category': 'alkene', 'difficulty': 2, 'smarts': '[C:1]=[C:2]>>[C:1][C:2]Br', 'reactant_info': []},
+    'c': {'category': 'alcohol', 'difficulty': 1, 'smarts': '[C:1][OH]>>[C:1]Cl', 'reactant_info': []}
+}
+
+
+class FakeGenerator:
+    """Produces numbered problems and records which templates were generated"""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, types, count, difficulty=None):
+        key = types[0]
+        self.calls.append(key)
+        start = self.calls.count(key) * 100
+        problems = [{'key': key, 'reactants': [f'C{i}'], 'products': [f'P{i}']} for i in range(start, start + count)]
+        return {'problems': problems, 'attempts': count, 'complete': True}
+
+
+@pytest.fixture
+def bank(tmp_path):
+    bank = ProblemBank(str(tmp_path / 'bank.sqlite'))
+    yield bank
+    bank.close()
+
+
+def _quiet(msg):
+    pass
+
+
+def test_refresh_only_recomputes_changed_templates(bank):
+    generator = FakeGenerator()
+    summary = refresh(bank, REACTIONS, generator, per_template=5, progress=_quiet)
+    assert summary == {'removed': 0, 'changed': 3, 'filled': 3, 'added': 15}
+    assert sorted(generator.calls) == ['a', 'b', 'c']
+
+    # Nothing changed: nothing is regenerated
+    generator.calls.clear()
+    assert refresh(bank, REACTIONS, generator, per_template=5, progress=_quiet)['filled'] == 0
+    assert generator.calls == []
+
+    # One SMARTS edited, one template deleted
+    reactions = copy.deepcopy(REACTIONS)
+    reactions['b']['smarts'] = '[C:1]=[C:2]>>[C:1][C:2]I'
+    del reactions['c']
+    summary = refresh(bank, reactions, generator, per_template=5, progress=_quiet)
+    assert summary['removed'] == 1 and summary['changed'] == 1
+    assert generator.calls == ['b']
+    assert set(bank.templates()) == {'a', 'b'}
+    assert bank.templates()['b']['smarts_hash'] == template_hash(reactions['b'])
+    assert bank.stats()['problems'] == 10
+
+
+def test_sample_reads_distinct_templates_and_skips_stale_hashes(bank):
+    refresh(bank, REACTIONS, FakeGenerator(), per_template=5, progress=_quiet)
+    rng = random.Random(0)
+
+    problems = bank.sample(['a', 'b', 'c'], 3, rng)
+    assert sorted(p['key'] for p in problems) == ['a', 'b', 'c']
+
+    # More problems than templates: repeats a template but never the same problem
+    problems = bank.sample(['a'], 5, rng)
+    assert len({tuple(p['reactants']) for p in problems}) == len(problems) >= 3
+
+    hashes = {key: template_hash(rxn) for key, rxn in REACTIONS.items()}
+    hashes['b'] = 'edited-but-not-refreshed'
+    assert {p['key'] for p in bank.sample(['a', 'b'], 10, rng, hashes)} == {'a'}
+
+
+def test_problems_endpoint_reads_bank_first(bank, monkeypatch):
+    pytest.importorskip("rdkit")
+    import server
+    from problem_generator import ProblemGenerator
+
+    refresh(bank, REACTIONS, FakeGenerator(), per_template=5, progress=_quiet)
+    monkeypatch.setattr(server, 'PROBLEM_BANK_ENABLED', True)
+    monkeypatch.setattr(server, 'AI_VALIDATION_ENABLED', False)
+    monkeypatch.setattr(server, 'problem_bank', bank)
+    monkeypatch.setattr(server, '_template_hashes', None)
+    monkeypatch.setattr(server, 'problem_generator',
+                        ProblemGenerator(REACTIONS, lambda key, smarts: [], lambda jobs: []))
+    server.app.config['TESTING'] = True
+    with server.app.test_client() as client:
+        data = client.post('/api/problems', json={'types': ['a', 'c'], 'count': 2}).get_json()
+
+    assert data['from_bank'] == 2
+    assert data['complete'] and data['attempts'] == 0
+    assert sorted(p['key'] for p in data['problems']) == ['a', 'c']
+
+
+class ValidatingGenerator(FakeGenerator):
+    """FakeGenerator whose problems carry validation results, as with --ai"""
+
+    def generate(self, types, count, difficulty=None):
+        result = super().generate(types, count, difficulty)
+        for problem in result['problems']:
+            problem['validation'] = [{'product': problem['products'][0], 'is_valid': True}]
+        return result
+
+
+def test_validated_problems_are_sampled_separately(bank):
+    refresh(bank, REACTIONS, FakeGenerator(), per_template=5, progress=_quiet)
+    rng = random.Random(0)
+    assert bank.sample(['a', 'b', 'c'], 3, rng, validated_only=True) == []
+
+    # A validating producer tops up the validated problems of every template
+    summary = refresh(bank, REACTIONS, ValidatingGenerator(), per_template=5, retry_interval=0,
+                      progress=_quiet, validated=True)
+    assert summary['filled'] == 3 and summary['added'] == 15
+    assert bank.templates()['a']['validated_count'] == 5
+    bank._counts = None
+    problems = bank.sample(['a', 'b', 'c'], 10, rng, validated_only=True)
+    assert problems and all(p['validation'] for p in problems)
+    assert bank.stats()['validated_problems'] == 15
+
+
+def test_problems_endpoint_skips_unvalidated_bank_rows_with_ai(bank, monkeypatch):
+    pytest.importorskip("rdkit")
+    import server
+    from problem_generator import ProblemGenerator
+
+    refresh(bank, REACTIONS, FakeGenerator(), per_template=5, progress=_quiet)
+    monkeypatch.setattr(server, 'PROBLEM_BANK_ENABLED', True)
+    monkeypatch.setattr(server, 'AI_VALIDATION_ENABLED', True)
+    monkeypatch.setattr(server, 'problem_bank', bank)
+    monkeypatch.setattr(server, '_template_hashes', None)
+    monkeypatch.setattr(server, 'problem_generator',
+                        ProblemGenerator(REACTIONS, lambda key, smarts: [], lambda jobs: []))
+    server.app.config['TESTING'] = True
+    with server.app.test_client() as client:
+        data = client.post('/api/problems', json={'types': ['a', 'c'], 'count': 2}).get_json()
+
+    assert data['from_bank'] == 0
+
+
+def test_db_option_before_or_after_command():
+    parser = _build_parser()
+    assert parser.parse_args(['produce', '--db', 'x.sqlite']).db == 'x.sqlite'
+    assert parser.parse_args(['--db', 'x.sqlite', 'info']).db == 'x.sqlite'
+    assert parser.parse_args(['info']).db == DEFAULT_DB_PATH
+
+
+def test_producer_lock_excludes_second_producer(tmp_path, monkeypatch):
+    monkeypatch.setattr(problem_bank, 'PRODUCER_LOCK_FILE', str(tmp_path / 'bank.lock'))
+    first = problem_bank._acquire_producer_lock(wait=False)
+    assert first is not None
+    if problem_bank.fcntl is not None or problem_bank.msvcrt is not None:
+        assert problem_bank._acquire_producer_lock(wait=False) is None
+    first.close()
+
+
+def test_producer_lock_without_fcntl(tmp_path, monkeypatch):
+    # Platforms without fcntl or msvcrt run unlocked instead of failing
+    monkeypatch.setattr(problem_bank, 'PRODUCER_LOCK_FILE', str(tmp_path / 'bank.lock'))
+    monkeypatch.setattr(problem_bank, 'fcntl', None)
+    monkeypatch.setattr(problem_bank, 'msvcrt', None)
+    handle = problem_bank._acquire_producer_lock(wait=False)
+    assert handle is not None
+    handle.close()
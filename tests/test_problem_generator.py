@@ -0,0 +1,127 @@
+"""测试服务器端出题和成功率采样"""
+import os
+import random
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from problem_generator import ProblemGenerator, SuccessSampler, parse_difficulty, select_main_products
+
+REACTIONS = {
+    'bromination': {
+        'name': '烯烃与溴加成', 'condition': 'Br2', 'difficulty': 1,
+        'smarts': "[C:1]=[C:2].[Br:3][Br:4]>>[C:1]([Br:3])[C:2]([Br:4])",
+        'reactant_info': [
+            {'smarts': '[C]=[C]', 'isReagent': False, 'skip': False, 'smiles': None},
+            {'smarts': '[Br][Br]', 'isReagent': True, 'skip': False, 'smiles': 'BrBr'}
+        ]
+    },
+    'hydration': {
+        'name': '烯烃水合', 'condition': 'H2O', 'difficulty': 2,
+        'smarts': "[C:1]=[C:2]>>[C:1][C:2]O",
+        'reactant_info': [{'smarts': '[C]=[C]', 'isReagent': False, 'skip': False, 'smiles': None}]
+    },
+    'no_pool': {
+        'name': '无分子池', 'condition': '', 'difficulty': 2,
+        'smarts': "[N:1]=[N+:2]=[N-:3]>>[N:1]",
+        'reactant_info': [{'smarts': '[N]=[N+]=[N-]', 'isReagent': False, 'skip': False, 'smiles': None}]
+    }
+}
+POOLS = {'[C]=[C]': ['CC=C', 'CC=CC']}
+
+
+def _molecules(key, smarts):
+    return POOLS.get(smarts, [])
+
+
+def _fake_run(fail_keys=()):
+    calls = []
+
+    def run(jobs):
+        calls.extend(jobs)
+        return [([] if job['key'] in fail_keys else ['P' + job['reactants'][0]], []) for job in jobs]
+    run.calls = calls
+    return run
+
+
+def test_parse_difficulty_and_main_products():
+    assert parse_difficulty('easy') == 1
+    assert parse_difficulty('3') == 3
+    assert parse_difficulty('custom') is None
+    assert select_main_products(['O', 'CCBr', 'CCCCO']) == ['CCCCO', 'CCBr']
+    assert select_main_products(['O', 'Br', 'N']) == ['O', 'Br']
+
+
+def test_generate_returns_requested_count():
+    run = _fake_run()
+    generator = ProblemGenerator(REACTIONS, _molecules, run, rng=random.Random(0))
+
+    result = generator.generate(count=4)
+
+    assert result['complete']
+    assert len(result['problems']) == 4
+    for problem in result['problems']:
+        assert problem['key'] in ('bromination', 'hydration')
+        assert problem['reactants'][0] in POOLS['[C]=[C]']
+    # The reagent is rendered but the reaction only gets as many reactants as it has templates
+    bromination = [job for job in run.calls if job['key'] == 'bromination']
+    assert all(job['reactants'][1] == 'BrBr' for job in bromination)
+    assert all(len(job['reactants']) == 1 for job in run.calls if job['key'] == 'hydration')
+
+
+def test_difficulty_filter_and_unavailable_templates():
+    generator = ProblemGenerator(REACTIONS, _molecules, _fake_run(), rng=random.Random(0))
+
+    result = generator.generate(count=3, difficulty=2)
+    assert {p['key'] for p in result['problems']} == {'hydration'}
+
+    result = generator.generate(types=['no_pool'], count=2)
+    assert result['problems'] == []
+    assert not result['complete']
+
+
+def test_sampler_learns_to_avoid_failing_templates():
+    sampler = SuccessSampler()
+    generator = ProblemGenerator(REACTIONS, _molecules, _fake_run(fail_keys={'hydration'}),
+                                 sampler=sampler, rng=random.Random(1))
+    for _ in range(20):
+        generator.generate(types=['bromination', 'hydration'], count=5)
+
+    assert sampler.success_rate('hydration') < 0.2 < 0.9 < sampler.success_rate('bromination')
+    picks = sampler.sample(['bromination', 'hydration'], 1000, random.Random(2))
+    assert picks.count('hydration') < 200
+
+
+def test_sampler_prior_comes_from_reaction_stats():
+    stats = {'bad': {'total_products': 48, 'valid_products': 0}, 'good': {'total_products': 48, 'valid_products': 48}}
+    sampler = SuccessSampler(lambda: stats)
+
+    assert sampler.success_rate('bad') < 0.05
+    assert sampler.success_rate('good') > 0.95
+    assert sampler.success_rate('unseen') == 0.5
+
+
+def test_problems_endpoint(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, 'AI_VALIDATION_ENABLED', False)
+    monkeypatch.setattr(server, 'DATA_LOGGING_ENABLED', False)
+    monkeypatch.setattr(server, 'REACTION_POOL_ENABLED', False)
+    monkeypatch.setattr(server, 'PROBLEM_BANK_ENABLED', False)
+    monkeypatch.setattr(server, 'problem_generator',
+                        ProblemGenerator(REACTIONS, _molecules, server._run_problem_jobs, rng=random.Random(0)))
+    server.app.config['TESTING'] = True
+    with server.app.test_client() as client:
+        data = client.post('/api/problems', json={'types': ['bromination'], 'count': 3}).get_json()
+        assert data['requested'] == 3
+        assert len(data['problems']) == 3
+        assert all(p['products'][0] in ('BrCC(C)Br', 'CC(Br)C(C)Br') for p in data['problems'])
+
+        data = client.get('/api/problems?types=hydration&difficulty=medium&count=2').get_json()
+        assert len(data['problems']) == 2
+
+        assert client.get('/api/problems?types=hydration&difficulty=easy').status_code == 400
@@ -0,0 +1,55 @@
+"""测试已编译反应缓存"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reaction_cache
+
+BROMINATION = "[C:1]=[C:2].[Br][Br]>>[C:1]([Br])-[C:2]([Br])"
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    reaction_cache.clear()
+    yield
+    reaction_cache.clear()
+
+
+def test_repeated_lookup_hits_cache():
+    first = reaction_cache.get_reaction(BROMINATION)
+    second = reaction_cache.get_reaction(BROMINATION)
+
+    assert first is second
+    assert first.IsInitialized()
+    stats = reaction_cache.get_cache_stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(reaction_cache, 'MAX_CACHE_SIZE', 2)
+    smarts = [
+        "[C:1]=[C:2]>>[C:1][C:2]",
+        "[C:1]#[C:2]>>[C:1]=[C:2]",
+        "[C:1][OH:2]>>[C:1][Cl:2]",
+    ]
+    for s in smarts:
+        reaction_cache.get_reaction(s)
+
+    stats = reaction_cache.get_cache_stats()
+    assert stats['size'] == 2
+    assert stats['evictions'] == 1
+
+
+def test_warm_up_does_not_count_lookups():
+    compiled = reaction_cache.warm_up()
+
+    assert compiled > 0
+    stats = reaction_cache.get_cache_stats()
+    assert stats['size'] == compiled
+    assert stats['hits'] == 0 and stats['misses'] == 0
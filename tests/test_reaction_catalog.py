@@ -0,0 +1,107 @@
+"""测试反应目录的索引和二进制快照"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rdkit import Chem
+
+import reaction_cache
+from problem_bank import template_hash
+from reaction_catalog import ReactionCatalog
+
+ALKENE = {'smarts': '[C]=[C]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None}
+REACTIONS = {
+    'bromination': {
+        'category': 'alkene', 'name': '与溴加成', 'difficulty': 1,
+        'smarts': '[C:1]=[C:2].[Br][Br]>>[C:1]([Br])[C:2]([Br])', 'source': ['alkenes'],
+        'search_smarts': ['[C]=[C]', 'BrBr'], 'condition': '与溴加成',
+        'reactant_info': [ALKENE, {'smarts': 'BrBr', 'count': 1, 'isReagent': True, 'skip': False, 'smiles': 'BrBr'}]
+    },
+    'hydration': {
+        'category': 'alkene', 'name': '水合', 'difficulty': 2, 'subcategory': 'addition_water',
+        'smarts': '[C:1]=[C:2]>>[C:1][C:2]O', 'source': ['alkenes'],
+        'search_smarts': ['[C]=[C]'], 'condition': '水合', 'reactant_info': [ALKENE]
+    },
+    'oxidation': {
+        'category': 'alcohol', 'name': '氧化', 'difficulty': 2,
+        'smarts': '[C:1][OH]>>[C:1]=O', 'source': ['alcohols'],
+        'search_smarts': ['[C][OH]'], 'condition': '氧化',
+        'reactant_info': [{'smarts': '[C][OH]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None}]
+    },
+    'broken': {
+        'category': 'alcohol', 'name': '语法错误', 'difficulty': 3,
+        'smarts': '[C:1=[C:2]>>[C:1]', 'source': ['alcohols'],
+        'search_smarts': [], 'condition': '语法错误', 'reactant_info': []
+    }
+}
+
+
+@pytest.fixture
+def json_path(tmp_path):
+    path = tmp_path / 'reactions.json'
+    path.write_text(json.dumps(REACTIONS, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_records_read_like_json_entries(json_path):
+    catalog = ReactionCatalog.load(json_path, snapshot_path=None)
+
+    assert list(catalog) == list(REACTIONS)
+    record = catalog['bromination']
+    assert record['smarts'] == REACTIONS['bromination']['smarts']
+    assert record.get('missing', 'default') == 'default'
+    assert record.to_dict() == dict(REACTIONS['bromination'], subcategory='general')
+    assert template_hash(record) == template_hash(REACTIONS['bromination'])
+
+    # Interned strings and shared reactant_info entries
+    assert catalog['hydration'].reactant_info[0] is record.reactant_info[0]
+    assert catalog['hydration'].source[0] is record.source[0]
+
+    assert record.rxn.GetNumReactantTemplates() == 2
+    assert Chem.MolFromSmiles('CC=C').HasSubstructMatch(record.query_mols[0])
+    assert catalog['broken'].rxn is None and catalog['broken'].error
+    assert catalog.stats()['compile_errors'] == 1
+
+
+def test_secondary_indexes(json_path):
+    catalog = ReactionCatalog.load(json_path, snapshot_path=None)
+
+    assert catalog.keys_for(category='alkene') == ['bromination', 'hydration']
+    assert catalog.keys_for(category=['alkene', 'alcohol'], difficulty=2) == ['hydration', 'oxidation']
+    assert catalog.keys_for(subcategory='addition_water') == ['hydration']
+    assert catalog.keys_for(difficulty=1, subcategory='addition_water') == []
+    assert len(catalog.keys_for()) == 4
+    assert catalog.categories() == {'alkene': 2, 'alcohol': 2}
+
+
+def test_snapshot_round_trip_and_invalidation(json_path, tmp_path):
+    snapshot = str(tmp_path / 'catalog.snapshot')
+    first = ReactionCatalog.load(json_path, snapshot_path=snapshot)
+    assert first.loaded_from == 'json' and os.path.exists(snapshot)
+
+    reaction_cache.clear()
+    second = ReactionCatalog.load(json_path, snapshot_path=snapshot)
+    assert second.loaded_from == 'snapshot'
+    assert [r.to_dict() for r in second.values()] == [r.to_dict() for r in first.values()]
+    products = second['hydration'].rxn.RunReactants((Chem.MolFromSmiles('CC=C'),))
+    assert len(products) == 2
+
+    # Seeding makes execute_reaction's cache lookups hits without recompiling
+    assert second.seed_reaction_cache() == 3
+    assert reaction_cache.get_reaction(second['hydration'].smarts) is second['hydration'].rxn
+    reaction_cache.clear()
+
+    # An edited database invalidates the snapshot
+    edited = dict(REACTIONS)
+    edited['hydration'] = dict(REACTIONS['hydration'], difficulty=3)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(edited, f)
+    third = ReactionCatalog.load(json_path, snapshot_path=snapshot)
+    assert third.loaded_from == 'json'
+    assert third.keys_for(difficulty=3) == ['hydration', 'broken']
@@ -0,0 +1,110 @@
+"""测试反应进程池：超时、进程回收和产物上限"""
+import os
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reaction_executor
+from reaction_executor import ReactionPool, ReactionTimeout
+
+BROMINATION = "[C:1]=[C:2].[Br:3][Br:4]>>[C:1]([Br:3])[C:2]([Br:4])"
+HYDROXYLATION = "[C:1]>>[C:1]O"
+
+
+@pytest.fixture
+def pool():
+    p = ReactionPool(workers=1, job_timeout=30, max_jobs_per_worker=2)
+    yield p
+    p.close()
+
+
+def test_pool_runs_reaction(pool):
+    assert pool.run(BROMINATION, ['C=C', 'BrBr']) == (['BrCCBr'], None)
+    assert pool.stats()['jobs'] == 1
+
+
+def test_timeout_kills_worker_and_pool_recovers(pool):
+    pool.job_timeout = 0
+    with pytest.raises(ReactionTimeout):
+        pool.run(BROMINATION, ['C=C', 'BrBr'])
+
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['live_workers'] == 0
+    assert stats['recent_timeouts'][0]['smarts'] == BROMINATION
+
+    pool.job_timeout = 30
+    assert pool.run(BROMINATION, ['C=C', 'BrBr']) == (['BrCCBr'], None)
+
+
+def test_queue_wait_does_not_shorten_run_budget(pool):
+    # The only worker is busy; the job queues for it, then still gets the full job_timeout
+    pool.job_timeout = 5
+    busy = pool._acquire(5)
+    threading.Timer(0.5, pool._release, args=(busy,)).start()
+    budgets = []
+    poll = busy.conn.poll
+
+    def recording_poll(timeout):
+        budgets.append(timeout)
+        return poll(timeout)
+    busy.conn.poll = recording_poll
+
+    assert pool.run(BROMINATION, ['C=C', 'BrBr']) == (['BrCCBr'], None)
+    assert budgets == [5]
+    stats = pool.stats()
+    assert stats['timeouts'] == 0 and stats['workers_started'] == 1
+
+
+def test_workers_are_recycled(pool):
+    for _ in range(3):
+        pool.run(BROMINATION, ['C=C', 'BrBr'])
+
+    stats = pool.stats()
+    assert stats['workers_recycled'] == 1
+    assert stats['workers_started'] == 2
+
+
+def test_map_keeps_order_and_flags_timeouts(pool):
+    outcomes = pool.map([
+        (BROMINATION, ['C=C', 'BrBr'], None),
+        ('not a smarts', ['C=C'], None),
+    ])
+
+    assert outcomes[0] == (['BrCCBr'], None, False)
+    assert outcomes[1][1] and outcomes[1][2] is False
+
+
+def test_max_products_caps_enumeration():
+    products, error = reaction_executor.execute_reaction(HYDROXYLATION, ['CCCCCC'], max_products=1)
+    assert error is None
+    assert len(products) == 1
+
+    products, _ = reaction_executor.execute_reaction(HYDROXYLATION, ['CCCCCC'], max_products=100)
+    assert sorted(products) == ['CCCC(O)CC', 'CCCCC(C)O', 'CCCCCCO']
+
+
+def test_postprocess_dedups_and_reports_stage_timings():
+    timings = {}
+    metathesis = "[C:1]=[C:2].[C:3]=[C:4]>>[C:1]=[C:3].[C:2]=[C:4]"
+    products, error = reaction_executor.execute_reaction(
+        metathesis, ['C=CCC=C', 'C=CCC=C'], max_products=100, timings=timings)
+
+    assert error is None
+    assert len(products) == len(set(products))
+    assert timings['candidates'] == 2 * timings['product_sets']
+    assert timings['duplicates'] > 0
+    for stage in reaction_executor.STAGES:
+        assert timings[stage] >= 0
+
+
+def test_large_products_are_filtered():
+    long_chain = 'C' * 35
+    products, error = reaction_executor.execute_reaction(HYDROXYLATION, [long_chain], max_products=5)
+    assert error is None
+    assert products == []
@@ -0,0 +1,123 @@
+"""测试追加写入的反应日志"""
+import json
+import os
+import sys
+from collections import deque
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reaction_logger
+
+TOO_DIFFERENT = {'similarity': 0.1, 'is_valid': False, 'reason': 'Product differs too much from reactant'}
+TOO_SIMILAR = {'similarity': 0.99, 'is_valid': False, 'reason': 'Product too similar to reactant'}
+
+
+@pytest.fixture(autouse=True)
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(reaction_logger, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(reaction_logger, 'FAILED_REACTIONS_FILE', str(tmp_path / 'failed_reactions.jsonl'))
+    monkeypatch.setattr(reaction_logger, 'LEGACY_FAILED_REACTIONS_FILE', str(tmp_path / 'failed_reactions.json'))
+    monkeypatch.setattr(reaction_logger, 'STATS_FILE', str(tmp_path / 'reaction_stats.json'))
+    monkeypatch.setattr(reaction_logger, '_loaded', False)
+    monkeypatch.setattr(reaction_logger, '_stats', {})
+    monkeypatch.setattr(reaction_logger, '_stats_delta', {})
+    monkeypatch.setattr(reaction_logger, '_stats_reset', False)
+    monkeypatch.setattr(reaction_logger, '_recent', deque(maxlen=reaction_logger.RECENT_ENTRIES))
+    monkeypatch.setattr(reaction_logger, '_segment_counts', [])
+    monkeypatch.setattr(reaction_logger, '_pending_counts', {'total': 0, 'reasons': {}})
+    monkeypatch.setattr(reaction_logger, '_log_handle', None)
+    yield tmp_path
+    reaction_logger.flush()
+    if reaction_logger._log_handle is not None:
+        reaction_logger._log_handle.close()
+        reaction_logger._log_handle = None
+
+
+def _log(product, result=TOO_DIFFERENT):
+    reaction_logger.log_failed_reaction(['CC=C'], product, '[C:1]=[C:2]>>[C:1][C:2]', result, 'test')
+
+
+def test_entries_are_appended_and_summarised(log_dir):
+    _log('CCC')
+    _log('CCCC', TOO_SIMILAR)
+    reaction_logger.update_stats('test', 4, 2, 2)
+
+    # Served from memory before the writer has flushed
+    summary = reaction_logger.get_summary()
+    assert summary['total_failed_logged'] == 2
+    assert summary['failure_reasons'] == {'Too Different': 1, 'Too Similar': 1}
+    assert summary['reaction_stats']['test']['success_rate'] == 50.0
+    assert [e['product'] for e in reaction_logger.get_failed_reactions(1)] == ['CCCC']
+
+    reaction_logger.flush()
+    lines = (log_dir / 'failed_reactions.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['product'] for line in lines] == ['CCC', 'CCCC']
+    stats = json.loads((log_dir / 'reaction_stats.json').read_text(encoding='utf-8'))
+    assert stats['test']['total_products'] == 4
+    assert reaction_logger.get_summary()['total_failed_logged'] == 2
+
+
+def test_stats_from_other_processes_are_merged(log_dir):
+    reaction_logger.update_stats('test', 2, 2, 0)
+    reaction_logger.flush()
+
+    # Another server worker process writes its own counts in between
+    stats_file = log_dir / 'reaction_stats.json'
+    stats = json.loads(stats_file.read_text(encoding='utf-8'))
+    stats['test']['total_runs'] += 1
+    stats['test']['total_products'] += 2
+    stats['other'] = {'total_runs': 1, 'total_products': 1, 'valid_products': 1,
+                      'failed_products': 0, 'last_run': None}
+    stats_file.write_text(json.dumps(stats), encoding='utf-8')
+
+    reaction_logger.update_stats('test', 2, 0, 2)
+    reaction_logger.flush()
+
+    merged = json.loads(stats_file.read_text(encoding='utf-8'))
+    assert merged['test']['total_runs'] == 3
+    assert merged['test']['total_products'] == 6
+    assert merged['test']['success_rate'] == 33.33
+    assert 'other' in merged
+    assert reaction_logger.get_stats() == merged
+
+
+def test_rotation_keeps_summary_in_step(log_dir, monkeypatch):
+    monkeypatch.setattr(reaction_logger, 'MAX_LOG_BYTES', 200)
+    monkeypatch.setattr(reaction_logger, 'LOG_BACKUP_COUNT', 1)
+    for i in range(10):
+        _log('C' * (i + 1))
+    reaction_logger.flush()
+
+    assert (log_dir / 'failed_reactions.1.jsonl').exists()
+    assert not (log_dir / 'failed_reactions.2.jsonl').exists()
+    retained = reaction_logger.get_failed_reactions(limit=None)
+    assert retained[-1]['product'] == 'C' * 10
+    assert reaction_logger.get_summary()['total_failed_logged'] == len(retained) < 10
+
+
+def test_legacy_json_is_migrated(log_dir):
+    legacy = [{'product': 'CCO', 'reason': 'Product differs too much from reactant'}]
+    (log_dir / 'failed_reactions.json').write_text(json.dumps(legacy), encoding='utf-8')
+
+    assert reaction_logger.get_failed_reactions() == legacy
+    assert reaction_logger.get_summary()['failure_reasons'] == {'Too Different': 1}
+    assert not (log_dir / 'failed_reactions.json').exists()
+
+
+def test_replace_and_clear(log_dir):
+    _log('CCC')
+    _log('CCCC', TOO_SIMILAR)
+    reaction_logger.update_stats('test', 2, 0, 2)
+
+    remaining = reaction_logger.get_failed_reactions(limit=None)[1:]
+    reaction_logger.replace_failed_reactions(remaining)
+    assert [e['product'] for e in reaction_logger.get_failed_reactions()] == ['CCCC']
+    assert reaction_logger.get_summary()['failure_reasons'] == {'Too Similar': 1}
+
+    reaction_logger.clear_logs()
+    summary = reaction_logger.get_summary()
+    assert summary['total_failed_logged'] == 0
+    assert summary['reaction_stats'] == {}
+    assert json.loads((log_dir / 'reaction_stats.json').read_text(encoding='utf-8')) == {}
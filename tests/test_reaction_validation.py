@@ -0,0 +1,68 @@
+"""测试反应规则的 RDKit 体检"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reaction_validation import check_reaction, sample_reactant_sets, validate_database
+
+ALKENE_INFO = [{'smarts': '[C]=[C]', 'count': 1, 'isReagent': False, 'skip': False, 'smiles': None}]
+REACTIONS = {
+    'hydration': {'name': '水合', 'smarts': '[C:1]=[C:2]>>[C:1][C:2]O', 'reactant_info': ALKENE_INFO},
+    'bad_valence': {'name': '溴化', 'smarts': '[C:1]=[C:2]>>[C:1]([Br])([Br])([Br])([Br])[C:2]', 'reactant_info': ALKENE_INFO},
+    'no_match': {'name': '无产物', 'smarts': '[C:1]#[C:2]>>[C:1]=[C:2]', 'reactant_info': ALKENE_INFO},
+    'bad_maps': {'name': '映射', 'smarts': '[C:1]=[C:1]>>[C:1][C:3]', 'reactant_info': ALKENE_INFO},
+    'unparsable': {'name': '语法', 'smarts': '[C:1]=[C:2>>[C:1]', 'reactant_info': ALKENE_INFO},
+}
+
+
+def _alkenes(slot_smarts):
+    return ['CC=C', 'CC=CC'] if slot_smarts == '[C]=[C]' else []
+
+
+def _issue_types(result):
+    return {issue['type'] for issue in result['issues']}
+
+
+def test_sample_reactant_sets_cycles_pools_and_keeps_reagents():
+    reaction = {'reactant_info': ALKENE_INFO + [
+        {'smarts': 'BrBr', 'count': 1, 'isReagent': True, 'skip': False, 'smiles': 'BrBr'}]}
+    assert sample_reactant_sets(reaction, _alkenes, samples=3) == [['CC=C', 'BrBr'], ['CC=CC', 'BrBr']]
+    assert sample_reactant_sets(reaction, lambda smarts: [], samples=3) is None
+
+
+def test_check_reaction_classifies_templates():
+    results = {key: check_reaction(rxn, _alkenes) for key, rxn in REACTIONS.items()}
+
+    assert results['hydration']['status'] == 'ok'
+    assert results['hydration']['samples'] == 2 and results['hydration']['products'] > 0
+    assert _issue_types(results['bad_valence']) == {'sanitize_failed'}
+    assert _issue_types(results['no_match']) == {'no_products'}
+    assert {'duplicate_map', 'unknown_product_map'} <= _issue_types(results['bad_maps'])
+    assert _issue_types(results['unparsable']) == {'parse_error'}
+    assert all(results[key]['status'] == 'error' for key in REACTIONS if key != 'hydration')
+
+    untested = check_reaction(REACTIONS['hydration'], lambda smarts: [])
+    assert untested['status'] == 'untested' and untested['samples'] == 0
+
+
+def test_validate_database_writes_report(tmp_path):
+    json_path = tmp_path / 'reactions.json'
+    json_path.write_text(json.dumps(REACTIONS))
+    output = tmp_path / 'report.json'
+
+    report = validate_database(str(json_path), pool_dir=str(tmp_path / 'no_pools'), output=str(output),
+                               workers=1, progress=lambda msg: None)
+
+    assert json.loads(output.read_text()) == report
+    assert list(report['reactions']) == list(REACTIONS)
+    assert not report['pools_built']
+    # Without pools only the static checks run
+    assert report['summary']['untested'] == 3
+    assert report['summary']['error'] == 2
+    assert report['summary']['issues']['parse_error'] == 1
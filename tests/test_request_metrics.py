@@ -0,0 +1,64 @@
+"""请求耗时直方图与 Prometheus 输出测试"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from request_metrics import Histogram, RequestMetrics, clear_shared_dir
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for _ in range(90):
+        histogram.observe(0.005)
+    for _ in range(10):
+        histogram.observe(0.5)
+
+    assert histogram.count == 100
+    assert 0 < histogram.quantile(0.5) <= 0.01
+    assert 0.1 < histogram.quantile(0.95) <= 0.5
+    # Quantiles never exceed the largest observation
+    assert histogram.quantile(0.99) <= 0.5
+    assert Histogram().quantile(0.5) is None
+
+
+def test_metrics_ignore_counts_and_render_prometheus():
+    metrics = RequestMetrics(buckets=(0.01, 0.1))
+    metrics.observe('react', {'json_parse': 0.001, 'run_reactants': 0.05, 'total': 0.2, 'candidates': 12})
+    metrics.observe('react', {'total': 0.005}, 'error')
+
+    summary = metrics.summary()['react']
+    assert summary['requests'] == {'error': 1, 'ok': 1}
+    assert summary['stages']['total']['count'] == 2
+    assert 'candidates' not in summary['stages']
+
+    text = metrics.render_prometheus()
+    assert '# TYPE reaction_server_stage_seconds histogram' in text
+    assert 'reaction_server_requests_total{endpoint="react",outcome="ok"} 1' in text
+    assert 'reaction_server_stage_seconds_bucket{endpoint="react",stage="total",le="0.01"} 1' in text
+    assert 'reaction_server_stage_seconds_bucket{endpoint="react",stage="total",le="+Inf"} 2' in text
+    assert 'reaction_server_stage_seconds_count{endpoint="react",stage="run_reactants"} 1' in text
+    assert 'reaction_server_stage_seconds_quantile{endpoint="react",stage="total",quantile="0.99"}' in text
+
+
+def test_shared_metrics_merge_snapshots_of_all_workers(tmp_path):
+    # Two gunicorn workers: a scrape reaching either one reports both
+    worker_a = RequestMetrics(buckets=(0.01, 0.1), shared_dir=str(tmp_path))
+    worker_b = RequestMetrics(buckets=(0.01, 0.1), shared_dir=str(tmp_path))
+    worker_a.observe('react', {'total': 0.005})
+    worker_b.observe('react', {'total': 0.05})
+    worker_b.observe('react', {'total': 0.5}, 'timeout')
+    worker_a.flush()
+    worker_b.flush()
+
+    for metrics in (worker_a, worker_b):
+        summary = metrics.summary()['react']
+        assert summary['requests'] == {'ok': 2, 'timeout': 1}
+        assert summary['stages']['total']['count'] == 3
+        assert summary['stages']['total']['max_ms'] == 500.0
+        text = metrics.render_prometheus()
+        assert 'reaction_server_stage_seconds_bucket{endpoint="react",stage="total",le="0.1"} 2' in text
+
+    # An exited worker's counts stay until the server restarts
+    clear_shared_dir(str(tmp_path))
+    assert worker_b.summary()['react']['requests'] == {'ok': 1, 'timeout': 1}
@@ -0,0 +1,142 @@
+"""使用 Flask test client 测试反应 API"""
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("rdkit")
+pytest.importorskip("flask")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server
+import warmup
+
+BROMINATION = "[C:1]=[C:2].[Br:3][Br:4]>>[C:1]([Br:3])[C:2]([Br:4])"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Keep tests offline: no ChemBERTa, no writes to data/
+    monkeypatch.setattr(server, 'AI_VALIDATION_ENABLED', False)
+    monkeypatch.setattr(server, 'DATA_LOGGING_ENABLED', False)
+    monkeypatch.setattr(server, 'REACTION_POOL_ENABLED', False)
+    server.app.config['TESTING'] = True
+    with server.app.test_client() as c:
+        yield c
+
+
+def test_react_single(client):
+    resp = client.post('/api/react', json={'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr']})
+    data = resp.get_json()
+
+    assert resp.status_code == 200
+    assert data['products'] == ['BrCCBr']
+
+
+def test_react_reports_stage_timings_and_metrics(client, monkeypatch):
+    monkeypatch.setattr(server, 'request_metrics', server.RequestMetrics())
+    resp = client.post('/api/react', json={'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr'],
+                                           'timings': True})
+    timings = resp.get_json()['timings']
+
+    for stage in ('json_parse', 'compile', 'mol_parse', 'run_reactants', 'postprocess', 'execute', 'total'):
+        assert timings[stage] >= 0
+    assert 'timings' not in client.post('/api/react', json={'smarts': BROMINATION,
+                                                            'reactants': ['C=C', 'BrBr']}).get_json()
+
+    resp = client.get('/api/metrics')
+    text = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert resp.content_type.startswith('text/plain; version=0.0.4')
+    assert 'reaction_server_requests_total{endpoint="react",outcome="ok"} 2' in text
+    assert 'reaction_server_stage_seconds_count{endpoint="react",stage="run_reactants"} 2' in text
+
+
+def test_react_batch_preserves_job_order(client):
+    jobs = [
+        {'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr'], 'reaction_name': 'a'},
+        {'smarts': BROMINATION, 'reactants': ['CC', 'BrBr'], 'reaction_name': 'b'},
+        {'smarts': 'not a smarts', 'reactants': ['C=C']},
+        {'smarts': BROMINATION, 'reactants': ['CC=C', 'BrBr']},
+    ]
+    resp = client.post('/api/react/batch', json={'jobs': jobs})
+    results = resp.get_json()['results']
+
+    assert len(results) == 4
+    assert results[0]['products'] == ['BrCCBr']
+    assert results[1]['products'] == []
+    assert 'error' in results[2]
+    assert results[3]['products'] == ['CC(Br)CBr']
+
+
+@pytest.fixture
+def slow_pool(monkeypatch):
+    """A reaction pool whose jobs always time out"""
+    pool = server.reaction_executor.ReactionPool(workers=1, job_timeout=0)
+    monkeypatch.setattr(server, 'REACTION_POOL_ENABLED', True)
+    monkeypatch.setattr(server, 'reaction_pool', pool)
+    yield pool
+    pool.close()
+
+
+def test_timed_out_jobs_are_reported(client, slow_pool):
+    data = client.post('/api/react', json={'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr']}).get_json()
+    assert data['products'] == []
+    assert data['timed_out'] is True
+
+    jobs = [{'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr']}] * 2
+    results = client.post('/api/react/batch', json={'jobs': jobs}).get_json()['results']
+    assert all(r['timed_out'] for r in results)
+
+    stats = client.get('/api/stats').get_json()['data']
+    assert stats['reaction_pool']['timeouts'] == 3
+
+
+def test_react_batch_rejects_oversized_batch(client, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_BATCH_JOBS', 1)
+    jobs = [{'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr']}] * 2
+    data = client.post('/api/react/batch', json={'jobs': jobs}).get_json()
+
+    assert data['results'] == []
+    assert 'Too many jobs' in data['error']
+
+
+@pytest.fixture
+def loading_model(monkeypatch):
+    """Pretend the warm-up thread is still loading ChemBERTa"""
+    monkeypatch.setattr(server, 'AI_VALIDATION_ENABLED', True)
+    monkeypatch.setattr(warmup, '_started_at', time.time())
+    monkeypatch.setattr(warmup, '_components', {
+        'reaction_cache': {'status': warmup.READY},
+        'ai_model': {'status': warmup.LOADING},
+    })
+
+    def fail_if_called():
+        raise AssertionError("request blocked on the AI validator")
+    monkeypatch.setattr(server, 'get_ai_validator', fail_if_called)
+
+
+def test_health(client):
+    data = client.get('/api/health').get_json()
+
+    assert data['status'] == 'ok'
+    assert data['rdkit_version']
+
+
+def test_ready_reports_loading_components(client, loading_model):
+    resp = client.get('/api/ready')
+    data = resp.get_json()
+
+    assert resp.status_code == 503
+    assert data['components']['ai_model']['status'] == 'loading'
+
+
+def test_react_skips_validation_while_model_loads(client, loading_model):
+    resp = client.post('/api/react', json={'smarts': BROMINATION, 'reactants': ['C=C', 'BrBr']})
+    data = resp.get_json()
+
+    assert data['products'] == ['BrCCBr']
+    assert data['ai_validated'] is False
+    assert data['ai_status'] == 'loading'
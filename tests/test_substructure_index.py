@@ -0,0 +1,55 @@
+"""测试指纹预筛选子结构索引"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("rdkit")
+pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rdkit import Chem
+
+from substructure_index import SubstructureIndex
+
+CORPUS = ['CC=C', 'CC(=O)O', 'CCO', 'c1ccccc1O', 'CC(=O)Cl', 'CCN', 'CC#N', 'C1CCCCC1', 'CCBr', 'not_a_smiles']
+QUERIES = ['[C]=[C]', '[C](=O)[OH]', '[OH][C]', '[OH]c', '[C](=O)Cl', '[NH2][C]', 'C#N', '[Br,Cl,I][CX4]', 'c1ccccc1']
+
+
+def _brute_force(smiles, smarts):
+    pattern = Chem.MolFromSmarts(smarts)
+    return [i for i, smi in enumerate(smiles) if Chem.MolFromSmiles(smi).HasSubstructMatch(pattern)]
+
+
+def test_search_matches_brute_force():
+    index = SubstructureIndex.build(CORPUS)
+
+    assert len(index) == len(CORPUS) - 1
+    for smarts in QUERIES:
+        expected = _brute_force(index.smiles, smarts)
+        assert index.search(smarts) == expected, smarts
+        # Screening may keep false positives but never drops a match
+        assert set(expected) <= set(index.screen(smarts).tolist())
+
+
+def test_screen_discards_candidates_and_limit_stops_early():
+    index = SubstructureIndex.build(CORPUS)
+
+    assert len(index.screen('[C](=O)Cl')) < len(index)
+    assert len(index.search('[#6]', limit=2)) == 2
+    assert index.search('not smarts[') == []
+
+
+def test_parallel_build_and_save_load_roundtrip(tmp_path, monkeypatch):
+    import substructure_index
+    monkeypatch.setattr(substructure_index, 'CHUNK_SIZE', 3)
+
+    index = SubstructureIndex.build(CORPUS, workers=2)
+    path = tmp_path / 'index.npz'
+    index.save(str(path))
+    loaded = SubstructureIndex.load(str(path))
+
+    assert loaded.smiles == SubstructureIndex.build(CORPUS).smiles
+    for smarts in QUERIES:
+        assert loaded.search(smarts) == index.search(smarts)
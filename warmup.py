@@ -0,0 +1,127 @@
+"""
+Startup Warm-up - Load slow components on a background thread
+后台预热：编译反应缓存、加载 ChemBERTa 模型，并记录进度和耗时
+
+Component status values:
+    pending   warm-up has not reached this component yet
+    loading   currently loading (see 'progress')
+    ready     loaded; 'duration_seconds' says how long it took
+    failed    loading raised; see 'error'
+    disabled  switched off in the server configuration
+"""
+
+import time
+import traceback
+from threading import Lock, Thread
+
+from server_log import get_logger
+
+log = get_logger('warmup')
+
+PENDING = 'pending'
+LOADING = 'loading'
+READY = 'ready'
+FAILED = 'failed'
+DISABLED = 'disabled'
+
+_state_lock = Lock()
+_components = {}
+_thread = None
+_started_at = None
+
+
+def _update(name, **fields):
+    with _state_lock:
+        _components.setdefault(name, {'status': PENDING}).update(fields)
+
+
+def register(name):
+    """Declare a component so it shows up as pending before warm-up starts"""
+    with _state_lock:
+        _components.setdefault(name, {'status': PENDING})
+
+
+def set_progress(name, done, total):
+    """Report loading progress for a component"""
+    _update(name, progress={'done': done, 'total': total})
+
+
+def _run_step(name, loader):
+    started = time.time()
+    _update(name, status=LOADING, started_at=started)
+    try:
+        loader()
+        _update(name, status=READY, duration_seconds=round(time.time() - started, 3))
+        log.info(f"{name} ready in {time.time() - started:.1f}s")
+    except Exception as e:
+        _update(name, status=FAILED, error=str(e), duration_seconds=round(time.time() - started, 3))
+        log.error(f"{name} failed: {e}\n{traceback.format_exc()}")
+
+
+def run(steps):
+    """
+    Run warm-up steps in order on the calling thread
+
+    Args:
+        steps: List of (name, loader) tuples; loader None marks the component disabled
+    """
+    global _started_at
+    if _started_at is None:
+        _started_at = time.time()
+    for name, _ in steps:
+        register(name)
+    for name, loader in steps:
+        if loader is None:
+            _update(name, status=DISABLED)
+        else:
+            _run_step(name, loader)
+
+
+def start(steps):
+    """
+    Run warm-up steps on a daemon thread (no-op if already started)
+
+    Args:
+        steps: List of (name, loader) tuples, see run()
+
+    Returns:
+        Thread: The warm-up thread
+    """
+    global _thread, _started_at
+    if _thread is not None:
+        return _thread
+    for name, _ in steps:
+        register(name)
+    _started_at = time.time()
+    _thread = Thread(target=run, args=(steps,), name='warmup', daemon=True)
+    _thread.start()
+    return _thread
+
+
+def status(name):
+    """Status of one component (PENDING if it was never registered)"""
+    with _state_lock:
+        return _components.get(name, {}).get('status', PENDING)
+
+
+def is_started():
+    return _started_at is not None
+
+
+def is_finished():
+    """True once every registered component has stopped loading"""
+    with _state_lock:
+        return bool(_components) and all(
+            c['status'] in (READY, FAILED, DISABLED) for c in _components.values()
+        )
+
+
+def get_status():
+    """Snapshot of all components with progress and timings"""
+    with _state_lock:
+        components = {name: dict(info) for name, info in _components.items()}
+    return {
+        'started': _started_at is not None,
+        'elapsed_seconds': round(time.time() - _started_at, 3) if _started_at else None,
+        'components': components
+    }